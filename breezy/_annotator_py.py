@@ -106,6 +106,121 @@ class Annotator(object):
             self._heads_provider = None
         return vf_keys_needed, ann_keys_needed
 
+    def _get_needed_keys_for_many(self, keys):
+        """Determine the texts we need to annotate all of keys.
+
+        Every key in keys is counted as needed once more, until it has been
+        handed out by _iter_annotations.
+
+        :return: (vf_keys_needed, ann_keys_needed) as for _get_needed_keys
+        """
+        parent_map = self._parent_map
+        vf_keys_needed = set()
+        ann_keys_needed = set()
+        for key in keys:
+            self._num_needed_children[key] = (
+                self._num_needed_children.get(key, 0) + 1)
+        needed_keys = set(keys)
+        seen = set()
+        while needed_keys:
+            seen.update(needed_keys)
+            parent_lookup = []
+            next_parent_map = {}
+            for key in needed_keys:
+                if key in parent_map:
+                    if key in self._annotations_cache:
+                        continue
+                    if key not in self._text_cache:
+                        vf_keys_needed.add(key)
+                    else:
+                        ann_keys_needed.add(key)
+                    next_parent_map[key] = parent_map[key]
+                else:
+                    parent_lookup.append(key)
+                    vf_keys_needed.add(key)
+            next_parent_map.update(self._vf.get_parent_map(parent_lookup))
+            needed_keys = set()
+            for key, parent_keys in viewitems(next_parent_map):
+                if parent_keys is None:  # No graph versionedfile
+                    parent_keys = ()
+                    next_parent_map[key] = ()
+                self._update_needed_children(key, parent_keys)
+                needed_keys.update([p for p in parent_keys if p not in seen])
+            parent_map.update(next_parent_map)
+        self._heads_provider = None
+        return vf_keys_needed, ann_keys_needed
+
+    def _iter_annotations(self, keys):
+        """Annotate all of keys, streaming the texts they need only once.
+
+        All texts come from a single record stream in the order that suits
+        the storage best. Each text is annotated as soon as its parents are,
+        and dropped when no text that is still to be annotated needs it.
+
+        :return: An iterator over (key, annotations, lines) for the keys, in
+            no particular order.
+        """
+        keys = set(keys)
+        vf_keys, ann_keys = self._get_needed_keys_for_many(keys)
+        parent_map = self._parent_map
+        annotations_cache = self._annotations_cache
+        # Texts that are waiting for their parents to be annotated
+        num_waiting_parents = {}
+        waiting_children = {}
+        ready = [key for key in keys if key in annotations_cache]
+
+        def text_available(key):
+            waiting = [p for p in parent_map[key]
+                       if p not in annotations_cache]
+            if waiting:
+                num_waiting_parents[key] = len(waiting)
+                for parent_key in waiting:
+                    waiting_children.setdefault(parent_key, []).append(key)
+            else:
+                ready.append(key)
+
+        def annotate_ready():
+            while ready:
+                key = ready.pop()
+                if key not in annotations_cache:
+                    lines = self._text_cache[key]
+                    self._annotate_one(key, lines, len(lines))
+                for child_key in waiting_children.pop(key, ()):
+                    num_waiting_parents[child_key] -= 1
+                    if not num_waiting_parents[child_key]:
+                        del num_waiting_parents[child_key]
+                        ready.append(child_key)
+                if key in keys:
+                    yield key
+
+        def release(key):
+            num = self._num_needed_children[key] - 1
+            if num == 0:
+                del self._text_cache[key]
+                del annotations_cache[key]
+            self._num_needed_children[key] = num
+
+        for key in ann_keys:
+            text_available(key)
+        with ui.ui_factory.nested_progress_bar() as pb:
+            stream = self._vf.get_record_stream(vf_keys, 'groupcompress', True)
+            for idx, record in enumerate(stream):
+                pb.update('annotating', idx, len(vf_keys))
+                if record.storage_kind == 'absent':
+                    raise errors.RevisionNotPresent(record.key, self._vf)
+                self._text_cache[record.key] = osutils.chunks_to_lines(
+                    record.get_bytes_as('chunked'))
+                text_available(record.key)
+                for key in annotate_ready():
+                    yield key, annotations_cache[key], self._text_cache[key]
+                    release(key)
+        for key in annotate_ready():
+            yield key, annotations_cache[key], self._text_cache[key]
+            release(key)
+        if num_waiting_parents:
+            raise errors.RevisionNotPresent(
+                sorted(num_waiting_parents)[0], self._vf)
+
     def _get_needed_texts(self, key, pb=None):
         """Get the texts we need to properly annotate key.
 
@@ -296,8 +411,24 @@ class Annotator(object):
         :return: [(ann_key, line)]
             A list of tuples with a single annotation key for each line.
         """
-        custom_tiebreaker = annotate._break_annotation_tie
         annotations, lines = self.annotate(key)
+        return self._flatten_annotations(annotations, lines)
+
+    def iter_annotate_flat(self, keys):
+        """Determine the single-best-revision for each line of many texts.
+
+        This is like annotate_flat, but annotates all of keys in one pass:
+        the texts they need are read once, and a single graph is used to
+        pick the best revision.
+
+        :return: An iterator over (key, [(ann_key, line)]) for the keys, in
+            no particular order.
+        """
+        for key, annotations, lines in self._iter_annotations(keys):
+            yield key, self._flatten_annotations(annotations, lines)
+
+    def _flatten_annotations(self, annotations, lines):
+        custom_tiebreaker = annotate._break_annotation_tie
         out = []
         heads = self._get_heads_provider().heads
         append = out.append
@@ -733,6 +733,52 @@ error:
 }
 
 
+static PyObject *
+py_intern_lines(PyObject *self, PyObject *args)
+{
+    PyObject *orig, *ids, *seq, *item, *id, *res;
+    Py_ssize_t size, i;
+
+    if (!PyArg_ParseTuple(args, "OO!", &orig, &PyDict_Type, &ids))
+        return NULL;
+
+    seq = PySequence_Fast(orig, "sequence expected");
+    if (seq == NULL)
+        return NULL;
+
+    size = PySequence_Fast_GET_SIZE(seq);
+    res = PyList_New(size);
+    if (res == NULL)
+        goto error;
+
+    for (i = 0; i < size; i++) {
+        item = PySequence_Fast_GET_ITEM(seq, i);
+        /* Borrowed reference */
+        id = PyDict_GetItem(ids, item);
+        if (id == NULL) {
+            id = PyInt_FromSsize_t(PyDict_Size(ids));
+            if (id == NULL)
+                goto error;
+            if (PyDict_SetItem(ids, item, id) != 0) {
+                Py_DECREF(id);
+                goto error;
+            }
+        } else {
+            Py_INCREF(id);
+        }
+        PyList_SET_ITEM(res, i, id);
+    }
+
+    Py_DECREF(seq);
+    return res;
+
+error:
+    Py_XDECREF(res);
+    Py_DECREF(seq);
+    return NULL;
+}
+
+
 static PyObject *
 PatienceSequenceMatcher_new(PyTypeObject *type, PyObject *args, PyObject *kwds)
 {
@@ -1177,6 +1223,7 @@ static PyTypeObject PatienceSequenceMatcherType = {
 static PyMethodDef cpatiencediff_methods[] = {
     {"unique_lcs_c", py_unique_lcs, METH_VARARGS},
     {"recurse_matches_c", py_recurse_matches, METH_VARARGS},
+    {"intern_lines_c", py_intern_lines, METH_VARARGS},
     {NULL, NULL}
 };
 
@@ -23,6 +23,18 @@ import difflib
 from .trace import mutter
 
 
+def intern_lines_py(lines, ids):
+    """Map lines to integer ids.
+
+    :param lines: A sequence of hashable lines
+    :param ids: A dict mapping lines to their ids. Lines that are not in
+        it yet are added, with the next free id.
+    :return: A list with the id of each line
+    """
+    setdefault = ids.setdefault
+    return [setdefault(line, len(ids)) for line in lines]
+
+
 def unique_lcs_py(a, b):
     """Find the longest common subset for unique lines.
 
@@ -214,6 +226,34 @@ class PatienceSequenceMatcher_py(difflib.SequenceMatcher):
                                       ' isjunk for sequence matching')
         difflib.SequenceMatcher.__init__(self, isjunk, a, b)
 
+    def set_seq2(self, b):
+        """Set the second sequence to be compared.
+
+        Unlike difflib, this doesn't index the lines of b, as
+        get_matching_blocks doesn't need that.
+        """
+        if b is self.b:
+            return
+        self.b = b
+        self.matching_blocks = self.opcodes = None
+        self.fullbcount = None
+        self.b2j = None
+
+    def find_longest_match(self, alo=0, ahi=None, blo=0, bhi=None):
+        """Find longest matching block in a[alo:ahi] and b[blo:bhi].
+
+        This is difflib's implementation, which needs the index of the lines
+        of b. It is built the first time this is called.
+        """
+        if self.b2j is None:
+            self._SequenceMatcher__chain_b()
+        if ahi is None:
+            ahi = len(self.a)
+        if bhi is None:
+            bhi = len(self.b)
+        return difflib.SequenceMatcher.find_longest_match(
+            self, alo, ahi, blo, bhi)
+
     def get_matching_blocks(self):
         """Return list of triples describing matching subsequences.
 
@@ -78,26 +78,77 @@ def annotate_file_tree(tree, path, to_file, verbose=False, full=False,
     if show_ids:
         return _show_id_annotations(annotations, to_file, full, encoding)
 
-    if not getattr(tree, "get_revision_id", False):
-        # Create a virtual revision to represent the current tree state.
-        # Should get some more pending commit attributes, like pending tags,
-        # bugfixes etc.
-        current_rev = Revision(CURRENT_REVISION)
-        current_rev.parent_ids = tree.get_parent_ids()
-        try:
-            current_rev.committer = branch.get_config_stack().get('email')
-        except NoWhoami:
-            current_rev.committer = 'local user'
-        current_rev.message = "?"
-        current_rev.timestamp = round(time.time(), 3)
-        current_rev.timezone = osutils.local_time_offset()
-    else:
-        current_rev = None
+    current_rev = _make_current_rev(tree, branch)
     annotation = list(_expand_annotations(
         annotations, branch, current_rev))
     _print_annotations(annotation, verbose, to_file, full, encoding)
 
 
+def annotate_files_tree(tree, paths, to_file, verbose=False, full=False,
+                        show_ids=False, branch=None):
+    """Annotate several files in a tree in one pass.
+
+    The files are annotated together, which is a lot faster than annotating
+    them one by one, so they are written out in no particular order. The
+    annotations of each file follow a line with its path.
+
+    The tree should already be read_locked() when annotate_files_tree is
+    called.
+
+    :param tree: The tree to look for revision numbers and history from.
+    :param paths: The paths of the files to annotate
+    :param to_file: The file to output the annotations to.
+    :param verbose: Show all details rather than truncating to ensure
+        reasonable text width.
+    :param full: XXXX Not sure what this does.
+    :param show_ids: Show revision ids in the annotation output.
+    :param branch: Branch to use for revision revno lookups
+    """
+    if branch is None:
+        branch = tree.branch
+    if to_file is None:
+        to_file = sys.stdout
+
+    encoding = osutils.get_terminal_encoding()
+    current_rev = None
+    revision_id_to_revno = None
+    revisions = {}
+    for path, annotations in tree.iter_annotations(paths):
+        to_file.write('=== %s\n' % (path,))
+        if show_ids:
+            _show_id_annotations(annotations, to_file, full, encoding)
+            continue
+        if revision_id_to_revno is None:
+            current_rev = _make_current_rev(tree, branch)
+            revision_id_to_revno = _get_revision_id_to_revno(
+                branch, current_rev)
+        annotation = list(_expand_annotations(
+            annotations, branch, current_rev, revision_id_to_revno,
+            revisions))
+        _print_annotations(annotation, verbose, to_file, full, encoding)
+
+
+def _make_current_rev(tree, branch):
+    """Create a virtual revision to represent the current tree state.
+
+    :return: The revision, or None if tree is not a working tree.
+    """
+    if getattr(tree, "get_revision_id", False):
+        return None
+    # Should get some more pending commit attributes, like pending tags,
+    # bugfixes etc.
+    current_rev = Revision(CURRENT_REVISION)
+    current_rev.parent_ids = tree.get_parent_ids()
+    try:
+        current_rev.committer = branch.get_config_stack().get('email')
+    except NoWhoami:
+        current_rev.committer = 'local user'
+    current_rev.message = "?"
+    current_rev.timestamp = round(time.time(), 3)
+    current_rev.timezone = osutils.local_time_offset()
+    return current_rev
+
+
 def _print_annotations(annotation, verbose, to_file, full, encoding):
     """Print annotations to to_file.
 
@@ -150,18 +201,14 @@ def _show_id_annotations(annotations, to_file, full, encoding):
     return
 
 
-def _expand_annotations(annotations, branch, current_rev=None):
-    """Expand a file's annotations into command line UI ready tuples.
+def _get_revision_id_to_revno(branch, current_rev=None):
+    """Get the map from revision ids to revision numbers for annotations.
 
-    Each tuple includes detailed information, such as the author name, and date
-    string for the commit, rather than just the revision id.
-
-    :param annotations: The annotations to expand.
-    :param revision_id_to_revno: A map from id to revision numbers.
-    :param branch: A locked branch to query for revision details.
+    :param branch: A locked branch to number the revisions of.
+    :param current_rev: The virtual revision of a working tree, if the
+        annotations are of a working tree.
     """
     repository = branch.repository
-    revision_ids = set(o for o, t in annotations)
     if current_rev is not None:
         # This can probably become a function on MutableTree, get_revno_map
         # there, or something.
@@ -191,15 +238,39 @@ def _expand_annotations(annotations, branch, current_rev=None):
         # in revision_ids). Possibly add a HPSS call that can look those up
         # in bulk over HPSS.
         revision_id_to_revno = branch.get_revision_id_to_revno_map()
+    return revision_id_to_revno
+
+
+def _expand_annotations(annotations, branch, current_rev=None,
+                        revision_id_to_revno=None, revisions=None):
+    """Expand a file's annotations into command line UI ready tuples.
+
+    Each tuple includes detailed information, such as the author name, and date
+    string for the commit, rather than just the revision id.
+
+    :param annotations: The annotations to expand.
+    :param branch: A locked branch to query for revision details.
+    :param current_rev: The virtual revision of a working tree, if the
+        annotations are of a working tree.
+    :param revision_id_to_revno: A map from id to revision numbers, as
+        returned by _get_revision_id_to_revno.
+    :param revisions: A dict of the revisions looked up so far, which is
+        updated with the revisions the annotations need.
+    """
+    repository = branch.repository
+    revision_ids = set(o for o, t in annotations)
+    if revision_id_to_revno is None:
+        revision_id_to_revno = _get_revision_id_to_revno(branch, current_rev)
+    if revisions is None:
+        revisions = {}
     last_origin = None
-    revisions = {}
     if CURRENT_REVISION in revision_ids:
         revision_id_to_revno[CURRENT_REVISION] = (
             "%d?" % (branch.revno() + 1),)
         revisions[CURRENT_REVISION] = current_rev
     revisions.update(
         entry for entry in
-        repository.iter_revisions(revision_ids)
+        repository.iter_revisions(revision_ids.difference(revisions))
         if entry[1] is not None)
     for origin, text in annotations:
         text = text.rstrip(b'\r\n')
@@ -383,6 +383,23 @@ class Branch(controldir.ControlComponent):
         with self.lock_read():
             return self._do_revision_id_to_dotted_revno(revision_id)
 
+    def revision_ids_to_dotted_revnos(self, revision_ids):
+        """Look up the dotted revnos of several revisions at once.
+
+        :param revision_ids: An iterable of revision ids.
+        :return: A dict mapping revision ids to dotted revno tuples. Revisions
+            that are not in the branch are left out.
+        """
+        result = {}
+        with self.lock_read():
+            for revision_id in revision_ids:
+                try:
+                    result[revision_id] = self.revision_id_to_dotted_revno(
+                        revision_id)
+                except errors.NoSuchRevision:
+                    pass
+        return result
+
     def _do_revision_id_to_dotted_revno(self, revision_id):
         """Worker function for revision_id_to_revno."""
         # Try the caches if they are loaded
@@ -492,11 +509,8 @@ class Branch(controldir.ControlComponent):
             # we need the full graph to get stable numbers, regardless of the
             # start_revision_id.
             if self._merge_sorted_revisions_cache is None:
-                last_revision = self.last_revision()
-                known_graph = self.repository.get_known_graph_ancestry(
-                    [last_revision])
-                self._merge_sorted_revisions_cache = known_graph.merge_sort(
-                    last_revision)
+                self._merge_sorted_revisions_cache = (
+                    self._gen_merge_sorted_revisions())
             filtered = self._filter_merge_sorted_revisions(
                 self._merge_sorted_revisions_cache, start_revision_id,
                 stop_revision_id, stop_rule)
@@ -510,6 +524,19 @@ class Branch(controldir.ControlComponent):
             else:
                 raise ValueError('invalid direction %r' % direction)
 
+    def _gen_merge_sorted_revisions(self):
+        """Merge sort the ancestry of the branch tip.
+
+        This is the worker function for iter_merge_sorted_revisions, which
+        caches the return value.
+
+        :return: A list of nodes as returned by KnownGraph.merge_sort.
+        """
+        last_revision = self.last_revision()
+        known_graph = self.repository.get_known_graph_ancestry(
+            [last_revision])
+        return known_graph.merge_sort(last_revision)
+
     def _filter_merge_sorted_revisions(self, merge_sorted_revisions,
                                        start_revision_id, stop_revision_id,
                                        stop_rule):
@@ -669,11 +669,12 @@ class cmd_revision_info(Command):
 
         revinfos = []
         maxlen = 0
+        dotted_revnos = b.revision_ids_to_dotted_revnos(revision_ids)
         for revision_id in revision_ids:
             try:
-                dotted_revno = b.revision_id_to_dotted_revno(revision_id)
+                dotted_revno = dotted_revnos[revision_id]
                 revno = '.'.join(str(i) for i in dotted_revno)
-            except errors.NoSuchRevision:
+            except KeyError:
                 revno = '???'
             maxlen = max(maxlen, len(revno))
             revinfos.append((revno, revision_id))
@@ -5150,6 +5151,9 @@ class cmd_pack(Command):
     during or immediately after repacking, you may be left with a state
     where the deletion has been written to disk but the new packs have not
     been. In this case the repository may be unusable.
+
+    The --jobs option sets the number of processes used to recompress file
+    texts, overriding the repository.pack_jobs configuration option.
     """
 
     _see_also = ['repositories']
@@ -5157,9 +5161,19 @@ class cmd_pack(Command):
     takes_options = [
         Option('clean-obsolete-packs',
                'Delete obsolete packs to save disk space.'),
+        Option('jobs', type=int,
+               help='Number of processes to compress texts with.'),
         ]
 
-    def run(self, branch_or_repo='.', clean_obsolete_packs=False):
+    def run(self, branch_or_repo='.', clean_obsolete_packs=False, jobs=None):
+        if jobs is not None:
+            if jobs < 1:
+                raise errors.BzrCommandError(
+                    gettext('--jobs must be at least 1.'))
+            # Same as -Orepository.pack_jobs=N, the overrides are reset when
+            # the command finishes.
+            overrides = breezy.get_global_state().cmdline_overrides
+            overrides.options['repository.pack_jobs'] = str(jobs)
         dir = controldir.ControlDir.open_containing(branch_or_repo)[0]
         try:
             branch = dir.open_branch()
@@ -5239,6 +5253,10 @@ class cmd_annotate(Command):
 
     If the origin is the same for a run of consecutive lines, it is
     shown only at the top, unless the --all option is given.
+
+    With --all-files, all files below the given directory are annotated
+    together, which is a lot faster than annotating them one by one. The
+    annotations of each file follow a line with its path.
     """
     # TODO: annotate directories; showing when each file was last changed
     # TODO: if the working copy is modified, show annotations on that
@@ -5246,6 +5264,8 @@ class cmd_annotate(Command):
     aliases = ['ann', 'blame', 'praise']
     takes_args = ['filename']
     takes_options = [Option('all', help='Show annotations on all lines.'),
+                     Option('all-files',
+                            help='Annotate all files below a directory.'),
                      Option('long', help='Show commit date in annotations.'),
                      'revision',
                      'show-ids',
@@ -5254,10 +5274,11 @@ class cmd_annotate(Command):
     encoding_type = 'exact'
 
     @display_command
-    def run(self, filename, all=False, long=False, revision=None,
-            show_ids=False, directory=None):
+    def run(self, filename, all=False, all_files=False, long=False,
+            revision=None, show_ids=False, directory=None):
         from .annotate import (
             annotate_file_tree,
+            annotate_files_tree,
             )
         wt, branch, relpath = \
             _open_directory_or_containing_tree_or_branch(filename, directory)
@@ -5273,7 +5294,16 @@ class cmd_annotate(Command):
             file_id = tree.path2id(relpath)
         if file_id is None:
             raise errors.NotVersionedError(filename)
-        if wt is not None and revision is None:
+        if all_files:
+            if wt is not None and revision is None:
+                tree = wt
+            paths = [path for path, entry in tree.iter_entries_by_dir()
+                     if entry.kind == 'file'
+                     and osutils.is_inside(relpath, path)
+                     and tree.has_filename(path)]
+            annotate_files_tree(tree, paths, self.outf, long, all,
+                                show_ids=show_ids, branch=branch)
+        elif wt is not None and revision is None:
             # If there is a tree and we're not annotating historical
             # versions, annotate the working tree's content.
             annotate_file_tree(wt, relpath, self.outf, long, all,
@@ -6878,6 +6908,7 @@ def _register_lazy_builtins():
             ('cmd_bundle_info', [], 'breezy.bundle.commands'),
             ('cmd_config', [], 'breezy.config'),
             ('cmd_dump_btree', [], 'breezy.bzr.debug_commands'),
+            ('cmd_fsmonitor', [], 'breezy.bzr.fsmonitor'),
             ('cmd_version_info', [], 'breezy.cmd_version_info'),
             ('cmd_resolve', ['resolved'], 'breezy.conflicts'),
             ('cmd_conflicts', [], 'breezy.conflicts'),
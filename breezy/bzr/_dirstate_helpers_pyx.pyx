@@ -1024,6 +1024,8 @@ cdef class ProcessEntryC:
     # A set of the ids we've output when doing partial output.
     cdef object seen_ids
     cdef object sha_file
+    # The function used to walk the disk
+    cdef public object walkdirs
 
     def __init__(self, include_unchanged, use_filesystem_for_exec,
         search_specific_files, state, source_index, target_index,
@@ -1085,6 +1087,7 @@ cdef class ProcessEntryC:
         self.pathjoin = osutils.pathjoin
         self.fstat = os.fstat
         self.sha_file = osutils.sha_file
+        self.walkdirs = osutils._walkdirs_utf8
         if target_index != 0:
             # A lot of code in here depends on target_index == 0
             raise errors.BzrError('unsupported target index')
@@ -1569,7 +1572,7 @@ cdef class ProcessEntryC:
             if self.root_dir_info and self.root_dir_info[2] == 'tree-reference':
                 self.current_dir_info = None
             else:
-                self.dir_iterator = osutils._walkdirs_utf8(self.root_abspath,
+                self.dir_iterator = self.walkdirs(self.root_abspath,
                     prefix=self.current_root)
                 self.path_index = 0
                 try:
@@ -0,0 +1,134 @@
+# Copyright (C) 2019 Breezy Developers
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Bloom filters over the keys of an index.
+
+A Bloom filter answers whether a key may be in an index without reading the
+index itself. It never gives false negatives, and with the default of 10 bits
+per key gives false positives for about 1% of the absent keys.
+
+The serialised form is::
+
+  SIGNATURE 'bits=' DIGITS NEWLINE 'hashes=' DIGITS NEWLINE BITS
+"""
+
+from __future__ import absolute_import, division
+
+import hashlib
+import math
+import struct
+
+from .. import (
+    errors,
+    )
+
+
+_SIGNATURE = b"Bloom Filter 1\n"
+_OPTION_BITS = b"bits="
+_OPTION_HASHES = b"hashes="
+
+# The suffix of the file holding the filter for an index.
+SUFFIX = '.bloom'
+
+BITS_PER_KEY = 10
+
+
+class BadBloomFilter(errors.BzrError):
+
+    _fmt = "Could not parse Bloom filter: %(reason)s"
+
+    def __init__(self, reason):
+        errors.BzrError.__init__(self)
+        self.reason = reason
+
+
+def _key_hashes(key):
+    """Return the two base hashes of key used for double hashing."""
+    digest = hashlib.sha1(b'\x00'.join(key)).digest()
+    return struct.unpack('>QQ', digest[:16])
+
+
+class BloomFilter(object):
+    """A set of keys that may give false positives."""
+
+    def __init__(self, num_bits, num_hashes, bits=None):
+        """Create a BloomFilter.
+
+        :param num_bits: The size of the filter in bits.
+        :param num_hashes: The number of bits set for each key.
+        :param bits: The bytes of an existing filter.
+        """
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+        if bits is None:
+            bits = bytearray((num_bits + 7) // 8)
+        self._bits = bits
+
+    @classmethod
+    def for_key_count(cls, key_count, bits_per_key=BITS_PER_KEY):
+        """Create an empty filter sized for key_count keys."""
+        num_bits = max(64, key_count * bits_per_key)
+        num_hashes = max(1, int(round(bits_per_key * math.log(2))))
+        return cls(num_bits, num_hashes)
+
+    def _positions(self, key):
+        h1, h2 = _key_hashes(key)
+        num_bits = self.num_bits
+        return [(h1 + i * h2) % num_bits for i in range(self.num_hashes)]
+
+    def add(self, key):
+        """Add key, a tuple of bytestrings, to the filter."""
+        bits = self._bits
+        for position in self._positions(key):
+            bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        bits = self._bits
+        for position in self._positions(key):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    def to_bytes(self):
+        """Serialise the filter."""
+        return b''.join([
+            _SIGNATURE,
+            b'%s%d\n' % (_OPTION_BITS, self.num_bits),
+            b'%s%d\n' % (_OPTION_HASHES, self.num_hashes),
+            bytes(self._bits)])
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Load a filter serialised by to_bytes.
+
+        :raises BadBloomFilter: If data is not a valid filter.
+        """
+        if not data.startswith(_SIGNATURE):
+            raise BadBloomFilter('bad signature')
+        parts = data[len(_SIGNATURE):].split(b'\n', 2)
+        if (len(parts) != 3 or not parts[0].startswith(_OPTION_BITS)
+                or not parts[1].startswith(_OPTION_HASHES)):
+            raise BadBloomFilter('bad options')
+        try:
+            num_bits = int(parts[0][len(_OPTION_BITS):])
+            num_hashes = int(parts[1][len(_OPTION_HASHES):])
+        except ValueError:
+            raise BadBloomFilter('bad options')
+        bits = bytearray(parts[2])
+        if num_bits < 1 or len(bits) != (num_bits + 7) // 8:
+            raise BadBloomFilter('expected %d bits, got %d bytes'
+                                 % (num_bits, len(bits)))
+        return cls(num_bits, num_hashes, bits)
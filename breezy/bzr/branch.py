@@ -30,6 +30,10 @@ from breezy import (
     shelf,
     tag as _mod_tag,
     )
+from breezy.bzr import (
+    index as _mod_index,
+    revno_cache,
+    )
 """)
 
 from . import bzrdir
@@ -76,6 +80,10 @@ class BzrBranch(Branch, _RelockDebugMixin):
         directory.
     """
 
+    # The merge sorted revisions are only kept in the persistent revno cache
+    # when the ancestry has at least this many revisions.
+    _revno_cache_min_revisions = 1000
+
     def __init__(self, _format=None,
                  _control_files=None, a_controldir=None, name=None,
                  _repository=None, ignore_fallbacks=False,
@@ -99,6 +107,7 @@ class BzrBranch(Branch, _RelockDebugMixin):
         self._transport = _control_files._transport
         self.repository = _repository
         self.conf_store = None
+        self._revno_cache = None
         Branch.__init__(self, possible_transports)
         self._tags_bytes = None
 
@@ -251,6 +260,7 @@ class BzrBranch(Branch, _RelockDebugMixin):
                 self._check_history_violation(revision_id)
             self._run_pre_change_branch_tip_hooks(revno, revision_id)
             self._write_last_revision_info(revno, revision_id)
+            self._update_revno_cache(old_revno, old_revid, revno, revision_id)
             self._clear_cached_state()
             self._last_revision_info_cache = revno, revision_id
             self._run_post_change_branch_tip_hooks(old_revno, old_revid)
@@ -439,9 +449,105 @@ class BzrBranch(Branch, _RelockDebugMixin):
             self._tags_bytes = bytes
             return self._transport.put_bytes('tags', bytes)
 
+    def _get_revno_cache(self):
+        """Return the persistent revno cache for the tip, or None."""
+        if self._revno_cache is None:
+            self._revno_cache = revno_cache.read_revno_cache(
+                self._transport, self.last_revision())
+            if self._revno_cache is None:
+                self._revno_cache = False
+        return self._revno_cache or None
+
+    def _update_revno_cache(self, old_revno, old_revid, revno, revision_id):
+        """Bring the persistent revno cache up to date for a new tip.
+
+        Mainline revisions committed on top of the cached tip are added to
+        its tail. Any other change of tip merge sorts the new ancestry, so
+        that readers of the branch find a cache for its tip.
+        """
+        if _mod_revision.is_null(revision_id):
+            return
+        if self._transport.has(revno_cache.INDEX_NAME):
+            new_revids = revno_cache.find_linear_extension(
+                self.repository, old_revno, old_revid, revno, revision_id)
+            if new_revids is not None:
+                try:
+                    if revno_cache.extend_revno_cache(
+                            self._transport, old_revid, new_revids,
+                            mode=self.controldir._get_file_mode()):
+                        return
+                except (errors.TransportNotPossible, errors.PathError) as e:
+                    mutter('unable to update revno cache: %s', e)
+                    return
+        if (self.repository._fallback_repositories or
+                not self.repository.has_revision(revision_id)):
+            # The ancestry of a stacked branch is spread over other,
+            # possibly remote, repositories, and the tip can be set before
+            # its revisions are fetched.
+            return
+        try:
+            known_graph = self.repository.get_known_graph_ancestry(
+                [revision_id])
+            merge_sorted = known_graph.merge_sort(revision_id)
+        except errors.RevisionNotPresent as e:
+            mutter('unable to update revno cache: %s', e)
+            return
+        self._write_revno_cache(revno, revision_id, merge_sorted)
+
+    def _write_revno_cache(self, revno, revision_id, merge_sorted):
+        """Write the merge sorted revisions if there are enough of them."""
+        if len(merge_sorted) < self._revno_cache_min_revisions:
+            return
+        try:
+            revno_cache.write_revno_cache(
+                self._transport, revno, revision_id, merge_sorted,
+                mode=self.controldir._get_file_mode())
+        except (errors.TransportNotPossible, errors.PathError,
+                _mod_index.BadIndexKey, _mod_index.BadIndexValue) as e:
+            mutter('unable to write revno cache: %s', e)
+
+    def _gen_merge_sorted_revisions(self):
+        cache = self._get_revno_cache()
+        if cache is not None:
+            return cache.iter_merge_sorted()
+        merge_sorted = super(BzrBranch, self)._gen_merge_sorted_revisions()
+        # The cache is normally written when the tip changes. Branches
+        # from before it existed get one the first time they are merge
+        # sorted under a write lock, so that it can not race with a change
+        # of tip.
+        if self.peek_lock_mode() == 'w':
+            last_revno, last_revision = self.last_revision_info()
+            self._write_revno_cache(last_revno, last_revision, merge_sorted)
+        return merge_sorted
+
+    def _do_revision_id_to_dotted_revno(self, revision_id):
+        if _mod_revision.is_null(revision_id):
+            return (0,)
+        cache = self._get_revno_cache()
+        if cache is None:
+            return super(BzrBranch, self)._do_revision_id_to_dotted_revno(
+                revision_id)
+        result = cache.get_dotted_revno(revision_id)
+        if result is None:
+            raise errors.NoSuchRevision(self, revision_id)
+        return result
+
+    def _do_dotted_revno_to_revision_id(self, revno):
+        if revno == (0,):
+            return _mod_revision.NULL_REVISION
+        cache = self._get_revno_cache()
+        if cache is None:
+            return super(BzrBranch, self)._do_dotted_revno_to_revision_id(
+                revno)
+        result = cache.get_revision_id(revno)
+        if result is None:
+            raise errors.NoSuchRevision(self, '.'.join(map(str, revno)))
+        return result
+
     def _clear_cached_state(self):
         super(BzrBranch, self)._clear_cached_state()
         self._tags_bytes = None
+        self._revno_cache = None
 
 
 class BzrBranch8(BzrBranch):
@@ -23,13 +23,20 @@ from ..lazy_import import lazy_import
 lazy_import(globals(), """
 import bisect
 import math
+import mmap
+import os
+import sys
 import tempfile
+import threading
 import zlib
+
+from breezy.transport import local
 """)
 
 from .. import (
     chunk_writer,
     debug,
+    errors,
     fifo_cache,
     lru_cache,
     osutils,
@@ -38,11 +45,13 @@ from .. import (
     transport,
     )
 from . import (
+    bloom,
     index,
     )
 from .index import _OPTION_NODE_REFS, _OPTION_KEY_ELEMENTS, _OPTION_LEN
 from ..sixish import (
     BytesIO,
+    PY3,
     map,
     range,
     viewitems,
@@ -62,6 +71,16 @@ _PAGE_SIZE = 4096
 # 4K per page: 4MB - 1000 entries
 _NODE_CACHE_SIZE = 1000
 
+# Decompressed pages of memory mapped indices are shared between all
+# BTreeGraphIndex objects in the process, so that opening the same index
+# twice does not inflate the same pages twice.
+_PAGE_CACHE_SIZE = 16 * 1024 * 1024
+_page_cache = lru_cache.LRUSizeCache(_PAGE_CACHE_SIZE)
+_page_cache_lock = threading.Lock()
+
+# Set to False to always read pages through the transport.
+_use_mmap = True
+
 
 class _BuilderRow(object):
     """The stored state accumulated while writing out a row in the index.
@@ -157,6 +176,16 @@ class BTreeBuilder(index.GraphIndexBuilder):
         # Indicate it hasn't been built yet
         self._nodes_by_key = None
         self._optimize_for_size = False
+        self._bloom_bits_per_key = None
+        # The Bloom filter of the keys, once finish() has been called
+        self.bloom_filter = None
+
+    def add_bloom_filter(self, bits_per_key=bloom.BITS_PER_KEY):
+        """Build a Bloom filter of the keys when the index is finished.
+
+        The filter is available as self.bloom_filter after finish().
+        """
+        self._bloom_bits_per_key = bits_per_key
 
     def add_node(self, key, value, references=()):
         """Add a node to the index.
@@ -454,7 +483,18 @@ class BTreeBuilder(index.GraphIndexBuilder):
         :return: A file handle for a temporary file containing the nodes added
             to the index.
         """
-        return self._write_nodes(self.iter_all_entries())[0]
+        nodes = self.iter_all_entries()
+        if self._bloom_bits_per_key is not None:
+            self.bloom_filter = bloom.BloomFilter.for_key_count(
+                self.key_count(), self._bloom_bits_per_key)
+            nodes = self._iter_adding_to_bloom_filter(nodes)
+        return self._write_nodes(nodes)[0]
+
+    def _iter_adding_to_bloom_filter(self, nodes):
+        add = self.bloom_filter.add
+        for node in nodes:
+            add(node[1])
+            yield node
 
     def iter_all_entries(self):
         """Iterate over all keys within the index
@@ -650,6 +690,46 @@ class _InternalNode(object):
         return nodes
 
 
+def _get_shared_page(key, data):
+    """Return the decompressed page for key, inflating data if needed.
+
+    :param key: A key identifying the page in the process wide page cache.
+    :param data: The compressed bytes of the page.
+    """
+    with _page_cache_lock:
+        page = _page_cache.get(key)
+    if page is None:
+        page = zlib.decompress(data)
+        with _page_cache_lock:
+            _page_cache[key] = page
+    return page
+
+
+class _MmapPageSource(object):
+    """Serve the pages of a local index file from a memory mapping.
+
+    Regions are returned as memoryviews of the mapping, so reading a page
+    costs neither a syscall nor a copy.
+
+    :ivar key: A tuple identifying the version of the file that is mapped.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            st = os.fstat(f.fileno())
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.key = (st.st_dev, st.st_ino, st.st_size, st.st_mtime)
+        if PY3:
+            self._view = memoryview(self._mmap)
+        else:
+            # zlib on python 2 does not accept memoryviews
+            self._view = self._mmap
+
+    def readv(self, ranges):
+        for offset, size in ranges:
+            yield offset, self._view[offset:offset + size]
+
+
 class BTreeGraphIndex(object):
     """Access to nodes via the standard GraphIndex interface for B+Tree's.
 
@@ -678,6 +758,7 @@ class BTreeGraphIndex(object):
         self._name = name
         self._size = size
         self._file = None
+        self._page_source = None
         self._recommended_pages = self._compute_recommended_pages()
         self._root_node = None
         self._base_offset = offset
@@ -696,6 +777,10 @@ class BTreeGraphIndex(object):
         self._key_count = None
         self._row_lengths = None
         self._row_offsets = None  # Start of each row, [-1] is the end
+        # The name of a Bloom filter of the keys on transport, if any. The
+        # filter is loaded on first use; False means there is none.
+        self._bloom_name = None
+        self._bloom_filter = None
 
     def __hash__(self):
         return id(self)
@@ -747,6 +832,39 @@ class BTreeGraphIndex(object):
             found[node_pos] = node
         return found
 
+    def _get_page_source(self):
+        """Return an _MmapPageSource for the index, or None.
+
+        Only indices on a plain LocalTransport are mapped. Windows is skipped
+        as mapped files can not be renamed or deleted there.
+        """
+        if self._page_source is None:
+            self._page_source = False
+            if (_use_mmap and sys.platform != 'win32'
+                    and isinstance(self._transport, local.LocalTransport)):
+                try:
+                    self._page_source = _MmapPageSource(
+                        self._transport.local_abspath(self._name))
+                except (EnvironmentError, ValueError) as e:
+                    # ValueError is raised when mapping an empty file
+                    trace.mutter('not mapping index %s: %s', self._name, e)
+        return self._page_source or None
+
+    def _get_bloom_filter(self):
+        """Return the Bloom filter of the keys in this index, or None."""
+        if self._bloom_filter is None:
+            self._bloom_filter = False
+            if self._bloom_name is not None:
+                try:
+                    self._bloom_filter = bloom.BloomFilter.from_bytes(
+                        self._transport.get_bytes(self._bloom_name))
+                except errors.NoSuchFile:
+                    pass
+                except bloom.BadBloomFilter as e:
+                    trace.mutter('ignoring Bloom filter %s: %s',
+                                 self._bloom_name, e)
+        return self._bloom_filter or None
+
     def _compute_recommended_pages(self):
         """Convert transport's recommended_page_size into btree pages.
 
@@ -1166,6 +1284,12 @@ class BTreeGraphIndex(object):
         if not keys:
             return
 
+        bloom_filter = self._get_bloom_filter()
+        if bloom_filter is not None:
+            keys = frozenset(key for key in keys if key in bloom_filter)
+            if not keys:
+                return
+
         if not self.key_count():
             return
 
@@ -1225,6 +1349,14 @@ class BTreeGraphIndex(object):
             if they are missing or present. Callers can re-query this index for
             those keys, and they will be placed into parent_map or missing_keys
         """
+        bloom_filter = self._get_bloom_filter()
+        if bloom_filter is not None:
+            absent_keys = [key for key in keys if key not in bloom_filter]
+            if absent_keys:
+                missing_keys.update(absent_keys)
+                keys = set(keys).difference(absent_keys)
+                if not keys:
+                    return set()
         if not self.key_count():
             # We use key_count() to trigger reading the root node and
             # determining info about this BTreeGraphIndex
@@ -1483,7 +1615,7 @@ class BTreeGraphIndex(object):
         :return: None
         """
         # may be the byte string of the whole file
-        bytes = None
+        file_bytes = None
         # list of (offset, length) regions of the file that should, evenually
         # be read in to data_ranges, either from 'bytes' or from the transport
         ranges = []
@@ -1498,8 +1630,8 @@ class BTreeGraphIndex(object):
                 else:
                     # The only case where we don't know the size, is for very
                     # small indexes. So we read the whole thing
-                    bytes = self._transport.get_bytes(self._name)
-                    num_bytes = len(bytes)
+                    file_bytes = self._transport.get_bytes(self._name)
+                    num_bytes = len(file_bytes)
                     self._size = num_bytes - base_offset
                     # the whole thing should be parsed out of 'bytes'
                     ranges = [(start, min(_PAGE_SIZE, num_bytes - start))
@@ -1513,14 +1645,21 @@ class BTreeGraphIndex(object):
                                          % (offset, self._size))
                 size = min(size, self._size - offset)
             ranges.append((base_offset + offset, size))
+        # the key of the file in the shared page cache, if pages are mapped
+        page_cache_key = None
         if not ranges:
             return
-        elif bytes is not None:
+        elif file_bytes is not None:
             # already have the whole file
-            data_ranges = [(start, bytes[start:start + size])
+            data_ranges = [(start, file_bytes[start:start + size])
                            for start, size in ranges]
         elif self._file is None:
-            data_ranges = self._transport.readv(self._name, ranges)
+            page_source = self._get_page_source()
+            if page_source is None:
+                data_ranges = self._transport.readv(self._name, ranges)
+            else:
+                data_ranges = page_source.readv(ranges)
+                page_cache_key = page_source.key + (base_offset,)
         else:
             data_ranges = []
             for offset, size in ranges:
@@ -1530,17 +1669,22 @@ class BTreeGraphIndex(object):
             offset -= base_offset
             if offset == 0:
                 # extract the header
+                if not isinstance(data, bytes):
+                    data = data.tobytes()
                 offset, data = self._parse_header_from_bytes(data)
                 if len(data) == 0:
                     continue
-            bytes = zlib.decompress(data)
-            if bytes.startswith(_LEAF_FLAG):
-                node = self._leaf_factory(bytes, self._key_length,
+            if page_cache_key is None:
+                page = zlib.decompress(data)
+            else:
+                page = _get_shared_page(page_cache_key + (offset,), data)
+            if page.startswith(_LEAF_FLAG):
+                node = self._leaf_factory(page, self._key_length,
                                           self.node_ref_lists)
-            elif bytes.startswith(_INTERNAL_FLAG):
-                node = _InternalNode(bytes)
+            elif page.startswith(_INTERNAL_FLAG):
+                node = _InternalNode(page)
             else:
-                raise AssertionError("Unknown node type for %r" % bytes)
+                raise AssertionError("Unknown node type for %r" % page)
             yield offset // _PAGE_SIZE, node
 
     def _signature(self):
@@ -42,7 +42,15 @@ from __future__ import absolute_import
 import heapq
 import threading
 
+import breezy
+from ..lazy_import import lazy_import
+lazy_import(globals(), """
+from breezy import (
+    config,
+    )
+""")
 from .. import (
+    debug,
     errors,
     lru_cache,
     osutils,
@@ -54,40 +62,219 @@ from ..sixish import (
     viewitems,
     viewvalues,
     )
+from ..i18n import gettext
 from ..sixish import PY3
 from ..static_tuple import StaticTuple
 
-# approx 4MB
+# The default size of the page cache, see the chk_map.page_cache_size option.
 # If each line is 50 bytes, and you have 255 internal pages, with 255-way fan
 # out, it takes 3.1MB to cache the layer.
-_PAGE_CACHE_SIZE = 4 * 1024 * 1024
-# Per thread caches for 2 reasons:
-# - in the server we may be serving very different content, so we get less
-#   cache thrashing.
-# - we avoid locking on every cache lookup.
-_thread_caches = threading.local()
-# The page cache.
-_thread_caches.page_cache = None
+_PAGE_CACHE_SIZE = 16 * 1024 * 1024
+# The page cache is shared by all threads, and split by key into this many
+# shards that are locked separately, so threads rarely wait for each other.
+_PAGE_CACHE_SHARDS = 16
+# The page cache, created by _get_cache() on first use.
+_page_cache = None
+_page_cache_lock = threading.Lock()
+# Per thread counts of the pages read, see get_page_read_counts.
+_thread_counts = threading.local()
+
+
+def _page_cache_entry_size(entry):
+    """Estimate the memory used by a page cache entry.
+
+    Measured with tracemalloc on the maps of a 3000 file 2a tree, a
+    deserialised leaf node takes about 2.4 times the size of its bytes and an
+    internal node about 3.7 times. Leaf nodes are far more common, and the
+    bytes are kept as well, so an entry with a node is charged 4 times the
+    size of its bytes.
+    """
+    page_bytes, node = entry
+    if node is None:
+        return len(page_bytes)
+    return 4 * len(page_bytes)
+
+
+class _PageCacheShard(object):
+    """An LRUSizeCache of (bytes, node) entries with its own lock."""
+
+    def __init__(self, max_size):
+        self.lock = threading.Lock()
+        self.cache = lru_cache.LRUSizeCache(
+            max_size, compute_size=_page_cache_entry_size)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Get the entry for key, or None."""
+        with self.lock:
+            entry = self.cache.get(key)
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return entry
+
+    def add(self, key, entry, replace=True):
+        with self.lock:
+            cache = self.cache
+            if key in cache:
+                if not replace:
+                    # Just mark it as recently used
+                    cache[key]
+                    return
+                added = 0
+            else:
+                added = 1
+            old_len = len(cache)
+            cache[key] = entry
+            self.evictions += old_len + added - len(cache)
+
+
+class _PageCache(object):
+    """A cache of CHK pages shared by all threads.
+
+    The bytes of each page are kept along with the node deserialised from
+    them, so that walking the same pages again does not parse them again.
+    CHKMap modifies the nodes it holds, so nodes are copied on their way in
+    and out of the cache.
+    """
+
+    def __init__(self, max_size=_PAGE_CACHE_SIZE, num_shards=_PAGE_CACHE_SHARDS):
+        self.max_size = max_size
+        self._shards = [_PageCacheShard(max_size // num_shards)
+                        for i in range(num_shards)]
+
+    def _get_shard(self, key):
+        return self._shards[hash(key) % len(self._shards)]
+
+    def __getitem__(self, key):
+        """Get the bytes of the page for key.
+
+        :raises KeyError: If the page is not cached.
+        """
+        entry = self._get_shard(key).get(key)
+        if entry is None:
+            raise KeyError(key)
+        return entry[0]
+
+    def __setitem__(self, key, page_bytes):
+        """Cache the bytes of the page for key."""
+        # Pages are content addressed, so an existing entry has the same
+        # bytes and may have a node too.
+        self._get_shard(key).add(key, (page_bytes, None), replace=False)
+
+    def get_node(self, key, search_key_func=None):
+        """Get a copy of the node for key.
+
+        If only the bytes of the page are cached, they are deserialised and
+        the node is cached as well.
+
+        :raises KeyError: If the page is not cached.
+        """
+        if search_key_func is None:
+            search_key_func = _search_key_plain
+        shard = self._get_shard(key)
+        entry = shard.get(key)
+        if entry is None:
+            raise KeyError(key)
+        page_bytes, node = entry
+        if node is None or node._search_key_func is not search_key_func:
+            node = _deserialise(page_bytes, key, search_key_func)
+            shard.add(key, (page_bytes, node._copy()))
+            return node
+        return node._copy()
+
+    def add_node(self, key, page_bytes, node):
+        """Cache the bytes of the page for key and the node read from them.
+
+        The node is copied, so the caller may go on to modify it.
+        """
+        self._get_shard(key).add(key, (page_bytes, node._copy()))
+
+    def clear(self):
+        for shard in self._shards:
+            with shard.lock:
+                shard.cache.clear()
+
+    def stats(self):
+        """Return a dict with the hits, misses and evictions so far, and the
+        current and maximum size of the cache in bytes.
+        """
+        result = dict(hits=0, misses=0, evictions=0, size=0,
+                      max_size=self.max_size)
+        for shard in self._shards:
+            with shard.lock:
+                result['hits'] += shard.hits
+                result['misses'] += shard.misses
+                result['evictions'] += shard.evictions
+                result['size'] += shard.cache._value_size
+        return result
+
+    def report(self):
+        """Report the statistics of the cache with trace.note."""
+        trace.note(gettext(
+            'CHK page cache: {hits} hits, {misses} misses, {evictions} '
+            'evictions, {size} of {max_size} bytes used').format(
+                **self.stats()))
 
 
 def _get_cache():
-    """Get the per-thread page cache.
+    """Get the page cache shared by all threads.
 
-    We need a function to do this because in a new thread the _thread_caches
-    threading.local object does not have the cache initialized yet.
+    The size of the cache is read from the chk_map.page_cache_size option
+    when it is first used. With -Dchk its statistics are reported on exit.
     """
-    page_cache = getattr(_thread_caches, 'page_cache', None)
-    if page_cache is None:
-        # We are caching bytes so len(value) is perfectly accurate
-        page_cache = lru_cache.LRUSizeCache(_PAGE_CACHE_SIZE)
-        _thread_caches.page_cache = page_cache
-    return page_cache
+    global _page_cache
+    if _page_cache is None:
+        with _page_cache_lock:
+            if _page_cache is None:
+                max_size = config.GlobalStack().get('chk_map.page_cache_size')
+                if max_size is None:
+                    max_size = _PAGE_CACHE_SIZE
+                page_cache = _PageCache(max_size)
+                if 'chk' in debug.debug_flags:
+                    breezy.get_global_state().cleanups.add_cleanup(
+                        page_cache.report)
+                _page_cache = page_cache
+    return _page_cache
 
 
 def clear_cache():
     _get_cache().clear()
 
 
+def _count_page_reads(from_store, from_cache=0):
+    """Record pages read by this thread, see get_page_read_counts."""
+    counts = getattr(_thread_counts, 'page_reads', None)
+    if counts is None:
+        counts = _thread_counts.page_reads = [0, 0]
+    counts[0] += from_store
+    counts[1] += from_cache
+
+
+def get_page_read_counts():
+    """Get the number of pages read by this thread.
+
+    This is meant to measure how much of a map an operation has to look at:
+    reset the counts with reset_page_read_counts() before the operation and
+    check them afterwards.
+
+    :return: A tuple of (pages read from the store, pages found in the page
+        cache).
+    """
+    counts = getattr(_thread_counts, 'page_reads', None)
+    if counts is None:
+        return (0, 0)
+    return tuple(counts)
+
+
+def reset_page_read_counts():
+    """Reset the counts returned by get_page_read_counts to zero."""
+    _thread_counts.page_reads = [0, 0]
+
+
 # If a ChildNode falls below this many bytes, we check for a remap
 _INTERESTING_NEW_SIZE = 50
 # If a ChildNode shrinks by more than this amount, we check for a remap
@@ -173,20 +360,26 @@ class CHKMap(object):
         :return: A node object.
         """
         if isinstance(node, StaticTuple):
-            bytes = self._read_bytes(node)
-            return _deserialise(bytes, node,
-                                search_key_func=self._search_key_func)
+            return self._read_node(node)
         else:
             return node
 
-    def _read_bytes(self, key):
+    def _read_node(self, key):
+        page_cache = _get_cache()
         try:
-            return _get_cache()[key]
+            node = page_cache.get_node(key, self._search_key_func)
         except KeyError:
+            if 'chk' in debug.debug_flags:
+                trace.mutter('reading chk page %s', key[0])
+            _count_page_reads(1)
             stream = self._store.get_record_stream([key], 'unordered', True)
             bytes = next(stream).get_bytes_as('fulltext')
-            _get_cache()[key] = bytes
-            return bytes
+            node = _deserialise(bytes, key,
+                                search_key_func=self._search_key_func)
+            page_cache.add_node(key, bytes, node)
+        else:
+            _count_page_reads(0, 1)
+        return node
 
     def _dump_tree(self, include_keys=False, encoding='utf-8'):
         """Return the tree in a string representation."""
@@ -632,6 +825,19 @@ class Node(object):
             self.__class__.__name__, self._key, self._len, self._raw_size,
             self._maximum_size, self._search_prefix, items_str)
 
+    def _copy(self):
+        """Return a shallow copy of this node with its own _items dict."""
+        result = object.__new__(self.__class__)
+        result._key = self._key
+        result._len = self._len
+        result._maximum_size = self._maximum_size
+        result._key_width = self._key_width
+        result._raw_size = self._raw_size
+        result._items = dict(self._items)
+        result._search_prefix = self._search_prefix
+        result._search_key_func = self._search_key_func
+        return result
+
     def key(self):
         return self._key
 
@@ -722,6 +928,11 @@ class LeafNode(Node):
             % (self.__class__.__name__, self._key, self._len, self._raw_size,
                self._maximum_size, self._search_prefix, self._key_width, items_str)
 
+    def _copy(self):
+        result = Node._copy(self)
+        result._common_serialised_prefix = self._common_serialised_prefix
+        return result
+
     def _current_size(self):
         """Answer the current serialised size of this node.
 
@@ -1015,6 +1226,11 @@ class InternalNode(Node):
         else:
             self._search_key_func = search_key_func
 
+    def _copy(self):
+        result = Node._copy(self)
+        result._node_width = self._node_width
+        return result
+
     def add_node(self, prefix, node):
         """Add a child node with prefix prefix, and node node.
 
@@ -1170,20 +1386,20 @@ class InternalNode(Node):
                         else:
                             yield node, node_key_filter
         if keys:
-            # Look in the page cache for some more bytes
+            # Look in the page cache for some more nodes
+            page_cache = _get_cache()
             found_keys = set()
             for key in keys:
                 try:
-                    bytes = _get_cache()[key]
+                    node = page_cache.get_node(key, self._search_key_func)
                 except KeyError:
                     continue
                 else:
-                    node = _deserialise(bytes, key,
-                                        search_key_func=self._search_key_func)
                     prefix, node_key_filter = keys[key]
                     self._items[prefix] = node
                     found_keys.add(key)
                     yield node, node_key_filter
+            _count_page_reads(0, len(found_keys))
             for key in found_keys:
                 del keys[key]
         if keys:
@@ -1194,6 +1410,9 @@ class InternalNode(Node):
             key_order = list(keys)
             for batch_start in range(0, len(key_order), batch_size):
                 batch = key_order[batch_start:batch_start + batch_size]
+                if 'chk' in debug.debug_flags:
+                    trace.mutter('reading %d chk pages', len(batch))
+                _count_page_reads(len(batch))
                 # We have to fully consume the stream so there is no pending
                 # I/O, so we buffer the nodes for now.
                 stream = store.get_record_stream(batch, 'unordered', True)
@@ -1205,7 +1424,7 @@ class InternalNode(Node):
                     prefix, node_key_filter = keys[record.key]
                     node_and_filters.append((node, node_key_filter))
                     self._items[prefix] = node
-                    _get_cache()[record.key] = bytes
+                    page_cache.add_node(record.key, bytes, node)
                 for info in node_and_filters:
                     yield info
 
@@ -1516,13 +1735,30 @@ class CHKMapDifference(object):
         self._new_item_queue = []
         self._state = None
 
-    def _read_nodes_from_store(self, keys):
-        # We chose not to use _get_cache(), because we think in
-        # terms of records to be yielded. Also, we expect to touch each page
-        # only 1 time during this code. (We may want to evaluate saving the
-        # raw bytes into the page cache, which would allow a working tree
-        # update after the fetch to not have to read the bytes again.)
-        as_st = StaticTuple.from_sequence
+    def _read_nodes_from_store(self, keys, use_cache=False):
+        """Read nodes, yielding (record, node, prefix_refs, items).
+
+        Every page read is added to the page cache, as the new pages of one
+        difference are often the old pages of the next one during a fetch.
+
+        :param use_cache: If True, take nodes from the page cache where
+            possible. The record is None for those nodes, so this is only
+            useful for pages whose records are not needed.
+        """
+        page_cache = _get_cache()
+        if use_cache:
+            cached = []
+            for key in keys:
+                try:
+                    cached.append(
+                        page_cache.get_node(key, self._search_key_func))
+                except KeyError:
+                    pass
+            _count_page_reads(0, len(cached))
+            keys = set(keys).difference(node._key for node in cached)
+            for node in cached:
+                yield (None,) + self._node_refs_and_items(node)
+        _count_page_reads(len(keys))
         stream = self._store.get_record_stream(keys, 'unordered', True)
         for record in stream:
             if self._pb is not None:
@@ -1532,28 +1768,34 @@ class CHKMapDifference(object):
             bytes = record.get_bytes_as('fulltext')
             node = _deserialise(bytes, record.key,
                                 search_key_func=self._search_key_func)
-            if isinstance(node, InternalNode):
-                # Note we don't have to do node.refs() because we know that
-                # there are no children that have been pushed into this node
-                # Note: Using as_st() here seemed to save 1.2MB, which would
-                #       indicate that we keep 100k prefix_refs around while
-                #       processing. They *should* be shorter lived than that...
-                #       It does cost us ~10s of processing time
-                prefix_refs = list(viewitems(node._items))
-                items = []
-            else:
-                prefix_refs = []
-                # Note: We don't use a StaticTuple here. Profiling showed a
-                #       minor memory improvement (0.8MB out of 335MB peak 0.2%)
-                #       But a significant slowdown (15s / 145s, or 10%)
-                items = list(viewitems(node._items))
-            yield record, node, prefix_refs, items
+            page_cache.add_node(record.key, bytes, node)
+            yield (record,) + self._node_refs_and_items(node)
+
+    def _node_refs_and_items(self, node):
+        """Return (node, prefix_refs, items) for node."""
+        if isinstance(node, InternalNode):
+            # Note we don't have to do node.refs() because we know that
+            # there are no children that have been pushed into this node
+            # Note: Using as_st() here seemed to save 1.2MB, which would
+            #       indicate that we keep 100k prefix_refs around while
+            #       processing. They *should* be shorter lived than that...
+            #       It does cost us ~10s of processing time
+            prefix_refs = list(viewitems(node._items))
+            items = []
+        else:
+            prefix_refs = []
+            # Note: We don't use a StaticTuple here. Profiling showed a
+            #       minor memory improvement (0.8MB out of 335MB peak 0.2%)
+            #       But a significant slowdown (15s / 145s, or 10%)
+            items = list(viewitems(node._items))
+        return node, prefix_refs, items
 
     def _read_old_roots(self):
         old_chks_to_enqueue = []
         all_old_chks = self._all_old_chks
         for record, node, prefix_refs, items in \
-                self._read_nodes_from_store(self._old_root_keys):
+                self._read_nodes_from_store(self._old_root_keys,
+                                            use_cache=True):
             # Uninteresting node
             prefix_refs = [p_r for p_r in prefix_refs
                            if p_r[1] not in all_old_chks]
@@ -1690,7 +1932,8 @@ class CHKMapDifference(object):
         refs = self._old_queue
         self._old_queue = []
         all_old_chks = self._all_old_chks
-        for record, _, prefix_refs, items in self._read_nodes_from_store(refs):
+        for record, _, prefix_refs, items in self._read_nodes_from_store(
+                refs, use_cache=True):
             # TODO: Use StaticTuple here?
             self._all_old_items.update(items)
             refs = [r for _, r in prefix_refs if r not in all_old_chks]
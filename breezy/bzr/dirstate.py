@@ -1924,6 +1924,81 @@ class DirState(object):
                                pack_stat(stat_value))
                 self._mark_modified([entry])
 
+    def update_sha1s_in_parallel(self, root_abspath, paths, workers):
+        """Refresh the sha1 of files whose stat changed, using threads.
+
+        This finds the files below paths that update_entry would hash and
+        hashes them with a pool of worker threads. The results are recorded
+        with update_entry in the calling thread, so that a following
+        iter_changes finds them in the stat cache. Files that can not be
+        hashed are left for iter_changes to deal with.
+
+        :param root_abspath: The absolute path of the tree root.
+        :param paths: A collection of utf8 paths to refresh the files in.
+        :param workers: The number of threads to hash files with.
+        :return: The number of files that were hashed.
+        """
+        from multiprocessing.pool import ThreadPool
+        if self._cutoff_time is None:
+            self._sha_cutoff_time()
+        cutoff_time = self._cutoff_time
+        pending = []
+        for entry in self._iter_entries():
+            if (entry[1][0][0] != b'f' or len(entry[1]) < 2
+                    or entry[1][1][0] == b'a'):
+                continue
+            if entry[0][0]:
+                path = entry[0][0] + b'/' + entry[0][1]
+            else:
+                path = entry[0][1]
+            if not osutils.is_inside_any(paths, path):
+                continue
+            abspath = osutils.pathjoin(root_abspath, path.decode('utf8'))
+            try:
+                stat_value = os.lstat(abspath)
+            except OSError:
+                continue
+            if not stat.S_ISREG(stat_value.st_mode):
+                continue
+            if (stat_value.st_size == entry[1][0][2]
+                    and pack_stat(stat_value) == entry[1][0][4]):
+                continue
+            if (stat_value.st_mtime >= cutoff_time
+                    or stat_value.st_ctime >= cutoff_time):
+                # update_entry would not cache the sha1 of this file.
+                continue
+            pending.append((entry, abspath, stat_value))
+        if not pending:
+            return 0
+        sha1_file = self._sha1_file
+
+        def sha1_or_none(item):
+            try:
+                return sha1_file(item[1])
+            except (IOError, OSError):
+                return None
+        pool = ThreadPool(min(workers, len(pending)))
+        try:
+            sha1s = pool.map(sha1_or_none, pending,
+                             chunksize=max(1, len(pending) // (workers * 4)))
+        finally:
+            pool.close()
+            pool.join()
+        hashed = {}
+        for (entry, abspath, stat_value), sha1 in zip(pending, sha1s):
+            if sha1 is not None:
+                hashed[abspath] = sha1
+        # update_entry hashes through self._sha1_file, so hand it the
+        # results of the workers.
+        self._sha1_file = hashed.__getitem__
+        try:
+            for entry, abspath, stat_value in pending:
+                if abspath in hashed:
+                    update_entry(self, entry, abspath, stat_value)
+        finally:
+            self._sha1_file = sha1_file
+        return len(hashed)
+
     def _sha_cutoff_time(self):
         """Return cutoff time.
 
@@ -3535,7 +3610,8 @@ class ProcessEntryPython(object):
                  "partial", "use_filesystem_for_exec", "utf8_decode",
                  "searched_specific_files", "search_specific_files",
                  "searched_exact_paths", "search_specific_file_parents", "seen_ids",
-                 "state", "source_index", "target_index", "want_unversioned", "tree"]
+                 "state", "source_index", "target_index", "want_unversioned", "tree",
+                 "walkdirs"]
 
     def __init__(self, include_unchanged, use_filesystem_for_exec,
                  search_specific_files, state, source_index, target_index,
@@ -3573,6 +3649,9 @@ class ProcessEntryPython(object):
             raise errors.BzrError('unsupported target index')
         self.want_unversioned = want_unversioned
         self.tree = tree
+        # The function used to walk the disk, which can be replaced by one
+        # that avoids reading unchanged directories.
+        self.walkdirs = osutils._walkdirs_utf8
 
     def _process_entry(self, entry, path_info, pathjoin=osutils.pathjoin):
         """Compare an entry and real disk to generate delta information.
@@ -3980,7 +4059,7 @@ class ProcessEntryPython(object):
             if root_dir_info and root_dir_info[2] == 'tree-reference':
                 current_dir_info = None
             else:
-                dir_iterator = osutils._walkdirs_utf8(
+                dir_iterator = self.walkdirs(
                     root_abspath, prefix=current_root)
                 try:
                     current_dir_info = next(dir_iterator)
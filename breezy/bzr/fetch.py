@@ -25,10 +25,12 @@ branch.
 from __future__ import absolute_import
 
 import operator
+import os
 
 from ..lazy_import import lazy_import
 lazy_import(globals(), """
 from breezy import (
+    bencode,
     tsort,
     )
 from breezy.bzr import (
@@ -429,3 +431,132 @@ class FetchSpecFactory(object):
             return vf_search.NotInOtherForRevs(self.target_repo, self.source_repo,
                                                required_ids=heads_to_fetch, if_present_ids=if_present_fetch,
                                                limit=self.limit).execute()
+
+
+def _get_resident_memory():
+    """Return the resident memory of this process in bytes, or None."""
+    try:
+        with open('/proc/self/statm', 'rb') as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+class BatchSizer(object):
+    """Choose the size of conversion batches from their memory footprint.
+
+    Batches are grown while the memory a batch adds stays below the limit,
+    and shrunk when it goes above. The resident memory of a process rarely
+    shrinks, so a batch that fits into memory freed by earlier batches adds
+    none; that says nothing about larger batches, and leaves the size as it
+    is rather than ratcheting it up to the maximum. Where the resident
+    memory of the process can not be determined, the initial size is used
+    throughout.
+    """
+
+    def __init__(self, initial, memory_limit, minimum=1, maximum=None,
+                 get_memory=_get_resident_memory):
+        """Create a BatchSizer.
+
+        :param initial: The size of the first batch.
+        :param memory_limit: The number of bytes a batch may add to the
+            memory of the process, or None to never adapt the size.
+        :param minimum: The smallest size to use.
+        :param maximum: The largest size to use, by default ten times the
+            initial size.
+        """
+        self.size = initial
+        self._memory_limit = memory_limit
+        self._minimum = minimum
+        if maximum is None:
+            maximum = initial * 10
+        self._maximum = maximum
+        self._get_memory = get_memory
+        self._start_memory = None
+
+    def start_batch(self):
+        """Note that a batch of self.size revisions is about to be made."""
+        if self._memory_limit is not None and self._memory_limit > 0:
+            self._start_memory = self._get_memory()
+
+    def finish_batch(self, count):
+        """Adjust the size after a batch of count revisions was made."""
+        if self._start_memory is None:
+            return
+        end_memory = self._get_memory()
+        start_memory, self._start_memory = self._start_memory, None
+        if end_memory is None or count < 1:
+            return
+        growth = end_memory - start_memory
+        if growth <= 0:
+            return
+        size = self._memory_limit * count // growth
+        size = max(self.size // 2, min(size, self.size * 2))
+        self.size = max(self._minimum, min(size, self._maximum))
+
+
+class FetchCheckpoint(object):
+    """Progress of a batched conversion of revisions into a repository.
+
+    Conversions that commit each batch in its own write group record the
+    number of converted revisions and the pack hints of the batches. If the
+    conversion is interrupted, the committed batches stay in the target and
+    a rerun converts only the remaining revisions; the checkpoint lets it
+    report the earlier progress and pack the earlier batches together with
+    its own.
+    """
+
+    _file_name = 'fetch-checkpoint'
+
+    def __init__(self, repository, heads):
+        """Create a FetchCheckpoint.
+
+        :param repository: The repository revisions are converted into.
+        :param heads: The revisions the conversion was asked for.
+        """
+        self._transport = repository.control_transport
+        self._heads = sorted(heads)
+        self._written = False
+
+    def load(self):
+        """Load the progress of an earlier run for the same heads.
+
+        :return: Tuple with the number of revisions converted before and
+            their pack hints.
+        """
+        try:
+            data = self._transport.get_bytes(self._file_name)
+        except (errors.NoSuchFile, errors.TransportNotPossible):
+            return 0, []
+        try:
+            heads, count, hints = bencode.bdecode(data)
+        except (ValueError, TypeError) as e:
+            mutter('ignoring unreadable fetch checkpoint: %s', e)
+            return 0, []
+        if heads != self._heads:
+            return 0, []
+        self._written = True
+        return count, [hint.decode('utf-8') for hint in hints]
+
+    def record(self, count, hints):
+        """Record that count revisions have been committed."""
+        hints = [hint if isinstance(hint, bytes) else hint.encode('utf-8')
+                 for hint in hints]
+        data = bencode.bencode([self._heads, count, hints])
+        try:
+            self._transport.put_bytes(self._file_name, data)
+        except (errors.TransportNotPossible, errors.PathError) as e:
+            mutter('unable to write fetch checkpoint: %s', e)
+        else:
+            self._written = True
+
+    def finish(self):
+        """Remove the checkpoint after the conversion has completed."""
+        if not self._written:
+            return
+        try:
+            self._transport.delete(self._file_name)
+        except (errors.NoSuchFile, errors.TransportNotPossible):
+            pass
+        self._written = False
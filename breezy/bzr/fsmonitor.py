@@ -0,0 +1,832 @@
+# Copyright (C) 2019 Breezy Developers
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Watch dirstate working trees for changes with inotify.
+
+A long running monitor ('brz fsmonitor') watches all directories of a
+working tree and records the paths that change in it. When a working tree
+compares itself to its basis, it asks the monitor for the paths that changed
+since the last time it did so and only looks at those on disk. Everything
+else comes from the dirstate, and from a snapshot of the directory listings
+that is written whenever a complete comparison was saved with the dirstate.
+
+The monitor hands out tokens to mark a point in time. When there is no
+monitor, when it was restarted or when it lost track of changes, the tree is
+walked in full as usual.
+"""
+
+from __future__ import absolute_import
+
+import binascii
+import errno
+import os
+import select
+import socket
+import stat
+import struct
+import sys
+import time
+
+from ..lazy_import import lazy_import
+lazy_import(globals(), """
+import ctypes
+import ctypes.util
+
+from breezy import (
+    bencode,
+    workingtree,
+    )
+from breezy.bzr import (
+    dirstate,
+    )
+from breezy.i18n import gettext
+""")
+
+from .. import (
+    errors,
+    osutils,
+    trace,
+    )
+from ..commands import Command
+from ..option import Option
+
+
+SNAPSHOT_NAME = 'fsmonitor-snapshot'
+_SNAPSHOT_SIGNATURE = b'breezy fsmonitor snapshot 1\n'
+
+# Events and flags from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_EXCL_UNLINK = 0x04000000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+IN_NONBLOCK = 0o4000
+
+_WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM
+               | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+               | IN_MOVE_SELF | IN_ONLYDIR | IN_DONT_FOLLOW | IN_EXCL_UNLINK)
+# Events that change the listing of the watched directory
+_LISTING_EVENTS = IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+_event_header = struct.Struct('iIII')
+_peer_credentials = struct.Struct('3i')
+
+
+class InotifyNotAvailable(errors.BzrError):
+
+    _fmt = "inotify is not available: %(reason)s"
+
+    def __init__(self, reason):
+        errors.BzrError.__init__(self, reason=reason)
+
+
+class MonitorAlreadyRunning(errors.BzrError):
+
+    _fmt = "A file system monitor is already running for %(basedir)s."
+
+    def __init__(self, basedir):
+        errors.BzrError.__init__(self, basedir=basedir)
+
+
+class Inotify(object):
+    """A minimal wrapper around the Linux inotify API."""
+
+    def __init__(self):
+        if not sys.platform.startswith('linux'):
+            raise InotifyNotAvailable('not running on Linux')
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        try:
+            inotify_init1 = libc.inotify_init1
+            self._inotify_add_watch = libc.inotify_add_watch
+            self._inotify_rm_watch = libc.inotify_rm_watch
+        except AttributeError:
+            raise InotifyNotAvailable('the C library has no inotify support')
+        self._inotify_add_watch.argtypes = [
+            ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        self.fd = inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise InotifyNotAvailable(os.strerror(ctypes.get_errno()))
+
+    def add_watch(self, path, mask):
+        """Watch path for the events in mask.
+
+        :return: The watch descriptor.
+        """
+        wd = self._inotify_add_watch(self.fd, path, mask)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), path)
+        return wd
+
+    def rm_watch(self, wd):
+        # This fails when the watch is already gone, which is fine.
+        self._inotify_rm_watch(self.fd, wd)
+
+    def read_events(self):
+        """Read the events that are ready without blocking.
+
+        :return: A list of (wd, mask, name) tuples.
+        """
+        try:
+            data = os.read(self.fd, 65536)
+        except OSError as e:
+            if e.errno in (errno.EAGAIN, errno.EINTR):
+                return []
+            raise
+        events = []
+        pos = 0
+        while pos < len(data):
+            wd, mask, cookie, length = _event_header.unpack_from(data, pos)
+            pos += _event_header.size
+            events.append((wd, mask, data[pos:pos + length].rstrip(b'\0')))
+            pos += length
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+def _socket_address(basedir):
+    """Return the abstract unix socket address of the monitor for basedir."""
+    return b'\0breezy-fsmonitor-' + osutils.sha_string(
+        osutils.safe_utf8(osutils.realpath(basedir)))
+
+
+def _peer_uid(sock):
+    return _peer_credentials.unpack(sock.getsockopt(
+        socket.SOL_SOCKET, socket.SO_PEERCRED, _peer_credentials.size))[1]
+
+
+def _join(relpath, name):
+    if relpath:
+        return relpath + b'/' + name
+    return name
+
+
+class TreeMonitor(object):
+    """Watch a working tree and record the paths that change in it.
+
+    Every change is recorded with the value of a clock, which moves forward
+    every time a token is handed out. A query for a token returns the paths
+    changed since the token was handed out.
+    """
+
+    # The number of changed paths to remember. When more paths change, the
+    # monitor forgets them and asks for the tree to be walked in full.
+    max_changed_paths = 500000
+
+    # How long to wait for the events from before a query to arrive.
+    sync_timeout = 10.0
+
+    # How long to wait for a client to send its request.
+    client_timeout = 10.0
+
+    def __init__(self, basedir, control_dir):
+        """Create a TreeMonitor.
+
+        :param basedir: The root of the working tree.
+        :param control_dir: The control directory of the working tree, used
+            for the files that synchronise queries with the events.
+        """
+        self.basedir = osutils.realpath(basedir)
+        self._root = osutils.safe_utf8(self.basedir)
+        self._control_dir = osutils.safe_utf8(control_dir)
+        # Tokens are only valid for this run of the monitor.
+        self._instance = b'%d.%d' % (os.getpid(), int(time.time() * 1000))
+        self._clock = 1
+        self._overflow_clock = 0
+        self._changed = {}
+        self._watches = {}
+        self._dirs = {}
+        self._cookie_wd = None
+        self._cookies = 0
+        self._inotify = None
+        self._socket = None
+        self._stopped = False
+
+    def _abspath(self, relpath):
+        if relpath:
+            return self._root + b'/' + relpath
+        return self._root
+
+    def start(self):
+        """Start watching the tree and listening for queries."""
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.bind(_socket_address(self.basedir))
+        except socket.error as e:
+            sock.close()
+            if e.errno == errno.EADDRINUSE:
+                raise MonitorAlreadyRunning(self.basedir)
+            raise
+        self._inotify = Inotify()
+        self._cookie_wd = self._inotify.add_watch(
+            self._control_dir, IN_CREATE | IN_CLOSE_WRITE | IN_ONLYDIR)
+        self._watch_dir(b'', False)
+        sock.listen(5)
+        self._socket = sock
+
+    def stop(self):
+        """Stop watching the tree."""
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+
+    def _watch_dir(self, relpath, mark_changed):
+        """Watch relpath and all directories below it.
+
+        :param mark_changed: If True, record everything that is found as
+            changed, since it may have been changed before it was watched.
+        """
+        pending = [relpath]
+        while pending:
+            relpath = pending.pop()
+            abspath = self._abspath(relpath)
+            try:
+                wd = self._inotify.add_watch(abspath, _WATCH_MASK)
+            except OSError as e:
+                if e.errno in (errno.ENOENT, errno.ENOTDIR):
+                    # Gone already, its parent records that.
+                    continue
+                if e.errno == errno.ENOSPC:
+                    raise errors.BzrError(
+                        "Too many directories to watch, consider raising "
+                        "fs.inotify.max_user_watches.")
+                raise
+            self._watches[wd] = relpath
+            self._dirs[relpath] = wd
+            if mark_changed:
+                self._mark(relpath)
+            try:
+                names = os.listdir(abspath)
+            except OSError:
+                continue
+            for name in names:
+                if not relpath and name == b'.bzr':
+                    continue
+                path = _join(relpath, name)
+                if mark_changed:
+                    self._mark(path)
+                try:
+                    st = os.lstat(self._abspath(path))
+                except OSError:
+                    continue
+                if stat.S_ISDIR(st.st_mode):
+                    pending.append(path)
+
+    def _unwatch_dir(self, relpath):
+        """Stop watching relpath and the directories below it."""
+        prefix = relpath + b'/'
+        for path in list(self._dirs):
+            if path == relpath or path.startswith(prefix):
+                wd = self._dirs.pop(path)
+                del self._watches[wd]
+                self._inotify.rm_watch(wd)
+
+    def _mark(self, path):
+        self._changed[path] = self._clock
+        if len(self._changed) > self.max_changed_paths:
+            self._overflow()
+
+    def _overflow(self):
+        """Forget the changed paths, all tokens handed out are now stale."""
+        trace.mutter('fsmonitor lost track of changes in %s', self.basedir)
+        self._changed.clear()
+        self._overflow_clock = self._clock
+
+    def _process_events(self):
+        """Record the events that are ready.
+
+        :return: The set of names created in the control directory.
+        """
+        cookies = set()
+        while True:
+            events = self._inotify.read_events()
+            if not events:
+                return cookies
+            for wd, mask, name in events:
+                if mask & IN_Q_OVERFLOW:
+                    self._overflow()
+                    continue
+                if wd == self._cookie_wd:
+                    cookies.add(name)
+                    continue
+                relpath = self._watches.get(wd)
+                if relpath is None:
+                    continue
+                if mask & IN_IGNORED:
+                    del self._watches[wd]
+                    if self._dirs.get(relpath) == wd:
+                        del self._dirs[relpath]
+                    continue
+                if not name:
+                    if (mask & (IN_DELETE_SELF | IN_MOVE_SELF)
+                            and not relpath):
+                        # The tree itself went away.
+                        self._overflow()
+                    continue
+                if not relpath and name == b'.bzr':
+                    continue
+                path = _join(relpath, name)
+                self._mark(path)
+                if mask & _LISTING_EVENTS:
+                    self._mark(relpath)
+                if mask & IN_ISDIR:
+                    if mask & (IN_MOVED_FROM | IN_DELETE):
+                        self._unwatch_dir(path)
+                    if mask & (IN_CREATE | IN_MOVED_TO):
+                        self._watch_dir(path, True)
+
+    def _sync(self):
+        """Record all events for changes made before now.
+
+        Events arrive in order, so once the creation of a new file in the
+        control directory is seen, all earlier events have been seen too.
+        """
+        self._cookies += 1
+        name = b'fsmonitor-cookie-%d' % (self._cookies,)
+        path = self._control_dir + b'/' + name
+        with open(path, 'wb'):
+            pass
+        try:
+            deadline = time.time() + self.sync_timeout
+            while name not in self._process_events():
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    self._overflow()
+                    break
+                select.select([self._inotify.fd], [], [], remaining)
+        finally:
+            os.unlink(path)
+
+    def query(self, token):
+        """Return the paths changed since token was handed out.
+
+        :param token: A token from an earlier query, or None.
+        :return: A tuple with a new token and the set of changed paths, or
+            None instead of the set if the whole tree has to be looked at.
+        """
+        self._sync()
+        since = None
+        if token is not None:
+            instance, _, clock = token.rpartition(b':')
+            if instance == self._instance:
+                try:
+                    since = int(clock)
+                except ValueError:
+                    pass
+        clock = self._clock
+        self._clock += 1
+        new_token = b'%s:%d' % (self._instance, clock)
+        if since is None or since < self._overflow_clock:
+            return new_token, None
+        return new_token, set(
+            path for path, changed in self._changed.items() if changed > since)
+
+    def _handle_request(self, request):
+        command, _, argument = request.partition(b' ')
+        if command == b'query':
+            if argument == b'-':
+                argument = None
+            token, changed = self.query(argument)
+            if changed is None:
+                return b'fresh ' + token + b'\n'
+            return b'changes ' + token + b'\n' + b'\0'.join(sorted(changed))
+        elif command == b'status':
+            return b'watching %d directories, %d changed paths\n' % (
+                len(self._dirs), len(self._changed))
+        elif command == b'stop':
+            self._stopped = True
+            return b'stopping\n'
+        return b'error unknown request\n'
+
+    def _handle_client(self, conn):
+        conn.settimeout(self.client_timeout)
+        try:
+            if _peer_uid(conn) != os.getuid():
+                return
+            request = b''
+            while not request.endswith(b'\n') and len(request) < 4096:
+                data = conn.recv(4096)
+                if not data:
+                    return
+                request += data
+            conn.sendall(self._handle_request(request.rstrip(b'\n')))
+        except socket.error as e:
+            trace.mutter('fsmonitor client failed: %s', e)
+        finally:
+            conn.close()
+
+    def serve(self):
+        """Record changes and answer queries until asked to stop."""
+        try:
+            while not self._stopped:
+                readable = select.select(
+                    [self._inotify.fd, self._socket], [], [])[0]
+                if self._inotify.fd in readable:
+                    self._process_events()
+                if self._socket in readable:
+                    conn = self._socket.accept()[0]
+                    self._handle_client(conn)
+        finally:
+            self.stop()
+
+
+def connect(basedir, timeout=30.0):
+    """Connect to the monitor of basedir.
+
+    :return: A socket for a single request, or None if no monitor is running.
+    """
+    if not sys.platform.startswith('linux'):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(timeout)
+        sock.connect(_socket_address(basedir))
+        if _peer_uid(sock) == os.getuid():
+            return sock
+        trace.mutter('ignoring fsmonitor of another user for %s', basedir)
+    except socket.error as e:
+        if e.errno not in (errno.ECONNREFUSED, errno.ENOENT):
+            trace.mutter('failed to connect to fsmonitor for %s: %s',
+                         basedir, e)
+    sock.close()
+    return None
+
+
+def _request(sock, request):
+    """Send a request over a connection from connect().
+
+    :return: The response, or None if the monitor did not answer.
+    """
+    try:
+        sock.sendall(request + b'\n')
+        chunks = []
+        while True:
+            data = sock.recv(65536)
+            if not data:
+                break
+            chunks.append(data)
+        return b''.join(chunks)
+    except socket.error as e:
+        trace.mutter('failed to talk to fsmonitor: %s', e)
+        return None
+    finally:
+        sock.close()
+
+
+def query_changes(sock, token):
+    """Ask a monitor for the paths changed since token.
+
+    :param sock: A connection from connect().
+    :param token: A token from an earlier query, or None.
+    :return: None if the monitor did not answer, otherwise a tuple with a new
+        token and the set of changed utf8 paths, or None instead of the set
+        if the whole tree has to be looked at.
+    """
+    if token is None:
+        token = b'-'
+    response = _request(sock, b'query ' + token)
+    if response is None:
+        return None
+    header, _, body = response.partition(b'\n')
+    kind, _, new_token = header.partition(b' ')
+    if kind == b'fresh':
+        return new_token, None
+    elif kind == b'changes':
+        if not body:
+            return new_token, set()
+        return new_token, set(body.split(b'\0'))
+    trace.mutter('unexpected fsmonitor response: %r', header)
+    return None
+
+
+def monitor_status(basedir):
+    """Return a description of the monitor of basedir, or None."""
+    sock = connect(basedir)
+    if sock is None:
+        return None
+    response = _request(sock, b'status')
+    if response is None:
+        return None
+    return response.rstrip(b'\n').decode('ascii')
+
+
+def stop_monitor(basedir):
+    """Stop the monitor of basedir.
+
+    :return: True if a monitor was running.
+    """
+    sock = connect(basedir)
+    if sock is None:
+        return False
+    return _request(sock, b'stop') is not None
+
+
+def read_snapshot(transport):
+    """Read the snapshot of the directory listings of a tree.
+
+    :return: A tuple of the token of the snapshot and a dict mapping
+        directories to their listing, or None if there is no usable snapshot.
+    """
+    try:
+        data = transport.get_bytes(SNAPSHOT_NAME)
+    except errors.NoSuchFile:
+        return None
+    if not data.startswith(_SNAPSHOT_SIGNATURE):
+        return None
+    try:
+        token, dirs = bencode.bdecode(data[len(_SNAPSHOT_SIGNATURE):])
+    except (ValueError, TypeError):
+        trace.mutter('ignoring corrupt fsmonitor snapshot')
+        return None
+    return token, dirs
+
+
+def write_snapshot(transport, token, dirs):
+    """Write a snapshot of the directory listings of a tree."""
+    transport.put_bytes(
+        SNAPSHOT_NAME, _SNAPSHOT_SIGNATURE + bencode.bencode([token, dirs]))
+
+
+class SnapshotStat(object):
+    """A stat result recreated from the dirstate or a snapshot."""
+
+    __slots__ = ['st_size', 'st_mtime', 'st_ctime', 'st_dev', 'st_ino',
+                 'st_mode']
+
+    def __init__(self, st_size=0, st_mtime=0, st_ctime=0, st_dev=0,
+                 st_ino=0, st_mode=0):
+        self.st_size = st_size
+        self.st_mtime = st_mtime
+        self.st_ctime = st_ctime
+        self.st_dev = st_dev
+        self.st_ino = st_ino
+        self.st_mode = st_mode
+
+    @classmethod
+    def from_packed_stat(cls, packed_stat, size):
+        """Recreate the stat a dirstate entry was recorded with.
+
+        This packs to the same value as the original stat.
+        """
+        (st_size, st_mtime, st_ctime, st_dev, st_ino,
+         st_mode) = struct.unpack('>6L', binascii.a2b_base64(packed_stat))
+        return cls(size, st_mtime, st_ctime, st_dev, st_ino, st_mode)
+
+
+class MonitoredWalker(object):
+    """Walk a working tree, only reading directories that changed.
+
+    This yields the same as osutils._walkdirs_utf8. Directories that did not
+    change since the snapshot was taken are listed from the snapshot and
+    from the dirstate. Stat values come from the dirstate, unless the path
+    changed or the dirstate has no usable stat value for it.
+
+    :ivar dirs: The listings of the directories walked, for a new snapshot.
+    :ivar read_dirs: The directories that were read from disk.
+    """
+
+    def __init__(self, state, token, snapshot_dirs, changed):
+        """Create a MonitoredWalker.
+
+        :param state: The DirState of the tree.
+        :param token: The token of the monitor for the walk.
+        :param snapshot_dirs: The directory listings from the last snapshot.
+        :param changed: The set of paths changed since the last snapshot.
+        """
+        state._read_dirblocks_if_needed()
+        self._state = state
+        self.token = token
+        self._snapshot_dirs = snapshot_dirs
+        self._changed = changed
+        self.dirs = {}
+        self.read_dirs = []
+        # The entries given a stat value from disk, with their details at
+        # the time.
+        self._stated = []
+
+    def _versioned_entries(self, relroot):
+        """Return the dirstate entries of the versioned children of relroot."""
+        state = self._state
+        block_index, present = state._find_block_index_from_key(
+            (relroot, b'', b''))
+        if block_index == 0:
+            # The root entry has its own block.
+            block_index = 1
+            present = (len(state._dirblocks) > 1
+                       and state._dirblocks[1][0] == relroot)
+        if not present:
+            return {}
+        entries = {}
+        for entry in state._dirblocks[block_index][1]:
+            if entry[1][0][0] in (b'f', b'd', b'l', b't'):
+                entries[entry[0][1]] = entry
+        return entries
+
+    def _stat(self, relpath, abspath, snapshot_stat):
+        if snapshot_stat is not None and relpath not in self._changed:
+            return snapshot_stat
+        try:
+            return os.lstat(abspath)
+        except OSError as e:
+            if e.errno in (errno.ENOENT, errno.ENOTDIR):
+                return None
+            raise
+
+    def _read_dir(self, reader, relroot, top):
+        """List one directory.
+
+        :return: The sorted dirblock and the dict of versioned entries.
+        """
+        versioned = self._versioned_entries(relroot)
+        fingerprint = osutils.sha_strings(
+            [name + b'\0' for name in sorted(versioned)])
+        record = self._snapshot_dirs.get(relroot)
+        if (record is None or relroot in self._changed
+                or record[0] != fingerprint):
+            self.read_dirs.append(relroot)
+            dirblock = sorted(reader.read_dir(relroot, top))
+            listed = set()
+            unknowns = []
+            for path_info in dirblock:
+                listed.add(path_info[1])
+                if path_info[1] not in versioned:
+                    unknowns.append([path_info[1], path_info[3].st_mode])
+            missing = sorted(name for name in versioned if name not in listed)
+            self._stated.extend((entry, entry[1][0])
+                                for entry in versioned.values())
+            self.dirs[relroot] = [fingerprint, missing, unknowns]
+            return dirblock, versioned
+        if isinstance(top, bytes):
+            top_slash = top + b'/'
+
+            def abspath(name):
+                return top_slash + name
+        else:
+            top_slash = top + u'/'
+
+            def abspath(name):
+                return top_slash + name.decode('utf-8')
+        missing = set(record[1])
+        dirblock = []
+        for name, entry in versioned.items():
+            if name in missing:
+                continue
+            relpath = _join(relroot, name)
+            details = entry[1][0]
+            if details[4] == dirstate.DirState.NULLSTAT:
+                snapshot_stat = None
+            else:
+                snapshot_stat = SnapshotStat.from_packed_stat(
+                    details[4], details[2])
+            stat_value = self._stat(relpath, abspath(name), snapshot_stat)
+            if stat_value is not snapshot_stat:
+                self._stated.append((entry, details))
+            if stat_value is None:
+                missing.add(name)
+                continue
+            dirblock.append((relpath, name,
+                             osutils.file_kind_from_stat_mode(
+                                 stat_value.st_mode),
+                             stat_value, abspath(name)))
+        unknowns = []
+        for name, mode in record[2]:
+            relpath = _join(relroot, name)
+            stat_value = self._stat(relpath, abspath(name),
+                                    SnapshotStat(st_mode=mode))
+            if stat_value is None:
+                continue
+            unknowns.append([name, stat_value.st_mode])
+            dirblock.append((relpath, name,
+                             osutils.file_kind_from_stat_mode(
+                                 stat_value.st_mode),
+                             stat_value, abspath(name)))
+        dirblock.sort()
+        self.dirs[relroot] = [fingerprint, sorted(missing), unknowns]
+        return dirblock, versioned
+
+    def updated_dirstate(self):
+        """Did the dirstate entries change after the walk looked at them?
+
+        Entries that were given a stat value from the dirstate are not
+        updated, as the stat value matches. Others may have been updated in
+        ways the dirstate does not save by itself, such as a new stat value
+        for a directory, but that the next walk relies on.
+        """
+        for entry, details in self._stated:
+            if entry[1][0] is not details:
+                return True
+        return False
+
+    def _walk(self, top, prefix):
+        reader = osutils._get_dir_reader()
+        pending = [[reader.top_prefix_to_starting_dir(top, prefix)]]
+        while pending:
+            relroot, _, _, _, top = pending[-1].pop()
+            if not pending[-1]:
+                pending.pop()
+            dirblock, versioned = self._read_dir(reader, relroot, top)
+            yield (relroot, top), dirblock, versioned
+            # Descend into the directories the caller left in dirblock.
+            next = [d for d in reversed(dirblock) if d[2] == 'directory']
+            if next:
+                pending.append(next)
+
+    def walkdirs(self, top, prefix=""):
+        """Walk the tree below top, like osutils._walkdirs_utf8."""
+        for dir_info, dirblock, versioned in self._walk(top, prefix):
+            yield dir_info, dirblock
+
+    def iter_unversioned(self, top):
+        """Yield the unversioned paths in versioned directories below top.
+
+        Unversioned directories are not descended into, like
+        WorkingTree.extras.
+        """
+        for (relroot, _), dirblock, versioned in self._walk(top, b''):
+            unversioned = []
+            for i in range(len(dirblock) - 1, -1, -1):
+                path_info = dirblock[i]
+                entry = versioned.get(path_info[1])
+                if entry is not None and entry[1][0][0] == b'd':
+                    continue
+                # Don't descend into unversioned directories or trees
+                del dirblock[i]
+                if entry is None and path_info[1] != b'.bzr':
+                    unversioned.append(path_info[0])
+            for path in reversed(unversioned):
+                yield path
+
+
+class cmd_fsmonitor(Command):
+    __doc__ = """Watch a working tree for changes.
+
+    While the monitor runs, commands like 'brz status' and 'brz diff' only
+    look at the parts of the tree that changed since they last ran, rather
+    than at every file in it. This makes them a lot faster on large trees.
+
+    The monitor uses inotify, so it is only available on Linux. It runs
+    until it is stopped with --stop, and does not detach from the
+    terminal. Large trees may need a larger fs.inotify.max_user_watches.
+    """
+
+    takes_args = ['directory?']
+    takes_options = [
+        Option('stop', help='Stop the monitor of the tree.'),
+        Option('status', help='Report whether the tree is monitored.'),
+        ]
+
+    def run(self, directory=u'.', stop=False, status=False):
+        tree = workingtree.WorkingTree.open_containing(directory)[0]
+        if stop:
+            if not stop_monitor(tree.basedir):
+                raise errors.BzrCommandError(
+                    gettext('No file system monitor is running for %s.')
+                    % (tree.basedir,))
+            return
+        if status:
+            description = monitor_status(tree.basedir)
+            if description is None:
+                self.outf.write(gettext('%s is not monitored.\n')
+                                % (tree.basedir,))
+            else:
+                self.outf.write('%s: %s\n' % (tree.basedir, description))
+            return
+        if getattr(tree, '_get_monitored_walker', None) is None:
+            raise errors.BzrCommandError(
+                gettext('%s does not support file system monitors.')
+                % (tree.basedir,))
+        monitor = TreeMonitor(tree.basedir, tree._transport.local_abspath('.'))
+        monitor.start()
+        self.outf.write(gettext('Watching %s.\n') % (tree.basedir,))
+        self.outf.flush()
+        monitor.serve()
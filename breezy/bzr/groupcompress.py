@@ -1104,6 +1104,89 @@ def cleanup_pack_group(versioned_files):
     versioned_files.stream.close()
 
 
+def _compress_texts_to_blocks(texts, settings=None):
+    """Compress a batch of fulltexts into groupcompress blocks.
+
+    This is the unit of work handed to worker processes when repacking with
+    several jobs. Blocks are split using the same rules as
+    GroupCompressVersionedFiles._insert_record_stream.
+
+    :param texts: A list of (key, sha1, bytes) tuples, in the order they
+        should be compressed. sha1 may be None.
+    :param settings: Settings for the GroupCompressor.
+    :return: A list of (block_bytes, [(key, start, end), ...]) tuples.
+    """
+    blocks = []
+    entries = []
+    compressor = GroupCompressor(settings)
+
+    def flush():
+        bytes_len, chunks = compressor.flush().to_chunks()
+        blocks.append((b''.join(chunks), entries))
+
+    last_prefix = None
+    max_fulltext_len = 0
+    max_fulltext_prefix = None
+    for key, sha1, bytes in texts:
+        if len(key) > 1:
+            prefix = key[0]
+            soft = (prefix == last_prefix)
+        else:
+            prefix = None
+            soft = False
+        if max_fulltext_len < len(bytes):
+            max_fulltext_len = len(bytes)
+            max_fulltext_prefix = prefix
+        (found_sha1, start_point, end_point,
+         type) = compressor.compress(key, bytes, sha1, soft=soft)
+        if (prefix == max_fulltext_prefix
+                and end_point < 2 * max_fulltext_len):
+            start_new_block = False
+        elif end_point > 4 * 1024 * 1024:
+            start_new_block = True
+        elif (prefix is not None and prefix != last_prefix
+              and end_point > 2 * 1024 * 1024):
+            start_new_block = True
+        else:
+            start_new_block = False
+        last_prefix = prefix
+        if start_new_block:
+            compressor.pop_last()
+            flush()
+            compressor = GroupCompressor(settings)
+            entries = []
+            max_fulltext_len = len(bytes)
+            (found_sha1, start_point, end_point,
+             type) = compressor.compress(key, bytes, sha1)
+        entries.append((key, start_point, end_point))
+    if entries:
+        flush()
+    return blocks
+
+
+def _compress_text_to_block(bytes):
+    """Compress a single fulltext into a groupcompress block of its own.
+
+    The block is the one GroupCompressVersionedFiles.add_lines writes for a
+    lone text, but no delta index is built and the key of the text need not
+    be known yet. Most of the work is zlib compression, which does not hold
+    the GIL, so this can be run in worker threads.
+
+    :param bytes: The fulltext.
+    :return: A (block_bytes, start, end) tuple.
+    """
+    if bytes:
+        chunks = [b'f', encode_base128_int(len(bytes)), bytes]
+    else:
+        # Like GroupCompressor.compress, store nothing for an empty text
+        chunks = []
+    length = sum(map(len, chunks))
+    block = GroupCompressBlock()
+    block.set_chunked_content(chunks, length)
+    bytes_len, block_chunks = block.to_chunks()
+    return b''.join(block_chunks), 0, length
+
+
 class _BatchingBlockFetcher(object):
     """Fetch group compress blocks in batches.
 
@@ -1674,6 +1757,24 @@ class GroupCompressVersionedFiles(VersionedFilesWithFallbacks):
     def _make_group_compressor(self):
         return GroupCompressor(self._get_compressor_settings())
 
+    def _insert_compressed_blocks(self, blocks, parent_map, random_id=False):
+        """Insert blocks that were compressed elsewhere.
+
+        :param blocks: An iterable of (block_bytes, [(key, start, end), ...])
+            tuples, as returned by _compress_texts_to_blocks.
+        :param parent_map: A dict mapping each key to its parents.
+        :param random_id: See add_lines.
+        """
+        self._index._check_write_ok()
+        for data, entries in blocks:
+            index, start, length = self._access.add_raw_records(
+                [(None, len(data))], data)[0]
+            nodes = [(key, b"%d %d %d %d" % (start, length, entry_start,
+                                             entry_end),
+                      (parent_map[key],))
+                     for key, entry_start, entry_end in entries]
+            self._index.add_records(nodes, random_id=random_id)
+
     def _insert_record_stream(self, stream, random_id=False, nostore_sha=None,
                               reuse_blocks=True):
         """Internal core to insert a record stream into this container.
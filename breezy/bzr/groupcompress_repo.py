@@ -20,6 +20,12 @@ from __future__ import absolute_import
 
 import time
 
+from ..lazy_import import lazy_import
+lazy_import(globals(), """
+import collections
+import multiprocessing
+""")
+
 from .. import (
     controldir,
     debug,
@@ -41,6 +47,7 @@ from ..bzr.btree_index import (
     BTreeGraphIndex,
     BTreeBuilder,
     )
+from ..bzr import groupcompress
 from ..bzr.groupcompress import (
     _GCGraphIndex,
     GroupCompressVersionedFiles,
@@ -197,6 +204,10 @@ class ResumedGCPack(ResumedPack):
 class GCCHKPacker(Packer):
     """This class understand what it takes to collect a GCCHK repo."""
 
+    # The amount of fulltext bytes handed to a worker at a time when
+    # compressing texts with several jobs.
+    _text_batch_size = 4 * 1024 * 1024
+
     def __init__(self, pack_collection, packs, suffix, revision_ids=None,
                  reload_func=None):
         super(GCCHKPacker, self).__init__(pack_collection, packs, suffix,
@@ -213,6 +224,7 @@ class GCCHKPacker(Packer):
         self._text_refs = None
         # set by .pack() if self.revision_ids is not None
         self.revision_keys = None
+        self._jobs = pack_collection.config_stack.get('repository.pack_jobs')
 
     def _get_progress_stream(self, source_vf, keys, message, pb):
         def pb_stream():
@@ -480,8 +492,81 @@ class GCCHKPacker(Packer):
         #      rev just before the ones you are copying, otherwise the filter
         #      is grabbing too many keys...
         text_keys = source_vf.keys()
-        self._copy_stream(source_vf, target_vf, text_keys,
-                          'texts', self._get_progress_stream, 4)
+        if self._jobs > 1:
+            self._copy_texts_with_jobs(source_vf, target_vf, text_keys, 4)
+        else:
+            self._copy_stream(source_vf, target_vf, text_keys,
+                              'texts', self._get_progress_stream, 4)
+
+    def _iter_text_batches(self, source_vf, keys, pb):
+        """Read the fulltexts for keys, grouped into batches for the workers.
+
+        Texts are read in 'groupcompress' order, and batches are only split
+        between file ids, unless a single file id has a lot of texts.
+
+        :return: An iterator over (texts, parent_map) tuples, where texts is
+            a list of (key, sha1, bytes) tuples.
+        """
+        texts = []
+        parent_map = {}
+        batch_size = 0
+        last_prefix = None
+        stream = source_vf.get_record_stream(keys, 'groupcompress', True)
+        for idx, record in enumerate(stream):
+            pb.update('texts', idx + 1, len(keys))
+            if record.storage_kind == 'absent':
+                raise errors.RevisionNotPresent(record.key, source_vf)
+            prefix = record.key[0]
+            if (batch_size >= self._text_batch_size
+                and (prefix != last_prefix
+                     or batch_size >= 4 * self._text_batch_size)):
+                yield texts, parent_map
+                texts = []
+                parent_map = {}
+                batch_size = 0
+            bytes = record.get_bytes_as('fulltext')
+            texts.append((record.key, record.sha1, bytes))
+            parent_map[record.key] = record.parents
+            batch_size += len(bytes)
+            last_prefix = prefix
+        if texts:
+            yield texts, parent_map
+
+    def _copy_texts_with_jobs(self, source_vf, target_vf, keys, pb_offset):
+        """Recompress texts using a pool of self._jobs processes.
+
+        Fulltexts are read in this process and handed to the workers in
+        batches. The blocks they return are written to the new pack in the
+        order the batches were read, so the result only differs from a serial
+        repack in where the blocks are split.
+        """
+        trace.mutter('repacking %d texts with %d jobs', len(keys), self._jobs)
+        self.pb.update('repacking texts', pb_offset)
+        settings = target_vf._get_compressor_settings()
+        pool = multiprocessing.Pool(self._jobs)
+        try:
+            pending = collections.deque()
+            with ui.ui_factory.nested_progress_bar() as child_pb:
+                for texts, parent_map in self._iter_text_batches(
+                        source_vf, keys, child_pb):
+                    result = pool.apply_async(
+                        groupcompress._compress_texts_to_blocks,
+                        (texts, settings))
+                    pending.append((result, parent_map))
+                    del texts
+                    # Bound the number of batches held in memory.
+                    while len(pending) > 2 * self._jobs:
+                        result, parent_map = pending.popleft()
+                        target_vf._insert_compressed_blocks(
+                            result.get(), parent_map, random_id=True)
+                while pending:
+                    result, parent_map = pending.popleft()
+                    target_vf._insert_compressed_blocks(
+                        result.get(), parent_map, random_id=True)
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
 
     def _copy_signature_texts(self):
         source_vf, target_vf = self._build_vfs('signature', False, False)
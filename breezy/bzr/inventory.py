@@ -939,6 +939,11 @@ class CommonInventory(object):
             other.add(entry.copy())
         return other
 
+    def iter_all_paths(self):
+        """Iterate over the paths of all entries, in no particular order."""
+        for path, ie in self.iter_entries_by_dir():
+            yield path
+
     def get_idpath(self, file_id):
         """Return a list of file_ids for the path to an entry.
 
@@ -2135,6 +2140,81 @@ class CHKInventory(CommonInventory):
             delta.append((old_path, new_path, file_id, entry))
         return delta
 
+    def get_entry_by_path(self, relpath):
+        """See CommonInventory.get_entry_by_path().
+
+        Unlike the generic version this does not load the children of the
+        directories on the path, only the pages holding the path itself.
+        """
+        try:
+            file_id = self.path2id(relpath)
+        except errors.NoSuchId:
+            return None
+        if file_id is None:
+            return None
+        return self.get_entry(file_id)
+
+    def iter_entries_by_dir(self, from_dir=None, specific_file_ids=None):
+        """See CommonInventory.iter_entries_by_dir().
+
+        When only specific_file_ids are requested, just those entries and
+        their parents are read, rather than the children of every directory
+        leading to them.
+        """
+        if from_dir is not None or specific_file_ids is None:
+            return CommonInventory.iter_entries_by_dir(
+                self, from_dir=from_dir, specific_file_ids=specific_file_ids)
+        return self._iter_specific_entries_by_dir(specific_file_ids)
+
+    def _iter_specific_entries_by_dir(self, specific_file_ids):
+        if self.root_id is None:
+            return
+        entries = self._getitems(
+            set(specific_file_ids).difference([None]))
+        # Read the parents one level at a time, so id2path finds them all
+        # in the cache.
+        seen = set()
+        pending = entries
+        while pending:
+            parent_ids = set(ie.parent_id for ie in pending)
+            parent_ids.difference_update(seen, [None])
+            seen.update(parent_ids)
+            pending = self._getitems(parent_ids)
+        by_dir = []
+        for ie in entries:
+            path = self.id2path(ie.file_id)
+            names = path.split('/')
+            # Sorting by the names of the parent directories and then by
+            # basename gives the same order as walking the directories.
+            by_dir.append((names[:-1], names[-1], path, ie))
+        by_dir.sort(key=lambda item: item[:2])
+        for dir_names, basename, path, ie in by_dir:
+            yield path, ie
+
+    def iter_all_paths(self):
+        """Iterate over the paths of all entries, in no particular order.
+
+        Only parent_id_basename_to_file_id is read, so none of the entries
+        themselves have to be deserialised.
+        """
+        if self.root_id is None:
+            return
+        children = {}
+        for (parent_id, name_utf8), file_id in (
+                self.parent_id_basename_to_file_id.iteritems()):
+            if parent_id:
+                children.setdefault(parent_id, []).append(
+                    (name_utf8.decode('utf-8'), file_id))
+        yield u''
+        pending = [(u'', self.root_id)]
+        while pending:
+            dir_prefix, dir_id = pending.pop()
+            for name, file_id in children.pop(dir_id, []):
+                path = dir_prefix + name
+                yield path
+                if file_id in children:
+                    pending.append((path + '/', file_id))
+
     def path2id(self, relpath):
         """See CommonInventory.path2id()."""
         # TODO: perhaps support negative hits?
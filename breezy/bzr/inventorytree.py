@@ -182,7 +182,8 @@ class InventoryTree(Tree):
         return {entry.file_id for path, entry in self.iter_entries_by_dir()}
 
     def all_versioned_paths(self):
-        return {path for path, entry in self.iter_entries_by_dir()}
+        # FIXME: Handle nested trees
+        return set(self.root_inventory.iter_all_paths())
 
     def iter_entries_by_dir(self, specific_files=None):
         """Walk the tree in 'by_dir' order.
@@ -351,6 +352,23 @@ def _find_children_across_trees(specified_ids, trees):
     return interesting_ids
 
 
+def _iter_annotations_by_text_key(tree, texts, paths):
+    """Annotate the files at paths of tree together, from texts.
+
+    :return: An iterator as for Tree.iter_annotations.
+    """
+    path_by_key = {}
+    for path in paths:
+        file_id = tree.path2id(path)
+        if file_id is None:
+            raise errors.NoSuchFile(path)
+        path_by_key[(file_id, tree.get_file_revision(path))] = path
+    annotator = texts.get_annotator()
+    for text_key, annotations in annotator.iter_annotate_flat(path_by_key):
+        yield path_by_key[text_key], [
+            (key[-1], line) for key, line in annotations]
+
+
 class MutableInventoryTree(MutableTree, InventoryTree):
 
     def apply_inventory_delta(self, changes):
@@ -841,6 +859,12 @@ class InventoryRevisionTree(RevisionTree, InventoryTree):
         annotations = annotator.annotate_flat(text_key)
         return [(key[-1], line) for key, line in annotations]
 
+    def iter_annotations(self, paths,
+                         default_revision=revision.CURRENT_REVISION):
+        """See Tree.iter_annotations"""
+        return _iter_annotations_by_text_key(self, self._repository.texts,
+                                             paths)
+
     def __eq__(self, other):
         if self is other:
             return True
@@ -45,6 +45,7 @@ from .. import (
     lockdir,
     )
 from ..bzr import (
+    bloom,
     btree_index,
     )
 
@@ -212,6 +213,7 @@ class Pack(object):
                                  unlimited_cache=unlimited_cache)
         if index_type == 'chk':
             index._leaf_factory = btree_index._gcchk_factory
+        self._pack_collection._use_bloom_filter(index)
         setattr(self, index_type + '_index', index)
 
     def __lt__(self, other):
@@ -537,6 +539,13 @@ class NewPack(Pack):
             transport = self.upload_transport
         else:
             transport = self.index_transport
+        # Suspended indices are moved into place by a ResumedPack later,
+        # without a Bloom filter.
+        write_bloom_filter = (
+            not suspend and isinstance(index, btree_index.BTreeBuilder)
+            and self._pack_collection._bloom_filters_enabled())
+        if write_bloom_filter:
+            index.add_bloom_filter()
         index_tempfile = index.finish()
         index_bytes = index_tempfile.read()
         write_stream = transport.open_write_stream(index_name,
@@ -544,6 +553,10 @@ class NewPack(Pack):
         write_stream.write(index_bytes)
         write_stream.close(
             want_fdatasync=self._pack_collection.config_stack.get('repository.fdatasync'))
+        if write_bloom_filter:
+            transport.put_bytes(index_name + bloom.SUFFIX,
+                                index.bloom_filter.to_bytes(),
+                                mode=self._file_mode)
         self.index_sizes[self.index_offset(index_type)] = len(index_bytes)
         if 'pack' in debug.debug_flags:
             # XXX: size might be interesting?
@@ -829,6 +842,7 @@ class RepositoryPackCollection(object):
         # resumed packs
         self._resumed_packs = []
         self.config_stack = config.LocationStack(self.transport.base)
+        self._bloom_filters = None
 
     def __repr__(self):
         return '%s(%r)' % (self.__class__.__name__, self.repo)
@@ -1184,8 +1198,23 @@ class RepositoryPackCollection(object):
                                   unlimited_cache=is_chk)
         if is_chk and self._index_class is btree_index.BTreeGraphIndex:
             index._leaf_factory = btree_index._gcchk_factory
+        if not resume:
+            self._use_bloom_filter(index)
         return index
 
+    def _bloom_filters_enabled(self):
+        """Are Bloom filters of the index keys written and used?"""
+        if self._bloom_filters is None:
+            self._bloom_filters = self.config_stack.get(
+                'repository.index_bloom_filters')
+        return self._bloom_filters
+
+    def _use_bloom_filter(self, index):
+        """Let index consult the Bloom filter stored next to it."""
+        if (isinstance(index, btree_index.BTreeGraphIndex)
+                and self._bloom_filters_enabled()):
+            index._bloom_name = index._name + bloom.SUFFIX
+
     def _max_pack_count(self, total_revisions):
         """Return the maximum number of packs to use for total revisions.
 
@@ -1248,6 +1277,16 @@ class RepositoryPackCollection(object):
                 except (errors.PathError, errors.TransportError) as e:
                     mutter("couldn't rename obsolete index, skipping it:\n%s"
                            % (e,))
+                if self._bloom_filters_enabled():
+                    bloom_name = pack.name + suffix + bloom.SUFFIX
+                    try:
+                        self._index_transport.move(
+                            bloom_name, '../obsolete_packs/' + bloom_name)
+                    except errors.NoSuchFile:
+                        pass
+                    except (errors.PathError, errors.TransportError) as e:
+                        mutter("couldn't rename obsolete Bloom filter,"
+                               " skipping it:\n%s" % (e,))
 
     def pack_distribution(self, total_revisions):
         """Generate a list of the number of revisions to put in each pack.
@@ -1507,6 +1546,8 @@ class RepositoryPackCollection(object):
             return found
         for filename in obsolete_pack_files:
             name, ext = osutils.splitext(filename)
+            if ext == bloom.SUFFIX:
+                name = osutils.splitext(name)[0]
             if ext == '.pack':
                 found.append(name)
             if name in preserve:
@@ -980,6 +980,16 @@ class RemoteInventoryTree(InventoryRevisionTree):
                 path, default_revision=default_revision)
         return ret
 
+    def iter_annotations(self, paths,
+                         default_revision=_mod_revision.CURRENT_REVISION):
+        """See Tree.iter_annotations.
+
+        The server annotates each file if it can, which saves streaming the
+        history of all of them to the client.
+        """
+        for path in paths:
+            yield path, list(self.annotate_iter(path, default_revision))
+
 
 class RemoteRepositoryFormat(vf_repository.VersionedFileRepositoryFormat):
     """Format for repositories accessed over a _SmartClient.
@@ -4034,6 +4044,38 @@ class RemoteBranch(branch.Branch, _RpcHelper, lock._RelockDebugMixin):
             else:
                 raise errors.UnexpectedSmartServerResponse(response)
 
+    def revision_ids_to_dotted_revnos(self, revision_ids):
+        """See Branch.revision_ids_to_dotted_revnos.
+
+        The lookups are pipelined, so this costs about one round trip rather
+        than one per revision.
+        """
+        revision_ids = list(revision_ids)
+        result = {}
+        with self.lock_read():
+            path = self._remote_path()
+            responses = self._client.call_pipelined(
+                [(b'Branch.revision_id_to_revno', (path, revision_id))
+                 for revision_id in revision_ids])
+            try:
+                for revision_id, response in zip(revision_ids, responses):
+                    if isinstance(response, errors.ErrorFromSmartServer):
+                        try:
+                            self._translate_error(response)
+                        except errors.NoSuchRevision:
+                            continue
+                    if response[0] != b'ok':
+                        raise errors.UnexpectedSmartServerResponse(response)
+                    result[revision_id] = tuple(
+                        [int(x) for x in response[1:]])
+            except errors.UnknownSmartMethod:
+                self._ensure_real()
+                return self._real_branch.revision_ids_to_dotted_revnos(
+                    revision_ids)
+            finally:
+                responses.close()
+        return result
+
     def revision_id_to_revno(self, revision_id):
         """Given a revision id on the branch mainline, return its revno.
 
@@ -0,0 +1,246 @@
+# Copyright (C) 2019 Breezy Developers
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Persistent cache of the merge sorted revisions of a branch.
+
+The cache lives in two files in the branch control directory:
+
+``revno-cache``
+    A B+Tree index holding the merge sorted revisions for a tip revision.
+    Its keys are ``(b'tip', b'tip')``, which maps to the revno and revision
+    id of the tip, ``(b'id', revision_id)``, which maps to the position,
+    merge depth, dotted revno and end of merge flag of a revision, and
+    ``(b'revno', dotted_revno)``, which maps back to the revision id.
+
+``revno-cache-tail``
+    Revisions committed on top of the tip of ``revno-cache`` without
+    merging anything. The first line is the tip they were added to, each
+    following line is the revision id of the next mainline revision. This
+    keeps updating the cache for a commit cheap.
+
+Lookups of a single revision only read the index pages on the path to its
+key.
+"""
+
+from __future__ import absolute_import
+
+from ..lazy_import import lazy_import
+lazy_import(globals(), """
+from breezy.bzr import (
+    btree_index,
+    index as _mod_index,
+    )
+""")
+
+from .. import (
+    errors,
+    revision as _mod_revision,
+    )
+from ..trace import (
+    mutter,
+    )
+
+
+INDEX_NAME = 'revno-cache'
+TAIL_NAME = 'revno-cache-tail'
+
+
+class CachedMergeSortNode(object):
+    """A merge sorted revision, as read back from the cache.
+
+    This has the attributes of the nodes returned by KnownGraph.merge_sort.
+    """
+
+    __slots__ = ('key', 'merge_depth', 'revno', 'end_of_merge')
+
+    def __init__(self, key, merge_depth, revno, end_of_merge):
+        self.key = key
+        self.merge_depth = merge_depth
+        self.revno = revno
+        self.end_of_merge = end_of_merge
+
+
+def _revno_to_bytes(revno):
+    return b'.'.join(b'%d' % r for r in revno)
+
+
+def _bytes_to_revno(revno_bytes):
+    return tuple(int(r) for r in revno_bytes.split(b'.'))
+
+
+class RevnoCache(object):
+    """The merge sorted revisions of one tip revision."""
+
+    def __init__(self, index, base_revno, base_revid, tail):
+        self._index = index
+        self._base_revno = base_revno
+        self._base_revid = base_revid
+        self._tail = tail
+        self._tail_revnos = {revid: base_revno + i + 1
+                             for i, revid in enumerate(tail)}
+
+    @property
+    def tip(self):
+        if self._tail:
+            return self._tail[-1]
+        return self._base_revid
+
+    def get_dotted_revno(self, revision_id):
+        """Return the dotted revno of revision_id, or None."""
+        revno = self._tail_revnos.get(revision_id)
+        if revno is not None:
+            return (revno,)
+        for entry in self._index.iter_entries([(b'id', revision_id)]):
+            return _bytes_to_revno(entry[2].split(b' ')[2])
+        return None
+
+    def get_revision_id(self, revno):
+        """Return the revision id with the dotted revno revno, or None."""
+        if len(revno) == 1 and self._base_revno < revno[0]:
+            offset = revno[0] - self._base_revno - 1
+            if offset < len(self._tail):
+                return self._tail[offset]
+            return None
+        for entry in self._index.iter_entries(
+                [(b'revno', _revno_to_bytes(revno))]):
+            return entry[2]
+        return None
+
+    def iter_merge_sorted(self):
+        """Return the merge sorted revisions, most recent first.
+
+        :return: A list of objects like those from KnownGraph.merge_sort.
+        """
+        nodes = [CachedMergeSortNode(revid, 0, (self._tail_revnos[revid],),
+                                     False)
+                 for revid in reversed(self._tail)]
+        entries = []
+        for entry in self._index.iter_entries_prefix([(b'id', None)]):
+            position, depth, revno, end_of_merge = entry[2].split(b' ')
+            entries.append((int(position), entry[1][1], int(depth),
+                            _bytes_to_revno(revno), end_of_merge == b'1'))
+        entries.sort()
+        nodes.extend(CachedMergeSortNode(revid, depth, revno, end_of_merge)
+                     for _, revid, depth, revno, end_of_merge in entries)
+        return nodes
+
+
+def read_revno_cache(transport, tip):
+    """Read the cache for tip from transport.
+
+    :return: A RevnoCache, or None if there is no cache for tip.
+    """
+    try:
+        size = transport.stat(INDEX_NAME).st_size
+    except errors.NoSuchFile:
+        return None
+    except errors.TransportNotPossible:
+        size = None
+    index = btree_index.BTreeGraphIndex(transport, INDEX_NAME, size)
+    try:
+        for entry in index.iter_entries([(b'tip', b'tip')]):
+            base_revno, base_revid = entry[2].split(b' ', 1)
+            base_revno = int(base_revno)
+            break
+        else:
+            return None
+    except (errors.NoSuchFile, _mod_index.BadIndexFormatSignature,
+            _mod_index.BadIndexOptions, _mod_index.BadIndexData,
+            ValueError) as e:
+        mutter('ignoring unreadable revno cache: %s', e)
+        return None
+    tail = []
+    if base_revid != tip:
+        try:
+            lines = transport.get_bytes(TAIL_NAME).splitlines()
+        except errors.NoSuchFile:
+            return None
+        if not lines or lines[0] != base_revid:
+            return None
+        tail = lines[1:]
+    cache = RevnoCache(index, base_revno, base_revid, tail)
+    if cache.tip != tip:
+        return None
+    return cache
+
+
+def write_revno_cache(transport, tip_revno, tip, merge_sorted, mode=None):
+    """Write a new cache for tip to transport.
+
+    :param merge_sorted: The output of KnownGraph.merge_sort for tip.
+    """
+    builder = btree_index.BTreeBuilder(reference_lists=0, key_elements=2)
+    builder.add_node((b'tip', b'tip'), b'%d %s' % (tip_revno, tip))
+    for position, node in enumerate(merge_sorted):
+        revno = _revno_to_bytes(node.revno)
+        builder.add_node((b'id', node.key), b'%d %d %s %d' % (
+            position, node.merge_depth, revno, node.end_of_merge))
+        builder.add_node((b'revno', revno), node.key)
+    transport.put_file(INDEX_NAME, builder.finish(), mode=mode)
+    try:
+        transport.delete(TAIL_NAME)
+    except errors.NoSuchFile:
+        pass
+
+
+def extend_revno_cache(transport, old_tip, new_revids, mode=None):
+    """Record mainline revisions committed on top of old_tip.
+
+    :param new_revids: The new revisions, oldest first. Each must have its
+        predecessor as its only parent.
+    :return: True if the cache was extended, False if it was not for
+        old_tip.
+    """
+    cache = read_revno_cache(transport, old_tip)
+    if cache is None:
+        return False
+    lines = [cache._base_revid] + cache._tail + list(new_revids)
+    transport.put_bytes(TAIL_NAME, b''.join(l + b'\n' for l in lines),
+                        mode=mode)
+    return True
+
+
+def find_linear_extension(repository, old_revno, old_tip, new_revno, new_tip):
+    """Find the revisions between old_tip and new_tip.
+
+    :return: The revisions after old_tip up to and including new_tip, oldest
+        first, or None if new_tip is not a descendant of old_tip that only
+        adds single-parent revisions to the mainline.
+    """
+    if (new_revno <= old_revno or _mod_revision.is_null(old_tip)
+            or _mod_revision.is_null(new_tip)):
+        return None
+    graph = repository.get_graph()
+    revids = []
+    try:
+        for revid in graph.iter_lefthand_ancestry(new_tip):
+            if revid == old_tip:
+                break
+            if len(revids) == new_revno - old_revno:
+                return None
+            revids.append(revid)
+        else:
+            return None
+    except errors.RevisionNotPresent:
+        return None
+    if len(revids) != new_revno - old_revno:
+        return None
+    parent_map = graph.get_parent_map(revids)
+    for revid in revids:
+        if len(parent_map.get(revid, ())) != 1:
+            return None
+    revids.reverse()
+    return revids
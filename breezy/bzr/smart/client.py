@@ -16,9 +16,14 @@
 
 from __future__ import absolute_import
 
+import collections
+
 from ... import lazy_import
 lazy_import.lazy_import(globals(), """
-from breezy.bzr.smart import request as _mod_request
+from breezy.bzr.smart import (
+    medium as _mod_medium,
+    request as _mod_request,
+    )
 """)
 
 import breezy
@@ -33,6 +38,10 @@ from ... import (
 
 class _SmartClient(object):
 
+    # The number of requests call_pipelined sends before reading the oldest
+    # response.
+    _max_pipelined_requests = 16
+
     def __init__(self, medium, headers=None):
         """Constructor.
 
@@ -109,6 +118,76 @@ class _SmartClient(object):
             expect_response_body=False)
         return (response, response_handler)
 
+    def call_pipelined(self, calls):
+        """Call several methods without waiting for each response in turn.
+
+        On stream mediums speaking protocol 3, up to _max_pipelined_requests
+        requests are sent before the oldest response is read, which saves a
+        round trip per call. Otherwise the calls are made one at a time.
+
+        As the requests can not be retried individually, only use this for
+        read-only methods that do not take or return bodies.
+
+        :param calls: An iterable of (method, args) tuples.
+        :return: An iterator over the result of each call, in order. A
+            result is the response tuple, like call() returns, or the
+            ErrorFromSmartServer exception for the call if the server
+            replied with an error.
+        """
+        calls = iter(calls)
+        if self._medium._protocol_version is None:
+            # The first call finds out what protocol the server speaks.
+            for method, args in calls:
+                yield self._call_catching_error(method, args)
+                break
+        if (self._medium._protocol_version != 3
+                or not isinstance(self._medium,
+                                  _mod_medium.SmartClientStreamMedium)):
+            for method, args in calls:
+                yield self._call_catching_error(method, args)
+            return
+        pending = collections.deque()
+        self._medium.start_pipelining()
+        try:
+            for method, args in calls:
+                request = _SmartClientRequest(self, method, args,
+                                              expect_response_body=False)
+                request._run_call_hooks()
+                encoder, response_handler = request._construct_protocol(3)
+                request._send_no_retry(encoder)
+                pending.append(response_handler)
+                if len(pending) >= self._max_pipelined_requests:
+                    yield self._read_pipelined_response(pending.popleft())
+            self._medium.stop_pipelining()
+            while pending:
+                yield self._read_pipelined_response(pending.popleft())
+        except errors.ConnectionReset:
+            # The responses to the outstanding requests are lost.
+            pending.clear()
+            self._medium.reset()
+            raise
+        finally:
+            self._medium.stop_pipelining()
+            # Keep the stream in sync if we were not iterated to the end.
+            while pending:
+                try:
+                    pending.popleft().read_response_tuple(expect_body=False)
+                except (errors.ErrorFromSmartServer,
+                        errors.UnknownSmartMethod):
+                    pass
+
+    def _call_catching_error(self, method, args):
+        try:
+            return self.call(method, *args)
+        except errors.ErrorFromSmartServer as err:
+            return err
+
+    def _read_pipelined_response(self, response_handler):
+        try:
+            return response_handler.read_response_tuple(expect_body=False)
+        except errors.ErrorFromSmartServer as err:
+            return err
+
     def remote_path_from_transport(self, transport):
         """Convert transport into a path suitable for using in a request.
 
@@ -26,6 +26,7 @@ breezy/transport/smart/__init__.py.
 
 from __future__ import absolute_import
 
+import collections
 import errno
 import io
 import os
@@ -296,7 +297,11 @@ class SmartServerStreamMedium(SmartMedium):
 
         :returns: a SmartServerRequestProtocol.
         """
-        self._wait_for_bytes_with_timeout(self._client_timeout)
+        if self._push_back_buffer is None:
+            # Pipelining clients may have sent the next request already, in
+            # which case it is sitting in the push back buffer rather than
+            # waiting on the stream.
+            self._wait_for_bytes_with_timeout(self._client_timeout)
         if self.finished:
             # We're stopping, so don't try to do any more work
             return None
@@ -883,6 +888,11 @@ class SmartClientStreamMedium(SmartClientMedium):
     def __init__(self, base):
         SmartClientMedium.__init__(self, base)
         self._current_request = None
+        # While pipelining, requests that have been sent but whose responses
+        # have not been read yet, oldest first. Responses arrive in this
+        # order, so only the first request may read.
+        self._unread_requests = collections.deque()
+        self._pipelining = False
 
     def accept_bytes(self, bytes):
         self._accept_bytes(bytes)
@@ -916,6 +926,21 @@ class SmartClientStreamMedium(SmartClientMedium):
         """
         self.disconnect()
         self._current_request = None
+        self._unread_requests.clear()
+
+    def start_pipelining(self):
+        """Allow new requests to be sent before earlier responses are read.
+
+        Responses must still be read in the order the requests were sent.
+        """
+        self._pipelining = True
+
+    def stop_pipelining(self):
+        """Stop sending requests before earlier responses are read.
+
+        Requests sent while pipelining still need their responses read.
+        """
+        self._pipelining = False
 
 
 class SmartSimplePipesClientMedium(SmartClientStreamMedium):
@@ -1203,12 +1228,33 @@ class SmartClientStreamMediumRequest(SmartClientMediumRequest):
         """
         self._medium._accept_bytes(bytes)
 
+    def _check_turn_to_read(self):
+        """Check that the next response on the stream belongs to this request.
+        """
+        unread_requests = self._medium._unread_requests
+        if unread_requests and unread_requests[0] is not self:
+            raise errors.TooManyConcurrentRequests(self._medium)
+
+    def _read_bytes(self, count):
+        """See SmartClientMediumRequest._read_bytes."""
+        self._check_turn_to_read()
+        return self._medium.read_bytes(count)
+
+    def _read_line(self):
+        """See SmartClientMediumRequest._read_line."""
+        self._check_turn_to_read()
+        return self._medium._get_line()
+
     def _finished_reading(self):
         """See SmartClientMediumRequest._finished_reading.
 
         This clears the _current_request on self._medium to allow a new
         request to be created.
         """
+        unread_requests = self._medium._unread_requests
+        if unread_requests and unread_requests[0] is self:
+            unread_requests.popleft()
+            return
         if self._medium._current_request is not self:
             raise AssertionError()
         self._medium._current_request = None
@@ -1217,5 +1263,10 @@ class SmartClientStreamMediumRequest(SmartClientMediumRequest):
         """See SmartClientMediumRequest._finished_writing.
 
         This invokes self._medium._flush to ensure all bytes are transmitted.
+        When the medium is pipelining, the next request may be sent before
+        the response to this one is read.
         """
         self._medium._flush()
+        if self._medium._pipelining:
+            self._medium._current_request = None
+            self._medium._unread_requests.append(self)
@@ -72,6 +72,14 @@ class MessageHandler(object):
         """
         raise NotImplementedError(self.bytes_received)
 
+    def _push_back_unused_data(self):
+        # When requests are pipelined, the medium may have read the start of
+        # the next response along with the end of this one.
+        unused_data = self._protocol_decoder.unused_data
+        if unused_data:
+            self._protocol_decoder.unused_data = b''
+            self._medium_request._medium._push_back(unused_data)
+
     def protocol_error(self, exception):
         """Called when there is a protocol decoding error.
 
@@ -283,6 +291,7 @@ class ConventionalResponseHandler(MessageHandler, ResponseHandler):
         if next_read_size == 0:
             # a complete request has been read.
             self.finished_reading = True
+            self._push_back_unused_data()
             self._medium_request.finished_reading()
             return
         data = self._medium_request.read_bytes(next_read_size)
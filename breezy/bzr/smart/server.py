@@ -18,6 +18,7 @@
 
 from __future__ import absolute_import
 
+import collections
 import errno
 import os.path
 import socket
@@ -25,6 +26,11 @@ import sys
 import time
 import threading
 
+try:
+    import selectors
+except ImportError:  # Python < 3.4
+    selectors = None
+
 from ...hooks import Hooks
 from ... import (
     errors,
@@ -49,11 +55,228 @@ from breezy import (
 """)
 
 
+class _SmartServerWorkerPool(object):
+    """Serve the requests of many connections with a fixed number of threads.
+
+    Connections that are waiting for their next request are parked in a
+    selector. Once a request starts arriving the connection is queued for one
+    of the worker threads, which serves that single request and then hands
+    the connection back to the selector.
+    """
+
+    # The longest time the selector waits before checking for idle clients
+    _POLL_TIMEOUT = 1.0
+
+    def __init__(self, max_workers, client_timeout, thread_name_suffix=''):
+        self._max_workers = max_workers
+        self._client_timeout = client_timeout
+        self._thread_name_suffix = thread_name_suffix
+        self._selector = selectors.DefaultSelector()
+        self._lock = threading.Lock()
+        self._work_available = threading.Condition(self._lock)
+        # Connections with a request ready to be served
+        self._queued = collections.deque()
+        # Connections that have finished a request and need parking again
+        self._returned = []
+        # Parked connection -> time of its last request
+        self._idle = {}
+        self._active = set()
+        self._stopping = False
+        self.connections_served = 0
+        self.requests_served = 0
+        self._wakeup_recv, self._wakeup_send = socket.socketpair()
+        self._wakeup_recv.setblocking(False)
+        self._selector.register(self._wakeup_recv, selectors.EVENT_READ)
+        self._threads = []
+
+    def start(self):
+        thread = threading.Thread(
+            None, self._run_selector,
+            name='smart-server-selector' + self._thread_name_suffix)
+        thread.daemon = True
+        self._threads.append(thread)
+        for i in range(self._max_workers):
+            thread = threading.Thread(
+                None, self._run_worker,
+                name='smart-server-worker' + self._thread_name_suffix)
+            thread.daemon = True
+            self._threads.append(thread)
+        for thread in self._threads:
+            thread.start()
+
+    def add_connection(self, handler):
+        """Start serving the connection of handler."""
+        with self._lock:
+            self.connections_served += 1
+            self._returned.append(handler)
+        self._wakeup()
+
+    def get_metrics(self):
+        """Return a dict describing the connections of this pool.
+
+        'active' connections are being served by a worker, 'queued' ones have
+        a request waiting for a worker and 'idle' ones are waiting for their
+        next request.
+        """
+        with self._lock:
+            return {
+                'workers': self._max_workers,
+                'active': len(self._active),
+                'queued': len(self._queued),
+                'idle': len(self._idle) + len(self._returned),
+                'connections_served': self.connections_served,
+                'requests_served': self.requests_served,
+                }
+
+    def has_connections(self):
+        with self._lock:
+            return bool(self._active or self._queued or self._idle
+                        or self._returned)
+
+    def stop_gracefully(self):
+        """Disconnect idle clients, and others once their request is done."""
+        with self._lock:
+            self._stopping = True
+            for handler in self._active.union(self._queued):
+                handler._stop_gracefully()
+            self._work_available.notify_all()
+        self._wakeup()
+
+    def join(self, timeout=None):
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _wakeup(self):
+        try:
+            self._wakeup_send.send(b'\0')
+        except socket.error:
+            pass
+
+    def _run_selector(self):
+        if self._client_timeout is None:
+            poll_timeout = self._POLL_TIMEOUT
+        else:
+            poll_timeout = min(self._client_timeout / 10.0,
+                               self._POLL_TIMEOUT)
+        while True:
+            with self._lock:
+                returned, self._returned = self._returned, []
+                stopping = self._stopping
+                if stopping and not (self._active or self._queued):
+                    break
+            now = time.time()
+            for handler in returned:
+                if stopping:
+                    self._close(handler)
+                    continue
+                self._idle[handler] = now
+                self._selector.register(
+                    handler.socket, selectors.EVENT_READ, handler)
+            if stopping:
+                for handler in list(self._idle):
+                    self._unpark(handler)
+                    self._close(handler)
+            ready = []
+            for key, events in self._selector.select(poll_timeout):
+                if key.data is None:
+                    try:
+                        self._wakeup_recv.recv(4096)
+                    except socket.error:
+                        pass
+                else:
+                    ready.append(key.data)
+            for handler in ready:
+                self._unpark(handler)
+            if ready:
+                with self._lock:
+                    stopping = self._stopping
+                    if not stopping:
+                        self._queued.extend(ready)
+                        self._work_available.notify(len(ready))
+                if stopping:
+                    # The workers may already have exited.
+                    for handler in ready:
+                        self._close(handler)
+            if self._client_timeout is None:
+                continue
+            now = time.time()
+            for handler, last_active in list(self._idle.items()):
+                if now - last_active > self._client_timeout:
+                    trace.note('%s' % (errors.ConnectionTimeout(
+                        'disconnecting client after %.1f seconds'
+                        % (self._client_timeout,)),))
+                    self._unpark(handler)
+                    self._close(handler)
+        with self._lock:
+            returned, self._returned = self._returned, []
+            self._work_available.notify_all()
+        for handler in returned:
+            self._close(handler)
+        for handler in list(self._idle):
+            self._unpark(handler)
+            self._close(handler)
+        self._selector.close()
+        self._wakeup_recv.close()
+        self._wakeup_send.close()
+
+    def _unpark(self, handler):
+        del self._idle[handler]
+        try:
+            self._selector.unregister(handler.socket)
+        except (KeyError, ValueError):
+            pass
+
+    def _close(self, handler):
+        try:
+            handler._disconnect_client()
+        except socket.error:
+            pass
+
+    def _run_worker(self):
+        while True:
+            with self._lock:
+                while not self._queued:
+                    if self._stopping:
+                        return
+                    self._work_available.wait()
+                handler = self._queued.popleft()
+                self._active.add(handler)
+            try:
+                self._serve_one_request(handler)
+            finally:
+                with self._lock:
+                    self._active.discard(handler)
+                    self.requests_served += 1
+                    if handler.finished:
+                        # Closed below, outside the lock.
+                        pass
+                    elif handler._push_back_buffer is not None:
+                        # The client already sent its next request.
+                        self._queued.append(handler)
+                        self._work_available.notify()
+                    else:
+                        self._returned.append(handler)
+                if handler.finished:
+                    self._close(handler)
+                self._wakeup()
+
+    def _serve_one_request(self, handler):
+        try:
+            protocol = handler._build_protocol()
+            handler._serve_one_request(protocol)
+        except Exception as e:
+            trace.mutter('%s terminating on exception %s' % (handler, e))
+            trace.log_exception_quietly()
+            handler.finished = True
+
+
 class SmartTCPServer(object):
     """Listens on a TCP socket and accepts connections from smart clients.
 
     Each connection will be served by a SmartServerSocketStreamMedium running in
-    a thread.
+    a thread. If max_workers is set, a pool of that many threads serves the
+    requests of all connections instead, and connections waiting for their
+    next request do not hold a thread.
 
     hooks: An instance of SmartServerHooks.
     """
@@ -68,7 +291,7 @@ class SmartTCPServer(object):
     _timer = time.time
 
     def __init__(self, backing_transport, root_client_path='/',
-                 client_timeout=None):
+                 client_timeout=None, max_workers=None):
         """Construct a new server.
 
         To actually start it running, call either start_background_thread or
@@ -79,20 +302,31 @@ class SmartTCPServer(object):
             of backing_transport.
         :param client_timeout: See SmartServerSocketStreamMedium's timeout
             parameter.
+        :param max_workers: The number of threads serving requests, or None
+            to use a thread per connection.
         """
         self.backing_transport = backing_transport
         self.root_client_path = root_client_path
         self._client_timeout = client_timeout
+        if max_workers is not None and selectors is None:
+            trace.warning(gettext(
+                'A worker pool needs the selectors module, '
+                'using a thread per connection.'))
+            max_workers = None
+        self._max_workers = max_workers
+        self._pool = None
         self._active_connections = []
         # This is set to indicate we want to wait for clients to finish before
         # we disconnect.
         self._gracefully_stopping = False
 
-    def start_server(self, host, port):
+    def start_server(self, host, port, backlog=1):
         """Create the server listening socket.
 
         :param host: Name of the interface to listen on.
         :param port: TCP port to listen on, or 0 to allocate a transient port.
+        :param backlog: The number of connections the operating system queues
+            for us before refusing new ones.
         """
         # let connections timeout so that we get a chance to terminate
         # Keep a reference to the exceptions we want to catch because the socket
@@ -117,7 +351,7 @@ class SmartTCPServer(object):
             raise errors.CannotBindAddress(host, port, message)
         self._sockname = self._server_socket.getsockname()
         self.port = self._sockname[1]
-        self._server_socket.listen(1)
+        self._server_socket.listen(backlog)
         self._server_socket.settimeout(self._ACCEPT_TIMEOUT)
         # Once we start accept()ing connections, we set started.
         self._started = threading.Event()
@@ -171,8 +405,30 @@ class SmartTCPServer(object):
         self._gracefully_stopping = True
         for handler, _ in self._active_connections:
             handler._stop_gracefully()
+        if self._pool is not None:
+            self._pool.stop_gracefully()
+
+    def get_metrics(self):
+        """Return a dict with the number of active and queued connections.
+
+        With a worker pool, connections waiting for their next request are
+        counted as 'idle' rather than 'active'.
+        """
+        if self._pool is not None:
+            return self._pool.get_metrics()
+        return {
+            'workers': None,
+            'active': len(self._active_connections),
+            'queued': 0,
+            'idle': 0,
+            }
 
     def _wait_for_clients_to_disconnect(self):
+        if self._pool is not None:
+            if self._pool.has_connections():
+                trace.note(gettext('Waiting for clients to finish'))
+            self._pool.join()
+            return
         self._poll_active_connections()
         if not self._active_connections:
             return
@@ -201,6 +457,10 @@ class SmartTCPServer(object):
         # for hooks we are letting code know that a server has started (and
         # later stopped).
         self.run_server_started_hooks()
+        if self._max_workers is not None:
+            self._pool = _SmartServerWorkerPool(
+                self._max_workers, self._client_timeout, thread_name_suffix)
+            self._pool.start()
         self._started.set()
         try:
             try:
@@ -241,6 +501,8 @@ class SmartTCPServer(object):
             self._stopped.set()
             signals.unregister_on_hangup(id(self))
             self.run_server_stopped_hooks()
+        if self._pool is not None and not self._gracefully_stopping:
+            self._pool.stop_gracefully()
         if self._gracefully_stopping:
             self._wait_for_clients_to_disconnect()
         self._fully_stopped.set()
@@ -267,7 +529,7 @@ class SmartTCPServer(object):
         still_active = []
         for handler, thread in self._active_connections:
             thread.join(timeout)
-            if thread.isAlive():
+            if thread.is_alive():
                 still_active.append((handler, thread))
         self._active_connections = still_active
 
@@ -276,8 +538,11 @@ class SmartTCPServer(object):
         # propagates to the newly accepted socket.
         conn.setblocking(True)
         conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
-        thread_name = 'smart-server-child' + thread_name_suffix
         handler = self._make_handler(conn)
+        if self._pool is not None:
+            self._pool.add_connection(handler)
+            return None
+        thread_name = 'smart-server-child' + thread_name_suffix
         connection_thread = threading.Thread(
             None, handler.serve, name=thread_name)
         self._active_connections.append((handler, connection_thread))
@@ -453,9 +718,15 @@ class BzrServerFactory(object):
                 host = medium.BZR_DEFAULT_INTERFACE
             if port is None:
                 port = medium.BZR_DEFAULT_PORT
+            c = config.GlobalStack()
+            max_workers = c.get('serve.max_workers')
+            if not max_workers:
+                max_workers = None
             smart_server = SmartTCPServer(self.transport,
-                                          client_timeout=timeout)
-            smart_server.start_server(host, port)
+                                          client_timeout=timeout,
+                                          max_workers=max_workers)
+            smart_server.start_server(host, port,
+                                      backlog=c.get('serve.listen_backlog'))
             trace.note(gettext('listening on port: %s'),
                        str(smart_server.port))
         self.smart_server = smart_server
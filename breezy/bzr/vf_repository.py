@@ -2442,6 +2442,8 @@ class InterVersionedFileRepository(InterRepository):
 
 class InterDifferingSerializer(InterVersionedFileRepository):
 
+    _fetch_batch_size = 100
+
     @classmethod
     def _get_repo_format_to_test(self):
         return None
@@ -2680,28 +2682,41 @@ class InterDifferingSerializer(InterVersionedFileRepository):
             self.target.add_revision(revision.revision_id, revision)
         return basis_id
 
-    def _fetch_all_revisions(self, revision_ids, pb):
+    def _fetch_all_revisions(self, revision_ids, pb, heads=None):
         """Fetch everything for the list of revisions.
 
+        Every batch of revisions is committed in its own write group, so an
+        interrupted fetch keeps the batches it completed. The progress is
+        recorded in a FetchCheckpoint for heads, if given.
+
         :param revision_ids: The list of revisions to fetch. Must be in
             topological order.
         :param pb: A ProgressTask
+        :param heads: The heads of revision_ids.
         :return: None
         """
         basis_id, basis_tree = self._get_basis(revision_ids[0])
-        batch_size = 100
+        memory_limit = _mod_config.LocationStack(self.target.user_url).get(
+            'repository.fetch_batch_memory')
+        sizer = _mod_fetch.BatchSizer(self._fetch_batch_size, memory_limit)
         cache = lru_cache.LRUCache(100)
         cache[basis_id] = basis_tree
         del basis_tree  # We don't want to hang on to it here
-        hints = []
-        a_graph = None
-
-        for offset in range(0, len(revision_ids), batch_size):
+        if heads is not None:
+            checkpoint = _mod_fetch.FetchCheckpoint(self.target, heads)
+            done, hints = checkpoint.load()
+        else:
+            checkpoint = None
+            done, hints = 0, []
+        total = done + len(revision_ids)
+        offset = 0
+        while offset < len(revision_ids):
             self.target.start_write_group()
             try:
-                pb.update(gettext('Transferring revisions'), offset,
-                          len(revision_ids))
-                batch = revision_ids[offset:offset + batch_size]
+                pb.update(gettext('Transferring revisions'), done + offset,
+                          total)
+                batch = revision_ids[offset:offset + sizer.size]
+                sizer.start_batch()
                 basis_id = self._fetch_batch(batch, basis_id, cache)
             except:
                 self.source._safe_to_return_from_cache = False
@@ -2711,10 +2726,15 @@ class InterDifferingSerializer(InterVersionedFileRepository):
                 hint = self.target.commit_write_group()
                 if hint:
                     hints.extend(hint)
+            offset += len(batch)
+            sizer.finish_batch(len(batch))
+            if checkpoint is not None and offset < len(revision_ids):
+                checkpoint.record(done + offset, hints)
         if hints and self.target._format.pack_compresses:
             self.target.pack(hint=hints)
-        pb.update(gettext('Transferring revisions'), len(revision_ids),
-                  len(revision_ids))
+        if checkpoint is not None:
+            checkpoint.finish()
+        pb.update(gettext('Transferring revisions'), total, total)
 
     def fetch(self, revision_id=None, find_ghosts=False,
               fetch_spec=None):
@@ -2749,15 +2769,17 @@ class InterDifferingSerializer(InterVersionedFileRepository):
                                                                        find_ghosts=find_ghosts).get_keys()
             if not revision_ids:
                 return 0, 0
-            revision_ids = tsort.topo_sort(
-                self.source.get_graph().get_parent_map(revision_ids))
+            parent_map = self.source.get_graph().get_parent_map(revision_ids)
+            revision_ids = tsort.topo_sort(parent_map)
             if not revision_ids:
                 return 0, 0
+            heads = set(parent_map).difference(
+                itertools.chain.from_iterable(viewvalues(parent_map)))
             # Walk though all revisions; get inventory deltas, copy referenced
             # texts that delta references, insert the delta, revision and
             # signature.
             with ui.ui_factory.nested_progress_bar() as pb:
-                self._fetch_all_revisions(revision_ids, pb)
+                self._fetch_all_revisions(revision_ids, pb, heads)
             return len(revision_ids), 0
 
     def _get_basis(self, first_revision_id):
@@ -858,6 +858,79 @@ class InventoryWorkingTree(WorkingTree, MutableInventoryTree):
                            for key, line in annotator.annotate_flat(this_key)]
             return annotations
 
+    def iter_annotations(self, paths,
+                         default_revision=_mod_revision.CURRENT_REVISION):
+        """See Tree.iter_annotations
+
+        Files that are unchanged from the only parent tree are annotated as
+        they are there. The text of other files is annotated against the
+        file in the parent trees, as annotate_iter does.
+        """
+        with self.lock_read():
+            parent_trees = []
+            try:
+                for parent_id in self.get_parent_ids():
+                    try:
+                        parent_tree = self.revision_tree(parent_id)
+                    except errors.NoSuchRevisionInTree:
+                        parent_tree = self.branch.repository.revision_tree(
+                            parent_id)
+                    parent_tree.lock_read()
+                    parent_trees.append(parent_tree)
+                for result in self._iter_annotations(
+                        paths, parent_trees, default_revision):
+                    yield result
+            finally:
+                for parent_tree in parent_trees:
+                    parent_tree.unlock()
+
+    def _iter_annotations(self, paths, parent_trees, default_revision):
+        unchanged = set()
+        if len(parent_trees) == 1:
+            unchanged.update(paths)
+            for change in self.iter_changes(parent_trees[0],
+                                            specific_files=paths):
+                unchanged.discard(change[1][1])
+        annotator = self.branch.repository.texts.get_annotator()
+        graph = None
+        path_by_key = {}
+        for path in paths:
+            file_id = self.path2id(path)
+            if file_id is None:
+                raise errors.NoSuchFile(path)
+            if path in unchanged:
+                text_key = (file_id, parent_trees[0].get_file_revision(path))
+                path_by_key[text_key] = path
+                continue
+            maybe_file_parent_keys = []
+            for parent_tree in parent_trees:
+                try:
+                    parent_path = parent_tree.id2path(file_id)
+                except errors.NoSuchId:
+                    continue
+                if parent_tree.kind(parent_path) != 'file':
+                    continue
+                parent_text_key = (
+                    file_id, parent_tree.get_file_revision(parent_path))
+                if parent_text_key not in maybe_file_parent_keys:
+                    maybe_file_parent_keys.append(parent_text_key)
+            if len(maybe_file_parent_keys) > 1:
+                if graph is None:
+                    graph = self.branch.repository.get_file_graph()
+                heads = graph.heads(maybe_file_parent_keys)
+                file_parent_keys = [key for key in maybe_file_parent_keys
+                                    if key in heads]
+            else:
+                file_parent_keys = maybe_file_parent_keys
+            this_key = (file_id, default_revision)
+            annotator.add_special_text(this_key, file_parent_keys,
+                                       self.get_file_text(path))
+            path_by_key[this_key] = path
+        for text_key, annotations in annotator.iter_annotate_flat(
+                path_by_key):
+            yield path_by_key[text_key], [
+                (key[-1], line) for key, line in annotations]
+
     def _put_rio(self, filename, stanzas, header):
         self._must_be_locked()
         my_file = _mod_rio.rio_file(stanzas, header)
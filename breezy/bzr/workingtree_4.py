@@ -49,6 +49,7 @@ from breezy import (
     )
 from breezy.bzr import (
     dirstate,
+    fsmonitor,
     )
 """)
 
@@ -59,6 +60,7 @@ from ..lockdir import LockDir
 from .inventorytree import (
     InventoryTree,
     InventoryRevisionTree,
+    _iter_annotations_by_text_key,
     )
 from ..mutabletree import (
     BadReferenceTarget,
@@ -118,6 +120,8 @@ class DirStateWorkingTree(InventoryWorkingTree):
         # None the rest of the time.
         self._dirstate = None
         self._inventory = None
+        # The walk to write a file system monitor snapshot for on unlock.
+        self._fsmonitor_walker = None
         # -------------
         self._setup_directory_is_tree_reference()
         self._detect_case_handling()
@@ -279,6 +283,58 @@ class DirStateWorkingTree(InventoryWorkingTree):
         conf = self.get_config_stack()
         return conf.get('bzr.workingtree.worth_saving_limit')
 
+    def extras(self):
+        """See WorkingTree.extras.
+
+        If a file system monitor watches the tree, only the directories it
+        saw change are read.
+        """
+        walker = self._get_monitored_walker()
+        if walker is None:
+            return super(DirStateWorkingTree, self).extras()
+        return (path.decode('utf8')
+                for path in walker.iter_unversioned(self.basedir))
+
+    def _get_monitored_walker(self):
+        """Return a walker for the changes seen by a file system monitor.
+
+        :return: A fsmonitor.MonitoredWalker, or None if the tree is not
+            monitored.
+        """
+        sock = fsmonitor.connect(self.basedir)
+        if sock is None:
+            return None
+        snapshot = fsmonitor.read_snapshot(self._transport)
+        if snapshot is None:
+            token, dirs = None, {}
+        else:
+            token, dirs = snapshot
+        result = fsmonitor.query_changes(sock, token)
+        if result is None:
+            return None
+        token, changed = result
+        if changed is None:
+            # Everything has to be read again.
+            dirs, changed = {}, set()
+        return fsmonitor.MonitoredWalker(
+            self.current_dirstate(), token, dirs, changed)
+
+    def _save_fsmonitor_snapshot(self, walker):
+        """Save the listings of a complete walk of the tree.
+
+        This must only happen when the dirstate on disk has all the stat
+        values the walk relied on, as the next walk uses them for paths the
+        monitor did not see change.
+        """
+        if (self._dirstate._dirblock_state !=
+                dirstate.DirState.IN_MEMORY_UNMODIFIED):
+            return
+        try:
+            fsmonitor.write_snapshot(self._transport, walker.token,
+                                     walker.dirs)
+        except (errors.TransportNotPossible, errors.PermissionDenied) as e:
+            trace.mutter('failed to save fsmonitor snapshot: %s', e)
+
     def filter_unversioned_files(self, paths):
         """Filter out paths that are versioned.
 
@@ -1202,9 +1258,21 @@ class DirStateWorkingTree(InventoryWorkingTree):
                 if self._dirty:
                     self.flush()
             if self._dirstate is not None:
+                walker = self._fsmonitor_walker
+                if walker is not None and walker.updated_dirstate():
+                    if self._dirstate._worth_saving_limit == -1:
+                        walker = None
+                    else:
+                        # The next walk takes stat values from the saved
+                        # dirstate, so all updates from this one must be
+                        # saved.
+                        self._dirstate._mark_modified()
                 # This is a no-op if there are no modifications.
                 self._dirstate.save()
+                if walker is not None:
+                    self._save_fsmonitor_snapshot(walker)
                 self._dirstate.unlock()
+            self._fsmonitor_walker = None
             # TODO: jam 20070301 We shouldn't have to wipe the dirstate at this
             #       point. Instead, it could check if the header has been
             #       modified when it is locked, and if not, it can hang on to
@@ -1730,6 +1798,12 @@ class DirStateRevisionTree(InventoryTree):
         annotations = self._repository.texts.annotate(text_key)
         return [(key[-1], line) for (key, line) in annotations]
 
+    def iter_annotations(self, paths,
+                         default_revision=_mod_revision.CURRENT_REVISION):
+        """See Tree.iter_annotations"""
+        return _iter_annotations_by_text_key(self, self._repository.texts,
+                                             paths)
+
     def _comparison_data(self, entry, path):
         """See Tree._comparison_data."""
         if entry is None:
@@ -2243,11 +2317,36 @@ class InterDirStateTree(InterTree):
             # would be good here.
             search_specific_files_utf8.add(path.encode('utf8'))
 
+        hash_workers = self.target.get_config_stack().get(
+            'status.hash_workers')
+        if hash_workers > 1 and source_index is not None:
+            state.update_sha1s_in_parallel(
+                self.target.basedir, search_specific_files_utf8, hash_workers)
+
         iter_changes = self.target._iter_changes(
             include_unchanged, self.target._supports_executable(),
             search_specific_files_utf8, state, source_index, target_index,
             want_unversioned, self.target)
-        return iter_changes.iter_changes()
+        walker = self.target._get_monitored_walker()
+        if walker is not None:
+            try:
+                iter_changes.walkdirs = walker.walkdirs
+            except AttributeError:
+                # A compiled extension that predates the walkdirs hook.
+                walker = None
+        if walker is None:
+            return iter_changes.iter_changes()
+        return self._iter_monitored_changes(
+            iter_changes.iter_changes(), walker,
+            search_specific_files_utf8 == {b''})
+
+    def _iter_monitored_changes(self, changes, walker, complete):
+        for change in changes:
+            yield change
+        if complete:
+            # The walk covered the whole tree, so it can be used as snapshot
+            # once the dirstate is saved.
+            self.target._fsmonitor_walker = walker
 
     @staticmethod
     def is_compatible(source, target):
@@ -1207,6 +1207,9 @@ def run_bzr(argv, load_plugins=load_plugins, disable_plugins=disable_plugins):
         # --verbose in their own way.
         if 'memory' in debug.debug_flags:
             trace.debug_memory('Process status after command:', short=False)
+        if 'http' in debug.debug_flags:
+            from .transport.http._urllib2_wrappers import connection_pool
+            connection_pool.report()
         option._verbosity_level = saved_verbosity_level
         # Reset the overrides
         cmdline_overrides._reset()
@@ -2758,6 +2758,16 @@ option_registry.register(
 option_registry.register(
     Option('child_submit_to',
            help='''Where submissions to this branch are mailed to.'''))
+option_registry.register(
+    Option('chk_map.page_cache_size', default=u'16MB',
+           from_unicode=int_SI_from_store, invalid='warning',
+           help='''\
+Size of the cache of CHK map pages shared by all threads.
+
+CHK maps hold the inventories of 2a repositories. Fetches of revisions with
+very large inventories are faster with a larger cache. Run with -Dchk to see
+how well the cache did.
+'''))
 option_registry.register(
     Option('create_signatures', default=SIGN_WHEN_REQUIRED,
            from_unicode=signing_policy_from_unicode,
@@ -2799,6 +2809,16 @@ GPG key to use for signing.
 
 This defaults to the first key associated with the users email.
 """))
+option_registry.register(
+    Option('http.readv_connections', default=1, from_unicode=int_from_store,
+           invalid='warning',
+           help='''\
+Maximum number of connections used to read parts of a file over http.
+
+When greater than 1, the range requests needed by a single readv are
+issued concurrently over a pool of persistent connections, with the
+concurrency adapted to the observed latency and throughput.
+'''))
 option_registry.register(
     Option('language',
            help='Language to translate messages into.'))
@@ -2884,6 +2904,38 @@ If true (default), repository changes are flushed through the OS buffers
 to physical disk.  This is somewhat slower, but means data should not be
 lost if the machine crashes.  See also dirstate.fdatasync.
 '''))
+option_registry.register(
+    Option('repository.fetch_batch_memory', default=u'256MB',
+           from_unicode=int_SI_from_store, invalid='warning',
+           help='''\
+Memory a batch of converted revisions may use during a fetch.
+
+Fetches that convert revisions between formats, such as imports from git,
+commit the converted revisions in batches. The size of the batches is
+adjusted so that the memory used by each stays below this value. A value
+of 0 keeps the batch size fixed.
+'''))
+option_registry.register(
+    Option('repository.index_bloom_filters', default=False,
+           from_unicode=bool_from_store,
+           help='''\
+Keep Bloom filters of the keys in pack indices?
+
+If true, a small Bloom filter is written next to each new B+Tree index of a
+pack repository, and lookups skip the indices whose filter shows they can
+not contain a key. This speeds up repositories with many packs.
+'''))
+option_registry.register(
+    Option('repository.pack_jobs', default=1,
+           from_unicode=int_from_store, invalid='warning',
+           help='''\
+Number of processes used to recompress file texts when packing.
+
+With a value larger than 1, file texts are compressed by a pool of worker
+processes when a 2a repository is packed. This speeds up packing large
+repositories on multi-core machines, at the cost of slightly different
+grouping of the compressed texts.
+'''))
 option_registry.register_lazy('smtp_server',
                               'breezy.smtp_connection', 'smtp_server')
 option_registry.register_lazy('smtp_password',
@@ -2912,10 +2964,46 @@ option_registry.register(
            default=300.0, from_unicode=float_from_store,
            help="If we wait for a new request from a client for more than"
                 " X seconds, consider the client idle, and hangup."))
+option_registry.register(
+    Option('serve.max_workers',
+           default=0, from_unicode=int_from_store, invalid='warning',
+           help="""\
+The number of threads serving requests in 'brz serve'.
+
+If set, connections waiting for their next request are watched by a single
+thread instead of holding a thread each. 0 means a thread per connection.
+"""))
+option_registry.register(
+    Option('serve.listen_backlog',
+           default=1, from_unicode=int_from_store, invalid='warning',
+           help="""\
+The number of connections queued by the operating system for 'brz serve'
+before new ones are refused.
+"""))
+option_registry.register(
+    Option('sftp.max_outstanding_requests',
+           default=64, from_unicode=int_from_store, invalid='warning',
+           help="""\
+The number of requests sent over sftp before waiting for their responses.
+
+Writes and metadata requests are pipelined up to this number, saving a round
+trip to the server for each of them. 1 waits for every response in turn.
+"""))
 option_registry.register(
     Option('stacked_on_location',
            default=None,
            help="""The location where this branch is stacked on."""))
+option_registry.register(
+    Option('status.hash_workers',
+           default=1, from_unicode=int_from_store, invalid='warning',
+           help="""\
+The number of threads hashing files when comparing a working tree.
+
+With a value larger than 1, files whose size or timestamps changed since
+they were last hashed are hashed by a pool of threads before the working
+tree is compared to its basis, for example by 'brz status' or 'brz diff'.
+This helps when many files were touched without being modified.
+"""))
 option_registry.register(
     Option('submit_branch',
            default=None,
@@ -2932,6 +3020,17 @@ option_registry.register(
     ListOption('suppress_warnings',
                default=[],
                help="List of warning classes to suppress."))
+option_registry.register(
+    Option('transport.copy_workers',
+           default=1, from_unicode=int_from_store, invalid='warning',
+           help="""\
+The number of files copied at once between transports.
+
+With a value larger than 1, bulk copies such as 'brz upload' or copying a
+tree between transports run on several threads, each with its own connection,
+so that the round trips for different files overlap. This helps with sftp
+locations on high latency links.
+"""))
 option_registry.register(
     Option('validate_signatures_in_log', default=False,
            from_unicode=bool_from_store, invalid='warning',
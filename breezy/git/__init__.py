@@ -421,6 +421,8 @@ from ..config import (
     option_registry,
     Option,
     bool_from_store,
+    int_from_store,
+    int_SI_from_store,
     )
 
 option_registry.register(
@@ -431,6 +433,27 @@ Allow fetching of Git packs over HTTP.
 
 This enables support for fetching Git packs over HTTP in Loggerhead.
 '''))
+option_registry.register(
+    Option('git.export_jobs',
+           default=1, from_unicode=int_from_store, invalid='warning',
+           help='''\
+Number of processes used to convert Bazaar revisions to Git objects.
+
+With a value larger than 1, the file texts, testaments and file id maps of
+the revisions in local repositories are prepared by a pool of worker
+processes when Git objects are generated or the Git SHA map is updated.
+'''))
+option_registry.register(
+    Option('git.object_cache_size',
+           default=u'0', from_unicode=int_SI_from_store, invalid='warning',
+           help='''\
+Maximum size of the cache of Git objects reconstructed from a repository.
+
+Blobs and trees served to Git clients, e.g. by serve-git, are stored
+compressed in this cache so that they do not have to be reconstructed when
+they are requested again. The least recently used objects are removed when
+the cache grows larger than this size. 0 disables the cache.
+'''))
 
 
 def test_suite():
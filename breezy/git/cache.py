@@ -22,8 +22,10 @@ from dulwich.objects import (
     sha_to_hex,
     hex_to_sha,
     )
+from io import BytesIO
 import os
 import threading
+import time
 
 from dulwich.objects import (
     ShaFile,
@@ -126,6 +128,21 @@ class GitShaMap(object):
         """
         raise NotImplementedError(self.lookup_git_sha)
 
+    def lookup_git_shas(self, shas):
+        """Lookup several Git shas in the database.
+
+        :param shas: Iterable over Git object shas
+        :return: dict mapping the shas that were found to lists of
+            (type, type_data) tuples, as returned by lookup_git_sha
+        """
+        ret = {}
+        for sha in shas:
+            try:
+                ret[sha] = list(self.lookup_git_sha(sha))
+            except KeyError:
+                pass
+        return ret
+
     def lookup_blob_id(self, file_id, revision):
         """Retrieve a Git blob SHA by file id.
 
@@ -227,28 +244,37 @@ class BzrGitCacheFormat(object):
         :param repository: Repository to open the cache for
         :return: A `BzrGitCache`
         """
-        from ..transport.local import LocalTransport
-        repo_transport = getattr(repository, "_transport", None)
-        if (repo_transport is not None
-                and isinstance(repo_transport, LocalTransport)):
-            # Even if we don't write to this repo, we should be able
-            # to update its cache.
-            try:
-                repo_transport = remove_readonly_transport_decorator(
-                    repo_transport)
-            except bzr_errors.ReadOnlyError:
-                transport = None
-            else:
-                try:
-                    repo_transport.mkdir('git')
-                except bzr_errors.FileExists:
-                    pass
-                transport = repo_transport.clone('git')
-        else:
+        return cls.from_transport(cache_transport_for_repository(repository))
+
+
+def cache_transport_for_repository(repository):
+    """Return the transport to store the caches for a repository in.
+
+    This is the repository's transport if it is local and writable, and
+    otherwise a directory in the users global cache directory.
+    """
+    from ..transport.local import LocalTransport
+    repo_transport = getattr(repository, "_transport", None)
+    if (repo_transport is not None
+            and isinstance(repo_transport, LocalTransport)):
+        # Even if we don't write to this repo, we should be able
+        # to update its cache.
+        try:
+            repo_transport = remove_readonly_transport_decorator(
+                repo_transport)
+        except bzr_errors.ReadOnlyError:
             transport = None
-        if transport is None:
-            transport = get_remote_cache_transport(repository)
-        return cls.from_transport(transport)
+        else:
+            try:
+                repo_transport.mkdir('git')
+            except bzr_errors.FileExists:
+                pass
+            transport = repo_transport.clone('git')
+    else:
+        transport = None
+    if transport is None:
+        transport = get_remote_cache_transport(repository)
+    return transport
 
 
 class CacheUpdater(object):
@@ -395,17 +421,9 @@ class SqliteCacheUpdater(CacheUpdater):
     def finish(self):
         if self._commit is None:
             raise AssertionError("No commit object added")
-        self.db.executemany(
-            "replace into trees (sha1, fileid, revid) values (?, ?, ?)",
-            self._trees)
-        self.db.executemany(
-            "replace into blobs (sha1, fileid, revid) values (?, ?, ?)",
-            self._blobs)
-        self.db.execute(
-            "replace into commits (sha1, revid, tree_sha, testament3_sha1) "
-            "values (?, ?, ?, ?)",
+        self.cache.idmap._add_entries(
             (self._commit.id, self.revid, self._commit.tree,
-                self._testament3_sha1))
+             self._testament3_sha1), self._trees, self._blobs)
         return self._commit
 
 
@@ -427,7 +445,17 @@ class SqliteGitCacheFormat(BzrGitCacheFormat):
 
 
 class SqliteGitShaMap(GitShaMap):
-    """Bazaar GIT Sha map that uses a sqlite database for storage."""
+    """Bazaar GIT Sha map that uses a sqlite database for storage.
+
+    New entries are kept in memory and inserted in batches of
+    _insert_batch_size rows, or when the write group is committed.
+    """
+
+    # Number of new rows after which they are inserted into the database
+    _insert_batch_size = 10000
+
+    # Number of shas to look up per query in lookup_git_shas
+    _lookup_batch_size = 500
 
     def __init__(self, path=None):
         self.path = path
@@ -435,9 +463,18 @@ class SqliteGitShaMap(GitShaMap):
             self.db = sqlite3.connect(":memory:")
         else:
             if path not in mapdbs():
-                mapdbs()[path] = sqlite3.connect(path)
+                db = sqlite3.connect(path)
+                try:
+                    # Let readers continue while the map is updated
+                    db.execute("pragma journal_mode=wal")
+                except sqlite3.OperationalError:
+                    pass  # Not supported by this sqlite or file system
+                mapdbs()[path] = db
             self.db = mapdbs()[path]
         self.db.text_factory = str
+        self._pending_commits = {}
+        self._pending_trees = {}
+        self._pending_blobs = {}
         self.db.executescript("""
         create table if not exists commits(
             sha1 text not null check(length(sha1) == 40),
@@ -472,7 +509,49 @@ class SqliteGitShaMap(GitShaMap):
     def __repr__(self):
         return "%s(%r)" % (self.__class__.__name__, self.path)
 
+    def _add_entries(self, commit, trees, blobs):
+        """Add the entries for a revision.
+
+        :param commit: Tuple with commit sha1, revid, tree sha1 and
+            testament3 sha1
+        :param trees: List of (sha1, fileid, revid) tuples
+        :param blobs: List of (sha1, fileid, revid) tuples
+        """
+        for (sha1, fileid, revid) in trees:
+            self._pending_trees[(fileid, revid)] = sha1
+        for (sha1, fileid, revid) in blobs:
+            self._pending_blobs[(fileid, revid)] = sha1
+        self._pending_commits[commit[1]] = commit
+        if (len(self._pending_trees) + len(self._pending_blobs) +
+                len(self._pending_commits) >= self._insert_batch_size):
+            self._flush()
+
+    def _flush(self):
+        """Insert the pending entries into the database."""
+        if self._pending_trees:
+            self.db.executemany(
+                "replace into trees (sha1, fileid, revid) values (?, ?, ?)",
+                ((sha1, fileid, revid) for ((fileid, revid), sha1)
+                 in viewitems(self._pending_trees)))
+            self._pending_trees = {}
+        if self._pending_blobs:
+            self.db.executemany(
+                "replace into blobs (sha1, fileid, revid) values (?, ?, ?)",
+                ((sha1, fileid, revid) for ((fileid, revid), sha1)
+                 in viewitems(self._pending_blobs)))
+            self._pending_blobs = {}
+        if self._pending_commits:
+            self.db.executemany(
+                "replace into commits (sha1, revid, tree_sha, "
+                "testament3_sha1) values (?, ?, ?, ?)",
+                viewvalues(self._pending_commits))
+            self._pending_commits = {}
+
     def lookup_commit(self, revid):
+        try:
+            return self._pending_commits[revid][0]
+        except KeyError:
+            pass
         cursor = self.db.execute("select sha1 from commits where revid = ?",
                                  (revid,))
         row = cursor.fetchone()
@@ -481,9 +560,20 @@ class SqliteGitShaMap(GitShaMap):
         raise KeyError
 
     def commit_write_group(self):
+        self._flush()
         self.db.commit()
 
+    def abort_write_group(self):
+        self._pending_commits = {}
+        self._pending_trees = {}
+        self._pending_blobs = {}
+        self.db.rollback()
+
     def lookup_blob_id(self, fileid, revision):
+        try:
+            return self._pending_blobs[(fileid, revision)]
+        except KeyError:
+            pass
         row = self.db.execute(
             "select sha1 from blobs where fileid = ? and revid = ?",
             (fileid, revision)).fetchone()
@@ -492,6 +582,10 @@ class SqliteGitShaMap(GitShaMap):
         raise KeyError(fileid)
 
     def lookup_tree_id(self, fileid, revision):
+        try:
+            return self._pending_trees[(fileid, revision)]
+        except KeyError:
+            pass
         row = self.db.execute(
             "select sha1 from trees where fileid = ? and revid = ?",
             (fileid, revision)).fetchone()
@@ -508,6 +602,7 @@ class SqliteGitShaMap(GitShaMap):
             tree: fileid, revid
             blob: fileid, revid
         """
+        self._flush()
         found = False
         cursor = self.db.execute(
             "select revid, tree_sha, testament3_sha1 from commits where "
@@ -532,12 +627,41 @@ class SqliteGitShaMap(GitShaMap):
         if not found:
             raise KeyError(sha)
 
+    def lookup_git_shas(self, shas):
+        self._flush()
+        ret = {}
+        shas = list(shas)
+        for i in range(0, len(shas), self._lookup_batch_size):
+            batch = shas[i:i + self._lookup_batch_size]
+            # Pad the batch to a fixed size, so the same prepared statements
+            # are reused for every batch.
+            params = batch + [None] * (self._lookup_batch_size - len(batch))
+            where = "sha1 in (%s)" % ", ".join("?" * len(params))
+            for row in self.db.execute(
+                    "select sha1, revid, tree_sha, testament3_sha1 from "
+                    "commits where " + where, params):
+                if row[3] is not None:
+                    verifiers = {"testament3-sha1": row[3]}
+                else:
+                    verifiers = {}
+                ret.setdefault(row[0], []).append(
+                    ("commit", (row[1], row[2], verifiers)))
+            for table, type_name in (("blobs", "blob"), ("trees", "tree")):
+                for row in self.db.execute(
+                        "select sha1, fileid, revid from %s where %s"
+                        % (table, where), params):
+                    ret.setdefault(row[0], []).append(
+                        (type_name, (row[1], row[2])))
+        return ret
+
     def revids(self):
         """List the revision ids known."""
+        self._flush()
         return (row for (row,) in self.db.execute("select revid from commits"))
 
     def sha1s(self):
         """List the SHA1s."""
+        self._flush()
         for table in ("blobs", "commits", "trees"):
             for (sha,) in self.db.execute("select sha1 from %s" % table):
                 yield sha.encode('ascii')
@@ -754,6 +878,133 @@ class VersionedFilesContentCache(ContentCache):
         return ShaFile._parse_legacy_object(entry.get_bytes_as('fulltext'))
 
 
+class SegmentContentCache(ContentCache):
+    """Size bounded cache of Git objects, stored in segment files.
+
+    Objects are stored zlib compressed, as in loose Git objects, and appended
+    to segment files (.seg). The location of each object is recorded in an
+    index file next to its segment (.idx), with lines of
+    "<sha> <offset> <length>".
+
+    Once the cache grows beyond its maximum size, the oldest segments are
+    removed. Objects read from the older half of the segments are copied to
+    the current segment, so the least recently used objects are evicted
+    first.
+    """
+
+    def __init__(self, transport, max_size, segment_size=None):
+        """Open a cache.
+
+        :param transport: Transport of the directory with the segments
+        :param max_size: Maximum size of the segments, in bytes
+        :param segment_size: Size after which a new segment is started.
+            Defaults to a sixteenth of max_size.
+        """
+        self._transport = transport
+        self._max_size = max_size
+        if segment_size is None:
+            segment_size = max(1, max_size // 16)
+        self._segment_size = segment_size
+        # Segment names, oldest first
+        self._segments = []
+        self._segment_sizes = {}
+        # Map from hex sha to (segment, offset, length)
+        self._entries = {}
+        self._current = None
+        self._load()
+
+    def _load(self):
+        try:
+            names = self._transport.list_dir('.')
+        except bzr_errors.NoSuchFile:
+            return
+        for name in sorted(names):
+            if not name.endswith('.idx'):
+                continue
+            segment = name[:-len('.idx')]
+            size = 0
+            for line in self._transport.get_bytes(name).splitlines():
+                try:
+                    (sha, offset, length) = line.split(b' ')
+                    offset = int(offset)
+                    length = int(length)
+                except ValueError:
+                    # Partially written entry
+                    continue
+                self._entries[sha] = (segment, offset, length)
+                size = max(size, offset + length)
+            self._segments.append(segment)
+            self._segment_sizes[segment] = size
+
+    def _total_size(self):
+        return sum(viewvalues(self._segment_sizes))
+
+    def _start_segment(self):
+        self._current = '%016x-%s' % (
+            int(time.time() * 1000000), osutils.rand_chars(8))
+        self._segments.append(self._current)
+        self._segment_sizes[self._current] = 0
+
+    def _append(self, sha, data):
+        if (self._current is None or
+                self._segment_sizes[self._current] >= self._segment_size):
+            self._start_segment()
+        offset = self._transport.append_bytes(self._current + '.seg', data)
+        self._transport.append_bytes(
+            self._current + '.idx', b'%s %d %d\n' % (sha, offset, len(data)))
+        self._entries[sha] = (self._current, offset, len(data))
+        self._segment_sizes[self._current] = offset + len(data)
+        self._evict()
+
+    def _evict(self):
+        while (self._total_size() > self._max_size and
+               self._segments[0] != self._current):
+            segment = self._segments.pop(0)
+            del self._segment_sizes[segment]
+            for ext in ('.idx', '.seg'):
+                try:
+                    self._transport.delete(segment + ext)
+                except bzr_errors.NoSuchFile:
+                    pass
+            self._entries = dict(
+                (sha, location) for (sha, location) in viewitems(self._entries)
+                if location[0] != segment)
+
+    def add(self, obj):
+        sha = obj.id
+        if sha in self._entries:
+            return
+        self._append(sha, b''.join(obj.as_legacy_object_chunks()))
+
+    def __contains__(self, sha):
+        return sha in self._entries
+
+    def __getitem__(self, sha):
+        (segment, offset, length) = self._entries[sha]
+        try:
+            data = next(self._transport.readv(
+                segment + '.seg', [(offset, length)]))[1]
+        except (bzr_errors.NoSuchFile, bzr_errors.ShortReadvError):
+            # Evicted by another process
+            del self._entries[sha]
+            raise KeyError(sha)
+        if self._segments.index(segment) < len(self._segments) // 2:
+            self._append(sha, data)
+        return ShaFile.from_file(BytesIO(data))
+
+
+def content_cache_from_repository(repository, max_size):
+    """Open the cache of Git objects for a repository.
+
+    :param repository: Repository to open the cache for
+    :param max_size: Maximum size of the cache, in bytes
+    :return: A `SegmentContentCache`
+    """
+    transport = cache_transport_for_repository(repository).clone('segments')
+    transport.ensure_base()
+    return SegmentContentCache(transport, max_size)
+
+
 class IndexCacheUpdater(CacheUpdater):
 
     def __init__(self, cache, rev):
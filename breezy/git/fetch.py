@@ -33,6 +33,7 @@ import posixpath
 import stat
 
 from .. import (
+    config,
     debug,
     errors,
     osutils,
@@ -41,6 +42,10 @@ from .. import (
 from ..errors import (
     BzrError,
     )
+from ..bzr.fetch import (
+    BatchSizer,
+    FetchCheckpoint,
+    )
 from ..bzr.inventory import (
     InventoryDirectory,
     InventoryFile,
@@ -441,7 +446,7 @@ def import_git_commit(repo, mapping, head, lookup_object,
         calculated_verifiers = {}
     store_updater.add_object(o, calculated_verifiers, None)
     store_updater.finish()
-    trees_cache.add(ret_tree)
+    trees_cache.add(ret_tree, basis_id, inv_delta)
     repo.add_revision(rev.revision_id, rev)
     if "verify" in debug.debug_flags:
         verify_commit_reconstruction(
@@ -467,6 +472,7 @@ def import_git_objects(repo, mapping, object_iter,
     graph = []
     checked = set()
     heads = list(set(heads))
+    checkpoint = FetchCheckpoint(repo, heads)
     trees_cache = LRUTreeCache(repo)
     # Find and convert commit objects
     while heads:
@@ -499,22 +505,31 @@ def import_git_objects(repo, mapping, object_iter,
     del checked
     # Order the revisions
     # Create the inventory objects
-    batch_size = 1000
+    sizer = BatchSizer(1000, config.LocationStack(repo.user_url).get(
+        'repository.fetch_batch_memory'))
     revision_ids = topo_sort(graph)
-    pack_hints = []
     if limit is not None:
         revision_ids = revision_ids[:limit]
+    # Batches are committed as they are imported; an interrupted import
+    # picks up after the last of them.
+    if revision_ids:
+        done, pack_hints = checkpoint.load()
+    else:
+        done, pack_hints = 0, []
+    total = done + len(revision_ids)
     last_imported = None
-    for offset in range(0, len(revision_ids), batch_size):
+    offset = 0
+    while offset < len(revision_ids):
+        batch = revision_ids[offset:offset + sizer.size]
+        sizer.start_batch()
         target_git_object_retriever.start_write_group()
         try:
             repo.start_write_group()
             try:
-                for i, head in enumerate(
-                        revision_ids[offset:offset + batch_size]):
+                for i, head in enumerate(batch):
                     if pb is not None:
-                        pb.update("fetching revisions", offset + i,
-                                  len(revision_ids))
+                        pb.update("fetching revisions", done + offset + i,
+                                  total)
                     import_git_commit(repo, mapping, head, lookup_object,
                                       target_git_object_retriever, trees_cache)
                     last_imported = head
@@ -530,6 +545,11 @@ def import_git_objects(repo, mapping, object_iter,
             raise
         else:
             target_git_object_retriever.commit_write_group()
+        offset += len(batch)
+        sizer.finish_batch(len(batch))
+        if offset < len(revision_ids):
+            checkpoint.record(done + offset, pack_hints)
+    checkpoint.finish()
     return pack_hints, last_imported
 
 
@@ -35,6 +35,19 @@ from dulwich.pack import (
     Pack,
     )
 
+from ..lazy_import import lazy_import
+lazy_import(globals(), """
+import collections
+import multiprocessing
+import time
+
+from breezy import (
+    config,
+    repository as _mod_repository,
+    )
+from breezy.bzr.inventorytree import InventoryRevisionTree
+from breezy.bzr.versionedfile import FulltextContentFactory
+""")
 from .. import (
     errors,
     lru_cache,
@@ -42,16 +55,21 @@ from .. import (
     osutils,
     ui,
     )
+from ..bzr.inventory import CHKInventory
 from ..lock import LogicalLockResult
 from ..revision import (
     NULL_REVISION,
     )
-from ..sixish import viewitems
+from ..sixish import (
+    viewitems,
+    viewvalues,
+    )
 from ..testament import (
     StrictTestament3,
     )
 
 from .cache import (
+    content_cache_from_repository,
     from_repository as cache_from_repository,
     )
 from .mapping import (
@@ -67,6 +85,7 @@ from .unpeel_map import (
 
 import posixpath
 import stat
+import sys
 
 
 BANNED_FILENAMES = ['.git']
@@ -84,25 +103,167 @@ def get_object_store(repo, mapping=None):
 
 MAX_TREE_CACHE_SIZE = 50 * 1024 * 1024
 
+MAX_TREE_DELTA_CACHE_SIZE = 10 * 1024 * 1024
 
-class LRUTreeCache(object):
+# Size charged for trees whose memory use can not be estimated
+_UNKNOWN_TREE_SIZE = 1024 * 1024
+
+# Memory used per entry by a CHKInventory that has been read completely,
+# including its path cache. A 3000 entry 2a tree measures 507 bytes per
+# entry with _entry_size after iter_entries_by_dir.
+_CHK_INVENTORY_ENTRY_SIZE = 512
+
+_ENTRY_ATTRIBUTES = ('file_id', 'name', 'parent_id', 'revision', 'text_sha1',
+                     'symlink_target', 'reference_revision')
+
+
+def _entry_size(entry):
+    """Estimate the memory used by an inventory entry, in bytes."""
+    size = sys.getsizeof(entry)
+    for attr in _ENTRY_ATTRIBUTES:
+        value = getattr(entry, attr, None)
+        if value is not None:
+            size += sys.getsizeof(value)
+    return size
+
+
+def _inventory_delta_size(delta):
+    """Estimate the memory used by an inventory delta, in bytes."""
+    size = sys.getsizeof(delta)
+    for old_path, new_path, file_id, entry in delta:
+        size += sys.getsizeof(old_path) + sys.getsizeof(new_path)
+        if entry is not None:
+            size += _entry_size(entry)
+    return size
+
+
+class _MemoryCHKStore(object):
+    """A CHK store that keeps new pages in memory.
+
+    Pages that are not in memory are read from the wrapped store. This
+    allows inventory deltas to be applied to a CHKInventory without
+    writing the pages of the result to the repository.
+    """
 
-    def __init__(self, repository):
-        def approx_tree_size(tree):
-            # Very rough estimate, 250 per inventory entry
+    def __init__(self, store):
+        self._store = store
+        self._search_key_func = store._search_key_func
+        self._pages = {}
+        self.size = 0
+
+    def add_lines(self, key, parents, lines):
+        text = b''.join(lines)
+        sha1 = osutils.sha_string(text)
+        if (b"sha1:" + sha1,) not in self._pages:
+            self._pages[(b"sha1:" + sha1,)] = text
+            self.size += len(text)
+        return sha1, len(text), None
+
+    def get_record_stream(self, keys, ordering, include_delta_closure):
+        missing = []
+        for key in keys:
             try:
-                inv = tree.root_inventory
-            except AttributeError:
-                inv = tree.inventory
-            return len(inv) * 250
+                text = self._pages[key]
+            except KeyError:
+                missing.append(key)
+            else:
+                yield FulltextContentFactory(key, (), None, text)
+        if missing:
+            for record in self._store.get_record_stream(
+                    missing, ordering, include_delta_closure):
+                yield record
+
+
+def _apply_inventory_delta(inv, delta, revision_id):
+    """Create a new inventory by applying delta to inv.
+
+    The pages of new CHKInventories are kept in memory, rather than
+    added to the repository.
+    """
+    if isinstance(inv, CHKInventory):
+        store = inv.id_to_entry._store
+        if not isinstance(store, _MemoryCHKStore):
+            store = _MemoryCHKStore(store)
+            inv = CHKInventory.deserialise(
+                store, b''.join(inv.to_lines()), (inv.revision_id,))
+    return inv.create_by_apply_delta(delta, revision_id)
+
+
+def _tree_size(tree):
+    """Estimate the memory used by a revision tree, in bytes."""
+    try:
+        inv = tree.root_inventory
+    except AttributeError:
+        return _UNKNOWN_TREE_SIZE
+    try:
+        entries = inv._byid
+    except AttributeError:
+        # A CHKInventory only reads entries as they are used, so charge
+        # what it costs once they all have been.
+        size = len(inv) * _CHK_INVENTORY_ENTRY_SIZE
+        store = inv.id_to_entry._store
+        if isinstance(store, _MemoryCHKStore):
+            size += store.size
+        return size
+    size = sys.getsizeof(entries)
+    for entry in viewvalues(entries):
+        size += _entry_size(entry)
+        children = getattr(entry, 'children', None)
+        if children is not None:
+            size += sys.getsizeof(children)
+    return size
+
+
+class LRUTreeCache(object):
+    """Cache of revision trees.
+
+    Besides the most recently used trees, the inventory deltas between
+    trees and their basis are kept. A tree that is no longer cached is
+    rebuilt from a cached ancestor by applying the deltas, which for
+    linear history only costs as much as the changes in each revision.
+    """
+
+    # How many deltas may be applied to rebuild a tree
+    _max_delta_chain = 100
+
+    def __init__(self, repository, max_size=MAX_TREE_CACHE_SIZE,
+                 max_delta_size=MAX_TREE_DELTA_CACHE_SIZE):
         self.repository = repository
         self._cache = lru_cache.LRUSizeCache(
-            max_size=MAX_TREE_CACHE_SIZE, after_cleanup_size=None,
-            compute_size=approx_tree_size)
+            max_size=max_size, after_cleanup_size=None,
+            compute_size=_tree_size)
+        self._deltas = lru_cache.LRUSizeCache(
+            max_size=max_delta_size, after_cleanup_size=None,
+            compute_size=lambda value: _inventory_delta_size(value[1]))
+
+    def _get_cached_tree(self, revid):
+        """Get a tree from the cache, rebuilding it from deltas if needed.
+
+        :raises KeyError: if the tree can not be found in the cache
+        """
+        try:
+            return self._cache[revid]
+        except KeyError:
+            pass
+        deltas = []
+        basis_id = revid
+        while basis_id not in self._cache:
+            if len(deltas) >= self._max_delta_chain:
+                raise KeyError(revid)
+            # Raises KeyError if the delta is not cached either
+            child_id = basis_id
+            basis_id, delta = self._deltas[child_id]
+            deltas.append((child_id, delta))
+        inv = self._cache[basis_id].root_inventory
+        for child_id, delta in reversed(deltas):
+            inv = _apply_inventory_delta(inv, delta, child_id)
+        tree = InventoryRevisionTree(self.repository, inv, revid)
+        self._cache[revid] = tree
+        return tree
 
     def revision_tree(self, revid):
         try:
-            tree = self._cache[revid]
+            tree = self._get_cached_tree(revid)
         except KeyError:
             tree = self.repository.revision_tree(revid)
             self.add(tree)
@@ -113,7 +274,7 @@ class LRUTreeCache(object):
         todo = []
         for revid in revids:
             try:
-                tree = self._cache[revid]
+                tree = self._get_cached_tree(revid)
             except KeyError:
                 todo.append(revid)
             else:
@@ -130,8 +291,43 @@ class LRUTreeCache(object):
     def revision_trees(self, revids):
         return list(self.iter_revision_trees(revids))
 
-    def add(self, tree):
-        self._cache[tree.get_revision_id()] = tree
+    def add(self, tree, basis_id=None, inventory_delta=None):
+        """Add a tree to the cache.
+
+        :param tree: The revision tree
+        :param basis_id: The revision the tree is based on, defaulting to
+            its left hand parent
+        :param inventory_delta: The inventory delta from the basis tree to
+            tree, if known
+        """
+        if inventory_delta is not None and basis_id is None:
+            raise ValueError("basis_id is required with an inventory delta")
+        revid = tree.get_revision_id()
+        self._cache[revid] = tree
+        if revid == NULL_REVISION or revid in self._deltas:
+            return
+        try:
+            inv = tree.root_inventory
+        except AttributeError:
+            # Only inventory trees can be rebuilt from deltas
+            return
+        if inventory_delta is None:
+            if basis_id is None:
+                parent_ids = tree.get_parent_ids()
+                if not parent_ids:
+                    return
+                basis_id = parent_ids[0]
+            basis_tree = self._cache.get(basis_id)
+            if basis_tree is None:
+                return
+            basis_inv = basis_tree.root_inventory
+            # Only CHK inventories can be compared without iterating over
+            # all of their entries.
+            if not (isinstance(inv, CHKInventory)
+                    and isinstance(basis_inv, CHKInventory)):
+                return
+            inventory_delta = inv._make_delta(basis_inv)
+        self._deltas[revid] = (basis_id, inventory_delta)
 
 
 def _find_missing_bzr_revids(graph, want, have):
@@ -154,6 +350,19 @@ def _find_missing_bzr_revids(graph, want, have):
     return todo
 
 
+def _objects_per_second(count, start):
+    elapsed = time.time() - start
+    if elapsed <= 0:
+        return 0
+    return count / elapsed
+
+
+def _report_throughput(action, revision_count, object_count, start):
+    trace.mutter('%s for %d revisions: %d objects in %.3fs (%d objects/s)',
+                 action, revision_count, object_count, time.time() - start,
+                 _objects_per_second(object_count, start))
+
+
 def _check_expected_sha(expected_sha, object):
     """Check whether an object matches an expected SHA.
 
@@ -208,7 +417,8 @@ def directory_to_tree(path, children, lookup_ie_sha1, unusual_modes,
 
 
 def _tree_to_objects(tree, parent_trees, idmap, unusual_modes,
-                     dummy_file_name=None, add_cache_entry=None):
+                     dummy_file_name=None, add_cache_entry=None,
+                     blobs=None):
     """Iterate over the objects that were introduced in a revision.
 
     :param idmap: id map
@@ -216,6 +426,8 @@ def _tree_to_objects(tree, parent_trees, idmap, unusual_modes,
     :param unusual_modes: Unusual file modes dictionary
     :param dummy_file_name: File name to use for dummy files
         in empty directories. None to skip empty directories
+    :param blobs: Optional dict mapping paths to (file_id, raw data, sha1)
+        of blobs that have already been created, as by _prepare_revision
     :return: Yields (path, object, ie) entries
     """
     dirty_dirs = set()
@@ -304,11 +516,25 @@ def _tree_to_objects(tree, parent_trees, idmap, unusual_modes,
                 continue
             dirty_dirs.add(osutils.dirname(p))
 
+    def iter_new_blobs():
+        to_read = []
+        for path, file_id in new_blobs:
+            prepared = None
+            if blobs is not None:
+                prepared = blobs.get(path)
+            if prepared is not None and prepared[0] == file_id:
+                yield path, file_id, Blob.from_raw_string(
+                    Blob.type_num, prepared[1], sha=prepared[2])
+            else:
+                to_read.append((path, file_id))
+        for (path, file_id), chunks in tree.iter_files_bytes(
+                [(path, (path, file_id)) for (path, file_id) in to_read]):
+            obj = Blob()
+            obj.chunked = chunks
+            yield path, file_id, obj
+
     # Fetch contents of the blobs that were changed
-    for (path, file_id), chunks in tree.iter_files_bytes(
-            [(path, (path, file_id)) for (path, file_id) in new_blobs]):
-        obj = Blob()
-        obj.chunked = chunks
+    for path, file_id, obj in iter_new_blobs():
         if add_cache_entry is not None:
             add_cache_entry(obj, (file_id, tree.get_file_revision(path)), path)
         yield path, obj, (file_id, tree.get_file_revision(path))
@@ -384,6 +610,76 @@ def _tree_to_objects(tree, parent_trees, idmap, unusual_modes,
             shamap[path] = obj.id
 
 
+def _create_fileid_map_blob(mapping, tree):
+    # FIXME: This can probably be a lot more efficient,
+    # not all files necessarily have to be processed.
+    file_ids = {}
+    for (path, ie) in tree.iter_entries_by_dir():
+        if mapping.generate_file_id(path) != ie.file_id:
+            file_ids[path] = ie.file_id
+    return mapping.export_fileid_map(file_ids)
+
+
+# The repository and mapping used by _prepare_revision in a worker process.
+_worker_repository = None
+_worker_mapping = None
+
+
+def _init_revision_worker(url, mapping):
+    global _worker_repository, _worker_mapping
+    _worker_repository = _mod_repository.Repository.open(url)
+    _worker_repository.lock_read()
+    _worker_mapping = mapping
+
+
+def _prepare_revision(revid, lossy):
+    """Prepare the conversion of a revision in a worker process.
+
+    This does the parts of the conversion that do not need the sha map:
+    reading the texts of changed files, and computing the testament and file
+    id map.
+
+    :return: Tuple with the testament3 sha1 (None if lossy), the raw data of
+        the file id map blob (None if there is none) and a dict mapping paths
+        to (file_id, raw data, sha1) for the blobs of the files changed
+        relative to the first present parent. None if the revision is not
+        present in the repository.
+    """
+    repository = _worker_repository
+    mapping = _worker_mapping
+    try:
+        rev = repository.get_revision(revid)
+    except errors.NoSuchRevision:
+        return None
+    tree = repository.revision_tree(revid)
+    present_parents = repository.has_revisions(rev.parent_ids)
+    parent_ids = [p for p in rev.parent_ids if p in present_parents]
+    if parent_ids:
+        base_tree = repository.revision_tree(parent_ids[0])
+    else:
+        base_tree = repository.revision_tree(NULL_REVISION)
+    changed_files = []
+    for (file_id, path, changed_content, versioned, parent, name, kind,
+         executable) in tree.iter_changes(base_tree):
+        if kind[1] == "file" and name[1] not in BANNED_FILENAMES:
+            changed_files.append((path[1], file_id))
+    blobs = {}
+    for (path, file_id), chunks in tree.iter_files_bytes(
+            [(path, (path, file_id)) for (path, file_id) in changed_files]):
+        blob = Blob()
+        blob.chunked = chunks
+        blobs[path] = (file_id, blob.as_raw_string(), blob.id)
+    testament3_sha1 = None
+    fileid_map_data = None
+    if not lossy:
+        testament3_sha1 = StrictTestament3(rev, tree).as_sha1()
+        if mapping.BZR_FILE_IDS_FILE is not None:
+            b = _create_fileid_map_blob(mapping, tree)
+            if b is not None:
+                fileid_map_data = b.as_raw_string()
+    return testament3_sha1, fileid_map_data, blobs
+
+
 class PackTupleIterable(object):
 
     def __init__(self, store):
@@ -408,6 +704,10 @@ class PackTupleIterable(object):
 class BazaarObjectStore(BaseObjectStore):
     """A Git-style object store backed onto a Bazaar repository."""
 
+    # Number of revisions after which the sha map is committed while it is
+    # being updated.
+    _sha_map_batch_size = 10000
+
     def __init__(self, repository, mapping=None):
         self.repository = repository
         self._map_updated = False
@@ -417,7 +717,14 @@ class BazaarObjectStore(BaseObjectStore):
         else:
             self.mapping = mapping
         self._cache = cache_from_repository(repository)
-        self._content_cache_types = ("tree",)
+        self._content_cache_types = ("blob", "tree")
+        content_cache_size = config.LocationStack(
+            self.repository.user_url).get('git.object_cache_size')
+        if content_cache_size:
+            self._content_cache = content_cache_from_repository(
+                repository, content_cache_size)
+        else:
+            self._content_cache = None
         self.start_write_group = self._cache.idmap.start_write_group
         self.abort_write_group = self._cache.idmap.abort_write_group
         self.commit_write_group = self._cache.idmap.commit_write_group
@@ -456,17 +763,29 @@ class BazaarObjectStore(BaseObjectStore):
             if stop_revision is None:
                 self._map_updated = True
             return
+        revids = list(graph.iter_topo_order(missing_revids))
+        lossy = not self.mapping.roundtripping
+        start = time.time()
+        object_count = 0
         self.start_write_group()
         try:
             pb = ui.ui_factory.nested_progress_bar()
             try:
-                for i, revid in enumerate(graph.iter_topo_order(
-                        missing_revids)):
+                for i, (revid, prepared) in enumerate(
+                        self._iter_prepared_revisions(revids, lossy)):
                     trace.mutter('processing %r', revid)
-                    pb.update("updating git map", i, len(missing_revids))
-                    self._update_sha_map_revision(revid)
+                    pb.update("updating git map (%d objects/s)"
+                              % _objects_per_second(object_count, start),
+                              i, len(revids))
+                    object_count += self._add_revision_to_sha_map(
+                        revid, prepared)[1]
+                    if (i + 1) % self._sha_map_batch_size == 0:
+                        self.commit_write_group()
+                        self.start_write_group()
             finally:
                 pb.finished()
+            _report_throughput('updated git map', len(revids), object_count,
+                               start)
             if stop_revision is None:
                 self._map_updated = True
         except BaseException:
@@ -497,21 +816,67 @@ class BazaarObjectStore(BaseObjectStore):
                                           lossy, verifiers)
 
     def _create_fileid_map_blob(self, tree):
-        # FIXME: This can probably be a lot more efficient,
-        # not all files necessarily have to be processed.
-        file_ids = {}
-        for (path, ie) in tree.iter_entries_by_dir():
-            if self.mapping.generate_file_id(path) != ie.file_id:
-                file_ids[path] = ie.file_id
-        return self.mapping.export_fileid_map(file_ids)
-
-    def _revision_to_objects(self, rev, tree, lossy, add_cache_entry=None):
+        return _create_fileid_map_blob(self.mapping, tree)
+
+    def _get_export_jobs(self):
+        return config.LocationStack(self.repository.user_url).get(
+            'git.export_jobs')
+
+    def _iter_prepared_revisions(self, revids, lossy):
+        """Iterate over revids, preparing their conversion in parallel.
+
+        With git.export_jobs larger than 1, _prepare_revision is run for the
+        revisions by a pool of worker processes, each reading them from its
+        own copy of the repository. This is only possible for local
+        repositories without uncommitted data.
+
+        :return: Iterator over (revid, prepared) in the order of revids.
+            prepared is the result of _prepare_revision, or None if the
+            revision was not prepared.
+        """
+        jobs = self._get_export_jobs()
+        if (jobs <= 1 or len(revids) < 2
+                or not self.repository.user_url.startswith('file:')
+                or self.repository.is_in_write_group()):
+            for revid in revids:
+                yield revid, None
+            return
+        trace.mutter('converting %d revisions with %d jobs',
+                     len(revids), jobs)
+        pool = multiprocessing.Pool(
+            jobs, _init_revision_worker,
+            (self.repository.user_url, self.mapping))
+        try:
+            pending = collections.deque()
+            for revid in revids:
+                pending.append((revid, pool.apply_async(
+                    _prepare_revision, (revid, lossy))))
+                # Bound the number of prepared revisions held in memory.
+                while len(pending) > 4 * jobs:
+                    revid, result = pending.popleft()
+                    yield revid, result.get()
+            while pending:
+                revid, result = pending.popleft()
+                yield revid, result.get()
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def _revision_to_objects(self, rev, tree, lossy, add_cache_entry=None,
+                             prepared=None):
         """Convert a revision to a set of git objects.
 
         :param rev: Bazaar revision object
         :param tree: Bazaar revision tree
         :param lossy: Whether to not roundtrip all Bazaar revision data
+        :param prepared: Optional result of _prepare_revision for rev,
+            with the same value for lossy
         """
+        if prepared is not None:
+            testament3_sha1, fileid_map_data, blobs = prepared
+        else:
+            blobs = None
         unusual_modes = extract_unusual_modes(rev)
         present_parents = self.repository.has_revisions(rev.parent_ids)
         parent_trees = self.tree_cache.revision_trees(
@@ -519,7 +884,7 @@ class BazaarObjectStore(BaseObjectStore):
         root_tree = None
         for path, obj, bzr_key_data in _tree_to_objects(
                 tree, parent_trees, self._cache.idmap, unusual_modes,
-                self.mapping.BZR_DUMMY_FILE, add_cache_entry):
+                self.mapping.BZR_DUMMY_FILE, add_cache_entry, blobs):
             if path == "":
                 root_tree = obj
                 root_key_data = bzr_key_data
@@ -535,7 +900,12 @@ class BazaarObjectStore(BaseObjectStore):
                 root_tree = self[self[base_sha1].tree]
             root_key_data = (tree.get_root_id(), tree.get_revision_id())
         if not lossy and self.mapping.BZR_FILE_IDS_FILE is not None:
-            b = self._create_fileid_map_blob(tree)
+            if prepared is None:
+                b = self._create_fileid_map_blob(tree)
+            elif fileid_map_data is not None:
+                b = Blob.from_string(fileid_map_data)
+            else:
+                b = None
             if b is not None:
                 root_tree[self.mapping.BZR_FILE_IDS_FILE] = (
                     (stat.S_IFREG | 0o644), b.id)
@@ -544,8 +914,9 @@ class BazaarObjectStore(BaseObjectStore):
             add_cache_entry(root_tree, root_key_data, "")
         yield "", root_tree
         if not lossy:
-            testament3 = StrictTestament3(rev, tree)
-            verifiers = {"testament3-sha1": testament3.as_sha1()}
+            if prepared is None:
+                testament3_sha1 = StrictTestament3(rev, tree).as_sha1()
+            verifiers = {"testament3-sha1": testament3_sha1}
         else:
             verifiers = {}
         commit_obj = self._reconstruct_commit(rev, root_tree.id,
@@ -566,17 +937,24 @@ class BazaarObjectStore(BaseObjectStore):
         return self._cache.get_updater(rev)
 
     def _update_sha_map_revision(self, revid):
+        return self._add_revision_to_sha_map(revid)[0]
+
+    def _add_revision_to_sha_map(self, revid, prepared=None):
+        """Add the objects of a revision to the sha map.
+
+        :return: Tuple with the sha1 of the commit and the number of objects
+        """
         rev = self.repository.get_revision(revid)
         tree = self.tree_cache.revision_tree(rev.revision_id)
         updater = self._get_updater(rev)
+        object_count = 0
         # FIXME JRV 2011-12-15: Shouldn't we try both values for lossy ?
         for path, obj in self._revision_to_objects(
                 rev, tree, lossy=(not self.mapping.roundtripping),
-                add_cache_entry=updater.add_object):
-            if isinstance(obj, Commit):
-                commit_obj = obj
+                add_cache_entry=updater.add_object, prepared=prepared):
+            object_count += 1
         commit_obj = updater.finish()
-        return commit_obj.id
+        return commit_obj.id, object_count
 
     def _reconstruct_blobs(self, keys):
         """Return a Git Blob object from a fileid and revision stored in bzr.
@@ -721,26 +1099,38 @@ class BazaarObjectStore(BaseObjectStore):
 
     def lookup_git_shas(self, shas):
         ret = {}
+        todo = []
         for sha in shas:
             if sha == ZERO_SHA:
                 ret[sha] = [("commit", (NULL_REVISION, None, {}))]
-                continue
-            try:
-                ret[sha] = list(self._cache.idmap.lookup_git_sha(sha))
-            except KeyError:
-                # if not, see if there are any unconverted revisions and
-                # add them to the map, search for sha in map again
-                self._update_sha_map()
-                try:
-                    ret[sha] = list(self._cache.idmap.lookup_git_sha(sha))
-                except KeyError:
-                    pass
+            else:
+                todo.append(sha)
+        found = self._cache.idmap.lookup_git_shas(todo)
+        missing = [sha for sha in todo if sha not in found]
+        if missing:
+            # if not, see if there are any unconverted revisions and
+            # add them to the map, search for sha in map again
+            self._update_sha_map()
+            found.update(self._cache.idmap.lookup_git_shas(missing))
+        ret.update(found)
         return ret
 
     def lookup_git_sha(self, sha):
         return self.lookup_git_shas([sha])[sha]
 
     def __getitem__(self, sha):
+        if self._content_cache is not None:
+            try:
+                return self._content_cache[sha]
+            except KeyError:
+                pass
+        obj = self._get_object(sha)
+        if (self._content_cache is not None and
+                obj.type_name.decode('ascii') in self._content_cache_types):
+            self._content_cache.add(obj)
+        return obj
+
+    def _get_object(self, sha):
         for (kind, type_data) in self.lookup_git_sha(sha):
             # convert object to git object
             if kind == "commit":
@@ -825,18 +1215,25 @@ class BazaarObjectStore(BaseObjectStore):
         graph = self.repository.get_graph()
         todo = _find_missing_bzr_revids(graph, pending, processed)
         ret = PackTupleIterable(self)
+        start = time.time()
         pb = ui.ui_factory.nested_progress_bar()
         try:
-            for i, revid in enumerate(graph.iter_topo_order(todo)):
-                pb.update("generating git objects", i, len(todo))
+            for i, (revid, prepared) in enumerate(
+                    self._iter_prepared_revisions(
+                        list(graph.iter_topo_order(todo)), lossy)):
+                pb.update("generating git objects (%d objects/s)"
+                          % _objects_per_second(len(ret), start),
+                          i, len(todo))
                 try:
                     rev = self.repository.get_revision(revid)
                 except errors.NoSuchRevision:
                     continue
                 tree = self.tree_cache.revision_tree(revid)
                 for path, obj in self._revision_to_objects(
-                        rev, tree, lossy=lossy):
+                        rev, tree, lossy=lossy, prepared=prepared):
                     ret.add(obj.id, path)
+            _report_throughput('generated git objects', len(todo), len(ret),
+                               start)
             return ret
         finally:
             pb.finished()
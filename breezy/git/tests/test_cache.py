@@ -44,6 +44,7 @@ from ..cache import (
     DictBzrGitCache,
     IndexBzrGitCache,
     IndexGitCacheFormat,
+    SegmentContentCache,
     SqliteBzrGitCache,
     TdbBzrGitCache,
     )
@@ -138,6 +139,25 @@ class TestGitShaMap:
         self.assertEqual(set([b"lala", b"bla"]),
                          set(self.map.missing_revisions([b"myrevid", b"lala", b"bla"])))
 
+    def test_lookup_git_shas(self):
+        self.map.start_write_group()
+        updater = self.cache.get_updater(Revision(b"myrevid"))
+        c = self._get_test_commit()
+        updater.add_object(c, {"testament3-sha1": b"testament"}, None)
+        b = Blob()
+        b.data = b"TEH BLOB"
+        updater.add_object(b, (b"myfileid", b"myrevid"), None)
+        updater.finish()
+        self.map.commit_write_group()
+        missing = b"5686645d49063c73d35436192dfc9a160c672301"
+        self.assertEqual(
+            {c.id: [("commit", (b"myrevid",
+                                b"cc9462f7f8263ef5adfbeff2fb936bb36b504cba",
+                                {"testament3-sha1": b"testament"}))],
+             b.id: [("blob", (b"myfileid", b"myrevid"))]},
+            self.map.lookup_git_shas([c.id, missing, b.id]))
+        self.assertEqual({}, self.map.lookup_git_shas([]))
+
 
 class DictGitShaMapTests(TestCase, TestGitShaMap):
 
@@ -154,6 +174,55 @@ class SqliteGitShaMapTests(TestCaseInTempDir, TestGitShaMap):
         self.cache = SqliteBzrGitCache(os.path.join(self.test_dir, 'foo.db'))
         self.map = self.cache.idmap
 
+    def add_blob_revision(self, revid, data):
+        updater = self.cache.get_updater(Revision(revid))
+        updater.add_object(self._get_test_commit(), {}, None)
+        b = Blob.from_string(data)
+        updater.add_object(b, (b"myfileid", revid), None)
+        updater.finish()
+        return b
+
+    def count_blob_rows(self):
+        return self.map.db.execute("select count(*) from blobs").fetchone()[0]
+
+    def test_batched_inserts(self):
+        self.map._insert_batch_size = 4
+        self.map.start_write_group()
+        b = self.add_blob_revision(b"rev1", b"one")
+        self.assertEqual(0, self.count_blob_rows())
+        # Pending entries can be looked up
+        self.assertEqual(b.id, self.map.lookup_blob_id(b"myfileid", b"rev1"))
+        self.add_blob_revision(b"rev2", b"two")
+        self.assertEqual(2, self.count_blob_rows())
+        self.add_blob_revision(b"rev3", b"three")
+        self.assertEqual(2, self.count_blob_rows())
+        self.map.commit_write_group()
+        self.assertEqual(3, self.count_blob_rows())
+
+    def test_abort_write_group(self):
+        self.map.start_write_group()
+        self.add_blob_revision(b"rev1", b"one")
+        self.map.abort_write_group()
+        self.assertEqual(set([b"rev1"]),
+                         self.map.missing_revisions([b"rev1"]))
+        self.assertRaises(KeyError, self.map.lookup_blob_id, b"myfileid",
+                          b"rev1")
+
+    def test_lookup_git_shas_batches(self):
+        self.map._lookup_batch_size = 2
+        self.map.start_write_group()
+        blobs = [self.add_blob_revision(b"rev%d" % i, b"%d" % i)
+                 for i in range(5)]
+        self.map.commit_write_group()
+        self.assertEqual(
+            dict((b.id, [("blob", (b"myfileid", b"rev%d" % i))])
+                 for (i, b) in enumerate(blobs)),
+            self.map.lookup_git_shas([b.id for b in blobs]))
+
+    def test_wal(self):
+        self.assertEqual(
+            "wal", self.map.db.execute("pragma journal_mode").fetchone()[0])
+
 
 class TdbGitShaMapTests(TestCaseInTempDir, TestGitShaMap):
 
@@ -174,3 +243,72 @@ class IndexGitShaMapTests(TestCaseInTempDir, TestGitShaMap):
         IndexGitCacheFormat().initialize(transport)
         self.cache = IndexBzrGitCache(transport)
         self.map = self.cache.idmap
+
+
+class SegmentContentCacheTests(TestCaseInTempDir):
+
+    def setUp(self):
+        super(SegmentContentCacheTests, self).setUp()
+        self.transport = get_transport(self.test_dir)
+
+    def make_blob(self):
+        # Random data, so that each blob has about the same compressed size
+        return Blob.from_string(os.urandom(100))
+
+    def test_add(self):
+        cache = SegmentContentCache(self.transport, 10000)
+        b = self.make_blob()
+        self.assertRaises(KeyError, cache.__getitem__, b.id)
+        cache.add(b)
+        self.assertTrue(b.id in cache)
+        self.assertEqual(b, cache[b.id])
+        t = Tree()
+        t.add(b"foo", stat.S_IFREG | 0o644, b.id)
+        cache.add(t)
+        self.assertEqual(t, cache[t.id])
+
+    def test_reopen(self):
+        b = self.make_blob()
+        SegmentContentCache(self.transport, 10000).add(b)
+        cache = SegmentContentCache(self.transport, 10000)
+        self.assertEqual(b, cache[b.id])
+
+    def test_add_existing(self):
+        cache = SegmentContentCache(self.transport, 10000)
+        b = self.make_blob()
+        cache.add(b)
+        size = cache._total_size()
+        cache.add(b)
+        self.assertEqual(size, cache._total_size())
+
+    def test_evict(self):
+        cache = SegmentContentCache(self.transport, 350, 100)
+        blobs = [self.make_blob() for i in range(5)]
+        for b in blobs:
+            cache.add(b)
+        self.assertTrue(cache._total_size() <= 350)
+        self.assertFalse(blobs[0].id in cache)
+        self.assertEqual(blobs[-1], cache[blobs[-1].id])
+        self.assertEqual(
+            sorted(name for segment in cache._segments
+                   for name in (segment + '.idx', segment + '.seg')),
+            sorted(self.transport.list_dir('.')))
+
+    def test_used_objects_are_kept(self):
+        cache = SegmentContentCache(self.transport, 400, 100)
+        blobs = [self.make_blob() for i in range(3)]
+        for b in blobs:
+            cache.add(b)
+        self.assertEqual(blobs[0], cache[blobs[0].id])
+        cache.add(self.make_blob())
+        self.assertFalse(blobs[1].id in cache)
+        self.assertEqual(blobs[0], cache[blobs[0].id])
+
+    def test_removed_segment(self):
+        cache = SegmentContentCache(self.transport, 10000)
+        b = self.make_blob()
+        cache.add(b)
+        for name in self.transport.list_dir('.'):
+            self.transport.delete(name)
+        self.assertRaises(KeyError, cache.__getitem__, b.id)
+        self.assertFalse(b.id in cache)
@@ -23,13 +23,21 @@ from dulwich.objects import (
     Tree,
     )
 
+from ... import (
+    config,
+    )
 from ...branchbuilder import (
     BranchBuilder,
     )
 from ...bzr.inventory import (
+    CHKInventory,
+    Inventory,
     InventoryDirectory,
     InventoryFile,
     )
+from ...bzr.inventorytree import (
+    InventoryRevisionTree,
+    )
 from ...errors import (
     NoSuchRevision,
     )
@@ -42,6 +50,9 @@ from ...tests import (
     TestCaseWithTransport,
     )
 
+from .. import (
+    object_store,
+    )
 from ..cache import (
     DictGitShaMap,
     )
@@ -51,6 +62,9 @@ from ..object_store import (
     directory_to_tree,
     _check_expected_sha,
     _find_missing_bzr_revids,
+    _init_revision_worker,
+    _prepare_revision,
+    _tree_size,
     _tree_to_objects,
     )
 
@@ -138,6 +152,97 @@ class LRUTreeCacheTests(TestCaseWithTransport):
         tree = self.cache.revision_tree(revid)
         self.assertEqual(revid, tree.get_revision_id())
 
+    def build_history(self):
+        bb = BranchBuilder(branch=self.branch)
+        bb.start_series()
+        revid1 = bb.build_snapshot(None,
+                                   [('add', ('', None, 'directory', None)),
+                                    ('add', ('foo', b'foo-id', 'file', b'a\n')),
+                                    ('add', ('bar', b'bar-id', 'file', b'b\n')),
+                                    ])
+        revid2 = bb.build_snapshot([revid1],
+                                   [('modify', ('foo', b'a\nb\n')),
+                                    ('add', ('dir', b'dir-id', 'directory', None)),
+                                    ])
+        revid3 = bb.build_snapshot([revid2],
+                                   [('rename', ('bar', 'dir/bar')),
+                                    ('unversion', 'foo'),
+                                    ])
+        bb.finish_series()
+        return revid1, revid2, revid3
+
+    def assertTreesEqual(self, expected, actual):
+        self.assertEqual(
+            [(p, ie.file_id, ie.revision)
+             for p, ie in expected.iter_entries_by_dir()],
+            [(p, ie.file_id, ie.revision)
+             for p, ie in actual.iter_entries_by_dir()])
+
+    def test_rebuild_from_deltas(self):
+        revid1, revid2, revid3 = self.build_history()
+        self.cache.revision_trees([revid1, revid2, revid3])
+        self.assertEqual((revid1, revid2), (self.cache._deltas[revid2][0],
+                                            self.cache._deltas[revid3][0]))
+        self.cache._cache.clear()
+        self.cache.add(self.branch.repository.revision_tree(revid1))
+        tree = self.cache.revision_tree(revid3)
+        self.assertEqual(revid3, tree.get_revision_id())
+        self.assertTreesEqual(
+            self.branch.repository.revision_tree(revid3), tree)
+        self.assertIn(revid3, self.cache._cache)
+        self.assertNotIn(revid2, self.cache._cache)
+
+    def test_delta_chain_limit(self):
+        revid1, revid2, revid3 = self.build_history()
+        self.cache.revision_trees([revid1, revid2, revid3])
+        self.cache._cache.clear()
+        self.cache.add(self.branch.repository.revision_tree(revid1))
+        self.cache._max_delta_chain = 1
+        self.assertRaises(KeyError, self.cache._get_cached_tree, revid3)
+        self.assertEqual(revid3, self.cache.revision_tree(revid3).get_revision_id())
+
+    def test_add_with_delta(self):
+        revid1, revid2, revid3 = self.build_history()
+        repo = self.branch.repository
+        tree1 = repo.revision_tree(revid1)
+        tree2 = repo.revision_tree(revid2)
+        delta = tree2.root_inventory._make_delta(tree1.root_inventory)
+        self.cache.add(tree2, revid1, delta)
+        self.assertEqual((revid1, delta), self.cache._deltas[revid2])
+        self.assertRaises(ValueError, self.cache.add, tree2, None, delta)
+
+    def test_size(self):
+        revid1, revid2, revid3 = self.build_history()
+        self.cache.revision_trees([revid1, revid2])
+        self.assertTrue(0 < self.cache._deltas._value_size
+                        < self.cache._cache._value_size)
+
+    def test_size_chk_inventory(self):
+        revid1, revid2, revid3 = self.build_history()
+        tree = self.branch.repository.revision_tree(revid2)
+        inv = tree.root_inventory
+        self.assertIsInstance(inv, CHKInventory)
+        size = _tree_size(tree)
+        # The whole inventory is charged before its entries are read
+        self.assertEqual(len(inv) * object_store._CHK_INVENTORY_ENTRY_SIZE,
+                         size)
+        list(tree.iter_entries_by_dir())
+        self.assertEqual(size, _tree_size(tree))
+
+    def test_size_without_inventory(self):
+        self.assertTrue(0 < _tree_size(object()))
+
+    def test_no_delta_for_plain_inventory(self):
+        revid1, revid2, revid3 = self.build_history()
+        repo = self.branch.repository
+        self.cache.add(repo.revision_tree(revid1))
+        inv = Inventory(root_id=None, revision_id=revid2)
+        for path, ie in repo.revision_tree(revid2).iter_entries_by_dir():
+            inv.add(ie.copy())
+        self.cache.add(InventoryRevisionTree(repo, inv, revid2))
+        self.assertIn(revid2, self.cache._cache)
+        self.assertNotIn(revid2, self.cache._deltas)
+
 
 class BazaarObjectStoreTests(TestCaseWithTransport):
 
@@ -206,6 +311,89 @@ class BazaarObjectStoreTests(TestCaseWithTransport):
         self.assertTrue(b.id in self.store)
 
 
+class ContentCacheTests(TestCaseWithTransport):
+
+    def test_reconstructed_objects_are_cached(self):
+        config.GlobalStack().set('git.object_cache_size', '1M')
+        tree = self.make_branch_and_tree('.')
+        self.build_tree_contents([('foo', b'foo\n')])
+        tree.add(['foo'])
+        tree.commit('commit')
+        store = BazaarObjectStore(tree.branch.repository)
+        b = Blob.from_string(b'foo\n')
+        with store.lock_read():
+            self.assertEqual(b, store[b.id])
+        self.assertTrue(b.id in store._content_cache)
+        store = BazaarObjectStore(tree.branch.repository)
+        store._get_object = None
+        self.assertEqual(b, store[b.id])
+
+    def test_disabled(self):
+        tree = self.make_branch_and_tree('.')
+        store = BazaarObjectStore(tree.branch.repository)
+        self.assertIs(None, store._content_cache)
+
+
+class ParallelExportTests(TestCaseWithTransport):
+
+    def make_history(self, path):
+        bb = self.make_branch_builder(path)
+        bb.start_series()
+        revid1 = bb.build_snapshot(None,
+                                   [('add', ('', None, 'directory', None)),
+                                    ('add', ('foo', b'foo-id', 'file', b'a\n')),
+                                    ('add', ('bar', b'bar-id', 'file', b'b\n')),
+                                    ])
+        revid2 = bb.build_snapshot([revid1],
+                                   [('modify', ('foo', b'c\n')),
+                                    ('add', ('dir', b'dir-id', 'directory', None)),
+                                    ('add', ('dir/baz', b'baz-id', 'file', b'd\n')),
+                                    ])
+        revid3 = bb.build_snapshot([revid2], [('unversion', 'bar')])
+        bb.finish_series()
+        return bb.get_branch(), [revid1, revid2, revid3]
+
+    def test_prepare_revision(self):
+        branch, revids = self.make_history('.')
+        store = BazaarObjectStore(branch.repository)
+        self.overrideAttr(object_store, '_worker_repository')
+        self.overrideAttr(object_store, '_worker_mapping')
+        _init_revision_worker(branch.repository.user_url, store.mapping)
+        self.addCleanup(object_store._worker_repository.unlock)
+        self.assertIs(None, _prepare_revision(b'missing', False))
+        testament_sha1, fileid_map_data, blobs = _prepare_revision(
+            revids[1], True)
+        self.assertIs(None, testament_sha1)
+        self.assertIs(None, fileid_map_data)
+        b = Blob.from_string(b'c\n')
+        self.assertEqual(
+            {'foo': (b'foo-id', b.as_raw_string(), b.id),
+             'dir/baz': (b'baz-id', b'd\n', Blob.from_string(b'd\n').id)},
+            blobs)
+        testament_sha1, fileid_map_data, blobs = _prepare_revision(
+            revids[2], False)
+        self.assertIsNot(None, testament_sha1)
+        self.assertEqual({}, blobs)
+
+    def test_update_sha_map_with_jobs(self):
+        serial_branch, revids = self.make_history('serial')
+        parallel_branch = serial_branch.controldir.sprout(
+            'parallel').open_branch()
+        serial_store = BazaarObjectStore(serial_branch.repository)
+        with serial_store.lock_read():
+            expected = [serial_store._lookup_revision_sha1(revid)
+                        for revid in revids]
+        config.GlobalStack().set('git.export_jobs', '2')
+        parallel_store = BazaarObjectStore(parallel_branch.repository)
+        self.assertEqual(2, parallel_store._get_export_jobs())
+        with parallel_store.lock_read():
+            self.assertEqual(
+                expected, [parallel_store._lookup_revision_sha1(revid)
+                           for revid in revids])
+            self.assertEqual(
+                b'c\n', parallel_store[Blob.from_string(b'c\n').id].data)
+
+
 class TreeToObjectsTests(TestCaseWithTransport):
 
     def setUp(self):
@@ -710,10 +710,13 @@ def _compute_revno_str(branch, rev_id):
 def _is_obvious_ancestor(branch, start_rev_id, end_rev_id):
     """Is start_rev_id an obvious ancestor of end_rev_id?"""
     if start_rev_id and end_rev_id:
+        # Looked up together, which remote branches do in one round trip
+        dotted_revnos = branch.revision_ids_to_dotted_revnos(
+            [start_rev_id, end_rev_id])
         try:
-            start_dotted = branch.revision_id_to_dotted_revno(start_rev_id)
-            end_dotted = branch.revision_id_to_dotted_revno(end_rev_id)
-        except errors.NoSuchRevision:
+            start_dotted = dotted_revnos[start_rev_id]
+            end_dotted = dotted_revnos[end_rev_id]
+        except KeyError:
             # one or both is not in the branch; not obvious
             return False
         if len(start_dotted) == 1 and len(end_dotted) == 1:
@@ -1844,20 +1844,8 @@ class DirReader(object):
 _selected_dir_reader = None
 
 
-def _walkdirs_utf8(top, prefix=""):
-    """Yield data about all the directories in a tree.
-
-    This yields the same information as walkdirs() only each entry is yielded
-    in utf-8. On platforms which have a filesystem encoding of utf8 the paths
-    are returned as exact byte-strings.
-
-    :return: yields a tuple of (dir_info, [file_info])
-        dir_info is (utf8_relpath, path-from-top)
-        file_info is (utf8_relpath, utf8_name, kind, lstat, path-from-top)
-        if top is an absolute path, path-from-top is also an absolute path.
-        path-from-top might be unicode or utf8, but it is the correct path to
-        pass to os functions to affect the file in question. (such as os.lstat)
-    """
+def _get_dir_reader():
+    """Return the DirReader best suited to this platform."""
     global _selected_dir_reader
     if _selected_dir_reader is None:
         if sys.platform == "win32":
@@ -1877,11 +1865,28 @@ def _walkdirs_utf8(top, prefix=""):
     if _selected_dir_reader is None:
         # Fallback to the python version
         _selected_dir_reader = UnicodeDirReader()
+    return _selected_dir_reader
+
 
+def _walkdirs_utf8(top, prefix=""):
+    """Yield data about all the directories in a tree.
+
+    This yields the same information as walkdirs() only each entry is yielded
+    in utf-8. On platforms which have a filesystem encoding of utf8 the paths
+    are returned as exact byte-strings.
+
+    :return: yields a tuple of (dir_info, [file_info])
+        dir_info is (utf8_relpath, path-from-top)
+        file_info is (utf8_relpath, utf8_name, kind, lstat, path-from-top)
+        if top is an absolute path, path-from-top is also an absolute path.
+        path-from-top might be unicode or utf8, but it is the correct path to
+        pass to os functions to affect the file in question. (such as os.lstat)
+    """
+    dir_reader = _get_dir_reader()
     # 0 - relpath, 1- basename, 2- kind, 3- stat, 4-toppath
     # But we don't actually uses 1-3 in pending, so set them to None
-    pending = [[_selected_dir_reader.top_prefix_to_starting_dir(top, prefix)]]
-    read_dir = _selected_dir_reader.read_dir
+    pending = [[dir_reader.top_prefix_to_starting_dir(top, prefix)]]
+    read_dir = dir_reader.read_dir
     _directory = _directory_kind
     while pending:
         relroot, _, _, _, top = pending[-1].pop()
@@ -26,8 +26,9 @@ import difflib
 """)
 
 
-__all__ = ['PatienceSequenceMatcher', 'unified_diff', 'unified_diff_bytes',
-           'unified_diff_files']
+__all__ = ['LineInterner', 'PatienceSequenceMatcher', 'unified_diff',
+           'unified_diff_bytes', 'unified_diff_files',
+           'get_matching_blocks_for_parents']
 
 
 # This is a version of unified_diff which only adds a factory parameter
@@ -200,18 +201,67 @@ def unified_diff_files(a, b, sequencematcher=None):
 
 try:
     from ._patiencediff_c import (
+        intern_lines_c as intern_lines,
         unique_lcs_c as unique_lcs,
         recurse_matches_c as recurse_matches,
         PatienceSequenceMatcher_c as PatienceSequenceMatcher
         )
 except ImportError:
     from ._patiencediff_py import (
+        intern_lines_py as intern_lines,
         unique_lcs_py as unique_lcs,
         recurse_matches_py as recurse_matches,
         PatienceSequenceMatcher_py as PatienceSequenceMatcher
         )  # noqa: F401
 
 
+class LineInterner(object):
+    """Map the lines of texts to integer ids.
+
+    Equal lines get the same id, so comparing the ids of two texts gives
+    the same matching blocks as comparing their lines, while the ids are
+    cheaper to hash and compare. Interning a text costs about as much as
+    comparing it once, so this only pays off for texts that are compared
+    with several others.
+    """
+
+    def __init__(self):
+        self._ids = {}
+
+    def __len__(self):
+        return len(self._ids)
+
+    def intern(self, lines):
+        """Return the list of ids of lines."""
+        return intern_lines(lines, self._ids)
+
+
+def get_matching_blocks_for_parents(parents, text, interner=None):
+    """Get the matching blocks between several parents and a text.
+
+    The lines of text are only hashed once, rather than once per parent.
+
+    :param parents: A list of parent texts, as sequences of lines
+    :param text: A sequence of lines
+    :param interner: The LineInterner to use, e.g. to share the ids of the
+        lines with other comparisons
+    :return: A list with the matching blocks between each parent and text,
+        as returned by PatienceSequenceMatcher.get_matching_blocks
+    """
+    if interner is None:
+        if len(parents) < 2:
+            # Interning only pays off when text is compared several times
+            return [PatienceSequenceMatcher(None, parent, text
+                                            ).get_matching_blocks()
+                    for parent in parents]
+        interner = LineInterner()
+    text = interner.intern(text)
+    return [
+        PatienceSequenceMatcher(
+            None, interner.intern(parent), text).get_matching_blocks()
+        for parent in parents]
+
+
 def main(args):
     import optparse
     p = optparse.OptionParser(usage='%prog [options] file_a file_b'
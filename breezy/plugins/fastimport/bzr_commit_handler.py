@@ -39,6 +39,7 @@ from fastimport import (
     )
 
 from .helpers import (
+    PrecompressedText,
     mode_to_kind,
     )
 
@@ -375,7 +376,10 @@ class CommitHandler(processor.CommitHandler):
         if kind == 'file':
             ie.executable = is_executable
             # lines = osutils.split_lines(data)
-            ie.text_sha1 = osutils.sha_string(data)
+            if isinstance(data, PrecompressedText):
+                ie.text_sha1 = data.sha1
+            else:
+                ie.text_sha1 = osutils.sha_string(data)
             ie.text_size = len(data)
             self.data_for_commit[file_id] = data
         elif kind == 'directory':
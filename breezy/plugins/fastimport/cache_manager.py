@@ -17,11 +17,10 @@
 
 from __future__ import absolute_import
 
-import atexit
-import os
-import shutil
+import collections
+import mmap
 import tempfile
-import weakref
+import zlib
 
 from ... import lru_cache, trace
 from . import (
@@ -31,48 +30,182 @@ from fastimport.reftracker import (
     RefTracker,
     )
 from .helpers import (
+    PrecompressedText,
+    precompressed_from_block,
     single_plural,
     )
 
 
-class _Cleanup(object):
-    """This class makes sure we clean up when CacheManager goes away.
+class _SpillFile(object):
+    """An append-only temporary file holding spilled blobs."""
 
-    We use a helper class to ensure that we are never in a refcycle.
+    def __init__(self):
+        self.file = tempfile.TemporaryFile(prefix='fastimport-blobs-')
+        self.size = 0
+        self._map = None
+
+    def append(self, data):
+        offset = self.size
+        self.file.write(data)
+        self.size += len(data)
+        return offset
+
+    def read(self, offset, n_bytes):
+        if self._map is None or offset + n_bytes > len(self._map):
+            # The file grew since it was mapped
+            self.file.flush()
+            if self._map is not None:
+                self._map.close()
+            self._map = mmap.mmap(self.file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+        return self._map[offset:offset + n_bytes]
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self.file.close()
+
+
+def _blob_size(data):
+    """Return the memory used by a blob, including a precompressed block."""
+    if isinstance(data, PrecompressedText):
+        return len(data) + len(data.block[0])
+    return len(data)
+
+
+class BlobCache(object):
+    """A cache of blobs that keeps at most max_size bytes in memory.
+
+    When the blobs in memory exceed max_size, the least recently used ones
+    are spilled to append-only temporary files and read back from there
+    through mmap. The spill files are split in shards of at most
+    _shard_size bytes, so that no single mapping gets too large.
+
+    Only the block of a PrecompressedText is spilled, which is compressed
+    already. The text is extracted from it again when it is read back.
     """
 
-    def __init__(self, disk_blobs):
-        self.disk_blobs = disk_blobs
-        self.tempdir = None
-        self.small_blobs = None
+    _shard_size = 1024 * 1024 * 1024
+
+    def __init__(self, max_size, compress=False):
+        """Create a BlobCache.
 
-    def __del__(self):
-        self.finalize()
+        :param max_size: Number of bytes of blobs to keep in memory
+        :param compress: Whether to zlib compress spilled blobs
+        """
+        self._max_size = max_size
+        self._compress = compress
+        # id -> data, least recently used first
+        self._memory = collections.OrderedDict()
+        self._memory_bytes = 0
+        # id -> (shard, offset, n_bytes, (sha1, start, end) or None)
+        self._spilled = {}
+        self._shards = []
+        self.memory_hits = 0
+        self.spill_hits = 0
+        self.spill_count = 0
+        self.spill_bytes = 0
+
+    def __len__(self):
+        return len(self._memory) + len(self._spilled)
+
+    def __contains__(self, id):
+        return id in self._memory or id in self._spilled
+
+    def memory_bytes(self):
+        """Return the number of bytes of blobs held in memory."""
+        return self._memory_bytes
+
+    def add(self, id, data):
+        self.remove(id)
+        self._memory[id] = data
+        self._memory_bytes += _blob_size(data)
+        while self._memory_bytes > self._max_size:
+            (old_id, old_data) = self._memory.popitem(last=False)
+            self._memory_bytes -= _blob_size(old_data)
+            self._spill(old_id, old_data)
+
+    def _spill(self, id, data):
+        if isinstance(data, PrecompressedText):
+            block_bytes, start, end = data.block
+            precompressed = (data.sha1, start, end)
+            data = block_bytes
+        else:
+            precompressed = None
+            if self._compress:
+                data = zlib.compress(data)
+        if (not self._shards or (self._shards[-1].size and
+                                 self._shards[-1].size + len(data) >
+                                 self._shard_size)):
+            self._shards.append(_SpillFile())
+        shard = len(self._shards) - 1
+        offset = self._shards[shard].append(data)
+        self._spilled[id] = (shard, offset, len(data), precompressed)
+        self.spill_count += 1
+        self.spill_bytes += len(data)
+
+    def get(self, id):
+        """Return the data of a blob.
+
+        :raises KeyError: if the blob is not in the cache
+        """
+        try:
+            data = self._memory.pop(id)
+        except KeyError:
+            (shard, offset, n_bytes, precompressed) = self._spilled[id]
+            data = self._shards[shard].read(offset, n_bytes)
+            if precompressed is not None:
+                sha1, start, end = precompressed
+                data = precompressed_from_block((data, start, end), sha1)
+            elif self._compress:
+                data = zlib.decompress(data)
+            self.spill_hits += 1
+            return data
+        # Mark as most recently used
+        self._memory[id] = data
+        self.memory_hits += 1
+        return data
+
+    def remove(self, id):
+        """Remove a blob, if present.
+
+        The space used by spilled blobs is not reclaimed until the cache is
+        closed.
+        """
+        try:
+            data = self._memory.pop(id)
+        except KeyError:
+            self._spilled.pop(id, None)
+        else:
+            self._memory_bytes -= _blob_size(data)
 
-    def finalize(self):
-        if self.disk_blobs is not None:
-            for info in self.disk_blobs.values():
-                if info[-1] is not None:
-                    os.unlink(info[-1])
-            self.disk_blobs = None
-        if self.small_blobs is not None:
-            self.small_blobs.close()
-            self.small_blobs = None
-        if self.tempdir is not None:
-            shutil.rmtree(self.tempdir)
+    def clear(self):
+        self._memory.clear()
+        self._memory_bytes = 0
+        self._spilled.clear()
+        self.close()
+
+    def close(self):
+        """Remove the spill files."""
+        for shard in self._shards:
+            shard.close()
+        self._shards = []
 
 
 class CacheManager(object):
 
-    _small_blob_threshold = 25 * 1024
     _sticky_cache_size = 300 * 1024 * 1024
-    _sticky_flushed_size = 100 * 1024 * 1024
 
-    def __init__(self, info=None, verbose=False, inventory_cache_size=10):
+    def __init__(self, info=None, verbose=False, inventory_cache_size=10,
+                 blob_cache_size=None, compress_blobs=False):
         """Create a manager of caches.
 
         :param info: a ConfigObj holding the output from
             the --info processor, or None if no hints are available
+        :param blob_cache_size: number of bytes of sticky blobs to keep in
+            memory before spilling them to disk
+        :param compress_blobs: whether to compress blobs spilled to disk
         """
         self.verbose = verbose
 
@@ -80,15 +213,9 @@ class CacheManager(object):
         # Sticky blobs are referenced more than once, and are saved until their
         # refcount goes to 0
         self._blobs = {}
-        self._sticky_blobs = {}
-        self._sticky_memory_bytes = 0
-        # if we overflow our memory cache, then we will dump large blobs to
-        # disk in this directory
-        self._tempdir = None
-        # id => (offset, n_bytes, fname)
-        #   if fname is None, then the content is stored in the small file
-        self._disk_blobs = {}
-        self._cleanup = _Cleanup(self._disk_blobs)
+        if blob_cache_size is None:
+            blob_cache_size = self._sticky_cache_size
+        self._sticky_blobs = BlobCache(blob_cache_size, compress_blobs)
 
         # revision-id -> Inventory cache
         # these are large and we probably don't need too many as
@@ -143,12 +270,25 @@ class CacheManager(object):
         """Dump some statistics about what we cached."""
         # TODO: add in inventory stastistics
         note("Cache statistics:")
-        self._show_stats_for(self._sticky_blobs, "sticky blobs", note=note)
+        self._show_blob_stats(note=note)
         self._show_stats_for(self.marks, "revision-ids", note=note)
         # These aren't interesting so omit from the output, at least for now
         #self._show_stats_for(self._blobs, "other blobs", note=note)
         # self.reftracker.dump_stats(note=note)
 
+    def _show_blob_stats(self, note):
+        blobs = self._sticky_blobs
+        count = len(blobs)
+        note("    %-12s: %8.1f M in memory, %d spilled (%.1f M) (%d %s)"
+             % ("sticky blobs", blobs.memory_bytes() / 1024. / 1024,
+                blobs.spill_count, blobs.spill_bytes / 1024. / 1024, count,
+                single_plural(count, "item", "items")))
+        fetches = blobs.memory_hits + blobs.spill_hits
+        if fetches:
+            note("    %-12s: %d from memory, %d from disk (%.1f%% spilled)"
+                 % ("blob fetches", blobs.memory_hits, blobs.spill_hits,
+                    100.0 * blobs.spill_hits / fetches))
+
     def _show_stats_for(self, a_dict, label, note, tuple_key=False):
         """Dump statistics about a given dictionary.
 
@@ -179,79 +319,25 @@ class CacheManager(object):
         self.reftracker.clear()
         self.inventories.clear()
 
-    def _flush_blobs_to_disk(self):
-        blobs = list(self._sticky_blobs)
-        sticky_blobs = self._sticky_blobs
-        total_blobs = len(sticky_blobs)
-        blobs.sort(key=lambda k: len(sticky_blobs[k]))
-        if self._tempdir is None:
-            tempdir = tempfile.mkdtemp(prefix='fastimport_blobs-')
-            self._tempdir = tempdir
-            self._cleanup.tempdir = self._tempdir
-            self._cleanup.small_blobs = tempfile.TemporaryFile(
-                prefix='small-blobs-', dir=self._tempdir)
-            small_blob_ref = weakref.ref(self._cleanup.small_blobs)
-            # Even though we add it to _Cleanup it seems that the object can be
-            # destroyed 'too late' for cleanup to actually occur. Probably a
-            # combination of bzr's "die directly, don't clean up" and how
-            # exceptions close the running stack.
-
-            def exit_cleanup():
-                small_blob = small_blob_ref()
-                if small_blob is not None:
-                    small_blob.close()
-                shutil.rmtree(tempdir, ignore_errors=True)
-            atexit.register(exit_cleanup)
-        count = 0
-        bytes = 0
-        n_small_bytes = 0
-        while self._sticky_memory_bytes > self._sticky_flushed_size:
-            id = blobs.pop()
-            blob = self._sticky_blobs.pop(id)
-            n_bytes = len(blob)
-            self._sticky_memory_bytes -= n_bytes
-            if n_bytes < self._small_blob_threshold:
-                f = self._cleanup.small_blobs
-                f.seek(0, os.SEEK_END)
-                self._disk_blobs[id] = (f.tell(), n_bytes, None)
-                f.write(blob)
-                n_small_bytes += n_bytes
-            else:
-                fd, name = tempfile.mkstemp(prefix='blob-', dir=self._tempdir)
-                os.write(fd, blob)
-                os.close(fd)
-                self._disk_blobs[id] = (0, n_bytes, name)
-            bytes += n_bytes
-            del blob
-            count += 1
-        trace.note('flushed %d/%d blobs w/ %.1fMB (%.1fMB small) to disk'
-                   % (count, total_blobs, bytes / 1024. / 1024,
-                      n_small_bytes / 1024. / 1024))
-
     def store_blob(self, id, data):
         """Store a blob of data."""
         # Note: If we're not reference counting, everything has to be sticky
         if not self._blob_ref_counts or id in self._blob_ref_counts:
-            self._sticky_blobs[id] = data
-            self._sticky_memory_bytes += len(data)
-            if self._sticky_memory_bytes > self._sticky_cache_size:
-                self._flush_blobs_to_disk()
+            self._sticky_blobs.add(id, data)
         elif data == b'':
             # Empty data is always sticky
-            self._sticky_blobs[id] = data
+            self._sticky_blobs.add(id, data)
         else:
             self._blobs[id] = data
 
-    def _decref(self, id, cache, fn):
+    def _decref(self, id):
         if not self._blob_ref_counts:
             return False
         count = self._blob_ref_counts.get(id, None)
         if count is not None:
             count -= 1
             if count <= 0:
-                del cache[id]
-                if fn is not None:
-                    os.unlink(fn)
+                self._sticky_blobs.remove(id)
                 del self._blob_ref_counts[id]
                 return True
             else:
@@ -262,18 +348,6 @@ class CacheManager(object):
         """Fetch a blob of data."""
         if id in self._blobs:
             return self._blobs.pop(id)
-        if id in self._disk_blobs:
-            (offset, n_bytes, fn) = self._disk_blobs[id]
-            if fn is None:
-                f = self._cleanup.small_blobs
-                f.seek(offset)
-                content = f.read(n_bytes)
-            else:
-                with open(fn, 'rb') as fp:
-                    content = fp.read()
-            self._decref(id, self._disk_blobs, fn)
-            return content
-        content = self._sticky_blobs[id]
-        if self._decref(id, self._sticky_blobs, None):
-            self._sticky_memory_bytes -= len(content)
+        content = self._sticky_blobs.get(id)
+        self._decref(id)
         return content
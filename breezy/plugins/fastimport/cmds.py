@@ -264,6 +264,17 @@ class cmd_fast_import(Command):
                      Option('inv-cache', type=int,
                             help="Number of inventories to cache.",
                             ),
+                     Option('blob-cache', type=int, argname='MB',
+                            help="Megabytes of blobs to keep in memory."
+                            " The default is 300.",
+                            ),
+                     Option('compress-blobs',
+                            help="Compress blobs spilled to disk.",
+                            ),
+                     Option('pipeline',
+                            help="Parse the stream and compress file texts"
+                                 " in separate threads.",
+                            ),
                      RegistryOption.from_kwargs('mode',
                                                 'The import algorithm to use.',
                                                 title='Import Algorithm',
@@ -290,7 +301,8 @@ class cmd_fast_import(Command):
     def run(self, source, destination='.', verbose=False, info=None,
             trees=False, count=-1, checkpoint=10000, autopack=4, inv_cache=-1,
             mode=None, import_marks=None, export_marks=None, format=None,
-            user_map=None):
+            user_map=None, blob_cache=None, compress_blobs=False,
+            pipeline=False):
         load_fastimport()
         from .processors import generic_processor
         from .helpers import (
@@ -313,6 +325,9 @@ class cmd_fast_import(Command):
             'checkpoint': checkpoint,
             'autopack': autopack,
             'inv-cache': inv_cache,
+            'blob-cache': blob_cache,
+            'compress-blobs': compress_blobs,
+            'pipeline': pipeline,
             'mode': mode,
             'import-marks': import_marks,
             'export-marks': export_marks,
@@ -414,6 +429,20 @@ class cmd_fast_export(Command):
      the first requested revision.  This allows a user to produce a tree
      identical to the original without munging multiple exports.
 
+    :Performance:
+
+     The --pipeline option reads the revisions, their trees and the file
+     texts a batch of revisions at a time, and works out the changes of
+     each revision in a separate thread while the earlier commits are
+     being written. The output is the same as without it.
+
+     When --export-marks or --marks is given, the marks are also saved at
+     every checkpoint. An interrupted export can then be resumed by
+     running it again with --marks: the revisions already exported are
+     skipped. Use the --import-marks and --export-marks options of
+     git-fast-import so that it knows about the commits imported
+     before the interruption.
+
     :Examples:
 
      To produce data destined for import into Bazaar::
@@ -478,13 +507,18 @@ class cmd_fast_export(Command):
                      Option('no-tags',
                             help="Don't export tags"
                             ),
+                     Option('pipeline',
+                            help="Read and diff revisions in batches in a "
+                            "separate thread."
+                            ),
                      ]
     encoding_type = 'exact'
 
     def run(self, source=None, destination=None, verbose=False,
             git_branch="master", checkpoint=10000, marks=None,
             import_marks=None, export_marks=None, revision=None,
-            plain=True, rewrite_tag_names=False, no_tags=False, baseline=False):
+            plain=True, rewrite_tag_names=False, no_tags=False, baseline=False,
+            pipeline=False):
         load_fastimport()
         from ...branch import Branch
         from . import exporter
@@ -501,5 +535,6 @@ class cmd_fast_export(Command):
                                             outf=outf, ref=b"refs/heads/%s" % git_branch.encode('utf-8'), checkpoint=checkpoint,
                                             import_marks_file=import_marks, export_marks_file=export_marks,
                                             revision=revision, verbose=verbose, plain_format=plain,
-                                            rewrite_tags=rewrite_tag_names, no_tags=no_tags, baseline=baseline)
+                                            rewrite_tags=rewrite_tag_names, no_tags=no_tags, baseline=baseline,
+                                            pipeline=pipeline)
         return exporter.run()
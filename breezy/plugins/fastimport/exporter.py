@@ -51,6 +51,7 @@ try:
     from email.utils import parseaddr
 except ImportError:  # python < 3
     from email.Utils import parseaddr
+import functools
 import sys
 import time
 import re
@@ -69,6 +70,7 @@ from ...sixish import (
     int2byte,
     PY3,
     viewitems,
+    viewvalues,
     )
 
 from . import (
@@ -81,6 +83,13 @@ lazy_import.lazy_import(globals(),
 from fastimport import commands
 """)
 
+# How many revisions are prepared together in pipeline mode
+_PIPELINE_BATCH_SIZE = 100
+
+# How many batches of prepared revisions may wait to be written in pipeline
+# mode. Their file texts are held in memory until they are written.
+_PIPELINE_QUEUE_BATCHES = 2
+
 
 def _get_output_stream(destination):
     if destination is None or destination == '-':
@@ -163,7 +172,7 @@ class BzrFastExporter(object):
     def __init__(self, source, outf, ref=None, checkpoint=-1,
                  import_marks_file=None, export_marks_file=None, revision=None,
                  verbose=False, plain_format=False, rewrite_tags=False,
-                 no_tags=False, baseline=False):
+                 no_tags=False, baseline=False, pipeline=False):
         """Export branch data in fast import format.
 
         :param plain_format: if True, 'classic' fast-import format is
@@ -175,6 +184,9 @@ class BzrFastExporter(object):
             Otherwise tags which aren't valid for git will be skipped if
             plain_format is set.
         :param no_tags: if True tags won't be exported at all
+        :param pipeline: if True, the revisions, trees and file texts are
+            read a batch of revisions at a time and the changes computed
+            in a separate thread, while the earlier commits are written
         """
         self.branch = source
         self.outf = outf
@@ -188,6 +200,7 @@ class BzrFastExporter(object):
         self.rewrite_tags = rewrite_tags
         self.no_tags = no_tags
         self.baseline = baseline
+        self.pipeline = pipeline
         self._multi_author_api_available = hasattr(breezy.revision.Revision,
                                                    'get_apparent_authors')
         self.properties_to_exclude = ['authors', 'author']
@@ -207,7 +220,7 @@ class BzrFastExporter(object):
         if self.import_marks_file:
             marks_info = marks_file.import_marks(self.import_marks_file)
             if marks_info is not None:
-                self.revid_to_mark = dict((r, m) for m, r in
+                self.revid_to_mark = dict((r, int(m)) for m, r in
                                           marks_info.items())
                 # These are no longer included in the marks file
                 #self.branch_names = marks_info[1]
@@ -249,8 +262,11 @@ class BzrFastExporter(object):
                 self.emit_features()
             if self.baseline:
                 self.emit_baseline(interesting.pop(0), self.ref)
-            for revid in interesting:
-                self.emit_commit(revid, self.ref)
+            if self.pipeline:
+                self._emit_commits_pipelined(interesting, self.ref)
+            else:
+                for revid in interesting:
+                    self.emit_commit(revid, self.ref)
             if self.branch.supports_tags() and not self.no_tags:
                 self.emit_tags()
 
@@ -302,7 +318,8 @@ class BzrFastExporter(object):
 
     def _save_marks(self):
         if self.export_marks_file:
-            revision_ids = dict((m, r) for r, m in self.revid_to_mark.items())
+            revision_ids = dict((b"%d" % m, r)
+                                for r, m in self.revid_to_mark.items())
             marks_file.export_marks(self.export_marks_file, revision_ids)
 
     def is_empty_dir(self, tree, path):
@@ -336,14 +353,24 @@ class BzrFastExporter(object):
         self.print_cmd(commands.ResetCommand(ref, None))
         self.print_cmd(self._get_commit_command(ref, mark, revobj, file_cmds))
 
-    def emit_commit(self, revid, ref):
+    def emit_commit(self, revid, ref, prepared=None):
+        """Emit the commit for a revision.
+
+        :param prepared: None or a (revobj, file_cmds) tuple as yielded
+            by _iter_prepared_commits
+        """
         if revid in self.revid_to_mark or revid in self.excluded_revisions:
             return
 
         # Get the Revision object
-        try:
-            revobj = self.branch.repository.get_revision(revid)
-        except bazErrors.NoSuchRevision:
+        if prepared is None:
+            try:
+                revobj = self.branch.repository.get_revision(revid)
+            except bazErrors.NoSuchRevision:
+                revobj = None
+        else:
+            revobj, file_cmds = prepared
+        if revobj is None:
             # This is a ghost revision. Mark it as not found and next!
             self.revid_to_mark[revid] = -1
             return
@@ -368,7 +395,8 @@ class BzrFastExporter(object):
         # Print the commit
         mark = ncommits + 1
         self.revid_to_mark[revid] = mark
-        file_cmds = self._get_filecommands(parent, revid)
+        if prepared is None:
+            file_cmds = self._get_filecommands(parent, revid)
         self.print_cmd(self._get_commit_command(ref, mark, revobj, file_cmds))
 
         # Report progress and checkpoint if it's time for that
@@ -380,6 +408,100 @@ class BzrFastExporter(object):
             self._save_marks()
             self.print_cmd(commands.CheckpointCommand())
 
+    def _emit_commits_pipelined(self, revids, ref):
+        # The revisions are prepared in a single thread as repository
+        # objects may not be used from several threads at once.
+        revids = [revid for revid in revids
+                  if revid not in self.revid_to_mark and
+                  revid not in self.excluded_revisions]
+        prepared = helpers.iter_in_thread(
+            functools.partial(self._iter_prepared_commits, revids),
+            _PIPELINE_QUEUE_BATCHES * _PIPELINE_BATCH_SIZE)
+        for revid, revobj, file_cmds in prepared:
+            self.emit_commit(revid, ref, (revobj, file_cmds))
+
+    def _iter_prepared_commits(self, revids):
+        """Prepare the commits for revids, a batch at a time.
+
+        :return: An iterator of (revid, revobj, file_cmds) tuples in the
+            order of revids. revobj is None for ghost revisions.
+        """
+        for start in range(0, len(revids), _PIPELINE_BATCH_SIZE):
+            for item in self._prepare_commits(
+                    revids[start:start + _PIPELINE_BATCH_SIZE]):
+                yield item
+
+    def _get_batch_trees(self, revids):
+        """Get the revision trees for a batch of revisions.
+
+        Trees that can't be read together are missing from the result.
+        """
+        repository = self.branch.repository
+        trees = {}
+        if breezy.revision.NULL_REVISION in revids:
+            trees[breezy.revision.NULL_REVISION] = repository.revision_tree(
+                breezy.revision.NULL_REVISION)
+            revids.discard(breezy.revision.NULL_REVISION)
+        try:
+            for tree in repository.revision_trees(list(revids)):
+                trees[tree.get_revision_id()] = tree
+        except (bazErrors.NoSuchRevision,
+                bazErrors.UnexpectedInventoryFormat):
+            # The trees are read one at a time by the caller instead
+            pass
+        return trees
+
+    def _prepare_commits(self, revids):
+        repository = self.branch.repository
+        revobjs = dict(repository.iter_revisions(revids))
+        parents = {}
+        for revid in revids:
+            revobj = revobjs[revid]
+            if revobj is None:
+                continue
+            if revobj.parent_ids:
+                parents[revid] = revobj.parent_ids[0]
+            else:
+                parents[revid] = breezy.revision.NULL_REVISION
+        trees = self._get_batch_trees(
+            set(parents).union(viewvalues(parents)))
+
+        # Read the file texts of the whole batch at once
+        prepared = []
+        desired_files = []
+        for revid in revids:
+            revobj = revobjs[revid]
+            file_cmds = None
+            if revobj is not None:
+                parent = parents[revid]
+                tree_old = trees.get(parent)
+                tree_new = trees.get(revid)
+                if tree_old is None or tree_new is None:
+                    tree_old, tree_new = self._get_revision_trees(
+                        parent, revid)
+                file_cmds = []
+                if tree_old and tree_new:
+                    file_cmds, files_to_get = self._get_change_commands(
+                        tree_old, tree_new, revid)
+                    for i, (path, identifier) in enumerate(files_to_get):
+                        desired_files.append(
+                            (tree_new.path2id(path),
+                             tree_new.get_file_revision(path),
+                             (len(prepared), i, identifier)))
+            prepared.append((revid, revobj, file_cmds))
+        texts = {}
+        for (index, i, identifier), chunks in repository.iter_files_bytes(
+                desired_files):
+            texts[index, i] = (identifier, b''.join(chunks))
+        for index, (revid, revobj, file_cmds) in enumerate(prepared):
+            i = 0
+            while (index, i) in texts:
+                (path, mode), text = texts.pop((index, i))
+                file_cmds.append(commands.FileModifyCommand(
+                    path.encode("utf-8"), mode, None, text))
+                i += 1
+            yield revid, revobj, file_cmds
+
     def _get_name_email(self, user):
         if user.find('<') == -1:
             # If the email isn't inside <>, we need to use it as the name
@@ -478,7 +600,27 @@ class BzrFastExporter(object):
         if not(tree_old and tree_new):
             # Something is wrong with this revision - ignore the filecommands
             return []
+        file_cmds, files_to_get = self._get_change_commands(
+            tree_old, tree_new, revision_id)
+        # Keep the order of files_to_get, as the pipelined export does
+        texts = {}
+        for (i, (path, mode)), chunks in tree_new.iter_files_bytes(
+                [(path, (i, identifier))
+                 for i, (path, identifier) in enumerate(files_to_get)]):
+            texts[i] = (path, mode, b''.join(chunks))
+        for i in range(len(files_to_get)):
+            path, mode, text = texts[i]
+            file_cmds.append(commands.FileModifyCommand(
+                path.encode("utf-8"), mode, None, text))
+        return file_cmds
+
+    def _get_change_commands(self, tree_old, tree_new, revision_id):
+        """Get the FileCommands for the changes between two trees.
 
+        :return: A tuple of the FileCommands that don't need a file text
+            and a list of (path, (path, mode)) tuples for the files
+            whose texts need to be read from tree_new.
+        """
         changes = tree_new.changes_from(tree_old)
 
         # Make "modified" have 3-tuples, as added does
@@ -521,11 +663,7 @@ class BzrFastExporter(object):
             else:
                 self.warning("cannot export '%s' of kind %s yet - ignoring" %
                              (path, kind))
-        for (path, mode), chunks in tree_new.iter_files_bytes(
-                files_to_get):
-            file_cmds.append(commands.FileModifyCommand(
-                path.encode("utf-8"), mode, None, b''.join(chunks)))
-        return file_cmds
+        return file_cmds, files_to_get
 
     def _process_renames_and_deletes(self, renames, deletes,
                                      revision_id, tree_old):
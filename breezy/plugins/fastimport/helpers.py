@@ -17,10 +17,26 @@
 
 from __future__ import absolute_import
 
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+import collections
+from multiprocessing.pool import ThreadPool
 import stat
+import sys
+import threading
 
 from ... import (
     controldir,
+    osutils,
+    )
+from ...bzr.groupcompress import (
+    GroupCompressBlock,
+    _compress_text_to_block,
+    )
+from ...sixish import (
+    reraise,
     )
 
 
@@ -178,3 +194,139 @@ def single_plural(n, single, plural):
         return single
     else:
         return plural
+
+
+def iter_in_thread(iter_factory, max_pending):
+    """Iterate over iter_factory() in a separate thread.
+
+    The items are produced while the caller processes the earlier ones,
+    with at most max_pending items waiting to be consumed. Exceptions
+    raised by the iterator are re-raised in the caller.
+
+    :param iter_factory: a callable returning an iterator
+    :param max_pending: the number of items that may be produced ahead
+    """
+    items = queue.Queue(max_pending)
+    stopped = threading.Event()
+
+    def put(item):
+        while not stopped.is_set():
+            try:
+                items.put(item, timeout=0.1)
+            except queue.Full:
+                continue
+            else:
+                return
+
+    def producer():
+        try:
+            for item in iter_factory():
+                put((item, None))
+                if stopped.is_set():
+                    return
+        except BaseException:
+            put((StopIteration, sys.exc_info()))
+        else:
+            put((StopIteration, None))
+
+    thread = threading.Thread(target=producer)
+    thread.daemon = True
+    thread.start()
+    try:
+        while True:
+            item, exc_info = items.get()
+            if item is not StopIteration:
+                yield item
+            elif exc_info is not None:
+                try:
+                    reraise(*exc_info)
+                finally:
+                    del exc_info
+            else:
+                return
+    finally:
+        # The consumer may stop early, e.g. after a number of commits
+        stopped.set()
+        thread.join()
+
+
+class PrecompressedText(bytes):
+    """A file text, along with its sha1 and groupcompress block.
+
+    :ivar sha1: the hex sha1 of the text
+    :ivar block: a (block_bytes, start, end) tuple, as returned by
+        groupcompress._compress_text_to_block
+    """
+
+
+def precompress_text(data):
+    """Compute the sha1 and the groupcompress block of a text.
+
+    :return: a PrecompressedText
+    """
+    text = PrecompressedText(data)
+    text.sha1 = osutils.sha_string(data)
+    text.block = _compress_text_to_block(data)
+    return text
+
+
+def precompressed_from_block(block, sha1):
+    """Recreate a PrecompressedText from its block and sha1."""
+    block_bytes, start, end = block
+    text = PrecompressedText(
+        GroupCompressBlock.from_bytes(block_bytes).extract(None, start, end))
+    text.sha1 = sha1
+    text.block = block
+    return text
+
+
+def _iter_text_commands(cmd):
+    """Iterate over the commands in cmd with a text that can be precompressed.
+
+    Texts given by a data reference are precompressed with their blob.
+    """
+    if cmd.name == b'blob':
+        yield cmd
+    elif cmd.name == b'commit':
+        if not isinstance(cmd.file_iter, list):
+            cmd.file_iter = list(cmd.iter_files())
+        for filecmd in cmd.file_iter:
+            if (filecmd.name == b'filemodify' and filecmd.data is not None
+                    and not stat.S_ISLNK(filecmd.mode)):
+                yield filecmd
+
+
+def iter_precompressed(commands, max_pending, workers=None):
+    """Precompress the texts of commands in a pool of threads.
+
+    The texts of blob and inline filemodify commands are replaced by
+    PrecompressedText objects. Compressing is mostly zlib and sha1 work,
+    which does not hold the GIL. Commands are yielded in order, with at most
+    max_pending commands being precompressed ahead of the caller.
+
+    :param commands: an iterator over the commands
+    :param max_pending: the number of commands that may be precompressed ahead
+    :param workers: the number of threads, defaulting to the number of CPUs
+    """
+    if workers is None:
+        workers = osutils.local_concurrency()
+    pool = ThreadPool(workers)
+    pending = collections.deque()
+
+    def finish(cmd, results):
+        for text_cmd, result in results:
+            text_cmd.data = result.get()
+        return cmd
+    try:
+        for cmd in commands:
+            results = [(text_cmd, pool.apply_async(precompress_text,
+                                                   (text_cmd.data,)))
+                       for text_cmd in _iter_text_commands(cmd)]
+            pending.append((cmd, results))
+            while len(pending) > max_pending:
+                yield finish(*pending.popleft())
+        while pending:
+            yield finish(*pending.popleft())
+    finally:
+        pool.terminate()
+        pool.join()
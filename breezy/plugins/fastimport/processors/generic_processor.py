@@ -17,7 +17,7 @@
 
 from __future__ import absolute_import
 
-
+import functools
 import time
 from .... import (
     debug,
@@ -65,6 +65,9 @@ _DEFAULT_AUTO_PACK = 4
 _DEFAULT_INV_CACHE_SIZE = 1
 _DEFAULT_CHK_INV_CACHE_SIZE = 1
 
+# How many parsed commands may wait to be processed in pipeline mode
+_PIPELINE_QUEUE_SIZE = 100
+
 
 class GenericProcessor(processor.ImportProcessor):
     """An import processor that handles basic imports.
@@ -108,6 +111,16 @@ class GenericProcessor(processor.ImportProcessor):
     * inv-cache - number of inventories to cache.
       If not set, the default is 1.
 
+    * blob-cache - number of megabytes of blobs to keep in memory.
+      Blobs beyond this are spilled to temporary files.
+      The default is 300.
+
+    * compress-blobs - compress the blobs spilled to temporary files.
+
+    * pipeline - parse the stream in a separate thread, while the
+      revisions parsed before are loaded. For repositories using
+      groupcompress, file texts are also compressed in a pool of threads.
+
     * mode - import algorithm to use: default or experimental.
 
     * import-marks - name of file to read to load mark information from
@@ -122,6 +135,9 @@ class GenericProcessor(processor.ImportProcessor):
         'checkpoint',
         'autopack',
         'inv-cache',
+        'blob-cache',
+        'compress-blobs',
+        'pipeline',
         'mode',
         'import-marks',
         'export-marks',
@@ -150,8 +166,9 @@ class GenericProcessor(processor.ImportProcessor):
                       (self.total_commits,))
         else:
             self.note("Starting import ...")
-        self.cache_mgr = cache_manager.CacheManager(self.info, self.verbose,
-                                                    self.inventory_cache_size)
+        self.cache_mgr = cache_manager.CacheManager(
+            self.info, self.verbose, self.inventory_cache_size,
+            self.blob_cache_size, self.compress_blobs)
 
         if self.params.get("import-marks") is not None:
             mark_info = marks_file.import_marks(
@@ -244,6 +261,13 @@ class GenericProcessor(processor.ImportProcessor):
                 cache_size = _DEFAULT_INV_CACHE_SIZE
         self.inventory_cache_size = cache_size
 
+        # Decide how many bytes of blobs to keep in memory
+        blob_cache_size = self.params.get('blob-cache')
+        if blob_cache_size is not None:
+            blob_cache_size = int(blob_cache_size) * 1024 * 1024
+        self.blob_cache_size = blob_cache_size
+        self.compress_blobs = bool(self.params.get('compress-blobs', False))
+
         # Find the maximum number of commits to import (None means all)
         # and prepare progress reporting. Just in case the info file
         # has an outdated count of commits, we store the max counts
@@ -279,7 +303,7 @@ class GenericProcessor(processor.ImportProcessor):
         elif self.repo is not None:
             self.repo.lock_write()
         try:
-            super(GenericProcessor, self)._process(command_iter)
+            self._process(command_iter)
         finally:
             # If an unhandled exception occurred, abort the write group
             if self.repo is not None and self.repo.is_in_write_group():
@@ -293,6 +317,9 @@ class GenericProcessor(processor.ImportProcessor):
                 self.repo.unlock()
 
     def _process(self, command_iter):
+        if self.params.get('pipeline'):
+            command_iter = functools.partial(
+                self._iter_pipelined, command_iter)
         # if anything goes wrong, abort the write group if any
         try:
             processor.ImportProcessor._process(self, command_iter)
@@ -301,6 +328,19 @@ class GenericProcessor(processor.ImportProcessor):
                 self.repo.abort_write_group()
             raise
 
+    def _iter_pipelined(self, command_iter):
+        """Iterate over the commands, parsed and precompressed ahead.
+
+        The stream is parsed in a thread. Where the repository stores texts
+        in groupcompress blocks, a pool of threads compresses each file text
+        into a block of its own, which RevisionStore inserts as it is.
+        """
+        commands = helpers.iter_in_thread(command_iter, _PIPELINE_QUEUE_SIZE)
+        if getattr(self.repo.texts, '_insert_compressed_blocks', None):
+            commands = helpers.iter_precompressed(
+                commands, _PIPELINE_QUEUE_SIZE)
+        return commands
+
     def post_process(self):
         # Commit the current write group and checkpoint the id map
         self.repo.commit_write_group()
@@ -28,6 +28,9 @@ from ... import (
 from ...bzr import (
     inventory,
     )
+from .helpers import (
+    PrecompressedText,
+    )
 
 
 class _TreeShim(object):
@@ -361,6 +364,30 @@ class RevisionStore(object):
                 return res
             builder._heads = thunked_heads
 
+        if getattr(self.repo.texts, '_insert_compressed_blocks', None):
+            orig_add_file_to_weave = builder._add_file_to_weave
+
+            def precompressed_add_file_to_weave(file_id, fileobj, parents,
+                                                nostore_sha):
+                # Insert the block compressed in pipeline mode as it is
+                try:
+                    text = text_provider(file_id)
+                except KeyError:
+                    text = None
+                if not isinstance(text, PrecompressedText):
+                    return orig_add_file_to_weave(file_id, fileobj, parents,
+                                                  nostore_sha)
+                if text.sha1 == nostore_sha:
+                    raise errors.ExistingContent()
+                key = (file_id, builder._new_revision_id)
+                parent_keys = tuple([(file_id, parent) for parent in parents])
+                block_bytes, start, end = text.block
+                self.repo.texts._insert_compressed_blocks(
+                    [(block_bytes, [(key, start, end)])], {key: parent_keys},
+                    random_id=builder.random_revid)
+                return text.sha1, len(text)
+            builder._add_file_to_weave = precompressed_add_file_to_weave
+
         if rev.parent_ids:
             basis_rev_id = rev.parent_ids[0]
         else:
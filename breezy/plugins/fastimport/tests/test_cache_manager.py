@@ -0,0 +1,176 @@
+# Copyright (C) 2019 Breezy Developers
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests of the cache_manager module."""
+
+from __future__ import absolute_import
+
+from .... import (
+    tests,
+    )
+from . import (
+    FastimportFeature,
+    )
+
+
+class TestBlobCache(tests.TestCase):
+
+    _test_needs_features = [FastimportFeature]
+
+    def make_cache(self, max_size, compress=False):
+        from ..cache_manager import BlobCache
+        cache = BlobCache(max_size, compress)
+        self.addCleanup(cache.close)
+        return cache
+
+    def test_in_memory(self):
+        cache = self.make_cache(100)
+        cache.add(b'a', b'aaa')
+        self.assertTrue(b'a' in cache)
+        self.assertEqual(b'aaa', cache.get(b'a'))
+        self.assertEqual(3, cache.memory_bytes())
+        self.assertEqual(0, cache.spill_count)
+        self.assertEqual(1, cache.memory_hits)
+        self.assertRaises(KeyError, cache.get, b'b')
+
+    def test_spill(self):
+        cache = self.make_cache(10)
+        cache.add(b'a', b'a' * 6)
+        cache.add(b'b', b'b' * 6)
+        self.assertEqual(6, cache.memory_bytes())
+        self.assertEqual(1, cache.spill_count)
+        self.assertEqual(b'a' * 6, cache.get(b'a'))
+        self.assertEqual(1, cache.spill_hits)
+        cache.add(b'c', b'c' * 6)
+        self.assertEqual(b'b' * 6, cache.get(b'b'))
+        self.assertEqual(b'c' * 6, cache.get(b'c'))
+        self.assertEqual(2, cache.spill_hits)
+        self.assertEqual(3, len(cache))
+
+    def test_lru(self):
+        cache = self.make_cache(10)
+        cache.add(b'a', b'aaaa')
+        cache.add(b'b', b'bbbb')
+        cache.get(b'a')
+        cache.add(b'c', b'cccc')
+        self.assertEqual([b'b'], list(cache._spilled))
+        self.assertEqual(b'aaaa', cache.get(b'a'))
+        self.assertEqual(b'cccc', cache.get(b'c'))
+        self.assertEqual(3, cache.memory_hits)
+        self.assertEqual(b'bbbb', cache.get(b'b'))
+        self.assertEqual(1, cache.spill_hits)
+
+    def test_larger_than_budget(self):
+        cache = self.make_cache(10)
+        cache.add(b'a', b'a' * 20)
+        self.assertEqual(0, cache.memory_bytes())
+        self.assertEqual(b'a' * 20, cache.get(b'a'))
+
+    def test_compress(self):
+        cache = self.make_cache(10, compress=True)
+        cache.add(b'a', b'a' * 1000)
+        self.assertTrue(cache.spill_bytes < 1000)
+        self.assertEqual(b'a' * 1000, cache.get(b'a'))
+
+    def test_precompressed_size(self):
+        from ..helpers import precompress_text
+        text = precompress_text(b'a' * 6)
+        cache = self.make_cache(100)
+        cache.add(b'a', text)
+        self.assertEqual(6 + len(text.block[0]), cache.memory_bytes())
+        cache.remove(b'a')
+        self.assertEqual(0, cache.memory_bytes())
+
+    def test_spill_precompressed(self):
+        from ..helpers import precompress_text
+        text = precompress_text(b'abc\n' * 100)
+        empty = precompress_text(b'')
+        cache = self.make_cache(0, compress=True)
+        cache.add(b'a', text)
+        cache.add(b'b', empty)
+        self.assertEqual(2, cache.spill_count)
+        for id, expected in [(b'a', text), (b'b', empty)]:
+            data = cache.get(id)
+            self.assertEqual(expected, data)
+            self.assertEqual(expected.sha1, data.sha1)
+            self.assertEqual(expected.block, data.block)
+
+    def test_shards(self):
+        cache = self.make_cache(0)
+        cache._shard_size = 10
+        cache.add(b'a', b'a' * 6)
+        cache.add(b'b', b'b' * 6)
+        cache.add(b'c', b'c' * 20)
+        self.assertEqual(3, len(cache._shards))
+        self.assertEqual(b'a' * 6, cache.get(b'a'))
+        self.assertEqual(b'b' * 6, cache.get(b'b'))
+        self.assertEqual(b'c' * 20, cache.get(b'c'))
+
+    def test_remove(self):
+        cache = self.make_cache(10)
+        cache.add(b'a', b'a' * 6)
+        cache.add(b'b', b'b' * 6)
+        cache.remove(b'a')
+        cache.remove(b'b')
+        cache.remove(b'c')
+        self.assertEqual(0, len(cache))
+        self.assertEqual(0, cache.memory_bytes())
+
+
+class TestCacheManager(tests.TestCase):
+
+    _test_needs_features = [FastimportFeature]
+
+    def make_cache_manager(self, **kwargs):
+        from ..cache_manager import CacheManager
+        cache_mgr = CacheManager(**kwargs)
+        self.addCleanup(cache_mgr._sticky_blobs.close)
+        return cache_mgr
+
+    def test_sticky_blobs_are_spilled(self):
+        cache_mgr = self.make_cache_manager(blob_cache_size=10)
+        cache_mgr.store_blob(b'a', b'a' * 6)
+        cache_mgr.store_blob(b'b', b'b' * 6)
+        self.assertEqual(b'a' * 6, cache_mgr.fetch_blob(b'a'))
+        # Without reference counts, blobs are kept
+        self.assertEqual(b'a' * 6, cache_mgr.fetch_blob(b'a'))
+
+    def test_reference_counts(self):
+        cache_mgr = self.make_cache_manager(blob_cache_size=10)
+        cache_mgr._blob_ref_counts = {b'a': 2, b'b': 2}
+        cache_mgr.store_blob(b'a', b'a' * 6)
+        cache_mgr.store_blob(b'b', b'b' * 6)
+        cache_mgr.store_blob(b'c', b'c' * 6)
+        self.assertEqual(b'c' * 6, cache_mgr.fetch_blob(b'c'))
+        self.assertRaises(KeyError, cache_mgr.fetch_blob, b'c')
+        cache_mgr.fetch_blob(b'a')
+        self.assertEqual(b'a' * 6, cache_mgr.fetch_blob(b'a'))
+        self.assertRaises(KeyError, cache_mgr.fetch_blob, b'a')
+
+    def test_dump_stats(self):
+        cache_mgr = self.make_cache_manager(blob_cache_size=10)
+        cache_mgr.store_blob(b'a', b'a' * 6)
+        cache_mgr.store_blob(b'b', b'b' * 6)
+        cache_mgr.fetch_blob(b'a')
+        cache_mgr.fetch_blob(b'b')
+        notes = []
+        cache_mgr.dump_stats(note=notes.append)
+        self.assertEqual(
+            ['Cache statistics:',
+             '    sticky blobs:      0.0 M in memory, 1 spilled (0.0 M)'
+             ' (2 items)',
+             '    blob fetches: 1 from memory, 1 from disk (50.0% spilled)',
+             '    revision-ids:      0.0 K (0 items)'],
+            notes)
@@ -195,6 +195,48 @@ class TestFastExport(ExternalBase):
         data2 = self.run_bzr("fast-export bl")[0]
         self.assertEquals(data1, data2)
 
+    def make_history(self):
+        tree = self.make_branch_and_tree("br")
+        self.build_tree_contents([('br/a', b'a1'), ('br/b', b'b1'),
+                                  ('br/dir/',), ('br/dir/c', b'c1')])
+        tree.add(['a', 'b', 'dir', 'dir/c'])
+        tree.commit('one')
+        self.build_tree_contents([('br/a', b'a2'), ('br/d', b'd1')])
+        tree.add(['d'])
+        tree.rename_one('b', 'dir/b')
+        tree.commit('two')
+        tree.remove(['a'], keep_files=False)
+        self.build_tree_contents([('br/dir/c', b'c2')])
+        tree.commit('three')
+        self.build_tree_contents([('br/d', b'd2')])
+        tree.commit('four')
+        return tree
+
+    def test_pipeline(self):
+        self.make_history()
+        expected = self.run_bzr("fast-export --no-plain br")[0]
+        self.assertEquals(
+            expected, self.run_bzr("fast-export --no-plain --pipeline br")[0])
+        # Several batches of revisions
+        from .. import exporter
+        self.overrideAttr(exporter, '_PIPELINE_BATCH_SIZE', 3)
+        self.assertEquals(
+            expected, self.run_bzr("fast-export --no-plain --pipeline br")[0])
+
+    def test_resume_from_marks(self):
+        self.make_history()
+        full = self.run_bzr("fast-export br")[0]
+        first = self.run_bzr("fast-export --marks=marks -r ..2 br")[0]
+        with open('marks', 'r') as f:
+            self.assertEqual(2, len(f.readlines()))
+        rest = self.run_bzr("fast-export --marks=marks br")[0]
+        self.assertTrue(rest.startswith('commit refs/heads/master\n'
+                                        'mark :3\n'), rest)
+        self.assertIn('from :2\n', rest)
+        self.assertEquals(full, first + rest)
+        with open('marks', 'r') as f:
+            self.assertEqual(4, len(f.readlines()))
+
 
 simple_fast_import_stream = b"""commit refs/heads/master
 mark :1
@@ -15,11 +15,16 @@
 
 from __future__ import absolute_import
 
+import threading
 import time
 
 from .... import (
+    osutils,
     tests,
     )
+from .. import (
+    helpers,
+    )
 from ..helpers import (
     kind_to_mode,
     )
@@ -2087,3 +2092,113 @@ class TestAddNonUtf8InBranch(TestCaseForGenericProcessor):
         rev_a = branch.last_revision()
         rtree_a = branch.repository.revision_tree(rev_a)
         self.assertEqual(rev_a, rtree_a.get_file_revision(u'foo\ufffd'))
+
+
+class TestPipelinedImport(TestCaseForGenericProcessor):
+
+    def get_handler(self, params=None):
+        from ..processors import (
+            generic_processor,
+            )
+        if params is None:
+            params = {}
+        params['pipeline'] = True
+        branch = self.make_branch('.', format=self.branch_format)
+        handler = generic_processor.GenericProcessor(branch.controldir,
+                                                     params=params)
+        return handler, branch
+
+    def command_list(self, count):
+        def command_list():
+            committer = [b'', b'elmer@a.com', time.time(), time.timezone]
+            for i in range(1, count + 1):
+                def files():
+                    yield commands.FileModifyCommand(
+                        b'a', kind_to_mode('file', False), None,
+                        b'content %d\n' % i)
+                if i > 1:
+                    from_ = b':%d' % (i - 1)
+                else:
+                    from_ = None
+                yield commands.CommitCommand(b'head', b'%d' % i, None,
+                                             committer, b'commit %d' % i,
+                                             from_, [], files)
+        return command_list
+
+    def test_import(self):
+        handler, branch = self.get_handler()
+        handler.process(self.command_list(3))
+        self.assertEqual(3, branch.revno())
+        revtree = branch.repository.revision_tree(branch.last_revision())
+        self.assertContent(branch, revtree, b'a', b'content 3\n')
+
+    def test_count(self):
+        handler, branch = self.get_handler({'count': 2})
+        handler.process(self.command_list(300))
+        self.assertEqual(2, branch.revno())
+
+    def test_parse_error(self):
+        handler, branch = self.get_handler()
+
+        def command_list():
+            for command in self.command_list(2)():
+                yield command
+            raise ValueError('bad command')
+        self.assertRaises(ValueError, handler.process, command_list)
+
+    def test_parsed_in_thread(self):
+        threads = set()
+
+        def command_list():
+            for command in self.command_list(2)():
+                threads.add(threading.current_thread())
+                yield command
+        handler, branch = self.get_handler()
+        handler.process(command_list)
+        self.assertEqual(2, branch.revno())
+        self.assertNotIn(threading.current_thread(), threads)
+
+    def test_texts_precompressed(self):
+        precompressed = []
+        orig_precompress_text = helpers.precompress_text
+
+        def precompress_text(data):
+            precompressed.append(data)
+            return orig_precompress_text(data)
+        self.overrideAttr(helpers, 'precompress_text', precompress_text)
+
+        def command_list():
+            committer = [b'', b'elmer@a.com', time.time(), time.timezone]
+
+            def files_one():
+                yield commands.FileModifyCommand(
+                    b'a', kind_to_mode('file', False), None, b'aaa\n')
+
+            def files_two():
+                yield commands.FileModifyCommand(
+                    b'a', kind_to_mode('file', False), None, b'aaa\n')
+                yield commands.FileModifyCommand(
+                    b'b', kind_to_mode('file', False), None, b'bbb\n')
+            yield commands.CommitCommand(b'head', b'1', None,
+                                         committer, b'commit 1', None, [],
+                                         files_one)
+            yield commands.CommitCommand(b'head', b'2', None,
+                                         committer, b'commit 2', b':1', [],
+                                         files_two)
+        handler, branch = self.get_handler()
+        handler.process(command_list)
+        if self.branch_format == '2a':
+            self.assertEqual([b'aaa\n', b'aaa\n', b'bbb\n'],
+                             sorted(precompressed))
+        else:
+            self.assertEqual([], precompressed)
+        rev_1, rev_2 = branch.get_rev_id(1), branch.get_rev_id(2)
+        revtree = branch.repository.revision_tree(rev_2)
+        self.assertContent(branch, revtree, b'a', b'aaa\n')
+        self.assertContent(branch, revtree, b'b', b'bbb\n')
+        with branch.lock_read():
+            self.assertEqual(osutils.sha_string(b'aaa\n'),
+                             revtree.get_file_sha1(u'a'))
+            self.assertEqual(osutils.sha_string(b'bbb\n'),
+                             revtree.get_file_sha1(u'b'))
+            branch.repository.check([rev_1, rev_2])
@@ -26,6 +26,7 @@ from ... import (
     osutils,
     )
 lazy_import.lazy_import(globals(), """
+import copy
 import stat
 
 from breezy import (
@@ -173,16 +174,22 @@ class BzrUploader(object):
                     dir = os.path.dirname(dir)
         return ignored
 
+    def _file_mode(self, relpath):
+        if self.tree.is_executable(relpath):
+            return 0o775
+        else:
+            return 0o664
+
     def upload_file(self, old_relpath, new_relpath, mode=None):
         if mode is None:
-            if self.tree.is_executable(new_relpath):
-                mode = 0o775
-            else:
-                mode = 0o664
+            mode = self._file_mode(new_relpath)
+        self._upload_text(old_relpath, self.tree.get_file_text(new_relpath),
+                          mode)
+
+    def _upload_text(self, relpath, text, mode):
         if not self.quiet:
-            self.outf.write('Uploading %s\n' % old_relpath)
-        self._up_put_bytes(
-            old_relpath, self.tree.get_file_text(new_relpath), mode)
+            self.outf.write('Uploading %s\n' % relpath)
+        self._up_put_bytes(relpath, text, mode)
 
     def _force_clear(self, relpath):
         try:
@@ -210,6 +217,29 @@ class BzrUploader(object):
         self._force_clear(relpath)
         self.upload_file(relpath, relpath, mode)
 
+    def upload_files_robustly(self, relpaths):
+        """Upload files, clearing the way on the remote side.
+
+        The files are uploaded concurrently when the transport allows it, see
+        transport.TransportWorkers. They are read from the tree by the calling
+        thread.
+        """
+        def read_files():
+            for relpath in relpaths:
+                yield (relpath, self.tree.get_file_text(relpath),
+                       self._file_mode(relpath))
+
+        def upload(to_transport, item):
+            relpath, text, mode = item
+            uploader = copy.copy(self)
+            uploader.to_transport = to_transport
+            uploader._force_clear(relpath)
+            uploader._upload_text(relpath, text, mode)
+
+        with transport.TransportWorkers([self.to_transport]) as workers:
+            for result in workers.map(upload, read_files()):
+                pass
+
     def upload_symlink(self, relpath, target):
         self.to_transport.symlink(target, relpath)
 
@@ -314,33 +344,43 @@ class BzrUploader(object):
         self.to_transport.ensure_base()  # XXX: Handle errors (add
         # --create-prefix option ?)
         with self.tree.lock_read():
-            for relpath, ie in self.tree.iter_entries_by_dir():
-                if relpath in ('', '.bzrignore', '.bzrignore-upload'):
-                    # skip root ('')
-                    # .bzrignore and .bzrignore-upload have no meaning outside
-                    # a working tree so do not upload them
-                    continue
-                if self.is_ignored(relpath):
-                    if not self.quiet:
-                        self.outf.write('Ignoring %s\n' % relpath)
-                    continue
-                if ie.kind == 'file':
-                    self.upload_file_robustly(relpath)
-                elif ie.kind == 'symlink':
-                    try:
-                        self.upload_symlink_robustly(
-                            relpath, ie.symlink_target)
-                    except errors.TransportNotPossible:
-                        if not self.quiet:
-                            target = self.tree.path_content_summary(relpath)[3]
-                            self.outf.write('Not uploading symlink %s -> %s\n'
-                                            % (relpath, target))
-                elif ie.kind == 'directory':
-                    self.make_remote_dir_robustly(relpath)
-                else:
-                    raise NotImplementedError
+            # The directories are created before the files they contain are
+            # handed to the workers
+            self.upload_files_robustly(self._upload_full_tree_but_files())
             self.set_uploaded_revid(self.rev_id)
 
+    def _upload_full_tree_but_files(self):
+        """Upload the directories and symlinks of the tree.
+
+        :return: An iterator over the files to upload, the others being
+            uploaded as the iteration proceeds.
+        """
+        for relpath, ie in self.tree.iter_entries_by_dir():
+            if relpath in ('', '.bzrignore', '.bzrignore-upload'):
+                # skip root ('')
+                # .bzrignore and .bzrignore-upload have no meaning outside
+                # a working tree so do not upload them
+                continue
+            if self.is_ignored(relpath):
+                if not self.quiet:
+                    self.outf.write('Ignoring %s\n' % relpath)
+                continue
+            if ie.kind == 'file':
+                yield relpath
+            elif ie.kind == 'symlink':
+                try:
+                    self.upload_symlink_robustly(
+                        relpath, ie.symlink_target)
+                except errors.TransportNotPossible:
+                    if not self.quiet:
+                        target = self.tree.path_content_summary(relpath)[3]
+                        self.outf.write('Not uploading symlink %s -> %s\n'
+                                        % (relpath, target))
+            elif ie.kind == 'directory':
+                self.make_remote_dir_robustly(relpath)
+            else:
+                raise NotImplementedError
+
     def upload_tree(self):
         # If we can't find the revid file on the remote location, upload the
         # full tree instead
@@ -622,6 +622,23 @@ class TestFullUpload(tests.TestCaseWithTransport, TestUploadMixin):
         self.assertUpFileEqual(b'baz', 'dir/goodbye')
         self.assertUpPathModeEqual('dir', 0o775)
 
+    def test_full_upload_concurrently(self):
+        config.GlobalStack().set('transport.copy_workers', '3')
+        self.make_branch_and_working_tree()
+        self.add_dir('dir')
+        self.add_dir('dir/sub')
+        paths = ['hello', 'dir/a', 'dir/b', 'dir/sub/c', 'dir/sub/d']
+        for path in paths:
+            self.add_file(path, path.encode('ascii'))
+        self.add_file('dir/to-be-cleared', b'foo')
+        os.makedirs(osutils.pathjoin(self.upload_dir, 'dir/to-be-cleared'))
+
+        self.do_full_upload()
+
+        for path in paths:
+            self.assertUpFileEqual(path.encode('ascii'), path)
+        self.assertUpFileEqual(b'foo', 'dir/to-be-cleared')
+
 
 class TestIncrementalUpload(tests.TestCaseWithTransport, TestUploadMixin):
 
@@ -4059,6 +4059,7 @@ def _test_suite_testmod_names():
         'breezy.tests.test_bad_files',
         'breezy.tests.test_bisect',
         'breezy.tests.test_bisect_multi',
+        'breezy.tests.test_bloom',
         'breezy.tests.test_branch',
         'breezy.tests.test_branchbuilder',
         'breezy.tests.test_btree_index',
@@ -4102,6 +4103,7 @@ def _test_suite_testmod_names():
         'breezy.tests.test_filters',
         'breezy.tests.test_filter_tree',
         'breezy.tests.test_foreign',
+        'breezy.tests.test_fsmonitor',
         'breezy.tests.test_generate_docs',
         'breezy.tests.test_generate_ids',
         'breezy.tests.test_globbing',
@@ -4168,6 +4170,7 @@ def _test_suite_testmod_names():
         'breezy.tests.test_revision',
         'breezy.tests.test_revisionspec',
         'breezy.tests.test_revisiontree',
+        'breezy.tests.test_revno_cache',
         'breezy.tests.test_rio',
         'breezy.tests.test_rules',
         'breezy.tests.test_url_policy_open',
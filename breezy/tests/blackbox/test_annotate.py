@@ -119,6 +119,28 @@ class TestAnnotate(tests.TestCaseWithTransport):
         self.assertEqual('', err)
         self.assertEqualDiff('''\
 2   no mail | nomail
+''', out)
+
+    def split_files(self, out):
+        files = {}
+        for section in out.split('=== ')[1:]:
+            path, annotation = section.split('\n', 1)
+            files[path] = annotation
+        return files
+
+    def test_annotate_cmd_all_files(self):
+        out, err = self.run_bzr('annotate --all-files .')
+        self.assertEqual('', err)
+        self.assertEqual({'hello.txt': self.run_bzr('annotate hello.txt')[0],
+                          'nomail.txt': self.run_bzr('annotate nomail.txt')[0]},
+                         self.split_files(out))
+
+    def test_annotate_cmd_all_files_revision(self):
+        out, err = self.run_bzr('annotate --all-files . -r1')
+        self.assertEqual('', err)
+        self.assertEqualDiff('''\
+=== hello.txt
+1   test@us | my helicopter
 ''', out)
 
     def test_annotate_cmd_revision(self):
@@ -84,6 +84,24 @@ class TestPack(tests.TestCaseWithTransport):
         pack_names = t.list_dir('repository/obsolete_packs')
         self.assertTrue(len(pack_names) == 0)
 
+    def test_pack_jobs(self):
+        wt = self.make_branch_and_tree('.')
+        self._make_versioned_file('file0.txt')
+        for i in range(5):
+            self._update_file('file0.txt', 'HELLO %d\n' % i)
+        out, err = self.run_bzr(['pack', '--jobs', '2'])
+        self.assertEqual('', out)
+        repo = wt.branch.repository
+        repo.lock_read()
+        self.addCleanup(repo.unlock)
+        self.assertLength(1, repo._pack_collection.names())
+        self.assertLength(7, repo.texts.keys())
+
+    def test_pack_jobs_invalid(self):
+        self.make_branch('.')
+        out, err = self.run_bzr(['pack', '--jobs', '0'], retcode=3)
+        self.assertContainsRe(err, '--jobs must be at least 1')
+
 
 class TestSmartServerPack(tests.TestCaseWithTransport):
 
@@ -295,6 +295,22 @@ class TestBzrServe(TestBzrServeBase):
             err)
         self.assertServerFinishesCleanly(process)
 
+    def test_bzr_serve_worker_pool(self):
+        gs = config.GlobalStack()
+        gs.set('serve.max_workers', 2)
+        gs.set('serve.client_timeout', 0.2)
+        gs.store.save()
+        self.make_branch('.')
+        process, url = self.start_server_port()
+        branch = Branch.open(url)
+        self.make_read_requests(branch)
+        # Idle connections are still disconnected by the worker pool.
+        err = process.stderr.readline()
+        self.assertEqual(
+            b'Connection Timeout: disconnecting client after 0.2 seconds\n',
+            err)
+        self.assertServerFinishesCleanly(process)
+
     def test_bzr_serve_supports_client_timeout(self):
         process, url = self.start_server_port(['--client-timeout=0.1'])
         self.build_tree_contents([('a_file', b'contents\n')])
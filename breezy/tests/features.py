@@ -400,6 +400,7 @@ lzma = ModuleAvailableFeature('lzma')
 meliae = ModuleAvailableFeature('meliae.scanner')
 paramiko = ModuleAvailableFeature('paramiko')
 pywintypes = ModuleAvailableFeature('pywintypes')
+selectors = ModuleAvailableFeature('selectors')
 subunit = ModuleAvailableFeature('subunit')
 testtools = ModuleAvailableFeature('testtools')
 flake8 = ModuleAvailableFeature('flake8.api.legacy')
@@ -36,6 +36,7 @@ from .. import (
     osutils,
     urlutils,
 )
+from ..transport.http import _urllib2_wrappers
 from . import test_server
 
 
@@ -485,6 +486,11 @@ class HttpServer(test_server.TestingTCPServerInAThread):
         self._http_base_url = '%s://%s:%s/' % (
             self._url_protocol, self.host, self.port)
 
+    def stop_server(self):
+        # The connections kept alive to this server are useless now
+        _urllib2_wrappers.connection_pool.clear()
+        super(HttpServer, self).stop_server()
+
     def get_url(self):
         """See breezy.transport.Server.get_url."""
         return self._get_remote_url(self._home_dir)
@@ -55,3 +55,19 @@ class TestAnnotate(TestCaseWithTree):
         self.addCleanup(tree.unlock)
         self.assertEqual([(revids[1], b'second\n'), (revids[0], b'content\n')],
                          list(tree.annotate_iter('one')))
+
+    def test_iter_annotations(self):
+        tree = self.make_branch_and_tree('tree')
+        self.build_tree_contents([('tree/one', b'first\ncontent\n'),
+                                  ('tree/two', b'other\n')])
+        tree.add(['one', 'two'])
+        rev_1 = tree.commit('one')
+        self.build_tree_contents([('tree/one', b'second\ncontent\n')])
+        rev_2 = tree.commit('two')
+        tree = self._convert_tree(tree)
+        tree.lock_read()
+        self.addCleanup(tree.unlock)
+        self.assertEqual(
+            {'one': [(rev_2, b'second\n'), (rev_1, b'content\n')],
+             'two': [(rev_1, b'other\n')]},
+            dict(tree.iter_annotations(['one', 'two'])))
@@ -48,6 +48,24 @@ class TestAnnotateIter(TestCaseWithWorkingTree):
                           (b'current:', b'new content\n'),
                           ], annotations)
 
+    def test_iter_annotations(self):
+        builder = self.make_branch_builder('branch')
+        revid = builder.build_snapshot(None, [
+            ('add', ('', None, 'directory', None)),
+            ('add', ('file', None, 'file', b'initial content\n')),
+            ('add', ('other', None, 'file', b'other content\n')),
+            ])
+        tree = builder.get_branch().create_checkout('tree', lightweight=True)
+        tree.lock_read()
+        self.addCleanup(tree.unlock)
+        self.build_tree_contents([('tree/file',
+                                   b'initial content\nnew content\n')])
+        self.assertEqual(
+            {'file': [(revid, b'initial content\n'),
+                      (b'current:', b'new content\n')],
+             'other': [(revid, b'other content\n')]},
+            dict(tree.iter_annotations(['file', 'other'])))
+
     def test_annotate_merge_parents(self):
         builder = self.make_branch_builder('branch')
         builder.start_series()
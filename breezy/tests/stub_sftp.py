@@ -73,6 +73,7 @@ class StubSFTPHandle(paramiko.SFTPHandle):
             paramiko.SFTPServer.set_file_attr(self.filename, attr)
         except OSError as e:
             return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
 
 
 class StubSFTPServer(paramiko.SFTPServerInterface):
@@ -359,6 +360,7 @@ class SocketDelay(object):
 class TestingSFTPConnectionHandler(socketserver.BaseRequestHandler):
 
     def setup(self):
+        ssh._set_nodelay(self.request)
         self.wrap_for_latency()
         tcs = self.server.test_case_server
         ptrans = paramiko.Transport(self.request)
@@ -392,6 +394,7 @@ class TestingSFTPConnectionHandler(socketserver.BaseRequestHandler):
 class TestingSFTPWithoutSSHConnectionHandler(TestingSFTPConnectionHandler):
 
     def setup(self):
+        ssh._set_nodelay(self.request)
         self.wrap_for_latency()
         # Re-import these as locals, so that they're still accessible during
         # interpreter shutdown (when all module globals get set to None, leading
@@ -373,3 +373,60 @@ class TestAnnotator(tests.TestCaseWithMemoryTransport):
         self.assertAnnotateEqual([(self.fb_key,),
                                   (self.fb_key,),
                                   ], self.fb_key)
+
+    def make_two_file_texts(self):
+        self.make_merge_text()
+        self.ga_key = (b'g-id', b'a-id')
+        self.gb_key = (b'g-id', b'b-id')
+        self.vf.add_lines(self.ga_key, [], [b'other\n', b'file\n'])
+        self.vf.add_lines(self.gb_key, [self.ga_key],
+                          [b'other\n', b'changed file\n'])
+
+    def test_iter_annotate_flat(self):
+        self.make_two_file_texts()
+        keys = [self.fd_key, self.gb_key, self.fb_key]
+        expected = {}
+        for key in keys:
+            expected[key] = self.module.Annotator(self.vf).annotate_flat(key)
+        self.assertEqual(expected, dict(self.ann.iter_annotate_flat(keys)))
+
+    def test_iter_annotate_flat_streams_once(self):
+        self.make_two_file_texts()
+        calls = []
+        get_record_stream = self.vf.get_record_stream
+
+        def counting_get_record_stream(keys, ordering, include_delta_closure):
+            calls.append(sorted(keys))
+            return get_record_stream(keys, ordering, include_delta_closure)
+        self.vf.get_record_stream = counting_get_record_stream
+        list(self.ann.iter_annotate_flat([self.fd_key, self.gb_key]))
+        self.assertEqual([[self.fa_key, self.fb_key, self.fc_key, self.fd_key,
+                           self.ga_key, self.gb_key]], calls)
+
+    def test_iter_annotate_flat_releases_texts(self):
+        self.make_two_file_texts()
+        results = self.ann.iter_annotate_flat([self.fd_key, self.gb_key])
+        key, annotations = next(results)
+        # Only what is needed for the other key is kept
+        self.assertTrue(len(self.ann._text_cache) < 6)
+        list(results)
+        self.assertEqual({}, self.ann._text_cache)
+        self.assertEqual({}, self.ann._annotations_cache)
+
+    def test_iter_annotate_flat_special_text(self):
+        self.make_two_file_texts()
+        spec_key = (b'f-id', revision.CURRENT_REVISION)
+        self.ann.add_special_text(spec_key, [self.fd_key],
+                                  b'simple\nlocally modified\n')
+        self.assertEqual(
+            {spec_key: [(self.fa_key, b'simple\n'),
+                        (spec_key, b'locally modified\n')],
+             self.ga_key: [(self.ga_key, b'other\n'),
+                           (self.ga_key, b'file\n')]},
+            dict(self.ann.iter_annotate_flat([spec_key, self.ga_key])))
+
+    def test_iter_annotate_flat_missing(self):
+        self.make_simple_text()
+        self.assertRaises(errors.RevisionNotPresent, list,
+                          self.ann.iter_annotate_flat(
+                              [self.fa_key, (b'not', b'present')]))
@@ -0,0 +1,76 @@
+# Copyright (C) 2019 Breezy Developers
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Tests for the Bloom filters of index keys."""
+
+from ..bzr import bloom
+from . import TestCase
+
+
+class TestBloomFilter(TestCase):
+
+    def make_filter(self, count):
+        bloom_filter = bloom.BloomFilter.for_key_count(count)
+        for i in range(count):
+            bloom_filter.add((b'file-id', b'rev-%d' % i))
+        return bloom_filter
+
+    def test_empty(self):
+        bloom_filter = bloom.BloomFilter.for_key_count(0)
+        self.assertFalse((b'key',) in bloom_filter)
+
+    def test_added_keys_present(self):
+        bloom_filter = self.make_filter(1000)
+        for i in range(1000):
+            self.assertTrue((b'file-id', b'rev-%d' % i) in bloom_filter)
+
+    def test_false_positive_rate(self):
+        bloom_filter = self.make_filter(1000)
+        false_positives = sum(
+            1 for i in range(1000)
+            if (b'file-id', b'other-%d' % i) in bloom_filter)
+        self.assertTrue(false_positives < 50, false_positives)
+
+    def test_key_elements_are_separated(self):
+        bloom_filter = bloom.BloomFilter.for_key_count(1)
+        bloom_filter.add((b'a', b'bc'))
+        self.assertTrue((b'a', b'bc') in bloom_filter)
+        self.assertFalse((b'ab', b'c') in bloom_filter)
+
+    def test_roundtrip(self):
+        bloom_filter = self.make_filter(100)
+        data = bloom_filter.to_bytes()
+        self.assertStartsWith(data, b'Bloom Filter 1\nbits=1000\nhashes=7\n')
+        loaded = bloom.BloomFilter.from_bytes(data)
+        self.assertEqual(1000, loaded.num_bits)
+        self.assertEqual(7, loaded.num_hashes)
+        for i in range(100):
+            self.assertTrue((b'file-id', b'rev-%d' % i) in loaded)
+        self.assertEqual(data, loaded.to_bytes())
+
+    def test_from_bytes_bad_signature(self):
+        self.assertRaises(bloom.BadBloomFilter,
+                          bloom.BloomFilter.from_bytes, b'garbage')
+
+    def test_from_bytes_bad_options(self):
+        self.assertRaises(bloom.BadBloomFilter,
+                          bloom.BloomFilter.from_bytes,
+                          b'Bloom Filter 1\nbits=x\nhashes=7\n')
+
+    def test_from_bytes_truncated(self):
+        data = self.make_filter(100).to_bytes()
+        self.assertRaises(bloom.BadBloomFilter,
+                          bloom.BloomFilter.from_bytes, data[:-1])
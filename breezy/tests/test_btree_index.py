@@ -18,6 +18,7 @@
 """Tests for btree indices."""
 
 import pprint
+import sys
 import zlib
 
 from .. import (
@@ -1206,6 +1207,130 @@ class TestBTreeIndex(BTreeTestCase):
         self.assertEqual(500, len(entries))
 
 
+class TestMmapPageSource(BTreeTestCase):
+
+    def setUp(self):
+        super(TestMmapPageSource, self).setUp()
+        self.overrideAttr(btree_index, '_page_cache',
+                          lru_cache.LRUSizeCache(btree_index._PAGE_CACHE_SIZE))
+
+    def make_index(self, t, nodes):
+        builder = btree_index.BTreeBuilder(reference_lists=2, key_elements=2)
+        for node in nodes:
+            builder.add_node(*node)
+        size = t.put_file('index', builder.finish())
+        return size
+
+    def test_local_index_is_mapped(self):
+        if not btree_index._use_mmap or sys.platform == 'win32':
+            raise tests.TestNotApplicable('indices are not mapped')
+        nodes = self.make_nodes(160, 2, 2)
+        t = self.get_transport('')
+        size = self.make_index(t, nodes)
+        index = btree_index.BTreeGraphIndex(t, 'index', size)
+        self.assertEqual(sorted((index,) + node for node in nodes),
+                         sorted(index.iter_all_entries()))
+        self.assertIsInstance(index._page_source,
+                              btree_index._MmapPageSource)
+
+    def test_pages_shared_between_indices(self):
+        if not btree_index._use_mmap or sys.platform == 'win32':
+            raise tests.TestNotApplicable('indices are not mapped')
+        nodes = self.make_nodes(160, 2, 2)
+        t = self.get_transport('')
+        size = self.make_index(t, nodes)
+        index = btree_index.BTreeGraphIndex(t, 'index', size)
+        entries = sorted(index.iter_all_entries())
+        cached = set(btree_index._page_cache.keys())
+        self.assertEqual(index._row_offsets[-1], len(cached))
+        other = btree_index.BTreeGraphIndex(t, 'index', size)
+        self.assertEqual([e[1:] for e in entries],
+                         sorted(e[1:] for e in other.iter_all_entries()))
+        self.assertEqual(cached, set(btree_index._page_cache.keys()))
+
+    def test_traced_transport_not_mapped(self):
+        nodes = self.make_nodes(160, 2, 2)
+        t = transport.get_transport_from_url('trace+' + self.get_url(''))
+        size = self.make_index(t, nodes)
+        index = btree_index.BTreeGraphIndex(t, 'index', size)
+        del t._activity[:]
+        self.assertEqual(len(nodes), len(list(index.iter_all_entries())))
+        self.assertEqual(None, index._get_page_source())
+        self.assertEqual('readv', t._activity[0][0])
+        self.assertEqual([], list(btree_index._page_cache.keys()))
+
+    def test_mmap_disabled(self):
+        self.overrideAttr(btree_index, '_use_mmap', False)
+        nodes = self.make_nodes(160, 2, 2)
+        t = self.get_transport('')
+        size = self.make_index(t, nodes)
+        index = btree_index.BTreeGraphIndex(t, 'index', size)
+        self.assertEqual(len(nodes), len(list(index.iter_all_entries())))
+        self.assertEqual(None, index._get_page_source())
+
+
+class TestBloomFilter(BTreeTestCase):
+
+    def make_index(self, nodes, spill_at=100000):
+        builder = btree_index.BTreeBuilder(reference_lists=1, key_elements=1,
+                                           spill_at=spill_at)
+        builder.add_bloom_filter()
+        for node in nodes:
+            builder.add_node(*node)
+        t = transport.get_transport_from_url('trace+' + self.get_url(''))
+        size = t.put_file('index', builder.finish())
+        t.put_bytes('index.bloom', builder.bloom_filter.to_bytes())
+        index = btree_index.BTreeGraphIndex(t, 'index', size)
+        index._bloom_name = 'index.bloom'
+        return builder, index
+
+    def test_builder_without_filter(self):
+        builder = btree_index.BTreeBuilder()
+        builder.add_node((b'key',), b'value')
+        builder.finish()
+        self.assertIs(None, builder.bloom_filter)
+
+    def test_builder_filter(self):
+        nodes = self.make_nodes(100, 1, 1)
+        builder, index = self.make_index(nodes, spill_at=10)
+        for node in nodes:
+            self.assertTrue(node[0] in builder.bloom_filter)
+
+    def test_missing_keys_read_no_pages(self):
+        nodes = self.make_nodes(1000, 1, 1)
+        builder, index = self.make_index(nodes)
+        del index._transport._activity[:]
+        self.assertEqual([], list(index.iter_entries([(b'missing',)])))
+        self.assertEqual(['get'], [a[0] for a in index._transport._activity])
+        self.assertEqual([(index,) + nodes[0]],
+                         list(index.iter_entries([nodes[0][0]])))
+
+    def test_find_ancestors(self):
+        nodes = self.make_nodes(100, 1, 1)
+        builder, index = self.make_index(nodes)
+        parent_map = {}
+        missing_keys = set()
+        search_keys = index._find_ancestors(
+            [nodes[1][0], (b'missing',)], 0, parent_map, missing_keys)
+        self.assertEqual({(b'missing',)}, missing_keys)
+        self.assertEqual({nodes[1][0]: nodes[1][2][0]}, parent_map)
+        self.assertEqual(set(nodes[1][2][0]), search_keys)
+
+    def test_filter_not_present(self):
+        nodes = self.make_nodes(10, 1, 1)
+        builder, index = self.make_index(nodes)
+        index._transport.delete('index.bloom')
+        self.assertIs(None, index._get_bloom_filter())
+        self.assertEqual([(index,) + nodes[0]],
+                         list(index.iter_entries([nodes[0][0]])))
+
+    def test_bad_filter_ignored(self):
+        nodes = self.make_nodes(10, 1, 1)
+        builder, index = self.make_index(nodes)
+        index._transport.put_bytes('index.bloom', b'garbage')
+        self.assertIs(None, index._get_bloom_filter())
+
+
 class TestBTreeNodes(BTreeTestCase):
 
     scenarios = btreeparser_scenarios()
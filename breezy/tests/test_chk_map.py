@@ -982,6 +982,30 @@ class TestMap(TestCaseWithStore):
         self.assertIsInstance(chkmap._root_node._items[b'aab'], LeafNode)
         self.assertIsInstance(chkmap._root_node._items[b'aac'], LeafNode)
 
+    def test_page_read_counts(self):
+        store = self.get_chk_bytes()
+        chkmap = CHKMap(store, None)
+        # Should fit 2 keys per LeafNode
+        chkmap._root_node.set_maximum_size(30)
+        chkmap.map((b'aaa',), b'val')
+        chkmap.map((b'aab',), b'val')
+        chkmap.map((b'aac',), b'val')
+        root_key = chkmap._save()
+        chk_map.clear_cache()
+        chk_map.reset_page_read_counts()
+        self.assertEqual((0, 0), chk_map.get_page_read_counts())
+        chkmap = CHKMap(store, root_key)
+        self.assertEqual({(b'aab',): b'val'},
+                         self.to_dict(chkmap, [(b'aab',)]))
+        # The root and the leaf holding 'aab' are read from the store
+        self.assertEqual((2, 0), chk_map.get_page_read_counts())
+        chkmap = CHKMap(store, root_key)
+        self.assertEqual(3, len(self.to_dict(chkmap)))
+        # Now the root and 'aab' come from the page cache
+        self.assertEqual((4, 2), chk_map.get_page_read_counts())
+        chk_map.reset_page_read_counts()
+        self.assertEqual((0, 0), chk_map.get_page_read_counts())
+
     def test_unmap_uses_existing_items(self):
         store = self.get_chk_bytes()
         chkmap = CHKMap(store, None)
@@ -1225,14 +1249,12 @@ class TestMap(TestCaseWithStore):
         ptr2 = nodes[1]
         self.assertEqual(b'k1', ptr1[0])
         self.assertEqual(b'k2', ptr2[0])
-        node1 = chk_map._deserialise(
-            chkmap._read_bytes(ptr1[1]), ptr1[1], None)
+        node1 = chkmap._read_node(ptr1[1])
         self.assertIsInstance(node1, LeafNode)
         self.assertEqual(1, len(node1))
         self.assertEqual({(b'k1' * 50,): b'v1'},
                          self.to_dict(node1, chkmap._store))
-        node2 = chk_map._deserialise(
-            chkmap._read_bytes(ptr2[1]), ptr2[1], None)
+        node2 = chkmap._read_node(ptr2[1])
         self.assertIsInstance(node2, LeafNode)
         self.assertEqual(1, len(node2))
         self.assertEqual({(b'k2' * 50,): b'v2'},
@@ -1477,6 +1499,101 @@ class TestMapSearchKeys(TestCaseWithStore):
                              "      ('3',) 'baz'\n", chkmap._dump_tree())
 
 
+class TestPageCache(TestCaseWithStore):
+
+    def make_page(self):
+        chkmap = self._get_map({(b'aaa',): b'foo', (b'aab',): b'bar'})
+        key = chkmap.key()
+        return key, self.read_bytes(chkmap._store, key)
+
+    def test_bytes(self):
+        key, page_bytes = self.make_page()
+        page_cache = chk_map._PageCache()
+        self.assertRaises(KeyError, page_cache.__getitem__, key)
+        page_cache[key] = page_bytes
+        self.assertEqual(page_bytes, page_cache[key])
+        stats = page_cache.stats()
+        self.assertEqual((1, 1, 0, len(page_bytes)),
+                         (stats['hits'], stats['misses'], stats['evictions'],
+                          stats['size']))
+
+    def test_get_node_deserialises_bytes(self):
+        key, page_bytes = self.make_page()
+        page_cache = chk_map._PageCache()
+        self.assertRaises(KeyError, page_cache.get_node, key)
+        page_cache[key] = page_bytes
+        node = page_cache.get_node(key)
+        self.assertIsInstance(node, LeafNode)
+        self.assertEqual({(b'aaa',): b'foo', (b'aab',): b'bar'},
+                         node._items)
+        # The node is now cached too
+        self.assertEqual(4 * len(page_bytes), page_cache.stats()['size'])
+
+    def test_get_node_returns_copies(self):
+        key, page_bytes = self.make_page()
+        page_cache = chk_map._PageCache()
+        node = chk_map._deserialise(page_bytes, key, None)
+        page_cache.add_node(key, page_bytes, node)
+        node.map(None, (b'aac',), b'baz')
+        node1 = page_cache.get_node(key)
+        node2 = page_cache.get_node(key)
+        self.assertIsNot(node1, node2)
+        self.assertEqual({(b'aaa',): b'foo', (b'aab',): b'bar'},
+                         node1._items)
+        node1.map(None, (b'aac',), b'baz')
+        self.assertEqual({(b'aaa',): b'foo', (b'aab',): b'bar'},
+                         node2._items)
+        self.assertEqual(key, node2.key())
+
+    def test_get_node_with_other_search_key_func(self):
+        key, page_bytes = self.make_page()
+        page_cache = chk_map._PageCache()
+        page_cache.add_node(
+            key, page_bytes, chk_map._deserialise(page_bytes, key, None))
+        node = page_cache.get_node(key, chk_map._search_key_16)
+        self.assertIs(chk_map._search_key_16, node._search_key_func)
+
+    def test_evictions(self):
+        page_cache = chk_map._PageCache(max_size=1000, num_shards=1)
+        for i in range(20):
+            page_cache[StaticTuple(b'sha1:%d' % i,)] = b'x' * 100
+        stats = page_cache.stats()
+        self.assertTrue(stats['evictions'] > 10, stats)
+        self.assertTrue(stats['size'] <= 1000, stats)
+        self.assertEqual(page_cache[StaticTuple(b'sha1:19',)], b'x' * 100)
+
+    def test_report(self):
+        page_cache = chk_map._PageCache(max_size=1000)
+        page_cache[StaticTuple(b'sha1:1',)] = b'x' * 10
+        page_cache[StaticTuple(b'sha1:1',)]
+        page_cache.report()
+        self.assertContainsRe(
+            self.get_log(), 'CHK page cache: 1 hits, 0 misses, 0 evictions, '
+            '10 of 1000 bytes used')
+
+    def test_difference_reads_old_pages_from_cache(self):
+        store = self.get_chk_bytes()
+        old_map = CHKMap(store, None)
+        old_map._root_node.set_maximum_size(30)
+        old_map.map((b'aaa',), b'val')
+        old_map.map((b'bbb',), b'val')
+        old_key = old_map._save()
+        old_map.map((b'ccc',), b'val')
+        new_key = old_map._save()
+        chk_map.clear_cache()
+        chk_map.reset_page_read_counts()
+        list(chk_map.CHKMapDifference(
+            store, [new_key], [old_key], chk_map._search_key_plain).process())
+        from_store, from_cache = chk_map.get_page_read_counts()
+        self.assertEqual(0, from_cache)
+        chk_map.reset_page_read_counts()
+        list(chk_map.CHKMapDifference(
+            store, [new_key], [old_key], chk_map._search_key_plain).process())
+        # The old pages come from the cache the second time round, only the
+        # new ones are read so that their records can be returned.
+        self.assertEqual((from_store - 1, 1), chk_map.get_page_read_counts())
+
+
 class TestLeafNode(TestCaseWithStore):
 
     def test_current_size_empty(self):
@@ -874,9 +874,30 @@ class TestPatienceDiffLib(tests.TestCase):
         super(TestPatienceDiffLib, self).setUp()
         self._unique_lcs = _patiencediff_py.unique_lcs_py
         self._recurse_matches = _patiencediff_py.recurse_matches_py
+        self._intern_lines = _patiencediff_py.intern_lines_py
         self._PatienceSequenceMatcher = \
             _patiencediff_py.PatienceSequenceMatcher_py
 
+    def test_intern_lines(self):
+        ids = {}
+        self.assertEqual([0, 1, 0, 2],
+                         self._intern_lines([b'a', b'b', b'a', b'c'], ids))
+        self.assertEqual({b'a': 0, b'b': 1, b'c': 2}, ids)
+        self.assertEqual([2, 3], self._intern_lines((b'c', b'd'), ids))
+        self.assertEqual([], self._intern_lines([], ids))
+        self.assertRaises(TypeError, self._intern_lines, [[]], ids)
+
+    def test_matching_blocks_of_interned_lines(self):
+        a = [b'a\n', b'b\n', b'c\n', b'b\n', b'd\n', b'e\n']
+        b = [b'b\n', b'c\n', b'x\n', b'd\n', b'b\n', b'e\n']
+        ids = {}
+        a_ids = self._intern_lines(a, ids)
+        b_ids = self._intern_lines(b, ids)
+        self.assertEqual(
+            self._PatienceSequenceMatcher(None, a, b).get_matching_blocks(),
+            self._PatienceSequenceMatcher(
+                None, a_ids, b_ids).get_matching_blocks())
+
     def test_diff_unicode_string(self):
         a = ''.join([unichr(i) for i in range(4000, 4500, 3)])
         b = ''.join([unichr(i) for i in range(4300, 4800, 2)])
@@ -1252,6 +1273,16 @@ pynff pzq_zxqve(Pbzznaq):
                                                sequencematcher=psm)))
 
 
+class TestPatienceSequenceMatcher_py(tests.TestCase):
+
+    def test_find_longest_match(self):
+        s = _patiencediff_py.PatienceSequenceMatcher_py(None, 'abxcd', 'xcdab')
+        self.assertEqual((2, 0, 3), tuple(s.find_longest_match(0, 5, 0, 5)))
+        self.assertEqual((0, 3, 2), tuple(s.find_longest_match(0, 2, 0, 5)))
+        s.set_seq2('abcd')
+        self.assertEqual((0, 0, 2), tuple(s.find_longest_match(0, 5, 0, 4)))
+
+
 class TestPatienceDiffLib_c(TestPatienceDiffLib):
 
     _test_needs_features = [features.compiled_patiencediff_feature]
@@ -1261,6 +1292,7 @@ class TestPatienceDiffLib_c(TestPatienceDiffLib):
         from breezy import _patiencediff_c
         self._unique_lcs = _patiencediff_c.unique_lcs_c
         self._recurse_matches = _patiencediff_c.recurse_matches_c
+        self._intern_lines = _patiencediff_c.intern_lines_c
         self._PatienceSequenceMatcher = \
             _patiencediff_c.PatienceSequenceMatcher_c
 
@@ -1392,6 +1424,49 @@ class TestUsingCompiledIfAvailable(tests.TestCase):
             self.assertIs(recurse_matches_py,
                           patiencediff.recurse_matches)
 
+    def test_intern_lines(self):
+        if features.compiled_patiencediff_feature.available():
+            from breezy._patiencediff_c import intern_lines_c
+            self.assertIs(intern_lines_c,
+                          patiencediff.intern_lines)
+        else:
+            from breezy._patiencediff_py import intern_lines_py
+            self.assertIs(intern_lines_py,
+                          patiencediff.intern_lines)
+
+
+class TestMatchingBlocksForParents(tests.TestCase):
+
+    def test_line_interner(self):
+        interner = patiencediff.LineInterner()
+        self.assertEqual([0, 1, 0], interner.intern([b'a', b'b', b'a']))
+        self.assertEqual([1, 2], interner.intern([b'b', b'c']))
+        self.assertEqual(3, len(interner))
+
+    def test_matching_blocks(self):
+        text = [b'a\n', b'b\n', b'c\n', b'd\n']
+        parents = [[b'a\n', b'c\n', b'd\n'], [b'x\n', b'b\n', b'c\n'], []]
+        self.assertEqual(
+            [patiencediff.PatienceSequenceMatcher(
+                None, parent, text).get_matching_blocks()
+             for parent in parents],
+            patiencediff.get_matching_blocks_for_parents(parents, text))
+        self.assertEqual(
+            [patiencediff.PatienceSequenceMatcher(
+                None, parents[0], text).get_matching_blocks()],
+            patiencediff.get_matching_blocks_for_parents(parents[:1], text))
+        self.assertEqual(
+            [], patiencediff.get_matching_blocks_for_parents([], text))
+
+    def test_shared_interner(self):
+        interner = patiencediff.LineInterner()
+        text = [b'a\n', b'b\n']
+        self.assertEqual(
+            [[(0, 0, 1), (1, 2, 0)]],
+            patiencediff.get_matching_blocks_for_parents(
+                [[b'a\n']], text, interner))
+        self.assertEqual(2, len(interner))
+
 
 class TestDiffFromTool(tests.TestCaseWithTransport):
 
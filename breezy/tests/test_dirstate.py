@@ -1417,6 +1417,63 @@ class TestDirStateHashUpdates(TestCaseWithDirState):
                          state._dirblock_state)
         self.assertEqual(0, len(state._known_hash_changes))
 
+    def get_state_with_committed_files(self):
+        tree = self.make_branch_and_tree('.')
+        self.build_tree(['a', 'b', 'dir/', 'dir/c'])
+        tree.add(['a', 'b', 'dir', 'dir/c'])
+        tree.commit('add files')
+        with tree.lock_read():
+            filename = tree.current_dirstate()._filename
+        state = InstrumentedDirState.on_file(filename)
+        state.lock_write()
+        self.addCleanup(state.unlock)
+        state._read_dirblocks_if_needed()
+        return state
+
+    def get_sha1_calls(self, state):
+        return [call for call in state._log if call[0] == 'sha1']
+
+    def test_update_sha1s_in_parallel(self):
+        state = self.get_state_with_committed_files()
+        state.adjust_time(+20)  # Allow things to be cached
+        self.assertEqual(3, state.update_sha1s_in_parallel(
+            osutils.getcwd(), {b''}, 4))
+        self.assertEqual(dirstate.DirState.IN_MEMORY_HASH_MODIFIED,
+                         state._dirblock_state)
+        for path in ['a', 'b', 'dir/c']:
+            entry = state._get_entry(0, path_utf8=path.encode('utf8'))
+            self.assertEqual(osutils.sha_file_by_name(path), entry[1][0][1])
+            self.assertEqual(dirstate.pack_stat(os.lstat(path)),
+                             entry[1][0][4])
+        self.assertEqual(3, len(self.get_sha1_calls(state)))
+        # Now that the stat cache is up to date, nothing is hashed.
+        self.assertEqual(0, state.update_sha1s_in_parallel(
+            osutils.getcwd(), {b''}, 4))
+        self.assertEqual(3, len(self.get_sha1_calls(state)))
+
+    def test_update_sha1s_in_parallel_specific_paths(self):
+        state = self.get_state_with_committed_files()
+        state.adjust_time(+20)  # Allow things to be cached
+        self.assertEqual(1, state.update_sha1s_in_parallel(
+            osutils.getcwd(), {b'dir'}, 4))
+        self.assertEqual([('sha1', osutils.pathjoin(osutils.getcwd(),
+                                                    'dir/c'))],
+                         self.get_sha1_calls(state))
+
+    def test_update_sha1s_in_parallel_skips_new_files(self):
+        state = self.get_state_with_committed_files()
+        # The files were just written, so their sha1 can not be cached.
+        self.assertEqual(0, state.update_sha1s_in_parallel(
+            osutils.getcwd(), {b''}, 4))
+        self.assertEqual([], self.get_sha1_calls(state))
+
+    def test_update_sha1s_in_parallel_missing_file(self):
+        state = self.get_state_with_committed_files()
+        state.adjust_time(+20)  # Allow things to be cached
+        os.unlink('b')
+        self.assertEqual(2, state.update_sha1s_in_parallel(
+            osutils.getcwd(), {b''}, 4))
+
 
 class TestGetLines(TestCaseWithDirState):
 
@@ -15,17 +15,20 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
 
 from .. import (
+    config,
     errors,
     osutils,
     revision as _mod_revision,
     )
 from ..bzr import (
     bzrdir,
+    fetch as _mod_fetch,
     versionedfile,
+    vf_repository,
     )
 from ..branch import Branch
 from ..bzr import knitrepo
-from . import TestCaseWithTransport
+from . import TestCase, TestCaseWithTransport
 from .test_revision import make_branches
 from ..upgrade import Convert
 from ..workingtree import WorkingTree
@@ -525,3 +528,119 @@ class Test1To2Fetch(TestCaseWithTransport):
         self.make_two_commits(change_root=False, fetch_twice=True)
         self.assertEqual(((b'TREE_ROOT', b'first-id'),),
                          self.get_parents(b'TREE_ROOT', b'second-id'))
+
+
+class TestBatchSizer(TestCase):
+
+    def make_sizer(self, memory, initial=10, memory_limit=1000):
+        return _mod_fetch.BatchSizer(
+            initial, memory_limit, maximum=100,
+            get_memory=lambda: memory.pop(0))
+
+    def test_grows_below_limit(self):
+        sizer = self.make_sizer([0, 100])
+        sizer.start_batch()
+        sizer.finish_batch(10)
+        self.assertEqual(20, sizer.size)
+
+    def test_shrinks_above_limit(self):
+        sizer = self.make_sizer([0, 1500])
+        sizer.start_batch()
+        sizer.finish_batch(10)
+        self.assertEqual(6, sizer.size)
+        sizer = self.make_sizer([0, 10000])
+        sizer.start_batch()
+        sizer.finish_batch(10)
+        self.assertEqual(5, sizer.size)
+
+    def test_no_growth_keeps_size(self):
+        # Memory freed by earlier batches is reused, so the resident memory
+        # often doesn't grow; that must not ratchet the size up.
+        sizer = self.make_sizer([0, 0, 0, -100, 0, 0])
+        for i in range(3):
+            sizer.start_batch()
+            sizer.finish_batch(10)
+        self.assertEqual(10, sizer.size)
+
+    def test_bounds(self):
+        sizer = self.make_sizer([0, 1, 0, 1000000], initial=80)
+        sizer.start_batch()
+        sizer.finish_batch(80)
+        self.assertEqual(100, sizer.size)
+        sizer = self.make_sizer([0, 1000000], initial=1)
+        sizer.start_batch()
+        sizer.finish_batch(1)
+        self.assertEqual(1, sizer.size)
+
+    def test_memory_unknown(self):
+        sizer = self.make_sizer([None])
+        sizer.start_batch()
+        sizer.finish_batch(10)
+        self.assertEqual(10, sizer.size)
+
+    def test_no_limit(self):
+        sizer = self.make_sizer([], memory_limit=0)
+        sizer.start_batch()
+        sizer.finish_batch(10)
+        self.assertEqual(10, sizer.size)
+
+
+class TestFetchCheckpoint(TestCaseWithTransport):
+
+    def test_record_and_load(self):
+        repo = self.make_repository('repo')
+        checkpoint = _mod_fetch.FetchCheckpoint(repo, [b'b', b'a'])
+        self.assertEqual((0, []), checkpoint.load())
+        checkpoint.record(100, ['pack1', 'pack2'])
+        checkpoint = _mod_fetch.FetchCheckpoint(repo, [b'a', b'b'])
+        self.assertEqual((100, ['pack1', 'pack2']), checkpoint.load())
+        checkpoint.finish()
+        self.assertFalse(repo.control_transport.has('fetch-checkpoint'))
+
+    def test_other_heads(self):
+        repo = self.make_repository('repo')
+        _mod_fetch.FetchCheckpoint(repo, [b'a']).record(100, [])
+        checkpoint = _mod_fetch.FetchCheckpoint(repo, [b'b'])
+        self.assertEqual((0, []), checkpoint.load())
+
+    def test_unreadable(self):
+        repo = self.make_repository('repo')
+        repo.control_transport.put_bytes('fetch-checkpoint', b'garbage')
+        checkpoint = _mod_fetch.FetchCheckpoint(repo, [b'a'])
+        self.assertEqual((0, []), checkpoint.load())
+
+
+class TestInterruptedConversion(TestCaseWithTransport):
+
+    def test_resume(self):
+        config.GlobalStack().set('repository.fetch_batch_memory', '0')
+        self.overrideAttr(vf_repository.InterDifferingSerializer,
+                          '_fetch_batch_size', 1)
+        tree = self.make_branch_and_tree('source', format='2a')
+        for revid in [b'rev1', b'rev2', b'rev3']:
+            tree.commit(revid.decode('ascii'), rev_id=revid)
+        target = self.make_repository('target', format='1.14-rich-root')
+        batches = []
+        interrupt = [True]
+        real_fetch_batch = vf_repository.InterDifferingSerializer._fetch_batch
+
+        def fetch_batch(inter, revision_ids, basis_id, cache):
+            batches.append(revision_ids)
+            if len(batches) == 2 and interrupt[0]:
+                raise errors.BzrError('interrupted')
+            return real_fetch_batch(inter, revision_ids, basis_id, cache)
+        self.overrideAttr(vf_repository.InterDifferingSerializer,
+                          '_fetch_batch', fetch_batch)
+        self.assertRaises(errors.BzrError, target.fetch,
+                          tree.branch.repository, b'rev3')
+        self.assertEqual([[b'rev1'], [b'rev2']], batches)
+        self.assertEqual({b'rev1'}, set(target.all_revision_ids()))
+        checkpoint = _mod_fetch.FetchCheckpoint(target, [b'rev3'])
+        self.assertEqual(1, checkpoint.load()[0])
+        del batches[:]
+        interrupt[0] = False
+        target.fetch(tree.branch.repository, b'rev3')
+        self.assertEqual([[b'rev2'], [b'rev3']], batches)
+        self.assertEqual({b'rev1', b'rev2', b'rev3'},
+                         set(target.all_revision_ids()))
+        self.assertFalse(target.control_transport.has('fetch-checkpoint'))
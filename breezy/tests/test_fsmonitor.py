@@ -0,0 +1,322 @@
+# Copyright (C) 2019 Breezy Developers
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Tests for the inotify file system monitor of dirstate trees."""
+
+import os
+import threading
+
+from .. import (
+    osutils,
+    tests,
+    )
+from ..bzr import fsmonitor
+from . import features
+
+
+class _InotifyFeature(features.Feature):
+
+    def _probe(self):
+        try:
+            fsmonitor.Inotify().close()
+        except fsmonitor.InotifyNotAvailable:
+            return False
+        return True
+
+    def feature_name(self):
+        return 'inotify'
+
+
+InotifyFeature = _InotifyFeature()
+
+
+class TestInotify(tests.TestCaseInTempDir):
+
+    _test_needs_features = [InotifyFeature]
+
+    def test_events(self):
+        os.mkdir('dir')
+        inotify = fsmonitor.Inotify()
+        self.addCleanup(inotify.close)
+        wd = inotify.add_watch(b'dir', fsmonitor.IN_CREATE)
+        self.build_tree(['dir/file'])
+        self.assertEqual([(wd, fsmonitor.IN_CREATE, b'file')],
+                         inotify.read_events())
+        self.assertEqual([], inotify.read_events())
+
+    def test_add_watch_missing(self):
+        inotify = fsmonitor.Inotify()
+        self.addCleanup(inotify.close)
+        self.assertRaises(OSError, inotify.add_watch, b'missing',
+                          fsmonitor.IN_CREATE)
+
+
+class TestWithMonitor(tests.TestCaseWithTransport):
+
+    _test_needs_features = [InotifyFeature]
+
+    def start_monitor(self, tree):
+        monitor = fsmonitor.TreeMonitor(
+            tree.basedir, tree._transport.local_abspath('.'))
+        monitor.start()
+        thread = threading.Thread(target=monitor.serve)
+        thread.start()
+
+        def stop():
+            fsmonitor.stop_monitor(tree.basedir)
+            thread.join()
+        self.addCleanup(stop)
+        return monitor
+
+    def query(self, tree, token):
+        return fsmonitor.query_changes(
+            fsmonitor.connect(tree.basedir), token)
+
+
+class TestTreeMonitor(TestWithMonitor):
+
+    def test_not_running(self):
+        tree = self.make_branch_and_tree('.')
+        self.assertIs(None, fsmonitor.connect(tree.basedir))
+        self.assertIs(None, fsmonitor.monitor_status(tree.basedir))
+        self.assertFalse(fsmonitor.stop_monitor(tree.basedir))
+
+    def test_already_running(self):
+        tree = self.make_branch_and_tree('.')
+        self.start_monitor(tree)
+        monitor = fsmonitor.TreeMonitor(
+            tree.basedir, tree._transport.local_abspath('.'))
+        self.assertRaises(fsmonitor.MonitorAlreadyRunning, monitor.start)
+
+    def test_status(self):
+        self.build_tree(['dir/', 'dir/subdir/'])
+        tree = self.make_branch_and_tree('.')
+        self.start_monitor(tree)
+        self.assertEqual('watching 3 directories, 0 changed paths',
+                         fsmonitor.monitor_status(tree.basedir))
+
+    def test_first_query_is_fresh(self):
+        tree = self.make_branch_and_tree('.')
+        self.start_monitor(tree)
+        token, changed = self.query(tree, None)
+        self.assertIs(None, changed)
+        token, changed = self.query(tree, b'unknown:1')
+        self.assertIs(None, changed)
+
+    def test_changes(self):
+        self.build_tree(['file', 'dir/', 'dir/file'])
+        tree = self.make_branch_and_tree('.')
+        self.start_monitor(tree)
+        token, changed = self.query(tree, None)
+        token, changed = self.query(tree, token)
+        self.assertEqual(set(), changed)
+        self.build_tree_contents([('dir/file', b'changed\n')])
+        token, changed = self.query(tree, token)
+        self.assertEqual({b'dir/file'}, changed)
+        os.unlink('file')
+        token, changed = self.query(tree, token)
+        self.assertEqual({b'', b'file'}, changed)
+
+    def test_control_dir_is_ignored(self):
+        tree = self.make_branch_and_tree('.')
+        self.start_monitor(tree)
+        token, changed = self.query(tree, None)
+        tree.lock_write()
+        tree.unlock()
+        token, changed = self.query(tree, token)
+        self.assertEqual(set(), changed)
+
+    def test_new_directory(self):
+        tree = self.make_branch_and_tree('.')
+        self.start_monitor(tree)
+        token, changed = self.query(tree, None)
+        self.build_tree(['dir/', 'dir/file'])
+        token, changed = self.query(tree, token)
+        self.assertEqual({b'', b'dir', b'dir/file'}, changed)
+        self.build_tree(['dir/other'])
+        token, changed = self.query(tree, token)
+        self.assertEqual({b'dir', b'dir/other'}, changed)
+
+    def test_moved_directory(self):
+        self.build_tree(['dir/', 'dir/subdir/'])
+        tree = self.make_branch_and_tree('.')
+        self.start_monitor(tree)
+        token, changed = self.query(tree, None)
+        os.rename('dir', 'moved')
+        token, changed = self.query(tree, token)
+        self.assertEqual({b'', b'dir', b'moved', b'moved/subdir'}, changed)
+        self.build_tree(['moved/subdir/file'])
+        token, changed = self.query(tree, token)
+        self.assertEqual({b'moved/subdir', b'moved/subdir/file'}, changed)
+
+    def test_too_many_changes(self):
+        tree = self.make_branch_and_tree('.')
+        monitor = self.start_monitor(tree)
+        monitor.max_changed_paths = 3
+        token, changed = self.query(tree, None)
+        self.build_tree(['a', 'b', 'c', 'd'])
+        token, changed = self.query(tree, token)
+        self.assertIs(None, changed)
+        monitor.max_changed_paths = 100
+        self.build_tree(['e'])
+        token, changed = self.query(tree, token)
+        self.assertEqual({b'', b'e'}, changed)
+
+
+class TestMonitoredWalker(tests.TestCaseWithTransport):
+
+    def make_tree(self):
+        tree = self.make_branch_and_tree('.')
+        self.build_tree(['file', 'dir/', 'dir/file', 'dir/subdir/',
+                         'dir/subdir/file', 'missing', 'unknown-dir/',
+                         'unknown-dir/file', 'unknown'])
+        tree.add(['file', 'dir', 'dir/file', 'dir/subdir', 'dir/subdir/file',
+                  'missing'])
+        tree.commit('one')
+        os.unlink('missing')
+        tree.lock_read()
+        self.addCleanup(tree.unlock)
+        return tree
+
+    def walk(self, walker, tree):
+        result = []
+        for (relroot, top), dirblock in walker(tree.abspath('')):
+            if not relroot:
+                del dirblock[[info[1] for info in dirblock].index(b'.bzr')]
+            result.append((relroot, [(info[0], info[2], info[3].st_mode)
+                                     for info in dirblock]))
+        return result
+
+    def make_walker(self, tree, dirs, changed):
+        return fsmonitor.MonitoredWalker(
+            tree.current_dirstate(), b'token', dirs, changed)
+
+    def test_without_snapshot(self):
+        tree = self.make_tree()
+        walker = self.make_walker(tree, {}, set())
+        self.assertEqual(self.walk(osutils._walkdirs_utf8, tree),
+                         self.walk(walker.walkdirs, tree))
+        self.assertEqual(
+            [b'', b'dir', b'dir/subdir', b'unknown-dir'], walker.read_dirs)
+        self.assertEqual(
+            [b'missing'], walker.dirs[b''][1])
+        self.assertEqual(
+            [b'.bzr', b'unknown', b'unknown-dir'],
+            [name for name, mode in walker.dirs[b''][2]])
+
+    def test_with_snapshot(self):
+        tree = self.make_tree()
+        walker = self.make_walker(tree, {}, set())
+        expected = self.walk(walker.walkdirs, tree)
+        walker = self.make_walker(tree, walker.dirs, set())
+        self.assertEqual(expected, self.walk(walker.walkdirs, tree))
+        self.assertEqual([], walker.read_dirs)
+
+    def test_changed_dir(self):
+        tree = self.make_tree()
+        walker = self.make_walker(tree, {}, set())
+        self.walk(walker.walkdirs, tree)
+        self.build_tree(['dir/new'])
+        walker = self.make_walker(tree, walker.dirs, {b'dir', b'dir/new'})
+        self.assertEqual(self.walk(osutils._walkdirs_utf8, tree),
+                         self.walk(walker.walkdirs, tree))
+        self.assertEqual([b'dir'], walker.read_dirs)
+
+    def test_changed_versioned_dirs_are_read(self):
+        tree = self.make_tree()
+        walker = self.make_walker(tree, {}, set())
+        self.walk(walker.walkdirs, tree)
+        tree.unlock()
+        tree.unversion(['dir/file'])
+        tree.lock_read()
+        walker = self.make_walker(tree, walker.dirs, set())
+        self.walk(walker.walkdirs, tree)
+        self.assertEqual([b'dir'], walker.read_dirs)
+
+    def test_updated_dirstate(self):
+        tree = self.make_tree()
+        walker = self.make_walker(tree, {}, set())
+        self.walk(walker.walkdirs, tree)
+        self.assertFalse(walker.updated_dirstate())
+        state = tree.current_dirstate()
+        entry = state._get_entry(0, path_utf8=b'dir')
+        entry[1][0] = entry[1][0][:4] + (b'updated',)
+        self.assertTrue(walker.updated_dirstate())
+
+    def test_iter_unversioned(self):
+        tree = self.make_tree()
+        walker = self.make_walker(tree, {}, set())
+        self.assertEqual([b'unknown', b'unknown-dir'],
+                         list(walker.iter_unversioned(tree.abspath(''))))
+
+
+class TestMonitoredWorkingTree(TestWithMonitor):
+
+    def make_tree(self):
+        tree = self.make_branch_and_tree('.')
+        self.build_tree(['file', 'dir/', 'dir/file', 'other/',
+                         'other/file'])
+        tree.add(['file', 'dir', 'dir/file', 'other', 'other/file'])
+        tree.commit('one')
+        self.start_monitor(tree)
+        return tree
+
+    def changes(self, tree):
+        with tree.lock_read():
+            return [(c[1], c[2])
+                    for c in tree.iter_changes(tree.basis_tree(),
+                                               want_unversioned=True)]
+
+    def read_dirs(self, tree):
+        walkers = []
+        real_get = tree._get_monitored_walker
+
+        def get_monitored_walker():
+            walker = real_get()
+            walkers.append(walker)
+            return walker
+        tree._get_monitored_walker = get_monitored_walker
+        try:
+            self.changes(tree)
+        finally:
+            del tree._get_monitored_walker
+        return walkers[0].read_dirs
+
+    def test_snapshot(self):
+        tree = self.make_tree()
+        self.assertEqual([], self.changes(tree))
+        self.assertIsNot(None, fsmonitor.read_snapshot(tree._transport))
+        self.assertEqual([], self.read_dirs(tree))
+
+    def test_changes(self):
+        tree = self.make_tree()
+        self.changes(tree)
+        self.build_tree_contents([('dir/file', b'changed\n')])
+        self.build_tree(['other/unknown'])
+        self.assertEqual([b'other'], self.read_dirs(tree))
+        self.assertEqual(
+            [(('dir/file', 'dir/file'), True),
+             ((None, 'other/unknown'), True)],
+            self.changes(tree))
+        with tree.lock_read():
+            self.assertEqual(['other/unknown'], list(tree.extras()))
+        self.assertEqual([], self.read_dirs(tree))
+
+    def test_monitor_restarted(self):
+        tree = self.make_tree()
+        self.changes(tree)
+        fsmonitor.write_snapshot(tree._transport, b'old:1', {})
+        self.assertEqual([b'', b'dir', b'other'], self.read_dirs(tree))
@@ -16,6 +16,7 @@
 
 """Tests for group compression."""
 
+import os
 import zlib
 
 from .. import (
@@ -556,6 +557,25 @@ class TestGroupCompressVersionedFiles(TestCaseWithGroupCompressVersionedFiles):
             'as-requested', False)]
         self.assertEqual([(b'b',), (b'a',), (b'd',), (b'c',)], keys)
 
+    def test_insert_compressed_blocks(self):
+        vf = self.make_test_vf(True, dir='source')
+        data, start, end = groupcompress._compress_text_to_block(
+            b'lines\n')
+        vf._insert_compressed_blocks(
+            [(data, [((b'a',), start, end)])], {(b'a',): ()})
+        data, start, end = groupcompress._compress_text_to_block(
+            b'more lines\n')
+        vf._insert_compressed_blocks(
+            [(data, [((b'b',), start, end)])], {(b'b',): ((b'a',),)})
+        vf.writer.end()
+        self.assertEqual({(b'a',): (), (b'b',): ((b'a',),)},
+                         vf.get_parent_map([(b'a',), (b'b',)]))
+        texts = dict((record.key, record.get_bytes_as('fulltext'))
+                     for record in vf.get_record_stream(
+                         [(b'a',), (b'b',)], 'unordered', True))
+        self.assertEqual({(b'a',): b'lines\n', (b'b',): b'more lines\n'},
+                         texts)
+
     def test_get_record_stream_max_bytes_to_index_default(self):
         vf = self.make_test_vf(True, dir='source')
         vf.add_lines((b'a',), (), [b'lines\n'])
@@ -1190,6 +1210,55 @@ class TestLazyGroupCompress(tests.TestCaseWithTransport):
         self.assertTrue(manager.check_is_well_utilized())
 
 
+class Test_compress_texts_to_blocks(tests.TestCase):
+
+    def extract_all(self, blocks):
+        texts = {}
+        for data, entries in blocks:
+            block = groupcompress.GroupCompressBlock.from_bytes(data)
+            for key, start, end in entries:
+                texts[key] = block.extract(key, start, end)
+        return texts
+
+    def test_empty(self):
+        self.assertEqual([], groupcompress._compress_texts_to_blocks([]))
+
+    def test_round_trip(self):
+        texts = [((b'f1', b'r%d' % i), None,
+                  b''.join(b'line %d\n' % j for j in range(i + 10)))
+                 for i in range(10)]
+        texts.append(((b'f2', b'r1'), None, b''))
+        blocks = groupcompress._compress_texts_to_blocks(texts)
+        self.assertLength(1, blocks)
+        self.assertEqual(dict((key, bytes) for key, _, bytes in texts),
+                         self.extract_all(blocks))
+
+    def test_splits_large_groups(self):
+        # Incompressible texts, larger than a block may hold in total
+        texts = [((b'f%d' % i, b'rev'), None, os.urandom(1024 * 1024))
+                 for i in range(5)]
+        blocks = groupcompress._compress_texts_to_blocks(texts)
+        self.assertTrue(len(blocks) > 1)
+        self.assertEqual(dict((key, bytes) for key, _, bytes in texts),
+                         self.extract_all(blocks))
+
+
+class Test_compress_text_to_block(tests.TestCase):
+
+    def assertSameBlock(self, bytes):
+        # The block is the one a compressor makes for a lone text
+        [(data, [(key, start, end)])] = groupcompress._compress_texts_to_blocks(
+            [((b'key',), None, bytes)])
+        self.assertEqual((data, start, end),
+                         groupcompress._compress_text_to_block(bytes))
+
+    def test_text(self):
+        self.assertSameBlock(b''.join(b'line %d\n' % i for i in range(100)))
+
+    def test_empty(self):
+        self.assertSameBlock(b'')
+
+
 class Test_GCBuildDetails(tests.TestCase):
 
     def test_acts_like_tuple(self):
@@ -29,6 +29,7 @@ try:
 except ImportError:  # python < 3
     from httplib import UnknownProtocol
     from SimpleHTTPServer import SimpleHTTPRequestHandler
+import gc
 import io
 import socket
 import sys
@@ -468,6 +469,81 @@ class TestHTTPConnections(http_utils.TestCaseWithWebserver):
             socket.setdefaulttimeout(default_timeout)
 
 
+class TestConnectionReuse(http_utils.TestCaseWithWebserver):
+    """Test that connections are reused across transports."""
+
+    scenarios = vary_by_http_client_implementation()
+
+    # HTTP/1.0 servers close the connection after each request
+    _protocol_version = 'HTTP/1.1'
+
+    def setUp(self):
+        super(TestConnectionReuse, self).setUp()
+        self.build_tree_contents([('a', b'content of a\n')])
+        self.pool = _urllib2_wrappers.connection_pool
+        self.addCleanup(self.pool.clear)
+        # Don't keep the transports alive until the end of the test
+        self.overrideAttr(transport.Transport, 'hooks',
+                          transport.TransportHooks())
+
+    def test_reuse_after_transport_is_collected(self):
+        t = self.get_readonly_transport()
+        self.assertEqual(b'content of a\n', t.get_bytes('a'))
+        connection = t._get_connection()
+        handshakes = self.pool.handshakes
+        reused = self.pool.reused
+        del t
+        gc.collect()
+        t = self.get_readonly_transport()
+        self.assertEqual(b'content of a\n', t.get_bytes('a'))
+        self.assertIs(connection, t._get_connection())
+        self.assertEqual(reused + 1, self.pool.reused)
+        self.assertEqual(handshakes, self.pool.handshakes)
+
+    def test_no_reuse_while_shared_with_clones(self):
+        t = self.get_readonly_transport()
+        t.get_bytes('a')
+        clone = t.clone('.')
+        del t
+        other = self.get_readonly_transport()
+        other.get_bytes('a')
+        self.assertIsNot(clone._get_connection(), other._get_connection())
+
+    def test_reused_connection_reports_to_new_transport(self):
+        reports = []
+
+        def report_activity(t, bytes, direction):
+            reports.append(t._test_name)
+        self.overrideAttr(self._transport, '_report_activity', report_activity)
+        t = self.get_readonly_transport()
+        t._test_name = 'first'
+        t.get_bytes('a')
+        connection = t._get_connection()
+        del t
+        gc.collect()
+        del reports[:]
+        t = self.get_readonly_transport()
+        t._test_name = 'second'
+        t.get_bytes('a')
+        self.assertIs(connection, t._get_connection())
+        self.assertEqual({'second'}, set(reports))
+
+    def test_debug_report_after_command(self):
+        # 'a' is not in a branch, but looking for one is enough
+        out, err = self.run_bzr(['-Dhttp', 'cat', self.get_readonly_url('a')],
+                                retcode=3)
+        self.assertContainsRe(err, 'HTTP connections: \\d+ handshakes')
+
+    def test_disconnect_closes(self):
+        t = self.get_readonly_transport()
+        t.get_bytes('a')
+        t.disconnect()
+        del t
+        self.assertIs(None, self.pool.get(
+            (_urllib2_wrappers.HTTPConnection, self.get_readonly_server().host,
+             None, None)))
+
+
 class TestHttpTransportRegistration(tests.TestCase):
     """Test registrations of various http implementations"""
 
@@ -536,6 +612,168 @@ class TestRangeHeader(tests.TestCase):
                           tail=50)
 
 
+class TestReadvConnectionPool(tests.TestCaseInTempDir):
+
+    def test_latency_bound_grows(self):
+        pool = http._ReadvConnectionPool(4)
+        self.assertEqual(2, pool.concurrency)
+        pool.record(1000, 1.0, 0.9)
+        self.assertEqual(3, pool.concurrency)
+        pool.record(2000, 1.0, 0.9)
+        self.assertEqual(4, pool.concurrency)
+        # Never more than the pool size
+        pool.record(3000, 1.0, 0.9)
+        self.assertEqual(4, pool.concurrency)
+
+    def test_worse_throughput_undoes_last_change(self):
+        pool = http._ReadvConnectionPool(4)
+        pool.record(1000, 1.0, 0.9)
+        self.assertEqual(3, pool.concurrency)
+        pool.record(500, 1.0, 0.9)
+        self.assertEqual(2, pool.concurrency)
+
+    def test_bandwidth_bound_shrinks(self):
+        pool = http._ReadvConnectionPool(4)
+        pool.concurrency = 4
+        pool.record(1000, 1.0, 0.1)
+        self.assertEqual(3, pool.concurrency)
+        pool.record(1000, 1.0, 0.1)
+        self.assertEqual(2, pool.concurrency)
+        # But always issue concurrent requests
+        pool.record(1000, 1.0, 0.1)
+        self.assertEqual(2, pool.concurrency)
+
+    def test_connections(self):
+        pool = http._ReadvConnectionPool(1)
+        self.assertIs(None, pool.get())
+
+        class FakeConnection(object):
+            closed = False
+
+            def close(self):
+                self.closed = True
+        c1 = FakeConnection()
+        c2 = FakeConnection()
+        pool.put(c1)
+        # Only max_connections are kept
+        pool.put(c2)
+        self.assertTrue(c2.closed)
+        self.assertIs(c1, pool.get())
+        pool.put(c1)
+        pool.close()
+        self.assertTrue(c1.closed)
+        self.assertIs(None, pool.get())
+
+    def test_readv_connections_option(self):
+        t = HttpTransport('http://example.com/')
+        self.assertIs(None, t._readv_pool)
+        config.GlobalStack().set('http.readv_connections', '3')
+        t = HttpTransport('http://example.com/')
+        self.assertEqual(3, t._readv_pool.max_connections)
+        self.assertIs(t._readv_pool, t.clone('foo')._readv_pool)
+
+    def test_group_coalesced(self):
+        t = HttpTransport('http://example.com/')
+        coalesced = list(t._coalesce_offsets(
+            [(0, 10), (20, 10), (40, 10), (60, 10)], limit=1,
+            fudge_factor=0))
+
+        def group(max_ranges, parts=1):
+            return [[c.start for c in g]
+                    for g in t._group_coalesced(coalesced, max_ranges, parts)]
+        self.assertEqual([[0, 20, 40, 60]], group(10))
+        self.assertEqual([[0, 20], [40, 60]], group(2))
+        # The data is spread over the requested number of parts
+        self.assertEqual([[0, 20], [40, 60]], group(10, 2))
+        self.assertEqual([[0], [20], [40], [60]], group(10, 4))
+
+
+class FakePooledConnection(object):
+
+    host = 'example.com'
+    port = 80
+
+    def __init__(self, key='example.com'):
+        self._pool_key = key
+        self.sock = object()
+        self._response = None
+        self.closed = False
+
+    def cleanup_pipe(self):
+        pass
+
+    def close(self):
+        self.closed = True
+        self.sock = None
+
+
+class TestConnectionPool(tests.TestCase):
+
+    def test_get_put(self):
+        pool = _urllib2_wrappers.ConnectionPool()
+        self.assertIs(None, pool.get('example.com'))
+        c1 = FakePooledConnection()
+        c2 = FakePooledConnection('example.org')
+        pool.put(c1)
+        pool.put(c2)
+        self.assertIs(None, pool.get('example.net'))
+        self.assertIs(c1, pool.get('example.com'))
+        self.assertIs(None, pool.get('example.com'))
+        self.assertIs(c2, pool.get('example.org'))
+        self.assertEqual(2, pool.reused)
+        self.assertFalse(c1.closed)
+
+    def test_closed_connections_are_not_kept(self):
+        pool = _urllib2_wrappers.ConnectionPool()
+        c = FakePooledConnection()
+        c.sock = None
+        pool.put(c)
+        self.assertIs(None, pool.get('example.com'))
+
+    def test_unread_response_is_not_touched(self):
+        pool = _urllib2_wrappers.ConnectionPool()
+
+        class Response(object):
+
+            def isclosed(self):
+                return False
+        c = FakePooledConnection()
+        c._response = Response()
+        pool.put(c)
+        self.assertIs(None, pool.get('example.com'))
+        self.assertFalse(c.closed)
+
+    def test_idle_timeout(self):
+        pool = _urllib2_wrappers.ConnectionPool()
+        pool.idle_timeout = -1
+        c = FakePooledConnection()
+        pool.put(c)
+        self.assertTrue(c.closed)
+        self.assertIs(None, pool.get('example.com'))
+
+    def test_max_idle(self):
+        pool = _urllib2_wrappers.ConnectionPool()
+        pool.max_idle = 2
+        connections = [FakePooledConnection() for i in range(3)]
+        for c in connections:
+            pool.put(c)
+        # The oldest one is closed
+        self.assertEqual([True, False, False],
+                         [c.closed for c in connections])
+
+    def test_release_when_unused(self):
+        pool = _urllib2_wrappers.ConnectionPool()
+
+        class Owner(object):
+            pass
+        owner = Owner()
+        c = FakePooledConnection()
+        pool.release_when_unused(owner, c)
+        self.assertIs(None, pool.get('example.com'))
+        del owner
+        self.assertIs(c, pool.get('example.com'))
+
+
 class TestSpecificRequestHandler(http_utils.TestCaseWithWebserver):
     """Tests a specific request handler.
 
@@ -732,6 +970,15 @@ class TestRecordingServer(tests.TestCase):
         self.assertEqual(b'abc', server.received_bytes)
 
 
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 0.0
+
+    def time(self):
+        return self.now
+
+
 class TestRangeRequestServer(TestSpecificRequestHandler):
     """Tests readv requests against server.
 
@@ -800,6 +1047,39 @@ class TestRangeRequestServer(TestSpecificRequestHandler):
         # The server should have issued 3 requests
         self.assertEqual(3, server.GET_request_nb)
 
+    def record_readv_estimate(self, t):
+        samples = []
+        record = t._readv_estimate.record
+
+        def record_sample(num_bytes, elapsed):
+            samples.append((num_bytes, elapsed))
+            record(num_bytes, elapsed)
+        t._readv_estimate.record = record_sample
+        return samples
+
+    def test_readv_estimate_excludes_caller_time(self):
+        clock = FakeClock()
+        self.overrideAttr(http, 'time', clock)
+        t = self.get_readonly_transport()
+        t._get_max_size = 2
+        samples = self.record_readv_estimate(t)
+        for offset, data in t.readv('a', ((0, 1), (1, 1), (2, 4), (6, 4))):
+            # Our own processing of the data takes a long time
+            clock.now += 10
+        self.assertEqual(10, sum(num_bytes for num_bytes, _ in samples))
+        self.assertEqual([0] * len(samples),
+                         [elapsed for _, elapsed in samples])
+
+    def test_incomplete_readv_records_estimate(self):
+        t = self.get_readonly_transport()
+        t._get_max_size = 2
+        samples = self.record_readv_estimate(t)
+        ireadv = iter(t.readv('a', ((0, 1), (1, 1), (2, 4), (6, 4))))
+        self.assertEqual((0, b'0'), next(ireadv))
+        del ireadv
+        gc.collect()
+        self.assertNotEqual([], samples)
+
     def test_complete_readv_leave_pipe_clean(self):
         server = self.get_readonly_server()
         t = self.get_readonly_transport()
@@ -828,6 +1108,49 @@ class TestRangeRequestServer(TestSpecificRequestHandler):
         self.assertEqual(2, server.GET_request_nb)
 
 
+class TestConcurrentRangeRequests(TestRangeRequestServer):
+    """Test readv issuing range requests concurrently."""
+
+    def get_readonly_transport(self, relpath=None):
+        t = super(TestConcurrentRangeRequests, self).get_readonly_transport(
+            relpath)
+        t._readv_pool = http._ReadvConnectionPool(4)
+        self.addCleanup(t._readv_pool.close)
+        return t
+
+    def test_readv_estimate_excludes_caller_time(self):
+        # The next requests are in flight while the caller processes the
+        # data of the previous ones, so their time overlaps with it.
+        raise tests.TestNotApplicable(
+            'concurrent requests overlap with the caller')
+
+    def test_readv_uses_pool(self):
+        server = self.get_readonly_server()
+        t = self.get_readonly_transport()
+        self.assertEqual(b'0123456789', t.get_bytes('a'))
+        t._max_readv_combine = 1
+        t._max_get_ranges = 1
+        l = list(t.readv('a', ((9, 1), (0, 1), (3, 2), (1, 1))))
+        self.assertEqual([(9, b'9'), (0, b'0'), (3, b'34'), (1, b'1')], l)
+        # One request per coalesced offset, all sent through the pool
+        self.assertEqual(5, server.GET_request_nb)
+        self.assertTrue(0 < len(t._readv_pool._idle) <= 2)
+
+    def test_readv_stopped_early(self):
+        server = self.get_readonly_server()
+        t = self.get_readonly_transport()
+        self.assertEqual(b'0123456789', t.get_bytes('a'))
+        t._max_readv_combine = 1
+        t._max_get_ranges = 1
+        self.assertEqual(2, t._readv_pool.concurrency)
+        readv = t.readv('a', [(i, 1) for i in range(10)])
+        self.assertEqual((0, b'0'), next(readv))
+        readv.close()
+        # The second request was in flight and a third one was issued when
+        # the first was received, the others never were.
+        self.assertEqual(4, server.GET_request_nb)
+
+
 class SingleRangeRequestHandler(http_server.TestingHTTPRequestHandler):
     """Always reply to range request as if they were single.
 
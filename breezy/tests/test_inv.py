@@ -1593,6 +1593,79 @@ class TestCHKInventoryExpand(tests.TestCaseWithMemoryTransport):
         self.assertExpand([b'TREE_ROOT', b'dir1-id', b'sub-dir1-id', b'top-id',
                            b'subsub-file1-id'], inv, [b'top-id', b'subsub-file1-id'])
 
+    def make_wide_inventory(self):
+        inv = Inventory(b'TREE_ROOT')
+        inv.revision_id = b"revid"
+        inv.root.revision = b"rootrev"
+        for i in range(20):
+            dir_name = 'dir%d' % i
+            self.make_dir(inv, dir_name, b'TREE_ROOT', b'dirrev')
+            for j in range(20):
+                self.make_file(inv, '%s-file%d' % (dir_name, j),
+                               dir_name.encode('utf-8') + b'-id', b'filerev')
+        chk_bytes = self.get_chk_bytes()
+        chk_inv = CHKInventory.from_inventory(chk_bytes, inv,
+                                              maximum_size=100,
+                                              search_key_name=b'hash-255-way')
+        bytes = b''.join(chk_inv.to_lines())
+        return CHKInventory.deserialise(chk_bytes, bytes, (b"revid",))
+
+    def count_pages_read(self, func, *args):
+        chk_map.clear_cache()
+        chk_map.reset_page_read_counts()
+        result = func(*args)
+        return result, chk_map.get_page_read_counts()[0]
+
+    def test_get_entry_by_path(self):
+        inv = self.make_simple_inventory()
+        self.assertEqual(b'subsub-file1-id', inv.get_entry_by_path(
+            'dir1/sub-dir1/subsub-file1').file_id)
+        self.assertEqual(b'dir2-id', inv.get_entry_by_path(['dir2']).file_id)
+        self.assertEqual(b'TREE_ROOT', inv.get_entry_by_path('').file_id)
+        self.assertIs(None, inv.get_entry_by_path('dir1/missing'))
+        self.assertIs(None, inv.get_entry_by_path('top/sub-file1'))
+
+    def test_get_entry_by_path_reads_only_path(self):
+        inv = self.make_wide_inventory()
+        ie, path_pages = self.count_pages_read(
+            inv.get_entry_by_path, 'dir7/dir7-file3')
+        self.assertEqual(b'dir7-file3-id', ie.file_id)
+        # The children of dir7 are not loaded
+        self.assertIs(None, inv.get_entry(b'dir7-id')._children)
+        inv = self.make_wide_inventory()
+        paths, all_pages = self.count_pages_read(
+            list, inv.iter_entries_by_dir())
+        self.assertEqual(421, len(paths))
+        self.assertTrue(path_pages * 5 < all_pages,
+                        '%d pages read for a path, %d for the whole tree'
+                        % (path_pages, all_pages))
+
+    def test_iter_entries_by_dir_specific_file_ids(self):
+        inv = self.make_simple_inventory()
+        file_ids = [b'subsub-file1-id', b'top-id', b'dir2-id',
+                    b'sub-file1-id', b'TREE_ROOT', b'missing-id']
+        expected = [(path, ie.file_id)
+                    for path, ie in inv.iter_entries_by_dir()
+                    if ie.file_id in file_ids]
+        inv = self.make_simple_inventory()
+        self.assertEqual(expected, [
+            (path, ie.file_id) for path, ie in
+            inv.iter_entries_by_dir(specific_file_ids=file_ids)])
+        # Only the requested entries and their parents were read
+        self.assertEqual(
+            sorted([b'TREE_ROOT', b'dir1-id', b'dir2-id', b'sub-dir1-id',
+                    b'subsub-file1-id', b'sub-file1-id', b'top-id']),
+            sorted(inv._fileid_to_entry_cache))
+
+    def test_iter_all_paths(self):
+        inv = self.make_simple_inventory()
+        self.assertEqual(
+            sorted(path for path, ie in inv.iter_entries_by_dir()),
+            sorted(inv.iter_all_paths()))
+        inv = self.make_simple_inventory()
+        list(inv.iter_all_paths())
+        self.assertEqual({}, inv._fileid_to_entry_cache)
+
 
 class TestMutableInventoryFromTree(TestCaseWithTransport):
 
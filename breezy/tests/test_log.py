@@ -1257,6 +1257,43 @@ class TestHistoryChange(tests.TestCaseWithTransport):
         self.assertNotContainsRe(s.getvalue(), 'Added Revisions:')
 
 
+class TestIsObviousAncestor(tests.TestCaseWithTransport):
+
+    def make_branch_with_merge(self):
+        builder = self.make_branch_builder('.')
+        builder.start_series()
+        builder.build_snapshot(None, [
+            ('add', ('', b'TREE_ROOT', 'directory', None))],
+            revision_id=b'1')
+        builder.build_snapshot([b'1'], [], revision_id=b'1.1.1')
+        builder.build_snapshot([b'1'], [], revision_id=b'2')
+        builder.build_snapshot([b'2', b'1.1.1'], [], revision_id=b'3')
+        builder.finish_series()
+        branch = builder.get_branch()
+        self.addCleanup(branch.lock_read().unlock)
+        return branch
+
+    def test_revnos_looked_up_together(self):
+        branch = self.make_branch_with_merge()
+        calls = []
+        lookup = branch.revision_ids_to_dotted_revnos
+
+        def revision_ids_to_dotted_revnos(revision_ids):
+            calls.append(list(revision_ids))
+            return lookup(revision_ids)
+        branch.revision_ids_to_dotted_revnos = revision_ids_to_dotted_revnos
+        self.assertTrue(log._is_obvious_ancestor(branch, b'1', b'3'))
+        self.assertEqual([[b'1', b'3']], calls)
+
+    def test_obvious_ancestor(self):
+        branch = self.make_branch_with_merge()
+        self.assertTrue(log._is_obvious_ancestor(branch, b'1', b'2'))
+        self.assertFalse(log._is_obvious_ancestor(branch, b'3', b'2'))
+        self.assertFalse(log._is_obvious_ancestor(branch, b'1.1.1', b'3'))
+        self.assertFalse(log._is_obvious_ancestor(branch, b'1', b'unknown'))
+        self.assertTrue(log._is_obvious_ancestor(branch, None, b'3'))
+
+
 class TestRevisionNotInBranch(TestCaseForLogFormatter):
 
     def setup_a_tree(self):
@@ -299,6 +299,15 @@ class TestLRUSizeCache(tests.TestCase):
         cache['my key'] = 'my value text'
         self.assertEqual(13, cache._value_size)
 
+    def test_replace_tracks_size(self):
+        cache = lru_cache.LRUSizeCache()
+        cache['my key'] = 'my value text'
+        cache['my key'] = 'other text'
+        self.assertEqual('other text', cache['my key'])
+        self.assertEqual(10, cache._value_size)
+        cache.clear()
+        self.assertEqual(0, cache._value_size)
+
     def test_remove_tracks_size(self):
         cache = lru_cache.LRUSizeCache()
         self.assertEqual(0, cache._value_size)
@@ -2200,6 +2200,48 @@ class TestBranchRevisionIdToRevno(RemoteBranchTestCase):
                          branch.revision_id_to_dotted_revno(b'null:'))
         self.assertLength(8, self.hpss_calls)
 
+    def test_revision_ids_to_dotted_revnos(self):
+        transport = MemoryTransport()
+        client = FakeClient(transport.base)
+        client.add_expected_call(
+            b'Branch.get_stacked_on_url', (b'quack/',),
+            b'error', (b'NotStacked',),)
+        client.add_expected_call(
+            b'Branch.revision_id_to_revno', (b'quack/', b'null:'),
+            b'success', (b'ok', b'0',),)
+        client.add_expected_call(
+            b'Branch.revision_id_to_revno', (b'quack/', b'unknown'),
+            b'error', (b'NoSuchRevision', b'unknown',),)
+        client.add_expected_call(
+            b'Branch.revision_id_to_revno', (b'quack/', b'merged'),
+            b'success', (b'ok', b'1', b'1', b'2'),)
+        transport.mkdir('quack')
+        transport = transport.clone('quack')
+        branch = self.make_remote_branch(transport, client)
+        self.assertEqual({b'null:': (0,), b'merged': (1, 1, 2)},
+                         branch.revision_ids_to_dotted_revnos(
+                             [b'null:', b'unknown', b'merged']))
+        self.assertFinished(client)
+
+    def test_revision_ids_to_dotted_revnos_pipelined(self):
+        self.setup_smart_server_with_call_log()
+        builder = self.make_branch_builder('foo')
+        builder.start_series()
+        builder.build_snapshot(None, [
+            ('add', ('', b'root-id', 'directory', ''))],
+            revision_id=b'rev-1')
+        builder.build_snapshot([b'rev-1'], [], revision_id=b'rev-2')
+        builder.finish_series()
+        branch = Branch.open(self.get_url('foo'))
+        self.addCleanup(branch.lock_read().unlock)
+        self.reset_smart_call_log()
+        self.assertEqual({b'rev-1': (1,), b'rev-2': (2,)},
+                         branch.revision_ids_to_dotted_revnos(
+                             [b'rev-1', b'unknown', b'rev-2']))
+        self.assertLength(3, self.hpss_calls)
+        # The medium is usable again once all responses have been read.
+        self.assertEqual((2,), branch.revision_id_to_dotted_revno(b'rev-2'))
+
 
 class TestBzrDirGetSetConfig(RemoteBzrDirTestCase):
 
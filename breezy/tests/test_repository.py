@@ -49,6 +49,7 @@ from breezy.tests import (
     TestCaseWithTransport,
     )
 from breezy import (
+    config,
     controldir,
     errors,
     osutils,
@@ -1648,6 +1649,73 @@ class TestGCCHKPacker(TestCaseWithTransport):
         self.assertContainsRe(str(e),
                               r"We are missing inventories for revisions: .*'A'")
 
+    def test_pack_with_jobs(self):
+        b = self.make_abc_branch()
+        repo = b.repository
+        repo.lock_write()
+        self.addCleanup(repo.unlock)
+        repo._pack_collection.config_stack.set('repository.pack_jobs', 2)
+        # Give the workers a batch per file id
+        self.overrideAttr(groupcompress_repo.GCCHKPacker,
+                          '_text_batch_size', 1)
+
+        def texts():
+            return dict((record.key, record.get_bytes_as('fulltext'))
+                        for record in repo.texts.get_record_stream(
+                            repo.texts.keys(), 'unordered', True))
+        expected = texts()
+        self.assertLength(4, expected)
+        repo.pack()
+        self.assertLength(1, repo._pack_collection.names())
+        self.assertEqual(expected, texts())
+
+
+class TestIndexBloomFilters(TestCaseWithTransport):
+
+    def bloom_names(self, transport):
+        return sorted(name for name in transport.list_dir('.')
+                      if name.endswith('.bloom'))
+
+    def test_filters_written_and_used(self):
+        config.GlobalStack().set('repository.index_bloom_filters', True)
+        tree = self.make_branch_and_tree('.', format='2a')
+        rev1 = tree.commit('one')
+        rev2 = tree.commit('two')
+        repo = tree.branch.repository
+        packs = repo._pack_collection
+        self.assertEqual(
+            sorted(name + suffix + '.bloom' for name in packs.names()
+                   for suffix in ['.cix', '.iix', '.rix', '.six', '.tix']),
+            self.bloom_names(packs._index_transport))
+        repo = repository.Repository.open('.')
+        repo.lock_read()
+        self.addCleanup(repo.unlock)
+        packs = repo._pack_collection
+        packs.ensure_loaded()
+        for pack in packs.all_packs():
+            self.assertIsNot(None, pack.revision_index._get_bloom_filter())
+        self.assertEqual({rev1, rev2},
+                         set(repo.get_parent_map([rev1, rev2, b'missing'])))
+
+    def test_filters_obsoleted_with_packs(self):
+        config.GlobalStack().set('repository.index_bloom_filters', True)
+        tree = self.make_branch_and_tree('.', format='2a')
+        tree.commit('one')
+        tree.commit('two')
+        repo = tree.branch.repository
+        repo.pack(clean_obsolete_packs=False)
+        packs = repo._pack_collection
+        self.assertLength(1, packs.names())
+        self.assertLength(5, self.bloom_names(packs._index_transport))
+        self.assertLength(10, self.bloom_names(
+            packs.transport.clone('obsolete_packs')))
+
+    def test_disabled(self):
+        tree = self.make_branch_and_tree('.', format='2a')
+        tree.commit('one')
+        packs = tree.branch.repository._pack_collection
+        self.assertEqual([], self.bloom_names(packs._index_transport))
+
 
 class TestCrossFormatPacks(TestCaseWithTransport):
 
@@ -0,0 +1,319 @@
+# Copyright (C) 2019 Breezy Developers
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Tests for the persistent revno cache of bzr branches."""
+
+from .. import (
+    errors,
+    tests,
+    )
+from ..bzr import (
+    branch as _mod_bzrbranch,
+    revno_cache,
+    )
+
+
+def node_tuples(nodes):
+    return [(n.key, n.merge_depth, n.revno, n.end_of_merge) for n in nodes]
+
+
+class TestRevnoCacheBase(tests.TestCaseWithTransport):
+
+    def make_merged_branch(self):
+        """Make a branch with a merge.
+
+        A-B---D
+           \\ /
+            C
+        """
+        builder = self.make_branch_builder('branch')
+        builder.start_series()
+        builder.build_snapshot(None, [
+            ('add', ('', b'root-id', 'directory', ''))],
+            revision_id=b'A')
+        builder.build_snapshot([b'A'], [], revision_id=b'B')
+        builder.build_snapshot([b'B'], [], revision_id=b'C')
+        builder.build_snapshot([b'B', b'C'], [], revision_id=b'D')
+        builder.finish_series()
+        return builder
+
+    def merge_sort(self, branch, tip):
+        graph = branch.repository.get_known_graph_ancestry([tip])
+        return graph.merge_sort(tip)
+
+
+class TestRevnoCache(TestRevnoCacheBase):
+
+    def write_cache(self, branch, tip_revno, tip):
+        with branch.lock_read():
+            merge_sorted = self.merge_sort(branch, tip)
+        revno_cache.write_revno_cache(
+            branch._transport, tip_revno, tip, merge_sorted)
+        return merge_sorted
+
+    def test_read_written(self):
+        branch = self.make_merged_branch().get_branch()
+        merge_sorted = self.write_cache(branch, 3, b'D')
+        cache = revno_cache.read_revno_cache(branch._transport, b'D')
+        self.assertEqual(b'D', cache.tip)
+        self.assertEqual(node_tuples(merge_sorted),
+                         node_tuples(cache.iter_merge_sorted()))
+        self.assertEqual((2, 1, 1), cache.get_dotted_revno(b'C'))
+        self.assertEqual((3,), cache.get_dotted_revno(b'D'))
+        self.assertEqual(None, cache.get_dotted_revno(b'E'))
+        self.assertEqual(b'C', cache.get_revision_id((2, 1, 1)))
+        self.assertEqual(b'A', cache.get_revision_id((1,)))
+        self.assertEqual(None, cache.get_revision_id((2, 1, 2)))
+
+    def test_read_missing(self):
+        branch = self.make_merged_branch().get_branch()
+        self.assertIs(None,
+                      revno_cache.read_revno_cache(branch._transport, b'D'))
+
+    def test_read_other_tip(self):
+        branch = self.make_merged_branch().get_branch()
+        self.write_cache(branch, 2, b'B')
+        self.assertIs(None,
+                      revno_cache.read_revno_cache(branch._transport, b'D'))
+
+    def test_read_corrupt(self):
+        branch = self.make_merged_branch().get_branch()
+        branch._transport.put_bytes(revno_cache.INDEX_NAME, b'garbage')
+        self.assertIs(None,
+                      revno_cache.read_revno_cache(branch._transport, b'D'))
+
+    def test_extend(self):
+        builder = self.make_merged_branch()
+        builder.build_snapshot([b'D'], [], revision_id=b'E')
+        builder.build_snapshot([b'E'], [], revision_id=b'F')
+        branch = builder.get_branch()
+        self.write_cache(branch, 3, b'D')
+        self.assertTrue(revno_cache.extend_revno_cache(
+            branch._transport, b'D', [b'E']))
+        self.assertTrue(revno_cache.extend_revno_cache(
+            branch._transport, b'E', [b'F']))
+        self.assertIs(None,
+                      revno_cache.read_revno_cache(branch._transport, b'E'))
+        cache = revno_cache.read_revno_cache(branch._transport, b'F')
+        with branch.lock_read():
+            self.assertEqual(node_tuples(self.merge_sort(branch, b'F')),
+                             node_tuples(cache.iter_merge_sorted()))
+        self.assertEqual((5,), cache.get_dotted_revno(b'F'))
+        self.assertEqual(b'E', cache.get_revision_id((4,)))
+        self.assertEqual(None, cache.get_revision_id((6,)))
+        self.assertEqual(b'C', cache.get_revision_id((2, 1, 1)))
+
+    def test_extend_other_tip(self):
+        branch = self.make_merged_branch().get_branch()
+        self.write_cache(branch, 3, b'D')
+        self.assertFalse(revno_cache.extend_revno_cache(
+            branch._transport, b'C', [b'E']))
+        self.assertFalse(branch._transport.has(revno_cache.TAIL_NAME))
+
+    def test_write_drops_tail(self):
+        builder = self.make_merged_branch()
+        builder.build_snapshot([b'D'], [], revision_id=b'E')
+        branch = builder.get_branch()
+        self.write_cache(branch, 3, b'D')
+        revno_cache.extend_revno_cache(branch._transport, b'D', [b'E'])
+        self.write_cache(branch, 4, b'E')
+        self.assertFalse(branch._transport.has(revno_cache.TAIL_NAME))
+        cache = revno_cache.read_revno_cache(branch._transport, b'E')
+        self.assertEqual((4,), cache.get_dotted_revno(b'E'))
+
+
+class TestFindLinearExtension(TestRevnoCacheBase):
+
+    def find(self, old_revno, old_tip, new_revno, new_tip):
+        builder = self.make_merged_branch()
+        builder.build_snapshot([b'D'], [], revision_id=b'E')
+        builder.build_snapshot([b'E'], [], revision_id=b'F')
+        repository = builder.get_branch().repository
+        with repository.lock_read():
+            return revno_cache.find_linear_extension(
+                repository, old_revno, old_tip, new_revno, new_tip)
+
+    def test_linear(self):
+        self.assertEqual([b'E', b'F'], self.find(3, b'D', 5, b'F'))
+
+    def test_merge(self):
+        self.assertIs(None, self.find(2, b'B', 5, b'F'))
+
+    def test_not_an_ancestor(self):
+        self.assertIs(None, self.find(3, b'C', 5, b'F'))
+
+    def test_wrong_revno(self):
+        self.assertIs(None, self.find(3, b'D', 4, b'F'))
+
+    def test_backwards(self):
+        self.assertIs(None, self.find(5, b'F', 3, b'D'))
+
+    def test_from_null(self):
+        self.assertIs(None, self.find(0, b'null:', 1, b'A'))
+
+
+class TestBzrBranchRevnoCache(TestRevnoCacheBase):
+
+    def setUp(self):
+        super(TestBzrBranchRevnoCache, self).setUp()
+        self.overrideAttr(_mod_bzrbranch.BzrBranch,
+                          '_revno_cache_min_revisions', 0)
+
+    def count_ancestry_walks(self, branch):
+        calls = []
+        orig = branch.repository.get_known_graph_ancestry
+
+        def get_known_graph_ancestry(revision_ids):
+            calls.append(revision_ids)
+            return orig(revision_ids)
+        branch.repository.get_known_graph_ancestry = get_known_graph_ancestry
+        return calls
+
+    def test_written_on_tip_change(self):
+        branch = self.make_merged_branch().get_branch()
+        self.assertTrue(branch._transport.has(revno_cache.INDEX_NAME))
+        cache = revno_cache.read_revno_cache(branch._transport, b'D')
+        with branch.lock_read():
+            self.assertEqual(node_tuples(self.merge_sort(branch, b'D')),
+                             node_tuples(cache.iter_merge_sorted()))
+
+    def test_merge_sort_is_cached(self):
+        branch = self.make_merged_branch().get_branch()
+        with branch.lock_read():
+            expected = self.merge_sort(branch, b'D')
+        calls = self.count_ancestry_walks(branch)
+        with branch.lock_read():
+            self.assertEqual(
+                node_tuples(expected),
+                [(r[0], r[1], r[2], r[3])
+                 for r in branch.iter_merge_sorted_revisions()])
+            self.assertEqual((2, 1, 1),
+                             branch.revision_id_to_dotted_revno(b'C'))
+            self.assertEqual(b'C',
+                             branch.dotted_revno_to_revision_id((2, 1, 1)))
+            self.assertEqual((0,),
+                             branch.revision_id_to_dotted_revno(b'null:'))
+            self.assertRaises(errors.NoSuchRevision,
+                              branch.revision_id_to_dotted_revno, b'X')
+            self.assertRaises(errors.NoSuchRevision,
+                              branch.dotted_revno_to_revision_id, (2, 2, 1))
+        self.assertEqual([], calls)
+
+    def test_small_ancestry_not_cached(self):
+        self.overrideAttr(_mod_bzrbranch.BzrBranch,
+                          '_revno_cache_min_revisions', 5)
+        branch = self.make_merged_branch().get_branch()
+        self.assertFalse(branch._transport.has(revno_cache.INDEX_NAME))
+        with branch.lock_write():
+            list(branch.iter_merge_sorted_revisions())
+        self.assertFalse(branch._transport.has(revno_cache.INDEX_NAME))
+
+    def test_absent_tip_not_cached(self):
+        branch = self.make_branch('branch')
+        branch.set_last_revision_info(1, b'absent')
+        self.assertFalse(branch._transport.has(revno_cache.INDEX_NAME))
+
+    def test_missing_cache_not_written_under_read_lock(self):
+        branch = self.make_merged_branch().get_branch()
+        branch._transport.delete(revno_cache.INDEX_NAME)
+        branch = branch.controldir.open_branch()
+        with branch.lock_read():
+            expected = list(branch.iter_merge_sorted_revisions())
+        self.assertFalse(branch._transport.has(revno_cache.INDEX_NAME))
+        branch = branch.controldir.open_branch()
+        with branch.lock_write():
+            self.assertEqual(expected,
+                             list(branch.iter_merge_sorted_revisions()))
+        self.assertTrue(branch._transport.has(revno_cache.INDEX_NAME))
+
+    def test_commit_extends_cache(self):
+        builder = self.make_merged_branch()
+        branch = builder.get_branch()
+        builder.build_snapshot([b'D'], [], revision_id=b'E')
+        self.assertTrue(branch._transport.has(revno_cache.TAIL_NAME))
+        branch = branch.controldir.open_branch()
+        calls = self.count_ancestry_walks(branch)
+        with branch.lock_read():
+            self.assertEqual((4,), branch.revision_id_to_dotted_revno(b'E'))
+            self.assertEqual(b'E', branch.dotted_revno_to_revision_id((4,)))
+            self.assertEqual(
+                [b'E', b'D', b'C', b'B', b'A'],
+                [r[0] for r in branch.iter_merge_sorted_revisions()])
+        self.assertEqual([], calls)
+
+    def test_merge_rewrites_cache(self):
+        builder = self.make_merged_branch()
+        branch = builder.get_branch()
+        builder.build_snapshot([b'D'], [], revision_id=b'E')
+        builder.build_snapshot([b'D'], [], revision_id=b'F')
+        builder.build_snapshot([b'E', b'F'], [], revision_id=b'G')
+        self.assertFalse(branch._transport.has(revno_cache.TAIL_NAME))
+        branch = branch.controldir.open_branch()
+        calls = self.count_ancestry_walks(branch)
+        with branch.lock_read():
+            self.assertEqual((3, 1, 1),
+                             branch.revision_id_to_dotted_revno(b'F'))
+            expected = self.merge_sort(branch, b'G')
+        cache = revno_cache.read_revno_cache(branch._transport, b'G')
+        self.assertEqual(node_tuples(expected),
+                         node_tuples(cache.iter_merge_sorted()))
+        # Only the walk made by the test itself
+        self.assertEqual([[b'G']], calls)
+
+    def test_uncommit_rewrites_cache(self):
+        builder = self.make_merged_branch()
+        branch = builder.get_branch()
+        builder.build_snapshot([b'D'], [], revision_id=b'E')
+        branch.set_last_revision_info(3, b'D')
+        self.assertIsNot(
+            None, revno_cache.read_revno_cache(branch._transport, b'D'))
+
+
+class TestRevnoCacheBlackbox(tests.TestCaseWithTransport):
+
+    def setUp(self):
+        super(TestRevnoCacheBlackbox, self).setUp()
+        self.overrideAttr(_mod_bzrbranch.BzrBranch,
+                          '_revno_cache_min_revisions', 5)
+
+    def make_branch_with_merge(self):
+        tree = self.make_branch_and_tree('trunk')
+        for i in range(3):
+            tree.commit('trunk %d' % i)
+        other = tree.controldir.sprout('other').open_workingtree()
+        other.commit('other 1')
+        other.commit('other 2')
+        tree.merge_from_branch(other.branch)
+        tree.commit('merge')
+        return tree.branch
+
+    def test_log_and_revision_info_use_cache(self):
+        branch = self.make_branch_with_merge()
+        self.assertTrue(branch._transport.has(revno_cache.INDEX_NAME))
+        walks = []
+        orig = _mod_bzrbranch.Branch._gen_merge_sorted_revisions
+
+        def _gen_merge_sorted_revisions(self):
+            walks.append(self)
+            return orig(self)
+        self.overrideAttr(_mod_bzrbranch.Branch,
+                          '_gen_merge_sorted_revisions',
+                          _gen_merge_sorted_revisions)
+        out, err = self.run_bzr('log -n0 --line trunk')
+        self.assertContainsRe(out, '3.1.2: .* other 2')
+        out, err = self.run_bzr('revision-info -d trunk 3.1.1')
+        self.assertStartsWith(out, '3.1.1 ')
+        self.assertEqual([], walks)
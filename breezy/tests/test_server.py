@@ -256,7 +256,7 @@ class TestThread(cethread.CatchingExceptionThread):
         serving a client connection is hung.
         """
         super(TestThread, self).join(timeout)
-        if timeout and self.isAlive():
+        if timeout and self.is_alive():
             # The timeout expired without joining the thread, the thread is
             # therefore stucked and that's a failure as far as the test is
             # concerned. We used to hang here.
@@ -469,6 +469,143 @@ class Test_SFTPReadvHelper(tests.TestCase):
             data, [(0, 1), (10, 1), (4, 3), (1, 3)])
 
 
+class FakeSFTPClient(object):
+    """An object that acts like Paramiko's SFTPClient for async requests.
+
+    The responses are the requests' arguments, or an error status for the
+    requests whose first argument is 'error'.
+    """
+
+    def __init__(self):
+        self.requests = []
+        self.outstanding = []
+        self.max_outstanding = 0
+
+    def _async_request(self, fileobj, t, *args):
+        num = len(self.requests)
+        self.requests.append((t, args))
+        self.outstanding.append((fileobj, num))
+        self.max_outstanding = max(self.max_outstanding,
+                                   len(self.outstanding))
+        return num
+
+    def _read_response(self, waitfor=None):
+        fileobj, num = self.outstanding.pop(0)
+        t, args = self.requests[num]
+        if args[0] == 'error':
+            fileobj._async_response(_mod_sftp.CMD_STATUS, args, num)
+        else:
+            fileobj._async_response(t, args, num)
+        return None, None
+
+    def _convert_status(self, msg):
+        raise IOError('%s %d' % msg)
+
+
+class Test_SFTPRequestWindow(tests.TestCase):
+
+    def setUp(self):
+        super(Test_SFTPRequestWindow, self).setUp()
+        self.requireFeature(features.paramiko)
+        self.sftp = FakeSFTPClient()
+
+    def test_outstanding_requests_limited(self):
+        window = _mod_sftp._SFTPRequestWindow(self.sftp, 3)
+        for i in range(10):
+            window.request(_mod_sftp.CMD_WRITE, 'ok', i)
+        self.assertEqual(3, len(self.sftp.outstanding))
+        window.finish()
+        self.assertEqual([], self.sftp.outstanding)
+        self.assertEqual(3, self.sftp.max_outstanding)
+        self.assertEqual(10, len(self.sftp.requests))
+
+    def test_finish_raises_first_error(self):
+        window = _mod_sftp._SFTPRequestWindow(self.sftp, 2)
+        window.request(_mod_sftp.CMD_WRITE, 'ok', 0)
+        window.request(_mod_sftp.CMD_WRITE, 'error', 1)
+        window.request(_mod_sftp.CMD_WRITE, 'error', 2)
+        window.request(_mod_sftp.CMD_WRITE, 'ok', 3)
+        e = self.assertRaises(IOError, window.finish)
+        self.assertEqual('error 1', str(e))
+        self.assertEqual([], self.sftp.outstanding)
+        # The error is only raised once
+        window.finish()
+
+    def test_result(self):
+        window = _mod_sftp._SFTPRequestWindow(self.sftp, 10)
+        first = window.request_result(_mod_sftp.CMD_STAT, 'first', 0)
+        error = window.request_result(_mod_sftp.CMD_STAT, 'error', 1)
+        last = window.request_result(_mod_sftp.CMD_STAT, 'last', 2)
+        # All the requests are sent before waiting for the responses
+        self.assertEqual(3, len(self.sftp.outstanding))
+        self.assertEqual((_mod_sftp.CMD_STAT, ('last', 2)),
+                         window.result(last))
+        self.assertEqual((_mod_sftp.CMD_STAT, ('first', 0)),
+                         window.result(first))
+        self.assertRaises(IOError, window.result, error)
+        # Errors of requests whose result is wanted are not raised again
+        window.finish()
+
+    def test_windowed_file_splits_writes(self):
+        window = _mod_sftp._SFTPRequestWindow(self.sftp, 10)
+        fout = _mod_sftp._SFTPWindowedFile(window, 'handle', 100)
+        fout.write(b'a' * 40000)
+        fout.write(b'b' * 10)
+        self.assertEqual(100 + 40010, fout.offset)
+        fout.close()
+        self.assertEqual(
+            [(_mod_sftp.CMD_WRITE, ('handle', 100, b'a' * 32768)),
+             (_mod_sftp.CMD_WRITE, ('handle', 32868, b'a' * 7232)),
+             (_mod_sftp.CMD_WRITE, ('handle', 40100, b'b' * 10)),
+             (_mod_sftp.CMD_CLOSE, ('handle',))],
+            self.sftp.requests)
+        # Closing again sends nothing
+        fout.close()
+        self.assertEqual(4, len(self.sftp.requests))
+
+
+class SFTPPipelinedRequests(TestCaseWithSFTPServer):
+
+    def get_transport(self, max_outstanding_requests):
+        t = super(SFTPPipelinedRequests, self).get_transport()
+        t._max_outstanding_requests = max_outstanding_requests
+        return t
+
+    def check_append_and_put(self, max_outstanding_requests):
+        t = self.get_transport(max_outstanding_requests)
+        content = b''.join(b'%d\n' % i for i in range(50000))
+        t.put_bytes('put', content)
+        self.assertEqual(content, t.get_bytes('put'))
+        self.assertEqual(0, t.append_bytes('append', content[:40000]))
+        self.assertEqual(40000, t.append_bytes('append', content[40000:],
+                                               mode=0o640))
+        self.assertEqual(content, t.get_bytes('append'))
+        if t._can_roundtrip_unix_modebits():
+            self.assertTransportMode(t, 'append', 0o640)
+        t.put_bytes_non_atomic('dir/non-atomic', content,
+                               create_parent_dir=True)
+        self.assertEqual(content, t.get_bytes('dir/non-atomic'))
+
+    def test_append_and_put(self):
+        self.check_append_and_put(4)
+
+    def test_append_and_put_unpipelined(self):
+        self.check_append_and_put(1)
+
+    def test_has_any(self):
+        t = self.get_transport(2)
+        self.build_tree(['a', 'b/'])
+        self.assertTrue(t.has_any(['x', 'y', 'b', 'z']))
+        self.assertTrue(t.has_any(['a']))
+        self.assertFalse(t.has_any(['x', 'y', 'z']))
+        self.assertFalse(t.has_any([]))
+
+    def test_max_outstanding_requests_config(self):
+        config.GlobalStack().set('sftp.max_outstanding_requests', '7')
+        t = super(SFTPPipelinedRequests, self).get_transport()
+        self.assertEqual(7, t._request_window()._size)
+
+
 class TestUsesAuthConfig(TestCaseWithSFTPServer):
     """Test that AuthenticationConfig can supply default usernames."""
 
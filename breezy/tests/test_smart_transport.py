@@ -757,6 +757,45 @@ class TestSmartClientStreamMediumRequest(tests.TestCase):
         request.finished_reading()
         self.assertRaises(errors.ReadingCompleted, request.read_bytes, None)
 
+    def test_pipelining_allows_next_request(self):
+        output = BytesIO()
+        client_medium = medium.SmartSimplePipesClientMedium(
+            BytesIO(b'12'), output, 'base')
+        client_medium.start_pipelining()
+        request1 = medium.SmartClientStreamMediumRequest(client_medium)
+        request1.accept_bytes(b'a')
+        request1.finished_writing()
+        request2 = medium.SmartClientStreamMediumRequest(client_medium)
+        request2.accept_bytes(b'b')
+        request2.finished_writing()
+        client_medium.stop_pipelining()
+        self.assertEqual(b'ab', output.getvalue())
+        # Responses are read in the order the requests were sent.
+        self.assertRaises(errors.TooManyConcurrentRequests,
+                          request2.read_bytes, 1)
+        self.assertEqual(b'1', request1.read_bytes(1))
+        request1.finished_reading()
+        self.assertEqual(b'2', request2.read_bytes(1))
+        request2.finished_reading()
+        self.assertEqual(None, client_medium._current_request)
+        self.assertEqual(0, len(client_medium._unread_requests))
+
+    def test_new_request_reads_after_pipelined_requests(self):
+        client_medium = medium.SmartSimplePipesClientMedium(
+            BytesIO(b'12'), BytesIO(), 'base')
+        client_medium.start_pipelining()
+        request1 = medium.SmartClientStreamMediumRequest(client_medium)
+        request1.finished_writing()
+        client_medium.stop_pipelining()
+        request2 = medium.SmartClientStreamMediumRequest(client_medium)
+        request2.finished_writing()
+        self.assertIs(request2, client_medium._current_request)
+        self.assertRaises(errors.TooManyConcurrentRequests,
+                          request2.read_bytes, 1)
+        request1.read_bytes(1)
+        request1.finished_reading()
+        self.assertEqual(b'2', request2.read_bytes(1))
+
     def test_reset(self):
         server_sock, client_sock = portable_socket_pair()
         # TODO: Use SmartClientAlreadyConnectedSocketMedium for the versions of
@@ -1273,7 +1312,7 @@ class TestGetProtocolFactoryForBytes(tests.TestCase):
 
 class TestSmartTCPServer(tests.TestCase):
 
-    def make_server(self):
+    def make_server(self, client_timeout=4.0, max_workers=None):
         """Create a SmartTCPServer that we can exercise.
 
         Note: we don't use SmartTCPServer_for_testing because the testing
@@ -1286,7 +1325,8 @@ class TestSmartTCPServer(tests.TestCase):
         :return: (server, server_thread)
         """
         t = _mod_transport.get_transport_from_url('memory:///')
-        server = _mod_server.SmartTCPServer(t, client_timeout=4.0)
+        server = _mod_server.SmartTCPServer(t, client_timeout=client_timeout,
+                                            max_workers=max_workers)
         server._ACCEPT_TIMEOUT = 0.1
         # We don't use 'localhost' because that might be an IPv6 address.
         server.start_server('127.0.0.1', 0)
@@ -1444,6 +1484,92 @@ class TestSmartTCPServer(tests.TestCase):
         client_sock3.close()
         self.shutdown_server_cleanly(server, server_thread)
 
+    def test_get_metrics(self):
+        server, server_thread = self.make_server()
+        client_sock = self.connect_to_server(server)
+        self.say_hello(client_sock)
+        self.assertEqual({'workers': None, 'active': 1, 'queued': 0,
+                          'idle': 0}, server.get_metrics())
+        client_sock.close()
+        self.shutdown_server_cleanly(server, server_thread)
+
+    def wait_for_metrics(self, server, **expected):
+        for i in range(100):
+            metrics = server.get_metrics()
+            if all(metrics[k] == v for k, v in expected.items()):
+                return metrics
+            time.sleep(0.05)
+        self.fail('metrics %r never matched %r' % (metrics, expected))
+
+    def test_worker_pool_serves_more_connections_than_workers(self):
+        self.requireFeature(features.selectors)
+        server, server_thread = self.make_server(max_workers=1)
+        client_socks = [self.connect_to_server(server) for i in range(3)]
+        for client_sock in client_socks:
+            self.say_hello(client_sock)
+        for client_sock in reversed(client_socks):
+            self.say_hello(client_sock)
+        self.assertEqual([], server._active_connections)
+        metrics = self.wait_for_metrics(server, idle=3)
+        self.assertEqual(
+            {'workers': 1, 'active': 0, 'queued': 0, 'idle': 3,
+             'connections_served': 3, 'requests_served': 6}, metrics)
+        for client_sock in client_socks:
+            client_sock.close()
+        self.wait_for_metrics(server, idle=0)
+        self.shutdown_server_cleanly(server, server_thread)
+
+    def test_worker_pool_serves_pipelined_requests(self):
+        self.requireFeature(features.selectors)
+        server, server_thread = self.make_server(max_workers=1)
+        client_sock = self.connect_to_server(server)
+        client_medium = medium.SmartClientAlreadyConnectedSocketMedium(
+            'base', client_sock)
+        client_medium._protocol_version = 3
+        smart_client = client._SmartClient(client_medium)
+        self.assertEqual(
+            [(b'ok', b'2')] * 3,
+            list(smart_client.call_pipelined([(b'hello', ())] * 3)))
+        client_sock.close()
+        self.shutdown_server_cleanly(server, server_thread)
+
+    def test_worker_pool_disconnects_idle_clients(self):
+        self.requireFeature(features.selectors)
+        server, server_thread = self.make_server(client_timeout=0.1,
+                                                 max_workers=1)
+        client_sock = self.connect_to_server(server)
+        self.say_hello(client_sock)
+        # The server hangs up once the client has been idle for too long.
+        self.assertEqual(b'', client_sock.recv(1))
+        self.wait_for_metrics(server, idle=0)
+        self.shutdown_server_cleanly(server, server_thread)
+
+    def test_worker_pool_without_client_timeout(self):
+        self.requireFeature(features.selectors)
+        pool = _mod_server._SmartServerWorkerPool(1, None)
+        pool.start()
+        self.addCleanup(pool.join)
+        self.addCleanup(pool.stop_gracefully)
+        server_sock, client_sock = socket.socketpair()
+        self.addCleanup(client_sock.close)
+        t = _mod_transport.get_transport_from_url('memory:///')
+        pool.add_connection(medium.SmartServerSocketStreamMedium(
+            server_sock, t, timeout=4.0))
+        self.say_hello(client_sock)
+        self.say_hello(client_sock)
+        self.wait_for_metrics(pool, idle=1, requests_served=2)
+        client_sock.close()
+        self.wait_for_metrics(pool, idle=0)
+
+    def test_worker_pool_graceful_shutdown_disconnects_idle_clients(self):
+        self.requireFeature(features.selectors)
+        server, server_thread = self.make_server(max_workers=2)
+        client_sock = self.connect_to_server(server)
+        self.say_hello(client_sock)
+        self.shutdown_server_cleanly(server, server_thread)
+        self.assertEqual(b'', client_sock.recv(1))
+        self.assertTrue(server._fully_stopped.isSet())
+
     def test_graceful_shutdown_waits_for_clients_to_stop(self):
         server, server_thread = self.make_server()
         # We need something big enough that it won't fit in a single recv. So
@@ -3781,6 +3907,86 @@ class Test_SmartClient(tests.TestCase):
         # encoder.
 
 
+class Test_SmartClientPipelined(tests.TestCase):
+
+    def make_response(self, response):
+        response_io = BytesIO()
+        responder = protocol.ProtocolThreeResponder(response_io.write)
+        responder.send_response(response)
+        return response_io.getvalue()
+
+    def make_client(self, responses, protocol_version=3):
+        input = BytesIO(b''.join(map(self.make_response, responses)))
+        output = BytesIO()
+        client_medium = medium.SmartSimplePipesClientMedium(
+            input, output, 'base')
+        client_medium._protocol_version = protocol_version
+        return output, client._SmartClient(client_medium)
+
+    def test_call_pipelined(self):
+        output, smart_client = self.make_client([
+            _mod_request.SuccessfulSmartServerResponse((b'ok', b'1')),
+            _mod_request.FailedSmartServerResponse((b'NoSuchFile', b'b')),
+            _mod_request.SuccessfulSmartServerResponse((b'ok', b'3'))])
+        smart_client._max_pipelined_requests = 2
+        results = smart_client.call_pipelined(
+            [(b'get', (b'a',)), (b'get', (b'b',)), (b'get', (b'c',))])
+        self.assertEqual((b'ok', b'1'), next(results))
+        # Two requests were sent before the first response was read
+        self.assertEqual(2, output.getvalue().count(b'get'))
+        err = next(results)
+        self.assertIsInstance(err, errors.ErrorFromSmartServer)
+        self.assertEqual((b'NoSuchFile', b'b'), err.error_tuple)
+        self.assertEqual((b'ok', b'3'), next(results))
+        self.assertRaises(StopIteration, next, results)
+        self.assertEqual(0, len(smart_client._medium._unread_requests))
+
+    def test_call_pipelined_closed_early(self):
+        output, smart_client = self.make_client([
+            _mod_request.SuccessfulSmartServerResponse((b'ok', b'1')),
+            _mod_request.SuccessfulSmartServerResponse((b'ok', b'2')),
+            _mod_request.SuccessfulSmartServerResponse((b'ok', b'3'))])
+        results = smart_client.call_pipelined(
+            [(b'get', (b'a',)), (b'get', (b'b',))])
+        self.assertEqual((b'ok', b'1'), next(results))
+        results.close()
+        # The outstanding response was consumed, so the next call gets its
+        # own response.
+        self.assertEqual((b'ok', b'3'), smart_client.call(b'get', b'c'))
+
+    def test_call_pipelined_reads_past_response(self):
+        # Like a socket, this stream returns whatever is available rather
+        # than the number of bytes asked for.
+        class GreedyBytesIO(BytesIO):
+            def read(self, size=-1):
+                return BytesIO.read(self)
+        input = GreedyBytesIO(b''.join(map(self.make_response, [
+            _mod_request.SuccessfulSmartServerResponse((b'ok', b'1')),
+            _mod_request.SuccessfulSmartServerResponse((b'ok', b'2'))])))
+        client_medium = medium.SmartSimplePipesClientMedium(
+            input, BytesIO(), 'base')
+        client_medium._protocol_version = 3
+        smart_client = client._SmartClient(client_medium)
+        self.assertEqual(
+            [(b'ok', b'1'), (b'ok', b'2')],
+            list(smart_client.call_pipelined(
+                [(b'get', (b'a',)), (b'get', (b'b',))])))
+
+    def test_call_pipelined_protocol_two(self):
+        input = BytesIO(
+            b'bzr response 2\nsuccess\nok\x011\n'
+            b'bzr response 2\nsuccess\nok\x012\n')
+        output = BytesIO()
+        client_medium = medium.SmartSimplePipesClientMedium(
+            input, output, 'base')
+        client_medium._protocol_version = 2
+        smart_client = client._SmartClient(client_medium)
+        self.assertEqual(
+            [(b'ok', b'1'), (b'ok', b'2')],
+            list(smart_client.call_pipelined(
+                [(b'get', (b'a',)), (b'get', (b'b',))])))
+
+
 class Test_SmartClientRequest(tests.TestCase):
 
     def make_client_with_failing_medium(self, fail_at_write=True, response=b''):
@@ -22,6 +22,7 @@ import sys
 import threading
 
 from .. import (
+    config,
     errors,
     osutils,
     tests,
@@ -230,6 +231,127 @@ class TestCoalesceOffsets(tests.TestCase):
             max_size=1 * 1024 * 1024 * 1024)
 
 
+class TestReadvEstimate(tests.TestCase):
+
+    def make_estimate(self, latency, bandwidth, sizes):
+        estimate = transport._ReadvEstimate()
+        for size in sizes:
+            estimate.record(size, latency + float(size) / bandwidth)
+        return estimate
+
+    def test_no_estimate(self):
+        estimate = transport._ReadvEstimate()
+        self.assertEqual((50, 100), estimate.coalesce_parameters(50, 100))
+        # A single request size doesn't tell latency from bandwidth
+        estimate = self.make_estimate(0.1, 1000000, [4096] * 10)
+        self.assertIs(None, estimate.latency)
+        self.assertEqual((50, 100), estimate.coalesce_parameters(50, 100))
+
+    def test_estimate(self):
+        estimate = self.make_estimate(0.1, 1000000,
+                                      [4096, 65536, 8192, 1024 * 1024])
+        self.assertAlmostEqual(0.1, estimate.latency)
+        self.assertAlmostEqual(1000000, estimate.bandwidth, places=-1)
+        # A round trip is worth reading 100kB
+        limit, fudge_factor = estimate.coalesce_parameters(50, 8192)
+        self.assertAlmostEqual(100000, fudge_factor, delta=10)
+        self.assertEqual(50 * 8, limit)
+        # Unlimited stays unlimited
+        self.assertEqual(0, estimate.coalesce_parameters(0, 128)[0])
+
+    def test_low_latency_keeps_defaults(self):
+        estimate = self.make_estimate(0.0001, 1000000, [4096, 65536, 8192])
+        self.assertEqual((200, 8192), estimate.coalesce_parameters(200, 8192))
+
+    def test_max_fudge_factor(self):
+        estimate = self.make_estimate(1, 100000000, [4096, 65536, 8192])
+        self.assertEqual(estimate.max_fudge_factor,
+                         estimate.coalesce_parameters(0, 0)[1])
+
+    def test_connected_transports_share_estimate(self):
+        t = transport.ConnectedTransport('foo://example.com/')
+        self.assertIsInstance(t._readv_estimate, transport._ReadvEstimate)
+        self.assertIs(t._readv_estimate, t.clone('bar')._readv_estimate)
+        self.assertIs(None, transport.get_transport_from_path(
+            '.')._readv_estimate)
+
+
+class TestTransportWorkers(tests.TestCaseInTempDir):
+
+    def record_calls(self, workers, items):
+        calls = []
+
+        def func(t, item):
+            calls.append((threading.current_thread(), t))
+            return item * 2
+        return calls, list(workers.map(func, items))
+
+    def test_sequential_without_concurrent_clone(self):
+        t = transport.ConnectedTransport('foo://example.com/')
+        with transport.TransportWorkers([t], 4) as workers:
+            calls, results = self.record_calls(workers, ['a', 'b', 'c'])
+        self.assertEqual(['aa', 'bb', 'cc'], results)
+        self.assertEqual([(threading.current_thread(), t)] * 3, calls)
+
+    def test_single_worker_is_sequential(self):
+        t = memory.MemoryTransport()
+        with transport.TransportWorkers([t], 1) as workers:
+            calls, results = self.record_calls(workers, ['a', 'b'])
+        self.assertEqual(['aa', 'bb'], results)
+        self.assertEqual([(threading.current_thread(), t)] * 2, calls)
+
+    def test_concurrent(self):
+        t = memory.MemoryTransport()
+        items = [str(i) for i in range(50)]
+        with transport.TransportWorkers([t], 3) as workers:
+            calls, results = self.record_calls(workers, items)
+        self.assertEqual([i * 2 for i in items], results)
+        threads = set(thread for thread, worker_t in calls)
+        self.assertNotIn(threading.current_thread(), threads)
+        self.assertTrue(len(threads) <= 3)
+        worker_ts = set(worker_t for thread, worker_t in calls)
+        self.assertNotIn(t, worker_ts)
+        self.assertTrue(len(worker_ts) <= 3)
+
+    def test_first_failure_raised(self):
+        t = memory.MemoryTransport()
+        items = ['a', 'b', 'error', 'c', 'other error'] + ['d'] * 20
+        with transport.TransportWorkers([t], 3) as workers:
+            results = []
+            e = self.assertRaises(ValueError, lambda: results.extend(
+                workers.map(lambda t, item: self.fail_on(item), items)))
+        self.assertEqual('error', str(e))
+        self.assertEqual(['a', 'b'], results)
+
+    def fail_on(self, item):
+        if 'error' in item:
+            raise ValueError(item)
+        return item
+
+    def test_stopped_iteration_stops_workers(self):
+        t = memory.MemoryTransport()
+        before = threading.active_count()
+        with transport.TransportWorkers([t], 3) as workers:
+            results = workers.map(lambda t, item: item, range(100))
+            self.assertEqual([0, 1], [next(results), next(results)])
+            results.close()
+        self.assertEqual(before, threading.active_count())
+
+    def test_copy_to_concurrently(self):
+        config.GlobalStack().set('transport.copy_workers', '4')
+        source = memory.MemoryTransport()
+        target = memory.MemoryTransport('memory:///target/')
+        target.ensure_base()
+        files = ['file%d' % i for i in range(20)]
+        for name in files:
+            source.put_bytes(name, name.encode('ascii'))
+        self.assertEqual(20, source.copy_to(files, target))
+        for name in files:
+            self.assertEqual(name.encode('ascii'), target.get_bytes(name))
+        self.assertRaises(errors.NoSuchFile, source.copy_to,
+                          ['file1', 'missing', 'file2'], target)
+
+
 class TestMemoryServer(tests.TestCase):
 
     def test_create_server(self):
@@ -744,6 +744,26 @@ class TestWorkingTreeFormat4(TestCaseWithTransport):
         self.assertEqual(expected_sha1, entry_state[1])
         self.assertEqual(statvalue.st_size, entry_state[2])
 
+    def test_iter_changes_hash_workers(self):
+        tree = self.get_tree_with_cachable_file_foo()
+        tree.commit('a commit')
+        self.build_tree_contents([('foo', b'new content for foo\n')])
+        tree.branch.get_config_stack().set('status.hash_workers', '4')
+        state = tree.current_dirstate()
+        state._cutoff_time = time.time() + 60
+        calls = []
+        orig = state.update_sha1s_in_parallel
+
+        def update_sha1s_in_parallel(root_abspath, paths, workers):
+            calls.append((root_abspath, set(paths), workers))
+            return orig(root_abspath, paths, workers)
+        state.update_sha1s_in_parallel = update_sha1s_in_parallel
+        changes = list(tree.iter_changes(tree.basis_tree()))
+        self.assertEqual([(tree.basedir, {b''}, 4)], calls)
+        self.assertEqual([('foo', 'foo')], [c[1] for c in changes])
+        entry = tree._get_entry(path='foo')
+        self.assertEqual(osutils.sha_file_by_name('foo'), entry[1][0][1])
+
     def test_observed_sha1_new_file(self):
         tree = self.make_branch_and_tree('.')
         self.build_tree(['foo'])
@@ -30,12 +30,20 @@ from __future__ import absolute_import
 
 import errno
 import sys
+import threading
+import time
+try:
+    import queue
+except ImportError:
+    import Queue as queue
 
 from ..lazy_import import lazy_import
 lazy_import(globals(), """
 from stat import S_ISDIR
 
 from breezy import (
+    config,
+    debug,
     errors,
     location as _mod_location,
     osutils,
@@ -47,6 +55,7 @@ from breezy import (
 from ..sixish import (
     BytesIO,
     PY3,
+    reraise,
     string_types,
     )
 from ..trace import (
@@ -198,6 +207,83 @@ class _CoalescedOffset(object):
                                    self.start, self.length, self.ranges)
 
 
+class _ReadvEstimate(object):
+    """A running estimate of the latency and bandwidth seen by readv.
+
+    Each request reading n bytes in t seconds is a sample of
+    t = latency + n / bandwidth, the estimate is a least squares fit of the
+    recent samples (older ones are progressively forgotten).
+
+    The product of the latency and the bandwidth is the amount of data that
+    could have been received while waiting for a round trip: reading that
+    much to bridge the gap between two ranges is cheaper than issuing another
+    request, so it is used as the fudge factor when coalescing offsets.
+    """
+
+    # How much of the previous samples is kept for each new one
+    _decay = 0.9
+    # Never read more than this to bridge a gap
+    max_fudge_factor = 1024 * 1024
+    # How much more ranges can be combined than the transport default
+    max_combine_scale = 8
+
+    def __init__(self):
+        self.latency = None
+        self.bandwidth = None
+        # Decayed sums of the weights, sizes, times, squared sizes and
+        # sizes times times of the samples.
+        self._sums = [0.0] * 5
+
+    def record(self, num_bytes, elapsed):
+        """Record a request.
+
+        :param num_bytes: The number of bytes received.
+        :param elapsed: The time taken from issuing the request to receiving
+            the last byte.
+        """
+        sums = self._sums
+        for i, value in enumerate((1.0, num_bytes, elapsed,
+                                   num_bytes * num_bytes,
+                                   num_bytes * elapsed)):
+            sums[i] = sums[i] * self._decay + value
+        weight, size, taken, size2, size_taken = sums
+        mean_size = size / weight
+        mean_taken = taken / weight
+        variance = size2 / weight - mean_size * mean_size
+        covariance = size_taken / weight - mean_size * mean_taken
+        if variance <= 0 or covariance <= 0:
+            # Not enough different sizes yet, or nothing to learn
+            return
+        per_byte = covariance / variance
+        self.bandwidth = 1 / per_byte
+        self.latency = max(0.0, mean_taken - per_byte * mean_size)
+        if 'transport' in debug.debug_flags:
+            limit, fudge_factor = self.coalesce_parameters(0, 0)
+            mutter('readv estimate: latency %.1fms, bandwidth %dkB/s,'
+                   ' fudge factor %d', self.latency * 1000,
+                   self.bandwidth / 1000, fudge_factor)
+
+    def coalesce_parameters(self, limit, fudge_factor):
+        """Adapt the readv coalescing parameters of a transport.
+
+        :param limit: The default maximum number of offsets combined.
+        :param fudge_factor: The default number of bytes worth reading rather
+            than seeking.
+        :return: (limit, fudge_factor) suitable for _coalesce_offsets.
+        """
+        if self.latency is None:
+            return limit, fudge_factor
+        estimated = min(int(self.latency * self.bandwidth),
+                        self.max_fudge_factor)
+        if estimated <= fudge_factor:
+            return limit, fudge_factor
+        if limit > 0:
+            # Bridging larger gaps means combining more offsets
+            scale = estimated // max(fudge_factor, 1)
+            limit *= max(1, min(scale, self.max_combine_scale))
+        return limit, estimated
+
+
 class LateReadError(object):
     """A helper for transports which pretends to be a readable file.
 
@@ -309,6 +395,143 @@ class AppendBasedFileStream(FileStream):
         self.transport.append_bytes(self.relpath, bytes)
 
 
+class TransportWorkers(object):
+    """Run transport operations concurrently, on threads of their own.
+
+    Each worker thread uses its own clones of the transports, as returned by
+    Transport._concurrent_clone(), so that the round trips of operations on
+    different files overlap. If one of the transports can't be used
+    concurrently, or a single worker is asked for, the operations are run in
+    turn in the calling thread with the transports themselves.
+    """
+
+    def __init__(self, transports, workers=None):
+        """Create a new set of workers.
+
+        :param transports: A list of the transports used by the operations.
+        :param workers: The maximum number of operations running at once, by
+            default the 'transport.copy_workers' configuration option.
+        """
+        if workers is None:
+            workers = config.GlobalStack().get('transport.copy_workers')
+        self._transports = tuple(transports)
+        self._workers = workers
+        self._clones = []
+        if self._workers > 1 and self._worker_transports(0) is None:
+            self._workers = 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+    def _worker_transports(self, index):
+        while len(self._clones) <= index:
+            clones = tuple(t._concurrent_clone() for t in self._transports)
+            if None in clones:
+                return None
+            self._clones.append(clones)
+        return self._clones[index]
+
+    def close(self):
+        """Disconnect the transports of the workers."""
+        for clones in self._clones:
+            for t in clones:
+                t.disconnect()
+        self._clones = []
+
+    def map(self, func, items):
+        """Call func(*(transports + (item,))) for each item.
+
+        The items are consumed by the calling thread, a few ahead of the
+        running operations, and the results are yielded in the order of the
+        items. Once an operation failed no new ones are started, the first
+        failure is raised when the running operations are finished and the
+        other failures are logged.
+        """
+        if self._workers <= 1:
+            for item in items:
+                yield func(*(self._transports + (item,)))
+            return
+        tasks = queue.Queue()
+        results = queue.Queue()
+        stopped = threading.Event()
+        skipped = object()
+
+        def work(transports):
+            while True:
+                task = tasks.get()
+                if task is None:
+                    return
+                index, item = task
+                if stopped.is_set():
+                    results.put((index, skipped, None))
+                    continue
+                try:
+                    result = func(*(transports + (item,)))
+                except BaseException:
+                    results.put((index, None, sys.exc_info()))
+                else:
+                    results.put((index, result, None))
+
+        threads = []
+        item_iter = iter(items)
+        exhausted = False
+        submitted = 0
+        next_index = 0
+        done = {}
+        failures = []
+        try:
+            while True:
+                # Keep the workers busy, with a few items waiting for them
+                while (not exhausted and not stopped.is_set()
+                       and submitted - next_index < self._workers * 2):
+                    try:
+                        item = next(item_iter)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    if len(threads) < self._workers:
+                        thread = threading.Thread(
+                            target=work,
+                            args=(self._worker_transports(len(threads)),))
+                        thread.daemon = True
+                        thread.start()
+                        threads.append(thread)
+                    tasks.put((submitted, item))
+                    submitted += 1
+                if next_index == submitted:
+                    break
+                while next_index not in done:
+                    index, result, exc_info = results.get()
+                    if exc_info is not None:
+                        stopped.set()
+                    done[index] = (result, exc_info)
+                result, exc_info = done.pop(next_index)
+                next_index += 1
+                if exc_info is not None:
+                    failures.append(exc_info)
+                elif not failures and result is not skipped:
+                    yield result
+        finally:
+            stopped.set()
+            for thread in threads:
+                tasks.put(None)
+            for thread in threads:
+                thread.join()
+        if failures:
+            for exc_info in failures[1:]:
+                mutter('concurrent transport operation also failed: %s',
+                       exc_info[1])
+            exc_info = failures[0]
+            try:
+                reraise(*exc_info)
+            finally:
+                del exc_info, failures
+
+
 class TransportHooks(hooks.Hooks):
     """Mapping of hook names to registered callbacks for transport hooks"""
 
@@ -337,6 +560,9 @@ class Transport(object):
     #       where the biggest benefit between combining reads and
     #       and seeking is. Consider a runtime auto-tune.
     _bytes_to_read_before_seek = 0
+    # Transports with a significant latency keep a _ReadvEstimate to adapt
+    # the two parameters above
+    _readv_estimate = None
 
     hooks = TransportHooks()
 
@@ -710,9 +936,11 @@ class Transport(object):
         # turn the list of offsets into a stack
         offset_stack = iter(offsets)
         cur_offset_and_size = next(offset_stack)
+        limit, fudge_factor = self._coalesce_parameters()
         coalesced = self._coalesce_offsets(sorted_offsets,
-                                           limit=self._max_readv_combine,
-                                           fudge_factor=self._bytes_to_read_before_seek)
+                                           limit=limit,
+                                           fudge_factor=fudge_factor)
+        estimate = self._readv_estimate
 
         # Cache the results, but only until they have been fulfilled
         data_map = {}
@@ -721,8 +949,12 @@ class Transport(object):
                 # TODO: jam 20060724 it might be faster to not issue seek if
                 #       we are already at the right location. This should be
                 #       benchmarked.
+                if estimate is not None:
+                    start = time.time()
                 fp.seek(c_offset.start)
                 data = fp.read(c_offset.length)
+                if estimate is not None:
+                    estimate.record(len(data), time.time() - start)
                 if len(data) < c_offset.length:
                     raise errors.ShortReadvError(relpath, c_offset.start,
                                                  c_offset.length, actual=len(data))
@@ -802,6 +1034,20 @@ class Transport(object):
         offsets.append((current_offset, current_length))
         return offsets
 
+    def _coalesce_parameters(self):
+        """Get the limit and fudge factor to use for coalescing offsets.
+
+        These are _max_readv_combine and _bytes_to_read_before_seek, adapted
+        to the latency and bandwidth measured by previous reads if the
+        transport keeps an estimate.
+
+        :return: (limit, fudge_factor)
+        """
+        if self._readv_estimate is None:
+            return self._max_readv_combine, self._bytes_to_read_before_seek
+        return self._readv_estimate.coalesce_parameters(
+            self._max_readv_combine, self._bytes_to_read_before_seek)
+
     @staticmethod
     def _coalesce_offsets(offsets, limit=0, fudge_factor=0, max_size=0):
         """Yield coalesced offsets.
@@ -1006,16 +1252,25 @@ class Transport(object):
     def copy_to(self, relpaths, other, mode=None, pb=None):
         """Copy a set of entries from self into another Transport.
 
+        The entries are copied concurrently when both transports support it,
+        see TransportWorkers.
+
         :param relpaths: A list/generator of entries to be copied.
         :param mode: This is the target mode for the newly created files
         TODO: This interface needs to be updated so that the target location
               can be different from the source location.
         """
         # The dummy implementation just does a simple get + put
-        def copy_entry(path):
-            other.put_file(path, self.get(path), mode=mode)
+        def copy_entry(source, target, path):
+            target.put_file(path, source.get(path), mode=mode)
 
-        return len(self._iterate_over(relpaths, copy_entry, pb, 'copy_to', expand=False))
+        total = self._get_total(relpaths)
+        count = 0
+        with TransportWorkers([self, other]) as workers:
+            for result in workers.map(copy_entry, relpaths):
+                count += 1
+                self._update_pb(pb, 'copy_to', count, total)
+        return count
 
     def copy_tree(self, from_relpath, to_relpath):
         """Copy a subtree from one relpath to another.
@@ -1039,19 +1294,29 @@ class Transport(object):
         is used as the target.  to_transport.base must exist (and be a
         directory).
         """
+        def list_dir(source, dir):
+            entries = []
+            for path in source.list_dir(dir):
+                path = dir + '/' + path
+                entries.append((path, S_ISDIR(source.stat(path).st_mode)))
+            return entries
+
         files = []
         directories = ['.']
-        while directories:
-            dir = directories.pop()
-            if dir != '.':
-                to_transport.mkdir(dir)
-            for path in self.list_dir(dir):
-                path = dir + '/' + path
-                stat = self.stat(path)
-                if S_ISDIR(stat.st_mode):
-                    directories.append(path)
-                else:
-                    files.append(path)
+        with TransportWorkers([self]) as workers:
+            while directories:
+                # The directories of a level are listed concurrently
+                for dir in directories:
+                    if dir != '.':
+                        to_transport.mkdir(dir)
+                subdirs = []
+                for entries in workers.map(list_dir, directories):
+                    for path, is_dir in entries:
+                        if is_dir:
+                            subdirs.append(path)
+                        else:
+                            files.append(path)
+                directories = subdirs
         self.copy_to(files, to_transport)
 
     def rename(self, rel_from, rel_to):
@@ -1214,6 +1479,17 @@ class Transport(object):
         # several questions about the transport.
         return False
 
+    def _concurrent_clone(self):
+        """Return a clone of this transport usable from another thread.
+
+        The clone must not share any state with this transport that can't be
+        used from several threads at once, like a connection.
+
+        :return: A transport for the same location, or None if this transport
+            can't be used concurrently.
+        """
+        return None
+
     def _reuse_for(self, other_base):
         # This is really needed for ConnectedTransport only, but it's easier to
         # have Transport refuses to be reused than testing that the reuse
@@ -1296,8 +1572,10 @@ class ConnectedTransport(Transport):
         super(ConnectedTransport, self).__init__(base)
         if _from_transport is None:
             self._shared_connection = _SharedConnection()
+            self._readv_estimate = _ReadvEstimate()
         else:
             self._shared_connection = _from_transport._shared_connection
+            self._readv_estimate = _from_transport._readv_estimate
 
     @property
     def _user(self):
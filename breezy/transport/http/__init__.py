@@ -21,12 +21,17 @@ There are separate implementation modules for each http client implementation.
 
 from __future__ import absolute_import
 
+import collections
+import itertools
 import os
 import re
 import sys
+import threading
+import time
 import weakref
 
 from ... import (
+    config,
     debug,
     errors,
     transport,
@@ -34,19 +39,148 @@ from ... import (
     urlutils,
     )
 from ...bzr.smart import medium
+from ...sixish import (
+    BytesIO,
+    )
 from ...trace import mutter
 from ...transport import (
     ConnectedTransport,
     )
 
 # TODO: handle_response should be integrated into the http/__init__.py
-from .response import handle_response
+from .response import (
+    RangeFile,
+    handle_response,
+    )
+from . import _urllib2_wrappers
 from ._urllib2_wrappers import (
     Opener,
     Request,
     )
 
 
+def _weak_report_activity(transport):
+    """Report the activity of the connections opened for transport.
+
+    Connections outlive their transport when they are kept in the connection
+    pool, so they should not keep it alive.
+    """
+    ref = weakref.ref(transport)
+
+    def report_activity(bytes, direction):
+        transport = ref()
+        if transport is None:
+            ui.ui_factory.report_transport_activity(None, bytes, direction)
+        else:
+            transport._report_activity(bytes, direction)
+    return report_activity
+
+
+class _ReadvConnectionPool(object):
+    """Persistent connections used to issue range requests concurrently.
+
+    The pool is shared between a transport and its clones, like the opener.
+    It also decides how many requests a readv issues at once: starting with
+    two, the concurrency grows while the requests spend most of their time
+    waiting for the server to answer and throughput keeps improving, and
+    shrinks back when it stops paying off.
+    """
+
+    def __init__(self, max_connections):
+        self.max_connections = max_connections
+        self.concurrency = min(2, max_connections)
+        self._idle = []
+        self._lock = threading.Lock()
+        self._last_throughput = None
+        self._last_step = 0
+
+    def get(self):
+        """Take an idle connection.
+
+        :return: A connection or None if the opener should create one.
+        """
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return None
+
+    def put(self, connection):
+        """Give back a connection whose response has been fully read."""
+        with self._lock:
+            if len(self._idle) < self.max_connections:
+                self._idle.append(connection)
+                return
+        _urllib2_wrappers.connection_pool.put(connection)
+
+    def close(self):
+        """Close all the idle connections."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
+
+    def record(self, num_bytes, elapsed, waiting):
+        """Adapt the concurrency to the outcome of a readv.
+
+        :param num_bytes: The number of bytes received.
+        :param elapsed: The wall clock time taken by all the requests.
+        :param waiting: The fraction of the time the requests spent waiting
+            for the response headers, i.e. dominated by the round trip.
+        """
+        if elapsed <= 0 or num_bytes == 0:
+            return
+        throughput = num_bytes / elapsed
+        last = self._last_throughput
+        if last is not None and throughput < last * 0.9:
+            # The last change made things worse, undo it
+            step = -self._last_step or -1
+        elif waiting >= 0.5:
+            # Latency bound, more requests in flight should help
+            step = 1
+        elif last is not None and throughput > last * 1.1:
+            # Bandwidth bound but still improving, keep going
+            step = self._last_step
+        else:
+            step = -1
+        old = self.concurrency
+        self.concurrency = max(min(2, self.max_connections),
+                               min(self.max_connections, old + step))
+        self._last_step = self.concurrency - old
+        self._last_throughput = throughput
+        if 'http' in debug.debug_flags:
+            mutter('http readv: %d bytes/s, %.0f%% waiting, concurrency %d',
+                   throughput, waiting * 100, self.concurrency)
+
+
+class _TimedResponseFile(object):
+    """Time the reads from a response file.
+
+    The time spent waiting for the data of a response is accumulated in
+    elapsed, without the time spent by readv callers between two reads.
+    """
+
+    def __init__(self, rfile, elapsed=0.0):
+        self._rfile = rfile
+        self.elapsed = elapsed
+
+    def read(self, size=-1):
+        start = time.time()
+        try:
+            return self._rfile.read(size)
+        finally:
+            self.elapsed += time.time() - start
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        start = time.time()
+        try:
+            return self._rfile.seek(offset, whence)
+        finally:
+            self.elapsed += time.time() - start
+
+    def __getattr__(self, name):
+        return getattr(self._rfile, name)
+
+
 class HttpTransport(ConnectedTransport):
     """HTTP Client implementations.
 
@@ -82,10 +216,18 @@ class HttpTransport(ConnectedTransport):
         if _from_transport is not None:
             self._range_hint = _from_transport._range_hint
             self._opener = _from_transport._opener
+            self._readv_pool = _from_transport._readv_pool
         else:
             self._range_hint = 'multi'
             self._opener = self._opener_class(
-                report_activity=self._report_activity, ca_certs=ca_certs)
+                report_activity=_weak_report_activity(self),
+                ca_certs=ca_certs)
+            max_connections = config.GlobalStack().get(
+                'http.readv_connections')
+            if max_connections is not None and max_connections > 1:
+                self._readv_pool = _ReadvConnectionPool(max_connections)
+            else:
+                self._readv_pool = None
 
     def _perform(self, request):
         """Send the request to the server and handles common errors.
@@ -118,6 +260,10 @@ class HttpTransport(ConnectedTransport):
             # First connection or reconnection
             self._set_connection(request.connection,
                                  (request.auth, request.proxy_auth))
+            # Keep the connection alive for other transports once we and our
+            # clones are done with it
+            _urllib2_wrappers.connection_pool.release_when_unused(
+                self._shared_connection, request.connection)
         else:
             # http may change the credentials while keeping the
             # connection opened
@@ -140,6 +286,8 @@ class HttpTransport(ConnectedTransport):
         connection = self._get_connection()
         if connection is not None:
             connection.close()
+        if self._readv_pool is not None:
+            self._readv_pool.close()
 
     def has(self, relpath):
         """Does the target location exist?
@@ -170,9 +318,20 @@ class HttpTransport(ConnectedTransport):
 
         :returns: (http_code, result_file)
         """
+        abspath, range_header, request = self._get_request(
+            relpath, offsets, tail_amount)
+        response = self._perform(request)
+        return self._get_response(abspath, range_header, response)
+
+    def _get_request(self, relpath, offsets, tail_amount=0):
+        """Build the GET request for a file, or part of a file.
+
+        :returns: (abspath, range_header, request)
+        """
         abspath = self._remote_path(relpath)
         headers = {}
         accepted_errors = [200, 404]
+        range_header = None
         if offsets or tail_amount:
             range_header = self._attempted_range_header(offsets, tail_amount)
             if range_header is not None:
@@ -184,8 +343,13 @@ class HttpTransport(ConnectedTransport):
 
         request = Request('GET', abspath, None, headers,
                           accepted_errors=accepted_errors)
-        response = self._perform(request)
+        return abspath, range_header, request
+
+    def _get_response(self, abspath, range_header, response):
+        """Check the response to a GET request.
 
+        :returns: (http_code, result_file)
+        """
         code = response.code
         if code == 404:  # not found
             raise errors.NoSuchFile(abspath)
@@ -277,9 +441,9 @@ class HttpTransport(ConnectedTransport):
 
             # Coalesce the offsets to minimize the GET requests issued
             sorted_offsets = sorted(offsets)
+            limit, fudge_factor = self._coalesce_parameters()
             coalesced = self._coalesce_offsets(
-                sorted_offsets, limit=self._max_readv_combine,
-                fudge_factor=self._bytes_to_read_before_seek,
+                sorted_offsets, limit=limit, fudge_factor=fudge_factor,
                 max_size=self._get_max_size)
 
             # Turn it into a list, we will iterate it several times
@@ -361,45 +525,184 @@ class HttpTransport(ConnectedTransport):
                 # errors.InvalidHttpRange. It's the caller's responsibility to
                 # decide how to retry since it may provide different coalesced
                 # offsets.
+                start = time.time()
                 code, rfile = self._get(relpath, coalesced)
-                for coal in coalesced:
-                    yield coal, rfile
+                rfile = _TimedResponseFile(rfile, time.time() - start)
+                num_bytes = 0
+                try:
+                    for coal in coalesced:
+                        # Our caller reads the data of coal before asking
+                        # for the next one or stopping.
+                        num_bytes += coal.length
+                        yield coal, rfile
+                finally:
+                    self._readv_estimate.record(num_bytes, rfile.elapsed)
 
         if self._range_hint is None:
             # Download whole file
             for c, rfile in get_and_yield(relpath, coalesced):
                 yield c, rfile
+            return
+        total = len(coalesced)
+        if self._range_hint == 'multi':
+            max_ranges = self._max_get_ranges
+        elif self._range_hint == 'single':
+            max_ranges = total
         else:
-            total = len(coalesced)
-            if self._range_hint == 'multi':
-                max_ranges = self._max_get_ranges
-            elif self._range_hint == 'single':
-                max_ranges = total
-            else:
-                raise AssertionError("Unknown _range_hint %r"
-                                     % (self._range_hint,))
-            # TODO: Some web servers may ignore the range requests and return
-            # the whole file, we may want to detect that and avoid further
-            # requests.
-            # Hint: test_readv_multiple_get_requests will fail once we do that
-            cumul = 0
-            ranges = []
-            for coal in coalesced:
-                if ((self._get_max_size > 0
-                     and cumul + coal.length > self._get_max_size) or
-                        len(ranges) >= max_ranges):
-                    # Get that much and yield
-                    for c, rfile in get_and_yield(relpath, ranges):
-                        yield c, rfile
-                    # Restart with the current offset
-                    ranges = [coal]
-                    cumul = coal.length
-                else:
-                    ranges.append(coal)
-                    cumul += coal.length
-            # Get the rest and yield
-            for c, rfile in get_and_yield(relpath, ranges):
+            raise AssertionError("Unknown _range_hint %r"
+                                 % (self._range_hint,))
+        # TODO: Some web servers may ignore the range requests and return
+        # the whole file, we may want to detect that and avoid further
+        # requests.
+        # Hint: test_readv_multiple_get_requests will fail once we do that
+        pool = self._readv_pool
+        if pool is None:
+            groups = self._group_coalesced(coalesced, max_ranges)
+        else:
+            groups = self._group_coalesced(coalesced, max_ranges,
+                                           pool.concurrency)
+            if groups and self._get_connection() is None:
+                # The pooled requests reuse the credentials established by
+                # the shared connection, so the first request goes there.
+                for c, rfile in get_and_yield(relpath, groups.pop(0)):
+                    yield c, rfile
+        if pool is not None and len(groups) > 1:
+            for c, rfile in self._get_groups_concurrently(relpath, groups):
                 yield c, rfile
+        else:
+            for group in groups:
+                for c, rfile in get_and_yield(relpath, group):
+                    yield c, rfile
+
+    def _group_coalesced(self, coalesced, max_ranges, parts=1):
+        """Split coalesced offsets into the groups requested by each GET.
+
+        :param coalesced: A list of _CoalescedOffset.
+        :param max_ranges: The maximum number of offsets in a group.
+        :param parts: The number of groups the data should at least be spread
+            over, so that they can be requested concurrently.
+        :return: A list of lists of _CoalescedOffset.
+        """
+        max_size = self._get_max_size
+        if parts > 1:
+            total = sum(coal.length for coal in coalesced)
+            target = -(-total // parts)
+            if max_size <= 0 or target < max_size:
+                max_size = target
+        groups = []
+        cumul = 0
+        ranges = []
+        for coal in coalesced:
+            if ranges and ((max_size > 0 and cumul + coal.length > max_size)
+                           or len(ranges) >= max_ranges):
+                groups.append(ranges)
+                ranges = []
+                cumul = 0
+            ranges.append(coal)
+            cumul += coal.length
+        if ranges:
+            groups.append(ranges)
+        return groups
+
+    def _get_groups_concurrently(self, relpath, groups):
+        """Issue the GET requests for several groups concurrently.
+
+        The requests are spread over the connections of the readv pool and
+        the results are yielded in the order of the groups. At most
+        pool.concurrency requests are in flight, the next one is only issued
+        when the oldest has been received, so that no more groups are
+        downloaded once the caller stops iterating.
+
+        :param groups: A list of lists of _CoalescedOffset as returned by
+            _group_coalesced.
+        """
+        from multiprocessing.pool import ThreadPool
+        pool = self._readv_pool
+        concurrency = min(pool.concurrency, len(groups))
+        workers = ThreadPool(concurrency)
+        remaining = iter(groups)
+        pending = collections.deque()
+
+        def submit(n):
+            for group in itertools.islice(remaining, n):
+                pending.append(workers.apply_async(
+                    self._get_group, (relpath, group)))
+        start = time.time()
+        received = waiting = busy = num_bytes = 0
+        try:
+            submit(concurrency)
+            while pending:
+                (results, group_waiting, group_busy,
+                 group_bytes) = pending.popleft().get()
+                submit(1)
+                received += 1
+                self._readv_estimate.record(group_bytes, group_busy)
+                waiting += group_waiting
+                busy += group_busy
+                num_bytes += group_bytes
+                if received == len(groups) and busy > 0:
+                    # Our caller may stop as soon as it has the last offset
+                    pool.record(num_bytes, time.time() - start,
+                                waiting / busy)
+                for c, rfile in results:
+                    yield c, rfile
+        finally:
+            # Only waits for the requests already in flight
+            workers.close()
+            workers.join()
+
+    def _get_group(self, relpath, group):
+        """Get a group of coalesced offsets on a pooled connection.
+
+        The data is read before the connection is given back to the pool, the
+        caller can then consume the results at its own pace.
+
+        :returns: (results, waiting, busy, num_bytes) where results is a list
+            of (_CoalescedOffset, file) and waiting is the part of the busy
+            time spent before the response headers were received.
+        """
+        abspath, range_header, request = self._get_request(relpath, group)
+        start = time.time()
+        try:
+            response = self._perform_pooled(request)
+            waiting = time.time() - start
+            code, rfile = self._get_response(abspath, range_header, response)
+            results = []
+            num_bytes = 0
+            for coal in group:
+                rfile.seek(coal.start, os.SEEK_SET)
+                data = rfile.read(coal.length)
+                num_bytes += len(data)
+                coal_file = RangeFile(abspath, BytesIO(data))
+                coal_file.set_range(coal.start, len(data))
+                results.append((coal, coal_file))
+            request.connection.cleanup_pipe()
+        except BaseException:
+            if request.connection is not None:
+                request.connection.close()
+            raise
+        self._readv_pool.put(request.connection)
+        return results, waiting, time.time() - start, num_bytes
+
+    def _perform_pooled(self, request):
+        """Send the request on a connection taken from the readv pool.
+
+        Unlike _perform, the connection shared with clones is left alone so
+        that several requests can be in flight at once. The credentials
+        established on the shared connection are reused.
+
+        :returns: urllib2 Response object
+        """
+        request.connection = self._readv_pool.get()
+        (request.auth, request.proxy_auth) = self._get_credentials()
+        response = self._opener.open(request)
+        code = response.code
+        if (request.follow_redirections is False
+                and code in (301, 302, 303, 307)):
+            raise errors.RedirectRequested(request.get_full_url(),
+                                           request.redirected_to,
+                                           is_permanent=(code == 301))
+        return response
 
     def recommended_page_size(self):
         """See Transport.recommended_page_size().
@@ -69,7 +69,9 @@ except ImportError:
 import re
 import ssl
 import sys
+import threading
 import time
+import weakref
 
 from ... import __version__ as breezy_version
 from ... import (
@@ -417,6 +419,15 @@ class AbstractHTTPConnection:
         """Wrap the socket before anybody use it."""
         self.sock = _ReportingSocket(sock, self._report_activity)
 
+    def set_report_activity(self, report_activity):
+        """Report the activity from now on to report_activity.
+
+        This is used when a pooled connection is reused by another transport.
+        """
+        self._report_activity = report_activity
+        if isinstance(self.sock, _ReportingSocket):
+            self.sock._report_activity = report_activity
+
 
 class HTTPConnection(AbstractHTTPConnection, http_client.HTTPConnection):
 
@@ -433,6 +444,7 @@ class HTTPConnection(AbstractHTTPConnection, http_client.HTTPConnection):
         # ca_certs is ignored, it's only relevant for https
 
     def connect(self):
+        connection_pool.connected(self)
         if 'http' in debug.debug_flags:
             self._mutter_connect()
         http_client.HTTPConnection.connect(self)
@@ -456,6 +468,7 @@ class HTTPSConnection(AbstractHTTPConnection, http_client.HTTPSConnection):
         self.ca_certs = ca_certs
 
     def connect(self):
+        connection_pool.connected(self)
         if 'http' in debug.debug_flags:
             self._mutter_connect()
         http_client.HTTPConnection.connect(self)
@@ -606,6 +619,113 @@ class _ConnectRequest(Request):
         urllib_request.Request.set_proxy(self, proxy, type)
 
 
+class ConnectionPool(object):
+    """Idle connections kept alive for reuse by later requests.
+
+    Connections are keyed by their class, host and proxy. A connection comes
+    back here when the transports sharing it are garbage collected and is
+    handed to the next request needing a new connection to the same host,
+    saving the TCP (and TLS) handshakes. Connections left idle for longer
+    than idle_timeout are closed since servers drop them anyway.
+    """
+
+    # How long (in seconds) an idle connection is kept
+    idle_timeout = 30
+    # How many idle connections are kept
+    max_idle = 8
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        # (key, connection, release time), oldest first
+        self._idle = []
+        self._owners = set()
+        self.handshakes = 0
+        self.reused = 0
+
+    def _expire(self, now):
+        """Remove the connections idle for too long, caller closes them."""
+        expired = []
+        while self._idle and (now - self._idle[0][2] > self.idle_timeout
+                              or len(self._idle) > self.max_idle):
+            expired.append(self._idle.pop(0)[1])
+        return expired
+
+    def get(self, key):
+        """Take an idle connection for key.
+
+        :return: A connection or None if a new one is needed.
+        """
+        found = None
+        with self._lock:
+            expired = self._expire(time.time())
+            for i in range(len(self._idle) - 1, -1, -1):
+                if self._idle[i][0] == key:
+                    found = self._idle.pop(i)[1]
+                    self.reused += 1
+                    break
+        for connection in expired:
+            connection.close()
+        if found is not None and 'http' in debug.debug_flags:
+            trace.mutter('* Reusing connection to %s:%s'
+                         ' (%d reused, %d handshakes)',
+                         found.host, found.port, self.reused, self.handshakes)
+        return found
+
+    def put(self, connection):
+        """Keep connection for reuse if it's still worth it."""
+        key = getattr(connection, '_pool_key', None)
+        if key is None or connection.sock is None:
+            # Not ours, never connected or already closed
+            connection.close()
+            return
+        response = connection._response
+        if response is not None and not response.isclosed():
+            # Someone may still be reading the response
+            return
+        try:
+            connection.cleanup_pipe()
+        except socket.error:
+            connection.close()
+            return
+        with self._lock:
+            self._idle.append((key, connection, time.time()))
+            expired = self._expire(time.time())
+        for connection in expired:
+            connection.close()
+
+    def release_when_unused(self, owner, connection):
+        """Give connection back to the pool when owner is garbage collected.
+
+        :param owner: The object sharing the connection between transports.
+        """
+        def release(ref):
+            with self._lock:
+                self._owners.discard(ref)
+            self.put(connection)
+        ref = weakref.ref(owner, release)
+        with self._lock:
+            self._owners.add(ref)
+
+    def connected(self, connection):
+        """Count a new TCP connection (and TLS handshake)."""
+        with self._lock:
+            self.handshakes += 1
+
+    def clear(self):
+        """Close all the idle connections."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for key, connection, released in idle:
+            connection.close()
+
+    def report(self):
+        trace.note('HTTP connections: %d handshakes, %d reused'
+                   % (self.handshakes, self.reused))
+
+
+connection_pool = ConnectionPool()
+
+
 class ConnectionHandler(urllib_request.BaseHandler):
     """Provides connection-sharing by pre-processing requests.
 
@@ -629,6 +749,12 @@ class ConnectionHandler(urllib_request.BaseHandler):
             # handled in the higher levels
             raise urlutils.InvalidURL(request.get_full_url(), 'no host given.')
 
+        key = (http_connection_class, host, request.proxied_host,
+               self.ca_certs)
+        connection = connection_pool.get(key)
+        if connection is not None:
+            connection.set_report_activity(self._report_activity)
+            return connection
         # We create a connection (but it will not connect until the first
         # request is made)
         try:
@@ -640,7 +766,7 @@ class ConnectionHandler(urllib_request.BaseHandler):
             # There is only one occurrence of InvalidURL in http_client
             raise urlutils.InvalidURL(request.get_full_url(),
                                       extra='nonnumeric port')
-
+        connection._pool_key = key
         return connection
 
     def capture_connection(self, request, http_connection_class):
@@ -1005,15 +1131,26 @@ class HTTPRedirectHandler(urllib_request.HTTPRedirectHandler):
             origin_req_host = req.get_origin_req_host()
 
         if code in (301, 302, 303, 307):
+            if PY3:
+                req_type, req_host = req.type, req.host
+            else:
+                req_type, req_host = req.get_type(), req.get_host()
+            new_type, rest = splittype(newurl)
+            new_host, path = splithost(rest)
+            if (req.proxied_host is None and new_type == req_type
+                    and new_host == req_host):
+                # Redirected on the same server, keep the connection
+                connection = req.connection
+            else:
+                # TODO: It will be nice to be able to detect virtual hosts
+                # sharing the same IP address, that will allow us to share
+                # the same connection...
+                connection = None
             return Request(req.get_method(), newurl,
                            headers=req.headers,
                            origin_req_host=origin_req_host,
                            unverifiable=True,
-                           # TODO: It will be nice to be able to
-                           # detect virtual hosts sharing the same
-                           # IP address, that will allow us to
-                           # share the same connection...
-                           connection=None,
+                           connection=connection,
                            parent=req,
                            )
         else:
@@ -84,6 +84,10 @@ class LocalTransport(transport.Transport):
                 abspath = self.base
             return LocalTransport(abspath)
 
+    def _concurrent_clone(self):
+        """See Transport._concurrent_clone."""
+        return self.clone()
+
     def _abspath(self, relative_reference):
         """Return a path for use in os calls.
 
@@ -98,6 +98,10 @@ class MemoryTransport(transport.Transport):
         result._locks = self._locks
         return result
 
+    def _concurrent_clone(self):
+        """See Transport._concurrent_clone."""
+        return self.clone('.')
+
     def abspath(self, relpath):
         """See Transport.abspath()."""
         # while a little slow, this is sufficiently fast to not matter in our
@@ -25,6 +25,7 @@ from __future__ import absolute_import
 __all__ = ['RemoteTransport', 'RemoteTCPTransport', 'RemoteSSHTransport']
 
 from io import BytesIO
+import time
 
 from .. import (
     config,
@@ -331,9 +332,10 @@ class RemoteTransport(transport.ConnectedTransport):
         offsets = list(offsets)
 
         sorted_offsets = sorted(offsets)
+        limit, fudge_factor = self._coalesce_parameters()
         coalesced = list(self._coalesce_offsets(sorted_offsets,
-                                                limit=self._max_readv_combine,
-                                                fudge_factor=self._bytes_to_read_before_seek,
+                                                limit=limit,
+                                                fudge_factor=fudge_factor,
                                                 max_size=self._max_readv_bytes))
 
         # now that we've coallesced things, avoid making enormous requests
@@ -362,6 +364,7 @@ class RemoteTransport(transport.ConnectedTransport):
         # using a list so it can be modified when passing down and coming back
         next_offset = [next(offset_stack)]
         for cur_request in requests:
+            start = time.time()
             try:
                 result = self._client.call_with_body_readv_array(
                     (b'readv', self._remote_path(relpath),),
@@ -378,14 +381,16 @@ class RemoteTransport(transport.ConnectedTransport):
             for res in self._handle_response(offset_stack, cur_request,
                                              response_handler,
                                              data_map,
-                                             next_offset):
+                                             next_offset, start):
                 yield res
 
     def _handle_response(self, offset_stack, coalesced, response_handler,
-                         data_map, next_offset):
+                         data_map, next_offset, start=None):
         cur_offset_and_size = next_offset[0]
         # FIXME: this should know how many bytes are needed, for clarity.
         data = response_handler.read_body_bytes()
+        if start is not None:
+            self._readv_estimate.record(len(data), time.time() - start)
         data_offset = 0
         for c_offset in coalesced:
             if len(data) < c_offset.length:
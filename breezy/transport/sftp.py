@@ -80,7 +80,10 @@ except ImportError as e:
 else:
     from paramiko.sftp import (SFTP_FLAG_WRITE, SFTP_FLAG_CREATE,
                                SFTP_FLAG_EXCL, SFTP_FLAG_TRUNC,
-                               CMD_HANDLE, CMD_OPEN)
+                               SFTP_FLAG_APPEND,
+                               CMD_ATTRS, CMD_CLOSE, CMD_FSETSTAT, CMD_FSTAT,
+                               CMD_HANDLE, CMD_LSTAT, CMD_OPEN, CMD_STAT,
+                               CMD_STATUS, CMD_WRITE, int64)
     from paramiko.sftp_attr import SFTPAttributes
     from paramiko.sftp_file import SFTPFile
 
@@ -352,6 +355,143 @@ class _SFTPReadvHelper(object):
                     return
 
 
+class _SFTPRequestWindow(object):
+    """Keep several requests outstanding on an sftp connection.
+
+    Requests are sent without waiting for the responses to the previous ones,
+    up to a maximum number of outstanding requests, so that a batch of writes
+    or stats costs about one round trip rather than one each. Paramiko only
+    does this for readv() prefetching.
+    """
+
+    def __init__(self, sftp, size):
+        """Create a new request window.
+
+        :param sftp: The paramiko SFTPClient the requests are sent on.
+        :param size: The maximum number of requests waiting for a response.
+        """
+        self._sftp = sftp
+        self._size = max(1, size)
+        # The numbers of the requests waiting for a response
+        self._pending = set()
+        # The responses to the requests sent by request_result()
+        self._keep = set()
+        self._results = {}
+        self._error = None
+
+    def _async_response(self, t, msg, num):
+        """Called by paramiko as the responses to our requests arrive."""
+        self._pending.discard(num)
+        result = (t, msg)
+        if t == CMD_STATUS:
+            try:
+                self._sftp._convert_status(msg)
+            except (IOError, EOFError) as e:
+                result = e
+        if num in self._keep:
+            self._results[num] = result
+        elif isinstance(result, Exception) and self._error is None:
+            self._error = result
+
+    def _wait(self, outstanding):
+        while len(self._pending) > outstanding:
+            self._sftp._read_response()
+
+    def _send(self, t, args):
+        self._wait(self._size - 1)
+        num = self._sftp._async_request(self, t, *args)
+        self._pending.add(num)
+        return num
+
+    def request(self, t, *args):
+        """Send a request whose response is only checked for errors.
+
+        The first error received is raised by finish().
+        """
+        self._send(t, args)
+
+    def request_result(self, t, *args):
+        """Send a request whose response is wanted.
+
+        :return: The request number to give to result().
+        """
+        num = self._send(t, args)
+        self._keep.add(num)
+        return num
+
+    def result(self, num):
+        """Wait for the response to a request sent by request_result().
+
+        :return: The (type, message) of the response.
+        """
+        while num in self._pending:
+            self._sftp._read_response()
+        self._keep.discard(num)
+        result = self._results.pop(num)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def finish(self):
+        """Wait for all the responses, raising the first error received."""
+        self._wait(0)
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+
+class _SFTPWindowedFile(object):
+    """A file open for writing over sftp, pipelining its requests.
+
+    Unlike paramiko's pipelined SFTPFile, at most a window of writes is left
+    unacknowledged and errors are reported when the file is closed.
+    """
+
+    # The sftp spec only requires servers to accept writes of 32kB
+    _max_request_size = 32768
+
+    def __init__(self, window, handle, offset=0):
+        """Create a new windowed file.
+
+        :param window: The _SFTPRequestWindow to send the requests through.
+        :param handle: The sftp handle of the open file.
+        :param offset: The offset of the next write.
+        """
+        self._window = window
+        self._handle = handle
+        self.offset = offset
+
+    def write(self, data):
+        for start in range(0, len(data), self._max_request_size):
+            chunk = data[start:start + self._max_request_size]
+            self._window.request(CMD_WRITE, self._handle, int64(self.offset),
+                                 chunk)
+            self.offset += len(chunk)
+
+    def chmod(self, mode):
+        attr = SFTPAttributes()
+        attr.st_mode = mode
+        self._window.request(CMD_FSETSTAT, self._handle, attr)
+
+    def stat(self):
+        t, msg = self._window.result(
+            self._window.request_result(CMD_FSTAT, self._handle))
+        if t != CMD_ATTRS:
+            raise TransportError('Expected SFTP attributes')
+        return SFTPAttributes._from_msg(msg)
+
+    def close(self):
+        """Close the file once all its requests have been answered.
+
+        The first error received for a request is raised.
+        """
+        if self._handle is None:
+            return
+        handle, self._handle = self._handle, None
+        self._window.request(CMD_CLOSE, handle)
+        self._window.finish()
+
+
 class SFTPTransport(ConnectedTransport):
     """Transport implementation for SFTP access."""
 
@@ -372,6 +512,9 @@ class SFTPTransport(ConnectedTransport):
     # up the request itself, rather than us having to worry about it
     _max_request_size = 32768
 
+    # The 'sftp.max_outstanding_requests' configuration, read on first use
+    _max_outstanding_requests = None
+
     def _remote_path(self, relpath):
         """Return the path to be passed along the sftp protocol for relpath.
 
@@ -426,10 +569,32 @@ class SFTPTransport(ConnectedTransport):
         connection = self._get_connection()
         if connection is None:
             # First connection ever
-            connection, credentials = self._create_connection()
+            credentials = self._get_credentials()
+            if credentials is not None:
+                # Reuse the password of the transport we were cloned from
+                credentials = credentials[1]
+            connection, credentials = self._create_connection(credentials)
             self._set_connection(connection, credentials)
         return connection
 
+    def _concurrent_clone(self):
+        """See Transport._concurrent_clone.
+
+        The clone has a connection of its own, opened with the credentials of
+        this transport when first used.
+        """
+        clone = self.__class__(self.base)
+        clone._update_credentials(self._get_credentials())
+        return clone
+
+    def _request_window(self):
+        """Return a window for pipelining requests on the connection."""
+        if self._max_outstanding_requests is None:
+            self._max_outstanding_requests = config.GlobalStack().get(
+                'sftp.max_outstanding_requests')
+        return _SFTPRequestWindow(self._get_sftp(),
+                                  self._max_outstanding_requests)
+
     def has(self, relpath):
         """
         Does the target location exist?
@@ -442,6 +607,27 @@ class SFTPTransport(ConnectedTransport):
         except IOError:
             return False
 
+    def has_any(self, relpaths):
+        """See Transport.has_any.
+
+        The stat requests are all sent before waiting for their responses.
+        """
+        sftp = self._get_sftp()
+        window = self._request_window()
+        requests = [
+            window.request_result(
+                CMD_STAT, sftp._adjust_cwd(self._remote_path(relpath)))
+            for relpath in relpaths]
+        found = False
+        for num in requests:
+            try:
+                window.result(num)
+            except IOError:
+                continue
+            self._report_activity(20, 'read')
+            found = True
+        return found
+
     def get(self, relpath):
         """Get the file at the given relative path.
 
@@ -518,14 +704,11 @@ class SFTPTransport(ConnectedTransport):
         """Helper function so both put() and copy_abspaths can reuse the code"""
         tmp_abspath = '%s.tmp.%.9f.%d.%d' % (abspath, time.time(),
                                              os.getpid(), random.randint(0, 0x7FFFFFFF))
-        fout = self._sftp_open_exclusive(tmp_abspath, mode=mode)
+        fout = _SFTPWindowedFile(self._request_window(),
+                                 self._sftp_open_exclusive_handle(
+                                     tmp_abspath, mode=mode))
         closed = False
         try:
-            try:
-                fout.set_pipelined(True)
-                length = self._pump(f, fout)
-            except (IOError, paramiko.SSHException) as e:
-                self._translate_io_exception(e, tmp_abspath)
             # XXX: This doesn't truly help like we would like it to.
             #      The problem is that openssh strips sticky bits. So while we
             #      can properly set group write permission, we lose the group
@@ -533,15 +716,17 @@ class SFTPTransport(ConnectedTransport):
             #      just tell users that they need to set the umask correctly.
             #      The attr.st_mode = mode, in _sftp_open_exclusive
             #      will handle when the user wants the final mode to be more
-            #      restrictive. And then we avoid a round trip. Unless
-            #      paramiko decides to expose an async chmod()
+            #      restrictive.
 
-            # This is designed to chmod() right before we close.
-            # Because we set_pipelined() earlier, theoretically we might
-            # avoid the round trip for fout.close()
-            if mode is not None:
-                self._get_sftp().chmod(tmp_abspath, mode)
-            fout.close()
+            # The writes, the chmod() and the close are pipelined, so they
+            # only wait for a single round trip.
+            try:
+                length = self._pump(f, fout)
+                if mode is not None:
+                    fout.chmod(mode)
+                fout.close()
+            except (IOError, paramiko.SSHException) as e:
+                self._translate_io_exception(e, tmp_abspath)
             closed = True
             self._rename_and_overwrite(tmp_abspath, abspath)
             return length
@@ -577,18 +762,18 @@ class SFTPTransport(ConnectedTransport):
             fout = None
             try:
                 try:
-                    fout = self._get_sftp().file(abspath, mode='wb')
-                    fout.set_pipelined(True)
+                    handle = self._sftp_open_handle(
+                        abspath,
+                        SFTP_FLAG_WRITE | SFTP_FLAG_CREATE | SFTP_FLAG_TRUNC)
+                    fout = _SFTPWindowedFile(self._request_window(), handle)
                     writer(fout)
+                    # The chmod() is pipelined with the writes and the close
+                    if mode is not None:
+                        fout.chmod(mode)
+                    fout.close()
                 except (paramiko.SSHException, IOError) as e:
                     self._translate_io_exception(e, abspath,
                                                  ': unable to open')
-
-                # This is designed to chmod() right before we close.
-                # Because we set_pipelined() earlier, theoretically we might
-                # avoid the round trip for fout.close()
-                if mode is not None:
-                    self._get_sftp().chmod(abspath, mode)
             finally:
                 if fout is not None:
                     fout.close()
@@ -649,13 +834,15 @@ class SFTPTransport(ConnectedTransport):
         # progress is handled by list_dir
         queue = list(self.list_dir('.'))
         while queue:
-            relpath = queue.pop(0)
-            st = self.stat(relpath)
-            if stat.S_ISDIR(st.st_mode):
-                for i, basename in enumerate(self.list_dir(relpath)):
-                    queue.insert(i, relpath + '/' + basename)
-            else:
-                yield relpath
+            # Stat all the queued paths before waiting for the first one
+            subdirs = []
+            for relpath, st in zip(queue, self._stat_multi(queue)):
+                if stat.S_ISDIR(st.st_mode):
+                    subdirs.append(relpath)
+                else:
+                    yield relpath
+            queue = [relpath + '/' + basename for relpath in subdirs
+                     for basename in self.list_dir(relpath)]
 
     def _mkdir(self, abspath, mode=None):
         if mode is None:
@@ -758,11 +945,18 @@ class SFTPTransport(ConnectedTransport):
         """
         try:
             path = self._remote_path(relpath)
-            fout = self._get_sftp().file(path, 'ab')
-            if mode is not None:
-                self._get_sftp().chmod(path, mode)
-            result = fout.tell()
-            self._pump(f, fout)
+            handle = self._sftp_open_handle(
+                path, SFTP_FLAG_WRITE | SFTP_FLAG_CREATE | SFTP_FLAG_APPEND)
+            fout = _SFTPWindowedFile(self._request_window(), handle)
+            try:
+                if mode is not None:
+                    fout.chmod(mode)
+                # Write at explicit offsets, in case the server ignores the
+                # append flag
+                result = fout.offset = fout.stat().st_size
+                self._pump(f, fout)
+            finally:
+                fout.close()
             return result
         except (IOError, paramiko.SSHException) as e:
             self._translate_io_exception(e, relpath, ': unable to append')
@@ -845,6 +1039,27 @@ class SFTPTransport(ConnectedTransport):
         except (IOError, paramiko.SSHException) as e:
             self._translate_io_exception(e, path, ': unable to stat')
 
+    def _stat_multi(self, relpaths):
+        """Return the stat information for several files.
+
+        The requests are all sent before waiting for their responses.
+        """
+        sftp = self._get_sftp()
+        window = self._request_window()
+        paths = [self._remote_path(relpath) for relpath in relpaths]
+        requests = [window.request_result(CMD_LSTAT, sftp._adjust_cwd(path))
+                    for path in paths]
+        result = []
+        for path, num in zip(paths, requests):
+            try:
+                t, msg = window.result(num)
+            except (IOError, paramiko.SSHException) as e:
+                self._translate_io_exception(e, path, ': unable to stat')
+            if t != CMD_ATTRS:
+                raise TransportError('Expected SFTP attributes')
+            result.append(SFTPAttributes._from_msg(msg))
+        return result
+
     def readlink(self, relpath):
         """See Transport.readlink."""
         path = self._remote_path(relpath)
@@ -913,23 +1128,41 @@ class SFTPTransport(ConnectedTransport):
         #       using the 'x' flag to indicate SFTP_FLAG_EXCL.
         #       However, there is no way to set the permission mode at open
         #       time using the sftp_client.file() functionality.
-        path = self._get_sftp()._adjust_cwd(abspath)
-        # mutter('sftp abspath %s => %s', abspath, path)
-        attr = SFTPAttributes()
-        if mode is not None:
-            attr.st_mode = mode
+        return SFTPFile(self._get_sftp(),
+                        self._sftp_open_exclusive_handle(abspath, mode),
+                        'wb', -1)
+
+    def _sftp_open_exclusive_handle(self, abspath, mode=None):
+        """Open a remote path exclusively, returning its sftp handle.
+
+        See _sftp_open_exclusive.
+        """
         omode = (SFTP_FLAG_WRITE | SFTP_FLAG_CREATE
                  | SFTP_FLAG_TRUNC | SFTP_FLAG_EXCL)
         try:
-            t, msg = self._get_sftp()._request(CMD_OPEN, path, omode, attr)
-            if t != CMD_HANDLE:
-                raise TransportError('Expected an SFTP handle')
-            handle = msg.get_string()
-            return SFTPFile(self._get_sftp(), handle, 'wb', -1)
+            return self._sftp_open_handle(abspath, omode, mode)
         except (paramiko.SSHException, IOError) as e:
             self._translate_io_exception(e, abspath, ': unable to open',
                                          failure_exc=FileExists)
 
+    def _sftp_open_handle(self, abspath, omode, mode=None):
+        """Open a remote path with the given sftp flags.
+
+        :param abspath: The remote absolute path to open
+        :param omode: The SFTP_FLAG_* flags to open the path with
+        :param mode: The mode permissions bits if the file is created
+        :return: The sftp handle of the open file
+        """
+        path = self._get_sftp()._adjust_cwd(abspath)
+        # mutter('sftp abspath %s => %s', abspath, path)
+        attr = SFTPAttributes()
+        if mode is not None:
+            attr.st_mode = mode
+        t, msg = self._get_sftp()._request(CMD_OPEN, path, omode, attr)
+        if t != CMD_HANDLE:
+            raise TransportError('Expected an SFTP handle')
+        return msg.get_string()
+
     def _can_roundtrip_unix_modebits(self):
         if sys.platform == 'win32':
             # anyone else?
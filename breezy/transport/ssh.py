@@ -257,6 +257,18 @@ class SSHVendor(object):
                                            orig_error=orig_error)
 
 
+def _set_nodelay(sock):
+    """Send small packets without waiting for the previous ones to be acked.
+
+    Otherwise the last of a batch of pipelined sftp requests can wait for
+    the others to be acknowledged, costing a round trip.
+    """
+    try:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    except (AttributeError, socket.error):
+        pass
+
+
 class LoopbackVendor(SSHVendor):
     """SSH "vendor" that connects over a plain TCP socket, not SSH."""
 
@@ -266,6 +278,7 @@ class LoopbackVendor(SSHVendor):
             sock.connect((host, port))
         except socket.error as e:
             self._raise_connection_error(host, port=port, orig_error=e)
+        _set_nodelay(sock)
         return SFTPClient(SocketAsChannelAdapter(sock))
 
 
@@ -285,6 +298,7 @@ class ParamikoVendor(SSHVendor):
 
         try:
             t = paramiko.Transport((host, port or 22))
+            _set_nodelay(t.sock)
             t.set_log_channel('bzr.paramiko')
             t.start_client()
         except (paramiko.SSHException, socket.error) as e:
@@ -464,6 +464,21 @@ class Tree(object):
         """
         raise NotImplementedError(self.annotate_iter)
 
+    def iter_annotations(self, paths,
+                         default_revision=_mod_revision.CURRENT_REVISION):
+        """Annotate several files.
+
+        Implementations may annotate the files together, which is a lot
+        faster than calling annotate_iter for each of them.
+
+        :param paths: The paths of the files to annotate
+        :param default_revision: As for annotate_iter
+        :return: An iterator over (path, [(revision_id, line)]) tuples, in
+            no particular order.
+        """
+        for path in paths:
+            yield path, list(self.annotate_iter(path, default_revision))
+
     def _iter_parent_trees(self):
         """Iterate through parent trees, defaulting to Tree.revision_tree."""
         for revision_id in self.get_parent_ids():
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+"""Compare the time taken by fast-import with and without pipelining.
+
+Usage: fastimport_benchmark.py [--commits N] [--files N] [--size N]
+
+A fast-import stream is generated in which every commit changes a few of
+the files, and then imported into new 2a branches, once serially and once
+with the pipeline parameter set, which parses the stream in a thread and
+compresses the file texts in a pool of threads.
+"""
+
+import optparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import breezy
+import breezy.bzr
+from breezy import (
+    controldir,
+    )
+from breezy.plugins.fastimport import load_fastimport
+
+p = optparse.OptionParser(usage='%prog [options]')
+p.add_option('--commits', default=1000, type=int,
+             help='Number of commits in the stream.')
+p.add_option('--files', default=100, type=int,
+             help='Number of files in the tree.')
+p.add_option('--size', default=10000, type=int,
+             help='Size in bytes of the changed file texts.')
+opts, args = p.parse_args(sys.argv[1:])
+
+
+def write_stream(f):
+    r = random.Random(0)
+    for i in range(1, opts.commits + 1):
+        f.write(b'commit refs/heads/master\n')
+        f.write(b'mark :%d\n' % i)
+        f.write(b'committer Joe <joe@example.com> %d +0000\n' % (i * 60))
+        message = b'commit %d' % i
+        f.write(b'data %d\n%s\n' % (len(message), message))
+        if i > 1:
+            f.write(b'from :%d\n' % (i - 1))
+        if i == 1:
+            changed = range(opts.files)
+        else:
+            changed = r.sample(range(opts.files), 3)
+        for j in changed:
+            lines = [b'line %d of %d in %d\n' % (r.randrange(1000), j, i)
+                     for k in range(opts.size // 20)]
+            data = b''.join(lines)
+            f.write(b'M 644 inline file%d\n' % j)
+            f.write(b'data %d\n%s\n' % (len(data), data))
+        f.write(b'\n')
+
+
+def time_import(stream_path, pipeline):
+    from breezy.plugins.fastimport.processors import generic_processor
+    from fastimport import parser
+    tmpdir = tempfile.mkdtemp(prefix='fastimport-benchmark-')
+    try:
+        format = controldir.format_registry.make_controldir('2a')
+        branch = controldir.ControlDir.create_branch_convenience(
+            os.path.join(tmpdir, 'branch'), format=format,
+            force_new_tree=False)
+        proc = generic_processor.GenericProcessor(
+            branch.controldir, params={'pipeline': pipeline})
+        with open(stream_path, 'rb') as stream:
+            p = parser.ImportParser(stream)
+            begin = time.time()
+            proc.process(p.iter_commands)
+            return time.time() - begin
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+with breezy.initialize():
+    load_fastimport()
+    fd, stream_path = tempfile.mkstemp(prefix='fastimport-benchmark-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write_stream(f)
+        serial = time_import(stream_path, False)
+        print('serial import:     %.3fs (%.1f commits/s)'
+              % (serial, opts.commits / serial))
+        pipelined = time_import(stream_path, True)
+        print('pipelined import:  %.3fs (%.1f commits/s, %.2fx)'
+              % (pipelined, opts.commits / pipelined, serial / pipelined))
+    finally:
+        os.unlink(stream_path)
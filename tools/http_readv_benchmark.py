@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+"""Time http readv with sequential and concurrent range requests.
+
+Usage: http_readv_benchmark.py [--latency MS] [--size N] [--ranges N]
+                               [--connections N] [--repeat N]
+
+A local http server answering every request after an artificial delay
+serves a file from which random ranges are read. The same readv is run
+on one connection and with the range requests spread over a pool of
+connections, printing the time taken and the concurrency the pool
+settled on.
+"""
+
+import optparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import breezy
+from breezy.tests import http_server
+from breezy.transport import (
+    get_transport_from_url,
+    http,
+    )
+
+p = optparse.OptionParser(usage='%prog [options]')
+p.add_option('--latency', default=50, type=int,
+             help='Delay in milliseconds before answering each request.')
+p.add_option('--size', default=16 * 1024 * 1024, type=int,
+             help='Size in bytes of the file read.')
+p.add_option('--ranges', default=400, type=int,
+             help='Number of ranges read by each readv.')
+p.add_option('--connections', default=4, type=int,
+             help='Maximum number of concurrent connections.')
+p.add_option('--repeat', default=5, type=int,
+             help='Number of readv calls for each mode.')
+opts, args = p.parse_args(sys.argv[1:])
+
+
+class LatencyRequestHandler(http_server.TestingHTTPRequestHandler):
+
+    def do_GET(self):
+        time.sleep(opts.latency / 1000.0)
+        return http_server.TestingHTTPRequestHandler.do_GET(self)
+
+
+def make_offsets():
+    r = random.Random(0)
+    length = opts.size // (opts.ranges * 4)
+    starts = r.sample(range(0, opts.size - length, length * 2), opts.ranges)
+    return [(start, length) for start in starts]
+
+
+def time_readv(url, offsets, connections):
+    t = get_transport_from_url(url)
+    if connections > 1:
+        t._readv_pool = http._ReadvConnectionPool(connections)
+    # A realistic server limit, forcing several requests per readv
+    t._max_get_ranges = 50
+    try:
+        t.get_bytes('data')
+        times = []
+        for i in range(opts.repeat):
+            begin = time.time()
+            for offset, data in t.readv('data', offsets):
+                pass
+            times.append(time.time() - begin)
+        return times, t._readv_pool
+    finally:
+        t.disconnect()
+
+
+with breezy.initialize():
+    tmpdir = tempfile.mkdtemp(prefix='http-readv-benchmark-')
+    cwd = os.getcwd()
+    os.chdir(tmpdir)
+    server = http_server.HttpServer(LatencyRequestHandler, 'HTTP/1.1')
+    try:
+        with open('data', 'wb') as f:
+            f.write(os.urandom(opts.size))
+        server.start_server()
+        offsets = make_offsets()
+        print('%d ranges of a %d bytes file, %dms latency'
+              % (len(offsets), opts.size, opts.latency))
+        times, pool = time_readv(server.get_url(), offsets, 1)
+        sequential = min(times)
+        print('sequential:  %.3fs' % sequential)
+        times, pool = time_readv(server.get_url(), offsets, opts.connections)
+        concurrent = min(times)
+        print('concurrent:  %.3fs (%.2fx, %s, concurrency %d)'
+              % (concurrent, sequential / concurrent,
+                 ' '.join('%.3f' % t for t in times), pool.concurrency))
+    finally:
+        server.stop_server()
+        os.chdir(cwd)
+        shutil.rmtree(tmpdir)
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+"""Compare the time taken to pack a repository serially and with jobs.
+
+Usage: pack_benchmark.py [--jobs N] [REPOSITORY]
+
+The repository, or the shared repository of a branch, is copied to a
+temporary directory for every run, so the original is left untouched.
+"""
+
+import optparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import breezy
+import breezy.bzr
+from breezy import (
+    controldir,
+    )
+
+p = optparse.OptionParser(usage='%prog [options] [REPOSITORY]')
+p.add_option('--jobs', default=4, type=int,
+             help='Number of jobs for the parallel run.')
+opts, args = p.parse_args(sys.argv[1:])
+
+if len(args) >= 1:
+    source = args[0]
+else:
+    source = '.'
+
+
+def time_pack(jobs):
+    tmpdir = tempfile.mkdtemp(prefix='pack-benchmark-')
+    try:
+        target = os.path.join(tmpdir, 'repo')
+        # The repository may be shared, above the branch it is found from.
+        dir = controldir.ControlDir.open_containing(
+            source)[0].find_repository().controldir
+        shutil.copytree(dir.root_transport.local_abspath('.bzr'),
+                        os.path.join(target, '.bzr'))
+        repo = controldir.ControlDir.open(target).open_repository()
+        overrides = breezy.get_global_state().cmdline_overrides
+        overrides.options['repository.pack_jobs'] = str(jobs)
+        begin = time.time()
+        repo.pack()
+        return time.time() - begin
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+with breezy.initialize():
+    serial = time_pack(1)
+    print('serial pack:   %.3fs' % (serial,))
+    parallel = time_pack(opts.jobs)
+    print('%d jobs pack:  %.3fs (%.2fx)' % (opts.jobs, parallel,
+                                          serial / parallel))
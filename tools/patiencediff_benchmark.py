@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+"""Time patience diff on the history of real files.
+
+Usage: patiencediff_benchmark.py [--repeat N] BRANCH PATH...
+
+Every text in the history of each file is compared to its parent texts,
+once with the lines themselves and once with the lines interned to integer
+ids by a LineInterner. The time taken to annotate the file is printed as
+well.
+"""
+
+import optparse
+import sys
+import time
+
+import breezy
+import breezy.bzr
+from breezy import (
+    osutils,
+    patiencediff,
+    )
+from breezy.branch import Branch
+
+p = optparse.OptionParser(usage='%prog [options] BRANCH PATH...')
+p.add_option('--repeat', default=3, type=int,
+             help='Number of times to run each benchmark, keeping the best.')
+opts, args = p.parse_args(sys.argv[1:])
+if len(args) < 2:
+    p.error('a branch and at least one path are required')
+
+
+def get_history(repository, tip):
+    """Get the texts and parent keys of all ancestors of tip."""
+    parent_map = {}
+    todo = set([tip])
+    while todo:
+        found = repository.texts.get_parent_map(todo)
+        parent_map.update(found)
+        todo = set()
+        for parent_keys in found.values():
+            todo.update(k for k in parent_keys if k not in parent_map)
+    texts = {}
+    for record in repository.texts.get_record_stream(
+            parent_map, 'unordered', True):
+        texts[record.key] = osutils.chunks_to_lines(
+            record.get_bytes_as('chunked'))
+    return texts, parent_map
+
+
+def best_of(func):
+    best = None
+    for i in range(opts.repeat):
+        begin = time.time()
+        func()
+        elapsed = time.time() - begin
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def diff_lines(texts, parent_map):
+    for key, parent_keys in parent_map.items():
+        for parent_key in parent_keys:
+            if parent_key in texts:
+                patiencediff.PatienceSequenceMatcher(
+                    None, texts[parent_key], texts[key]).get_matching_blocks()
+
+
+def diff_interned(texts, parent_map):
+    interner = patiencediff.LineInterner()
+    ids = dict((key, interner.intern(lines)) for key, lines in texts.items())
+    for key, parent_keys in parent_map.items():
+        for parent_key in parent_keys:
+            if parent_key in ids:
+                patiencediff.PatienceSequenceMatcher(
+                    None, ids[parent_key], ids[key]).get_matching_blocks()
+
+
+def benchmark(branch, path):
+    repository = branch.repository
+    tree = branch.basis_tree()
+    with tree.lock_read():
+        tip = (tree.path2id(path), tree.get_file_revision(path))
+    texts, parent_map = get_history(repository, tip)
+    num_lines = sum(len(lines) for lines in texts.values())
+    print('%s: %d texts, %d lines' % (path, len(texts), num_lines))
+    print('  lines:     %.3fs' % best_of(lambda: diff_lines(texts, parent_map)))
+    print('  interned:  %.3fs' % best_of(
+        lambda: diff_interned(texts, parent_map)))
+    print('  annotate:  %.3fs' % best_of(
+        lambda: repository.texts.get_annotator().annotate_flat(tip)))
+
+
+with breezy.initialize():
+    print('using %s' % patiencediff.PatienceSequenceMatcher.__name__)
+    branch = Branch.open(args[0])
+    with branch.lock_read():
+        for path in args[1:]:
+            benchmark(branch, path)
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+"""Compare static and adaptive readv coalescing on a simulated link.
+
+Usage: readv_latency_benchmark.py [--latency MS] [--bandwidth KB/S]
+                                  [--combine N] [--fudge N] [--readvs N]
+
+Each read on the simulated transport takes the round trip latency plus the
+time needed to transfer its bytes at the given bandwidth. Simulated time is
+used instead of sleeping so that slow links can be benchmarked quickly.
+Batches of btree-like page reads (random pages, some next to each other)
+are issued with the transport's static coalescing parameters and then with
+the parameters adapted from its latency and bandwidth estimate. The time,
+number of reads and bytes transferred are printed for both.
+"""
+
+import optparse
+import random
+import sys
+
+import breezy
+from breezy import transport
+
+p = optparse.OptionParser(usage='%prog [options]')
+p.add_option('--latency', default=20, type=float,
+             help='Round trip latency in milliseconds.')
+p.add_option('--bandwidth', default=10000, type=float,
+             help='Bandwidth in kB/s.')
+p.add_option('--combine', default=200, type=int,
+             help='Static limit of offsets combined in a read.')
+p.add_option('--fudge', default=8192, type=int,
+             help='Static number of bytes read rather than seeking.')
+p.add_option('--readvs', default=200, type=int,
+             help='Number of readv calls.')
+p.add_option('--pages', default=50, type=int,
+             help='Number of 4kB pages read by each readv.')
+p.add_option('--size', default=64 * 1024 * 1024, type=int,
+             help='Size of the file read.')
+opts, args = p.parse_args(sys.argv[1:])
+
+
+class SimulatedClock(object):
+
+    def __init__(self):
+        self.now = 0.0
+
+    def time(self):
+        return self.now
+
+
+class SimulatedFile(object):
+
+    def __init__(self, clock, stats):
+        self._clock = clock
+        self._stats = stats
+        self._pos = 0
+
+    def seek(self, pos):
+        self._pos = pos
+
+    def read(self, size):
+        self._clock.now += (opts.latency / 1000.0
+                            + size / (opts.bandwidth * 1000.0))
+        self._stats['reads'] += 1
+        self._stats['bytes'] += size
+        self._pos += size
+        return b'\0' * size
+
+    def close(self):
+        pass
+
+
+class SimulatedTransport(transport.Transport):
+
+    _max_readv_combine = opts.combine
+    _bytes_to_read_before_seek = opts.fudge
+
+    def __init__(self, clock, estimate):
+        transport.Transport.__init__(self, 'simulated:///')
+        self._clock = clock
+        self._readv_estimate = estimate
+        self.stats = {'reads': 0, 'bytes': 0}
+
+    def get(self, relpath):
+        return SimulatedFile(self._clock, self.stats)
+
+
+def make_readvs():
+    r = random.Random(0)
+    num_pages = opts.size // 4096
+    readvs = []
+    for i in range(opts.readvs):
+        pages = set()
+        while len(pages) < opts.pages:
+            page = r.randrange(num_pages)
+            # Btree nodes read together are often close to each other
+            for j in range(r.choice([1, 1, 2, 4])):
+                pages.add(min(page + j * r.choice([1, 2, 3]), num_pages - 1))
+        readvs.append([(page * 4096, 4096) for page in sorted(pages)])
+    return readvs
+
+
+def run(readvs, estimate):
+    clock = SimulatedClock()
+    # Let _seek_and_read measure the simulated time
+    transport.time = clock
+    t = SimulatedTransport(clock, estimate)
+    for offsets in readvs:
+        for offset, data in t.readv('file', offsets):
+            pass
+    return clock.now, t.stats
+
+
+with breezy.initialize():
+    readvs = make_readvs()
+    print('%d readvs of %d pages, %.1fms latency, %.0fkB/s'
+          % (opts.readvs, opts.pages, opts.latency, opts.bandwidth))
+    static, stats = run(readvs, None)
+    print('static:    %8.3fs  %6d reads  %10d bytes'
+          % (static, stats['reads'], stats['bytes']))
+    estimate = transport._ReadvEstimate()
+    adaptive, stats = run(readvs, estimate)
+    limit, fudge_factor = estimate.coalesce_parameters(
+        opts.combine, opts.fudge)
+    print('adaptive:  %8.3fs  %6d reads  %10d bytes  (%.2fx)'
+          % (adaptive, stats['reads'], stats['bytes'], static / adaptive))
+    print('estimate:  latency %.1fms, bandwidth %.0fkB/s, fudge factor %d,'
+          ' combine limit %d'
+          % (estimate.latency * 1000, estimate.bandwidth / 1000,
+             fudge_factor, limit))
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+"""Time sftp writes and stats with and without pipelined requests.
+
+Usage: sftp_benchmark.py [--latency MS] [--size N] [--appends N]
+                         [--files N] [--window N]
+
+A local paramiko sftp server stands in for a remote server, behind a proxy
+delaying the data sent in each direction by half the round trip latency.
+A pack sized file is put, an index is built with several appends, and a
+tree of files is listed recursively, first waiting for every response in
+turn and then keeping a window of requests outstanding.
+"""
+
+import logging
+import optparse
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+import breezy
+from breezy.tests import stub_sftp
+from breezy.transport import get_transport_from_url
+
+p = optparse.OptionParser(usage='%prog [options]')
+p.add_option('--latency', default=50, type=int,
+             help='Latency in milliseconds added to each round trip.')
+p.add_option('--size', default=4 * 1024 * 1024, type=int,
+             help='Size in bytes of the file put.')
+p.add_option('--appends', default=10, type=int,
+             help='Number of appends of 64kB.')
+p.add_option('--files', default=50, type=int,
+             help='Number of files in the tree listed.')
+p.add_option('--window', default=64, type=int,
+             help='Maximum number of outstanding requests.')
+opts, args = p.parse_args(sys.argv[1:])
+
+
+class LatencyProxy(object):
+    """Forward connections to a server, delaying the data both ways."""
+
+    def __init__(self, port, delay):
+        self._port = port
+        self._delay = delay
+        self._sock = socket.socket()
+        self._sock.bind(('127.0.0.1', 0))
+        self._sock.listen(5)
+        self.port = self._sock.getsockname()[1]
+        thread = threading.Thread(target=self._accept)
+        thread.daemon = True
+        thread.start()
+
+    def _accept(self):
+        while True:
+            client, addr = self._sock.accept()
+            server = socket.create_connection(('127.0.0.1', self._port))
+            for sock in (client, server):
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            for source, dest in ((client, server), (server, client)):
+                self._start_pipe(source, dest)
+
+    def _start_pipe(self, source, dest):
+        pending = queue.Queue()
+
+        def read():
+            while True:
+                data = source.recv(65536)
+                pending.put((time.time() + self._delay, data))
+                if not data:
+                    return
+
+        def write():
+            while True:
+                due, data = pending.get()
+                time.sleep(max(0, due - time.time()))
+                if not data:
+                    dest.shutdown(socket.SHUT_WR)
+                    return
+                dest.sendall(data)
+        for target in (read, write):
+            thread = threading.Thread(target=target)
+            thread.daemon = True
+            thread.start()
+
+
+def time_operations(url, window):
+    t = get_transport_from_url(url)
+    t._max_outstanding_requests = window
+    try:
+        t.has('.')
+        times = []
+        content = os.urandom(opts.size)
+        begin = time.time()
+        t.put_bytes('pack', content)
+        times.append(time.time() - begin)
+        chunk = os.urandom(64 * 1024)
+        begin = time.time()
+        for i in range(opts.appends):
+            t.append_bytes('index', chunk)
+        times.append(time.time() - begin)
+        begin = time.time()
+        list(t.iter_files_recursive())
+        times.append(time.time() - begin)
+        t.delete('pack')
+        t.delete('index')
+        return times
+    finally:
+        t.disconnect()
+
+
+with breezy.initialize():
+    logging.getLogger('brz').setLevel(logging.WARNING)
+    tmpdir = tempfile.mkdtemp(prefix='sftp-benchmark-')
+    cwd = os.getcwd()
+    os.chdir(tmpdir)
+    server = stub_sftp.SFTPAbsoluteServer()
+    try:
+        for i in range(opts.files):
+            dirname = 'tree/%d' % (i % 5)
+            if not os.path.isdir(dirname):
+                os.makedirs(dirname)
+            with open('%s/%d' % (dirname, i), 'wb') as f:
+                f.write(b'file %d\n' % i)
+        server.start_server()
+        proxy = LatencyProxy(server.port, opts.latency / 2000.0)
+        url = server.get_url().replace(
+            ':%d/' % server.port, ':%d/' % proxy.port)
+        print('%d bytes put, %d appends, %d files listed, %dms latency'
+              % (opts.size, opts.appends, opts.files, opts.latency))
+        print('             put  appends     list')
+        one = time_operations(url, 1)
+        print('one:     %7.3fs %7.3fs %7.3fs' % tuple(one))
+        window = time_operations(url, opts.window)
+        print('window:  %7.3fs %7.3fs %7.3fs' % tuple(window))
+        print('speedup: %7.2fx %7.2fx %7.2fx'
+              % tuple(a / b for a, b in zip(one, window)))
+    finally:
+        server.stop_server()
+        os.chdir(cwd)
+        shutil.rmtree(tmpdir)
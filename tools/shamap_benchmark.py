@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+"""Compare the bzr-git SHA map backends.
+
+Usage: shamap_benchmark.py [--revisions N] [--objects N] [BACKEND...]
+
+For every backend (dict, sqlite, tdb and index by default) this adds
+entries for a number of synthetic revisions, looks all of their objects up
+one at a time and in bulk, and prints the time taken by each step.
+"""
+
+import optparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import breezy
+from breezy import (
+    osutils,
+    )
+from breezy.revision import Revision
+from breezy.transport import get_transport
+from breezy.git.cache import (
+    DictBzrGitCache,
+    IndexBzrGitCache,
+    IndexGitCacheFormat,
+    SqliteBzrGitCache,
+    TdbBzrGitCache,
+    )
+
+from dulwich.objects import (
+    Blob,
+    Commit,
+    )
+
+p = optparse.OptionParser(usage='%prog [options] [BACKEND...]')
+p.add_option('--revisions', default=1000, type=int,
+             help='Number of revisions to add.')
+p.add_option('--objects', default=10, type=int,
+             help='Number of blobs per revision.')
+opts, args = p.parse_args(sys.argv[1:])
+
+
+def open_dict(path):
+    return DictBzrGitCache()
+
+
+def open_sqlite(path):
+    return SqliteBzrGitCache(os.path.join(path, 'idmap.db'))
+
+
+def open_tdb(path):
+    return TdbBzrGitCache(os.path.join(path, 'idmap.tdb'))
+
+
+def open_index(path):
+    transport = get_transport(path)
+    IndexGitCacheFormat().initialize(transport)
+    return IndexBzrGitCache(transport)
+
+
+backends = [
+    ('dict', open_dict),
+    ('sqlite', open_sqlite),
+    ('tdb', open_tdb),
+    ('index', open_index),
+    ]
+
+
+def make_revision(i):
+    revid = b'rev-%d' % i
+    c = Commit()
+    c.committer = c.author = b'Joe Example <joe@example.com>'
+    c.commit_time = c.author_time = i
+    c.commit_timezone = c.author_timezone = 0
+    c.message = b'revision %d' % i
+    c.tree = osutils.sha_string(revid)
+    blobs = [(Blob.from_string(b'%d %d' % (i, j)), (b'file-%d' % j, revid))
+             for j in range(opts.objects)]
+    return revid, c, blobs
+
+
+def benchmark(name, open_cache):
+    tmpdir = tempfile.mkdtemp(prefix='shamap-benchmark-')
+    try:
+        try:
+            cache = open_cache(tmpdir)
+        except ImportError as e:
+            print('%-8s unavailable: %s' % (name, e))
+            return
+        revisions = [make_revision(i) for i in range(opts.revisions)]
+        shas = [c.id for (revid, c, blobs) in revisions]
+        shas.extend(b.id for (revid, c, blobs) in revisions
+                    for (b, key) in blobs)
+        begin = time.time()
+        cache.idmap.start_write_group()
+        for revid, c, blobs in revisions:
+            updater = cache.get_updater(Revision(revid))
+            for b, key in blobs:
+                updater.add_object(b, key, None)
+            updater.add_object(c, {'testament3-sha1': c.tree}, None)
+            updater.finish()
+        cache.idmap.commit_write_group()
+        added = time.time() - begin
+        begin = time.time()
+        for sha in shas:
+            list(cache.idmap.lookup_git_sha(sha))
+        looked_up = time.time() - begin
+        begin = time.time()
+        found = cache.idmap.lookup_git_shas(shas)
+        bulk = time.time() - begin
+        if len(found) != len(shas):
+            raise AssertionError('%s: found %d of %d objects'
+                                 % (name, len(found), len(shas)))
+        print('%-8s add: %.3fs  lookup: %.3fs  bulk lookup: %.3fs'
+              % (name, added, looked_up, bulk))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+with breezy.initialize():
+    print('%d revisions with %d blobs each' % (opts.revisions, opts.objects))
+    for name, open_cache in backends:
+        if args and name not in args:
+            continue
+        benchmark(name, open_cache)
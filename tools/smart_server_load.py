@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+"""Put a local smart server under load from many concurrent clients.
+
+Usage: smart_server_load.py [options]
+
+A SmartTCPServer is started in this process on a memory transport, and
+every client thread opens its own connection and makes a series of 'hello'
+and 'get' requests.  The request latencies, the peak number of threads and
+the server's connection metrics are reported at the end, which makes it easy
+to compare a thread per connection with a worker pool.
+"""
+
+import optparse
+import socket
+import sys
+import threading
+import time
+
+import breezy
+from breezy import transport
+from breezy.bzr.smart import (
+    client,
+    medium,
+    server,
+    )
+
+p = optparse.OptionParser(usage='%prog [options]')
+p.add_option('--clients', default=50, type=int,
+             help='Number of concurrent client connections.')
+p.add_option('--requests', default=100, type=int,
+             help='Number of requests made by each client.')
+p.add_option('--workers', default=0, type=int,
+             help='Size of the server worker pool, 0 for a thread per '
+                  'connection.')
+p.add_option('--think-time', default=0.0, type=float,
+             help='Seconds each client waits between requests, which '
+                  'leaves its connection idle.')
+p.add_option('--backlog', default=128, type=int,
+             help='Listen backlog of the server socket.')
+opts, args = p.parse_args(sys.argv[1:])
+
+
+def run_client(address, latencies, errors):
+    sock = socket.create_connection(address)
+    client_medium = medium.SmartClientAlreadyConnectedSocketMedium(
+        'bzr://%s:%d/' % address, sock)
+    smart_client = client._SmartClient(client_medium)
+    try:
+        for i in range(opts.requests):
+            start = time.time()
+            if i % 2:
+                smart_client.call_expecting_body(
+                    b'get', b'file')[1].read_body_bytes()
+            else:
+                smart_client.call(b'hello')
+            latencies.append(time.time() - start)
+            if opts.think_time:
+                time.sleep(opts.think_time)
+    except Exception as e:
+        errors.append(e)
+    finally:
+        client_medium.disconnect()
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+with breezy.initialize():
+    backing = transport.get_transport_from_url('memory:///')
+    backing.put_bytes('file', b'x' * 4096)
+    smart_server = server.SmartTCPServer(
+        backing, client_timeout=60.0, max_workers=opts.workers or None)
+    smart_server.start_server('127.0.0.1', 0, backlog=opts.backlog)
+    smart_server.start_background_thread('-load')
+    address = smart_server._sockname[:2]
+
+    peaks = {'threads': 0, 'active': 0, 'queued': 0}
+    finished = threading.Event()
+
+    def monitor():
+        while not finished.is_set():
+            metrics = smart_server.get_metrics()
+            peaks['threads'] = max(peaks['threads'], threading.active_count())
+            peaks['active'] = max(peaks['active'], metrics['active'])
+            peaks['queued'] = max(peaks['queued'], metrics['queued'])
+            time.sleep(0.01)
+    monitor_thread = threading.Thread(target=monitor)
+    monitor_thread.start()
+
+    latencies = []
+    errors = []
+    clients = [threading.Thread(target=run_client,
+                                args=(address, latencies, errors))
+               for i in range(opts.clients)]
+    begin = time.time()
+    for t in clients:
+        t.start()
+    for t in clients:
+        t.join()
+    elapsed = time.time() - begin
+    finished.set()
+    monitor_thread.join()
+    smart_server.stop_background_thread()
+
+    latencies.sort()
+    print('%d clients x %d requests, %s' % (
+        opts.clients, opts.requests,
+        '%d workers' % opts.workers if opts.workers
+        else 'thread per connection'))
+    print('requests:     %d in %.3fs (%.0f/s), %d errors' % (
+        len(latencies), elapsed, len(latencies) / elapsed, len(errors)))
+    print('latency:      p50 %.2fms  p95 %.2fms  max %.2fms' % (
+        percentile(latencies, 0.5) * 1000, percentile(latencies, 0.95) * 1000,
+        percentile(latencies, 1.0) * 1000))
+    print('peak threads: %d (including %d client threads)' % (
+        peaks['threads'], opts.clients))
+    print('peak active:  %d  peak queued: %d' % (
+        peaks['active'], peaks['queued']))
+    if errors:
+        print('first error:  %s' % (errors[0],))
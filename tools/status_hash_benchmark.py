@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+"""Time comparing a synthetic tree whose files all need re-hashing.
+
+Usage: status_hash_benchmark.py [options]
+
+A working tree with many files is created and committed in a temporary
+directory. Before every run the timestamps of all files are moved, as a
+checkout of another branch or a copy would do, so that the dirstate has to
+hash every file again. iter_changes against the basis tree is then timed
+with status.hash_workers set to 1 and to the given number of workers.
+"""
+
+import optparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import breezy
+import breezy.bzr
+from breezy import (
+    controldir,
+    workingtree,
+    )
+
+p = optparse.OptionParser(usage='%prog [options]')
+p.add_option('--files', default=5000, type=int,
+             help='Number of files in the tree.')
+p.add_option('--size', default=64 * 1024, type=int,
+             help='Size of each file in bytes.')
+p.add_option('--per-dir', default=100, type=int,
+             help='Number of files in each directory.')
+p.add_option('--workers', default=4, type=int,
+             help='Number of hashing threads for the parallel run.')
+opts, args = p.parse_args(sys.argv[1:])
+
+
+def build_tree(basedir):
+    tree = controldir.ControlDir.create_standalone_workingtree(
+        basedir, controldir.format_registry.make_controldir('2a'))
+    paths = []
+    for i in range(opts.files):
+        dirname = 'd%04d' % (i // opts.per_dir)
+        if i % opts.per_dir == 0:
+            os.mkdir(os.path.join(basedir, dirname))
+            paths.append(dirname)
+        path = '%s/f%06d' % (dirname, i)
+        with open(os.path.join(basedir, path), 'wb') as f:
+            f.write(os.urandom(opts.size))
+        paths.append(path)
+    tree.add(paths)
+    tree.commit('synthetic tree')
+    return tree, paths
+
+
+def touch_all(basedir, paths, mtime):
+    for path in paths:
+        os.utime(os.path.join(basedir, path), (mtime, mtime))
+    # The ctime can not be set, so wait for it to fall behind the cutoff of
+    # the dirstate.
+    time.sleep(4)
+
+
+def time_iter_changes(basedir, workers):
+    tree = workingtree.WorkingTree.open(basedir)
+    overrides = breezy.get_global_state().cmdline_overrides
+    overrides.options['status.hash_workers'] = str(workers)
+    begin = time.time()
+    with tree.lock_read():
+        changes = list(tree.iter_changes(tree.basis_tree()))
+    elapsed = time.time() - begin
+    if changes:
+        raise AssertionError('unexpected changes: %r' % (changes[:5],))
+    return elapsed
+
+
+with breezy.initialize():
+    tmpdir = tempfile.mkdtemp(prefix='status-hash-benchmark-')
+    try:
+        basedir = os.path.join(tmpdir, 'tree')
+        os.mkdir(basedir)
+        tree, paths = build_tree(basedir)
+        # Timestamps must be older than the dirstate cutoff for the hashes to
+        # be cached, and differ between runs for every run to hash again.
+        now = time.time()
+        print('%d files of %d bytes' % (opts.files, opts.size))
+        touch_all(basedir, paths, now - 3600)
+        serial = time_iter_changes(basedir, 1)
+        print('serial:      %.3fs' % (serial,))
+        touch_all(basedir, paths, now - 7200)
+        parallel = time_iter_changes(basedir, opts.workers)
+        print('%d workers:   %.3fs (%.2fx)' % (opts.workers, parallel,
+                                               serial / parallel))
+        cached = time_iter_changes(basedir, opts.workers)
+        print('cached:      %.3fs' % (cached,))
+    finally:
+        shutil.rmtree(tmpdir)